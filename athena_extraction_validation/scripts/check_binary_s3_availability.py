@@ -6,10 +6,21 @@ This script reads ALL_BINARY_FILES_METADATA.csv and checks S3 availability for e
 
 Key Features:
 - Applies period→underscore conversion (critical S3 naming bug fix)
-- Checks S3 head_object for each Binary ID
-- Adds s3_available, s3_bucket, s3_key columns
+- Checks S3 with bounded concurrent head_object calls, or one listing of the prefix
+- Adds s3_available, s3_bucket, s3_key columns (vectorized set-membership join)
 - Handles missing Binary IDs gracefully
-- Progress tracking for large datasets
+- Progress tracking for large datasets; an interrupted run resumes with --resume
+  (the progress file is removed once a run completes)
+
+Check Modes (--mode):
+- head (default): concurrent head_object per Binary ID on a thread pool (--workers)
+  sharing one client with a matching connection pool
+- list: list_objects_v2 over prd/source/Binary/, one listing per leading character
+  of the IDs being checked (run concurrently); best when checking many thousands of IDs
+- sequential: the original one-at-a-time head_object loop
+
+Local S3 stand-in: pass --endpoint-url (e.g. MinIO or `moto_server`) or inject an
+s3_client; see benchmarks/benchmark_s3_availability.py.
 
 Critical S3 Naming Bug:
 - FHIR Binary IDs contain periods (.) 
@@ -31,11 +42,14 @@ Date: 2025-01-10
 
 import os
 import sys
+import argparse
 import boto3
 import pandas as pd
 import logging
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Tuple
+from typing import Iterable, Optional, Set, Tuple
 
 # Configure logging
 logging.basicConfig(
@@ -49,23 +63,60 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+CHECK_MODES = ('head', 'list', 'sequential')
+
+# Progress file is appended every N completed HEAD checks
+PROGRESS_FLUSH_EVERY = 500
+
+
 class S3AvailabilityChecker:
     """Check S3 availability for Binary files."""
     
-    def __init__(self):
-        """Initialize checker with S3 configuration."""
+    def __init__(
+        self,
+        s3_client=None,
+        mode: str = 'head',
+        max_workers: int = 32,
+        progress_file: Optional[str] = None,
+        endpoint_url: Optional[str] = None
+    ):
+        """
+        Initialize checker with S3 configuration.
+        
+        Args:
+            s3_client: Existing boto3 S3 client (e.g. pointed at a local stand-in)
+            mode: 'head' (concurrent HEADs), 'list' (prefix listing) or 'sequential'
+            max_workers: Concurrent HEAD requests / listings; also sizes the connection pool
+            progress_file: CSV of already-checked keys used to resume an interrupted run
+                (removed by run() once the results are saved)
+            endpoint_url: Custom S3 endpoint (MinIO, moto_server) when no client is given
+        """
+        if mode not in CHECK_MODES:
+            raise ValueError(f"mode must be one of {CHECK_MODES}, got '{mode}'")
+        
         # S3 configuration
         self.s3_bucket = 'radiant-prd-343218191717-us-east-1-prd-ehr-pipeline'
         self.s3_prefix = 'prd/source/Binary/'
-        
-        # Initialize AWS S3 client
-        self.s3_client = boto3.client('s3', region_name='us-east-1')
+        self.mode = mode
+        self.max_workers = max_workers
+        self.progress_file = progress_file
+        
+        # Initialize AWS S3 client (connection pool sized for the worker threads)
+        if s3_client is None:
+            s3_client = boto3.client(
+                's3',
+                region_name='us-east-1',
+                endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max(max_workers, 10), retries={'mode': 'adaptive'})
+            )
+        self.s3_client = s3_client
         
         logger.info("=" * 100)
         logger.info("🔍 BINARY FILES S3 AVAILABILITY CHECKER")
         logger.info("=" * 100)
         logger.info(f"S3 Bucket: {self.s3_bucket}")
         logger.info(f"S3 Prefix: {self.s3_prefix}")
+        logger.info(f"Mode: {self.mode} (workers: {self.max_workers})")
         logger.info("=" * 100)
     
     def load_binary_metadata(self, filename: str = 'ALL_BINARY_FILES_METADATA.csv') -> pd.DataFrame:
@@ -157,6 +208,155 @@ class S3AvailabilityChecker:
         """
         Check S3 availability for all Binary IDs in DataFrame.
         
+        Args:
+            df: DataFrame with binary_id column
+            
+        Returns:
+            DataFrame with added s3_available, s3_bucket, s3_key columns
+        """
+        if self.mode == 'sequential':
+            return self.check_all_s3_availability_sequential(df)
+        
+        logger.info(f"\n🔍 Checking S3 availability for all Binary IDs ({self.mode} mode)...")
+        
+        # S3 keys for every row (period → underscore), computed column-wise
+        has_id = df['binary_id'].notna()
+        s3_keys = self.s3_prefix + df['binary_id'].astype(str).str.replace('.', '_', regex=False)
+        s3_keys = s3_keys.where(has_id, None)
+        unique_keys = set(s3_keys[has_id])
+        
+        if self.mode == 'list':
+            existing = self.list_existing_keys(unique_keys)
+        else:
+            existing = self.head_existing_keys(unique_keys)
+        
+        # Vectorized set-membership join
+        available = s3_keys.isin(existing)
+        df['s3_available'] = available.map({True: 'Yes', False: 'No'})
+        df['s3_bucket'] = pd.Series(self.s3_bucket, index=df.index).where(available, None)
+        df['s3_key'] = s3_keys
+        
+        checked = int(has_id.sum())
+        n_available = int(available.sum())
+        logger.info("\n✅ S3 Availability Check Complete!")
+        logger.info(f"  Total records checked: {checked}")
+        if checked:
+            logger.info(f"  Available in S3: {n_available} ({n_available/checked*100:.1f}%)")
+            logger.info(f"  Not available in S3: {checked - n_available} ({(checked-n_available)/checked*100:.1f}%)")
+        
+        return df
+    
+    def list_existing_keys(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Find which keys exist by listing the Binary prefix.
+        
+        One list_objects_v2 pagination per leading character of the wanted IDs,
+        run concurrently, so only the part of the prefix that can match is listed.
+        
+        Args:
+            keys: Full S3 keys to look for
+            
+        Returns:
+            Subset of keys that exist
+        """
+        keys = set(keys)
+        sub_prefixes = sorted({key[:len(self.s3_prefix) + 1] for key in keys})
+        logger.info(f"  Listing {len(sub_prefixes)} sub-prefixes of s3://{self.s3_bucket}/{self.s3_prefix}...")
+        
+        def list_prefix(prefix: str) -> Set[str]:
+            found = set()
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=prefix):
+                found.update(obj['Key'] for obj in page.get('Contents', []))
+            return found
+        
+        listed = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for found in pool.map(list_prefix, sub_prefixes):
+                listed |= found
+        
+        logger.info(f"  Listed {len(listed):,} objects")
+        return keys & listed
+    
+    def head_existing_keys(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Find which keys exist with bounded concurrent head_object calls.
+        
+        Results are appended to the progress file as they complete, and keys
+        already recorded there are not checked again.
+        
+        Args:
+            keys: Full S3 keys to look for
+            
+        Returns:
+            Subset of keys that exist
+        """
+        done = self.load_progress()
+        existing = {key for key, exists in done.items() if exists}
+        pending = sorted(set(keys) - set(done))
+        total = len(pending) + len(set(keys) & set(done))
+        
+        if done:
+            logger.info(f"  Resuming: {total - len(pending)} keys already checked")
+        logger.info(f"  Checking {len(pending)} keys with {self.max_workers} concurrent HEAD requests...")
+        
+        unsaved = []
+        checked = total - len(pending)
+        
+        def head(key: str) -> Tuple[str, Optional[bool]]:
+            try:
+                self.s3_client.head_object(Bucket=self.s3_bucket, Key=key)
+                return key, True
+            except self.s3_client.exceptions.ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                    return key, False
+                logger.warning(f"  ⚠️  Error checking {key}: {e}")
+            except Exception as e:
+                logger.warning(f"  ⚠️  Unexpected error checking {key}: {e}")
+            return key, None  # Unknown: not recorded, so a resumed run retries it
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for key, exists in pool.map(head, pending):
+                checked += 1
+                if exists:
+                    existing.add(key)
+                if exists is not None:
+                    unsaved.append((key, exists))
+                    if len(unsaved) >= PROGRESS_FLUSH_EVERY:
+                        self.save_progress(unsaved)
+                        unsaved = []
+                
+                if checked % 1000 == 0:
+                    logger.info(f"  📊 Progress: {checked}/{total} ({checked/total*100:.1f}%) - Available: {len(existing)}")
+        
+        self.save_progress(unsaved)
+        return existing
+    
+    def load_progress(self) -> dict:
+        """Load {s3_key: exists} from the progress file (empty if none)."""
+        if not self.progress_file or not os.path.exists(self.progress_file):
+            return {}
+        progress = pd.read_csv(self.progress_file, dtype={'s3_key': str, 'exists': bool})
+        return dict(zip(progress['s3_key'], progress['exists']))
+    
+    def clear_progress(self) -> None:
+        """Remove the progress file, so a later run checks every key again."""
+        if self.progress_file and os.path.exists(self.progress_file):
+            os.remove(self.progress_file)
+    
+    def save_progress(self, results) -> None:
+        """Append (s3_key, exists) pairs to the progress file."""
+        if not self.progress_file or not results:
+            return
+        write_header = not os.path.exists(self.progress_file)
+        pd.DataFrame(results, columns=['s3_key', 'exists']).to_csv(
+            self.progress_file, mode='a', header=write_header, index=False
+        )
+    
+    def check_all_s3_availability_sequential(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Check S3 availability one Binary ID at a time (original implementation).
+        
         Args:
             df: DataFrame with binary_id column
             
@@ -324,6 +524,9 @@ class S3AvailabilityChecker:
             # Save to CSV
             self.save_to_csv(df, 'ALL_BINARY_FILES_METADATA_WITH_AVAILABILITY.csv')
             
+            # Completed: recorded results must not stand in for a later run's checks
+            self.clear_progress()
+            
             logger.info("\n✅ S3 availability check complete!")
             
             return df
@@ -335,7 +538,29 @@ class S3AvailabilityChecker:
 
 def main():
     """Main execution function."""
-    checker = S3AvailabilityChecker()
+    parser = argparse.ArgumentParser(description='Check S3 availability for Binary files')
+    parser.add_argument('--mode', choices=CHECK_MODES, default='head',
+                        help='head: concurrent HEADs, list: prefix listing, sequential: original loop')
+    parser.add_argument('--workers', type=int, default=32,
+                        help='Concurrent S3 requests (also sizes the connection pool)')
+    parser.add_argument('--progress-file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                                             'staging_files', 'check_s3_availability_progress.csv'),
+                        help='Checked keys are recorded here so an interrupted run can resume')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip keys recorded in the progress file by an interrupted run')
+    parser.add_argument('--endpoint-url', help='Custom S3 endpoint (local stand-in)')
+    args = parser.parse_args()
+    
+    if not args.resume and os.path.exists(args.progress_file):
+        os.remove(args.progress_file)
+    
+    checker = S3AvailabilityChecker(
+        mode=args.mode,
+        max_workers=args.workers,
+        progress_file=args.progress_file,
+        endpoint_url=args.endpoint_url
+    )
     df = checker.run()
     return df
 
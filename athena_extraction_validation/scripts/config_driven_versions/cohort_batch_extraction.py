@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+Cohort Batch Extraction
+
+Runs the config-driven extraction scripts for a whole cohort while scanning each
+Athena table once per batch of patients instead of once per patient.
+
+How it works:
+- Each extraction script's main() is run once per patient, unchanged, but with a
+  per-patient engine (CohortPatientEngine) instead of a real Athena connection
+- The first time a query shape is seen, the patient's SQL is rewritten from
+  `col = '<patient>'` to `col IN ('<p1>', '<p2>', ...)` with the patient key added
+  as an extra column, executed ONCE for the batch, and split by patient
+- Every other patient's identical query is answered from that split result
+
+Because the per-patient post-processing code is reused as-is, the staging CSVs
+(staging_files/patient_*/encounters.csv, medications.csv, ...) have exactly the
+same columns as a single-patient run.
+
+Queries whose patient filter cannot be rewritten safely (EXISTS, UNION, LIKE,
+GROUP BY) fall back to a normal per-patient query and are reported in the summary.
+
+Usage:
+    python3 cohort_batch_extraction.py --cohort-config ../../cohort_config.json
+    python3 cohort_batch_extraction.py --cohort-config ../../cohort_config.json \\
+        --batch-size 200 --extractors encounters medications procedures
+
+cohort_config.json:
+{
+  "database": "fhir_prd_db",
+  "aws_profile": "343218191717_AWSAdministratorAccess",
+  "s3_output": "s3://aws-athena-query-results-343218191717-us-east-1/",
+  "patients": [
+    {"fhir_id": "e4BwD8ZYDBccepXcJ.Ilo3w3", "birth_date": "2005-05-13",
+     "output_dir": "staging_files/patient_e4BwD8ZYDBccepXcJ.Ilo3w3"}
+  ]
+}
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Placeholder substituted for the patient FHIR ID to turn a patient's SQL into a template
+PATIENT_PLACEHOLDER = '{cohort_patient_id}'
+
+# Extra column carrying the patient key through the batched query
+COHORT_KEY_COLUMN = 'cohort_patient_id'
+
+# Alias of the parent-table join that supplies the key for child-table queries
+COHORT_PARENT_ALIAS = 'cohort_parent'
+
+# Extraction scripts that can run in cohort mode (name -> module in this directory)
+COHORT_EXTRACTORS = {
+    'encounters': 'extract_all_encounters_metadata',
+    'medications': 'extract_all_medications_metadata',
+    'procedures': 'extract_all_procedures_metadata',
+    'imaging': 'extract_all_imaging_metadata',
+    'measurements': 'extract_all_measurements_metadata',
+    'diagnoses': 'extract_all_diagnoses_metadata',
+    'binary_files': 'extract_all_binary_files_metadata',
+}
+
+# col = '<prefix><patient>'
+EQUALS_PATTERN = re.compile(
+    r"(?P<lhs>[\w.]+)\s*=\s*'(?P<prefix>[^']*)" + re.escape(PATIENT_PLACEHOLDER) + r"'"
+)
+
+# fk IN (SELECT pk FROM table WHERE col = '<prefix><patient>')
+IN_SUBQUERY_PATTERN = re.compile(
+    r"(?P<fk>[\w.]+)\s+IN\s*\(\s*SELECT\s+(?:DISTINCT\s+)?(?P<pk>\w+)\s+FROM\s+(?P<table>[\w.]+)"
+    r"\s+WHERE\s+(?P<col>\w+)\s*=\s*'(?P<prefix>[^']*)" + re.escape(PATIENT_PLACEHOLDER) + r"'\s*\)",
+    re.IGNORECASE
+)
+
+# '<patient>' as some_alias  (patient ID selected as a literal)
+LITERAL_COLUMN_PATTERN = re.compile(
+    r"'" + re.escape(PATIENT_PLACEHOLDER) + r"'(?=\s+as\s+\w+)", re.IGNORECASE
+)
+
+
+class CohortRewriteError(ValueError):
+    """Raised when a per-patient query cannot be rewritten into a cohort query."""
+
+
+def _depths(sql: str) -> List[int]:
+    """
+    Parenthesis depth of every character, ignoring string literals and -- comments.
+
+    String/comment characters get depth -1 so they never match as keywords.
+    """
+    depths = []
+    depth = 0
+    i = 0
+    n = len(sql)
+
+    while i < n:
+        ch = sql[i]
+        if ch == "'":
+            end = i + 1
+            while end < n:
+                if sql[end] == "'" and not (end + 1 < n and sql[end + 1] == "'"):
+                    break
+                end += 2 if sql[end] == "'" else 1
+            depths.extend([-1] * (min(end, n - 1) - i + 1))
+            i = end + 1
+            continue
+        if sql.startswith('--', i):
+            end = sql.find('\n', i)
+            end = n if end == -1 else end
+            depths.extend([-1] * (end - i))
+            i = end
+            continue
+        if ch == '(':
+            depths.append(depth)
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            depths.append(depth)
+        else:
+            depths.append(depth)
+        i += 1
+
+    return depths
+
+
+def _top_level_matches(sql: str, pattern: str) -> List[re.Match]:
+    """Keyword matches that sit at parenthesis depth 0 (outside strings/comments)."""
+    depths = _depths(sql)
+    return [
+        m for m in re.finditer(pattern, sql, re.IGNORECASE)
+        if depths[m.start()] == 0
+    ]
+
+
+def _in_list(values: List[str], prefix: str) -> str:
+    return ', '.join("'" + (prefix + v).replace("'", "''") + "'" for v in values)
+
+
+def rewrite_for_cohort(template: str, patient_ids: List[str]) -> Tuple[str, str]:
+    """
+    Rewrite a single-patient SQL template into one query for many patients.
+
+    Args:
+        template: SQL with the patient FHIR ID replaced by PATIENT_PLACEHOLDER
+        patient_ids: Patient FHIR IDs in the batch
+
+    Returns:
+        Tuple of (cohort SQL with a cohort_patient_id column, key prefix to strip
+        from cohort_patient_id values, e.g. 'Patient/')
+
+    Raises:
+        CohortRewriteError: If the patient filter has an unsupported shape
+    """
+    sql = template
+    key_expr = None
+    key_prefix = ''
+
+    # 1. Parent-table subqueries: a top-level one can supply the key through a join on the parent
+    depths = _depths(sql)
+    parent = next((m for m in IN_SUBQUERY_PATTERN.finditer(sql) if depths[m.start()] == 0), None)
+    sql = IN_SUBQUERY_PATTERN.sub(
+        lambda m: (f"{m['fk']} IN (SELECT {m['pk']} FROM {m['table']} "
+                   f"WHERE {m['col']} IN ({_in_list(patient_ids, m['prefix'])}))"),
+        sql
+    )
+
+    # 2. Direct predicates: a top-level one gives the key column itself
+    depths = _depths(sql)
+    for m in EQUALS_PATTERN.finditer(sql):
+        if depths[m.start()] == 0:
+            key_expr = m['lhs']
+            key_prefix = m['prefix']
+            break
+    sql = EQUALS_PATTERN.sub(
+        lambda m: f"{m['lhs']} IN ({_in_list(patient_ids, m['prefix'])})", sql
+    )
+
+    if key_expr is None and parent is not None:
+        # Joined on DISTINCT (pk, patient) rows: duplicate parent ids neither fail the query
+        # (as a scalar subquery would) nor multiply the child rows
+        wheres = _top_level_matches(sql, r'\bWHERE\b')
+        if len(wheres) != 1:
+            raise CohortRewriteError("Parent-table filter without a single top-level WHERE")
+        alias = COHORT_PARENT_ALIAS
+        join = (f"JOIN (SELECT DISTINCT {parent['pk']}, {parent['col']} FROM {parent['table']} "
+                f"WHERE {parent['col']} IN ({_in_list(patient_ids, parent['prefix'])})) {alias}\n"
+                f"            ON {alias}.{parent['pk']} = {parent['fk']}\n        ")
+        sql = sql[:wheres[0].start()] + join + sql[wheres[0].start():]
+        key_expr = f"{alias}.{parent['col']}"
+        key_prefix = parent['prefix']
+
+    if key_expr is None:
+        raise CohortRewriteError("No top-level patient filter to derive the patient key from")
+
+    # 3. Patient ID selected as a literal column becomes the key (prefix-free only)
+    if LITERAL_COLUMN_PATTERN.search(sql):
+        if key_prefix:
+            raise CohortRewriteError("Literal patient column with a prefixed patient key")
+        sql = LITERAL_COLUMN_PATTERN.sub(key_expr, sql)
+
+    if PATIENT_PLACEHOLDER in sql:
+        raise CohortRewriteError("Patient ID used outside a supported filter (e.g. LIKE/EXISTS)")
+
+    if _top_level_matches(sql, r'\b(UNION|INTERSECT|EXCEPT|LIMIT|GROUP\s+BY)\b'):
+        raise CohortRewriteError("Top-level UNION/INTERSECT/EXCEPT/LIMIT/GROUP BY cannot be batched")
+
+    selects = _top_level_matches(sql, r'\bSELECT\b(\s+DISTINCT\b)?')
+    if len(selects) != 1:
+        raise CohortRewriteError(f"Expected one top-level SELECT, found {len(selects)}")
+
+    insert_at = selects[0].end()
+    sql = f"{sql[:insert_at]}\n            {key_expr} AS {COHORT_KEY_COLUMN},{sql[insert_at:]}"
+
+    return sql, key_prefix
+
+
+def split_by_patient(df: pd.DataFrame, patient_ids: List[str], key_prefix: str = '') -> Dict[str, pd.DataFrame]:
+    """
+    Split a cohort result into one DataFrame per patient (key column dropped).
+
+    Row order within each patient is preserved, so per-query ORDER BY still holds.
+
+    Args:
+        df: Cohort query result containing COHORT_KEY_COLUMN
+        patient_ids: Patient FHIR IDs in the batch
+        key_prefix: Prefix to strip from key values (e.g. 'Patient/')
+
+    Returns:
+        Mapping of patient FHIR ID -> DataFrame (empty frames keep the columns)
+    """
+    columns = [c for c in df.columns if c != COHORT_KEY_COLUMN]
+    empty = pd.DataFrame(columns=columns, dtype=object)
+
+    if df.empty:
+        return {pid: empty.copy() for pid in patient_ids}
+
+    keys = df[COHORT_KEY_COLUMN].astype(str)
+    if key_prefix:
+        keys = keys.str.slice(len(key_prefix))
+
+    slices = {
+        pid: group[columns].reset_index(drop=True)
+        for pid, group in df.groupby(keys, sort=False)
+    }
+    return {pid: slices.get(pid, empty.copy()) for pid in patient_ids}
+
+
+class CohortQueryBatcher:
+    """
+    Execute each distinct per-patient query shape once for a batch of patients.
+
+    Results are cached per SQL template and handed out patient by patient.
+    """
+
+    def __init__(self, engine: AthenaQueryEngine, patient_ids: List[str]):
+        """
+        Initialize batcher.
+
+        Args:
+            engine: Shared AthenaQueryEngine used for the batched queries
+            patient_ids: Patient FHIR IDs in this batch
+        """
+        self.engine = engine
+        self.patient_ids = list(patient_ids)
+        self._results: Dict[Tuple[str, Optional[str]], Dict[str, pd.DataFrame]] = {}
+        self._locks: Dict[Tuple[str, Optional[str]], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+        # Counters are updated from the DAG runner's worker threads
+        self._stats_lock = threading.Lock()
+        self.batched_queries = 0
+        self.fallback_queries = 0
+        self.passthrough_queries = 0
+        self.fallback_reasons: Dict[str, str] = {}
+
+    def fetch(self, query: str, patient_id: str, database: Optional[str] = None) -> pd.DataFrame:
+        """
+        Return one patient's rows for a query, running the batched query on first use.
+
+        Args:
+            query: The SQL the per-patient script would have executed
+            patient_id: Patient FHIR ID the query was built for
+            database: Database override passed by the script
+
+        Returns:
+            Untyped DataFrame (NULL -> None), same columns as the per-patient query
+        """
+        if patient_id not in query:
+            with self._stats_lock:
+                self.passthrough_queries += 1
+            return self.engine.query(query, database=database, typed=False)
+
+        template = query.replace(patient_id, PATIENT_PLACEHOLDER)
+        cache_key = (template, database)
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(cache_key, threading.Lock())
+
+        with lock:
+            if cache_key not in self._results:
+                self._results[cache_key] = self._run_template(template, database)
+
+        slices = self._results[cache_key]
+        if slices is None:
+            with self._stats_lock:
+                self.fallback_queries += 1
+            return self.engine.query(query, database=database, typed=False)
+
+        return slices[patient_id].copy()
+
+    def _run_template(self, template: str, database: Optional[str]) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        Run a template for the whole batch; None means 'fall back to per-patient'.
+
+        A cohort query that fails (Athena error, timeout, download error) is not
+        retried for the next patient: the template falls back to per-patient queries.
+        """
+        first_line = ' '.join(template.split())[:120]
+        try:
+            cohort_sql, key_prefix = rewrite_for_cohort(template, self.patient_ids)
+        except CohortRewriteError as e:
+            with self._stats_lock:
+                self.fallback_reasons[first_line] = str(e)
+            logger.warning(f"  ⚠️  Per-patient fallback ({e}): {first_line}...")
+            return None
+
+        start = time.time()
+        try:
+            df = self.engine.query(cohort_sql, database=database, typed=False)
+        except Exception as e:
+            with self._stats_lock:
+                self.fallback_reasons[first_line] = f"cohort query failed: {e}"
+            logger.warning(f"  ⚠️  Cohort query failed, per-patient fallback ({e}): {first_line}...")
+            return None
+        with self._stats_lock:
+            self.batched_queries += 1
+        logger.info(
+            f"  ✅ Cohort query returned {len(df)} rows for {len(self.patient_ids)} patients "
+            f"in {time.time() - start:.1f}s"
+        )
+        return split_by_patient(df, self.patient_ids, key_prefix)
+
+
+class CohortPatientEngine:
+    """
+    Per-patient stand-in for AthenaQueryEngine backed by a CohortQueryBatcher.
+
+    Supports the engine.query(...) and engine.query_many(...) calls the extraction scripts make.
+    """
+
+    def __init__(self, batcher: CohortQueryBatcher, patient_id: str):
+        self.batcher = batcher
+        self.patient_id = patient_id
+        self.athena = batcher.engine.athena
+        self.database = batcher.engine.database
+
+    def query(
+        self,
+        query: str,
+        database: Optional[str] = None,
+        typed: bool = True,
+        na_value: Optional[str] = None,
+        fetch_mode: Optional[str] = None
+    ) -> pd.DataFrame:
+        """Answer a patient's query from the batched cohort result."""
+        if typed:
+            raise ValueError("Cohort batching serves untyped results; call query(..., typed=False)")
+
+        df = self.batcher.fetch(query, self.patient_id, database)
+        if na_value is not None:
+            df = df.astype(object).where(df.notna(), na_value)
+        return df
+
+    def query_many(
+        self,
+        queries: Dict[str, str],
+        database: Optional[str] = None,
+        typed: bool = True,
+        na_value: Optional[str] = None,
+        raise_on_error: bool = True,
+        fetch_mode: Optional[str] = None,
+        errors: Optional[Dict[str, Exception]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """Answer a patient's prefetch batch query by query from the batched cohort results."""
+        results = {}
+        for key, sql in queries.items():
+            try:
+                results[key] = self.query(sql, database, typed, na_value, fetch_mode)
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                logger.error(f"Query '{key}' failed: {e}")
+                if errors is not None:
+                    errors[key] = e
+                results[key] = pd.DataFrame()
+        return results
+
+
+def load_cohort_config(config_path: Path) -> List[dict]:
+    """
+    Load cohort_config.json into one patient_config dict per patient.
+
+    Top-level keys (database, aws_profile, s3_output, ...) are shared defaults;
+    each patient entry overrides them.
+
+    Args:
+        config_path: Path to cohort_config.json
+
+    Returns:
+        List of per-patient config dicts in the patient_config.json format
+    """
+    with open(config_path) as f:
+        cohort = json.load(f)
+
+    defaults = {k: v for k, v in cohort.items() if k != 'patients'}
+    patient_configs = []
+    for patient in cohort['patients']:
+        config = dict(defaults)
+        config.update(patient)
+        config.setdefault('output_dir', f"staging_files/patient_{config['fhir_id']}")
+        patient_configs.append(config)
+
+    return patient_configs
+
+
+def run_cohort(
+    patient_configs: List[dict],
+    extractors: List[str],
+    batch_size: int = 100,
+    engine: Optional[AthenaQueryEngine] = None
+) -> Dict[str, dict]:
+    """
+    Run extraction scripts for every patient, batching Athena scans.
+
+    Args:
+        patient_configs: Per-patient configs (see load_cohort_config)
+        extractors: Names from COHORT_EXTRACTORS to run
+        batch_size: Patients per batched query
+        engine: Shared engine (created from the first patient config if omitted)
+
+    Returns:
+        Summary dict per extractor
+    """
+    if engine is None:
+        engine = AthenaQueryEngine.from_patient_config(patient_configs[0])
+
+    summary = {}
+    for name in extractors:
+        module = importlib.import_module(COHORT_EXTRACTORS[name])
+        stats = {'patients': 0, 'failed': [], 'batched_queries': 0,
+                 'fallback_queries': 0, 'fallback_reasons': {}}
+        start = time.time()
+
+        for offset in range(0, len(patient_configs), batch_size):
+            batch = patient_configs[offset:offset + batch_size]
+            batcher = CohortQueryBatcher(engine, [c['fhir_id'] for c in batch])
+
+            logger.info(f"\n{'='*80}")
+            logger.info(f"🧬 {name.upper()}: patients {offset + 1}-{offset + len(batch)} of {len(patient_configs)}")
+            logger.info(f"{'='*80}")
+
+            for config in batch:
+                try:
+                    result = module.main(config=config, engine=CohortPatientEngine(batcher, config['fhir_id']))
+                    if isinstance(result, int) and result != 0:
+                        stats['failed'].append(config['fhir_id'])
+                except Exception as e:
+                    logger.error(f"  ❌ {name} failed for {config['fhir_id']}: {e}")
+                    stats['failed'].append(config['fhir_id'])
+                stats['patients'] += 1
+
+            stats['batched_queries'] += batcher.batched_queries
+            stats['fallback_queries'] += batcher.fallback_queries
+            stats['fallback_reasons'].update(batcher.fallback_reasons)
+
+        stats['duration_seconds'] = round(time.time() - start, 1)
+        summary[name] = stats
+
+    return summary
+
+
+def main():
+    """Main execution"""
+    parser = argparse.ArgumentParser(description='Batched cohort extraction (one table scan per batch)')
+    parser.add_argument('--cohort-config', type=Path,
+                        default=Path(__file__).parent.parent.parent / 'cohort_config.json',
+                        help='Cohort config JSON (shared settings + patients list)')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='Patients per batched Athena query')
+    parser.add_argument('--extractors', nargs='+', choices=sorted(COHORT_EXTRACTORS),
+                        default=list(COHORT_EXTRACTORS),
+                        help='Extraction scripts to run')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore the Athena result cache even if the config enables it')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Re-run every query and overwrite its cached result')
+    args = parser.parse_args()
+
+    start_time = datetime.now()
+    patient_configs = load_cohort_config(args.cohort_config)
+
+    logger.info("=" * 80)
+    logger.info("COHORT BATCH EXTRACTION")
+    logger.info("=" * 80)
+    logger.info(f"Patients: {len(patient_configs)}")
+    logger.info(f"Batch size: {args.batch_size}")
+    logger.info(f"Extractors: {', '.join(args.extractors)}")
+
+    cache_options = {'refresh': args.refresh}
+    if args.no_cache:
+        cache_options['enabled'] = False
+    engine = AthenaQueryEngine.from_patient_config(
+        patient_configs[0], cache=QueryResultCache.from_config(patient_configs[0], **cache_options)
+    )
+    summary = run_cohort(patient_configs, args.extractors, args.batch_size, engine=engine)
+
+    logger.info(f"\n{'='*80}")
+    logger.info("COHORT EXTRACTION SUMMARY")
+    logger.info(f"{'='*80}")
+    for name, stats in summary.items():
+        logger.info(
+            f"  {name:<15} {stats['patients']} patients, {stats['batched_queries']} batched queries, "
+            f"{stats['fallback_queries']} per-patient fallbacks, {len(stats['failed'])} failed "
+            f"({stats['duration_seconds']}s)"
+        )
+        for query, reason in stats['fallback_reasons'].items():
+            logger.info(f"      fallback: {reason} — {query[:80]}...")
+
+    if engine.cache is not None:
+        logger.info(f"  {engine.cache.summary()}")
+
+    duration = (datetime.now() - start_time).total_seconds()
+    logger.info(f"\nTotal execution time: {duration:.1f} seconds")
+
+    return 1 if any(stats['failed'] for stats in summary.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
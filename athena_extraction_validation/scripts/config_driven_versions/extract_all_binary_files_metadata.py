@@ -20,6 +20,7 @@ Date: 2025-01-09
 import os
 import sys
 import json
+import time
 import boto3
 import pandas as pd
 import logging
@@ -27,14 +28,15 @@ from pathlib import Path
 from datetime import datetime, timezone
 from typing import Optional
 
-# Configure logging
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
+# Configure logging (the extract_binary_files.log file handler is added when run as a script)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('extract_binary_files.log'),
-        logging.StreamHandler()
-    ]
+    format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
@@ -42,7 +44,7 @@ logger = logging.getLogger(__name__)
 class BinaryFilesExtractor:
     """Extract binary files metadata from FHIR database."""
     
-    def __init__(self, patient_config: dict):
+    def __init__(self, patient_config: dict, engine: Optional[AthenaQueryEngine] = None):
         """Initialize extractor with patient info and AWS clients."""
         # Load patient details from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -62,14 +64,25 @@ class BinaryFilesExtractor:
         # Get AWS profile from config (if provided)
         self.aws_profile = patient_config.get('aws_profile')
         
-        # Initialize AWS clients with profile
-        session_kwargs = {'region_name': 'us-east-1'}
-        if self.aws_profile:
-            session_kwargs['profile_name'] = self.aws_profile
-        session = boto3.Session(**session_kwargs)
-        
-        self.athena_client = session.client('athena')
-        self.s3_client = session.client('s3')
+        # Initialize AWS clients with profile (unless a shared engine is supplied)
+        if engine is None:
+            session_kwargs = {'region_name': 'us-east-1'}
+            if self.aws_profile:
+                session_kwargs['profile_name'] = self.aws_profile
+            session = boto3.Session(**session_kwargs)
+            
+            engine = AthenaQueryEngine(
+                session.client('athena'),
+                database=self.database,
+                output_location=f's3://{self.output_bucket}/athena-results/',
+                work_group=self.work_group,
+                s3_client=session.client('s3'),
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena_client = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
         
         logger.info("=" * 100)
         logger.info("📄 BINARY FILES METADATA EXTRACTOR")
@@ -96,86 +109,22 @@ class BinaryFilesExtractor:
         logger.info("  Starting query execution...")
         
         try:
-            # Start query execution
-            response = self.athena_client.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={
-                    'OutputLocation': f's3://{self.output_bucket}/athena-results/'
-                },
-                WorkGroup=self.work_group
-            )
-            
-            query_execution_id = response['QueryExecutionId']
+            start = time.time()
             
-            # Wait for query to complete
-            while True:
-                response = self.athena_client.get_query_execution(
-                    QueryExecutionId=query_execution_id
-                )
-                status = response['QueryExecution']['Status']['State']
-                
-                if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                    break
-            
-            if status != 'SUCCEEDED':
-                error_msg = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
-                logger.error(f"  ❌ Query failed: {error_msg}")
-                return pd.DataFrame()
+            # Results are paged with NextToken inside the engine
+            df = self.engine.query(query, database=self.database, typed=False)
             
-            # Get results with pagination (MaxResults max is 1000)
-            all_rows = []
-            columns = None
-            next_token = None
-            page = 1
-            
-            while True:
-                if next_token:
-                    results = self.athena_client.get_query_results(
-                        QueryExecutionId=query_execution_id,
-                        MaxResults=1000,
-                        NextToken=next_token
-                    )
-                else:
-                    results = self.athena_client.get_query_results(
-                        QueryExecutionId=query_execution_id,
-                        MaxResults=1000
-                    )
-                
-                # Extract column names from first page
-                if page == 1:
-                    columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-                    all_rows.extend(results['ResultSet']['Rows'][1:])  # Skip header
-                else:
-                    all_rows.extend(results['ResultSet']['Rows'])
-                
-                # Check if there are more results
-                next_token = results.get('NextToken')
-                if not next_token:
-                    break
-                
-                page += 1
-                if page % 5 == 0:
-                    logger.info(f"  📄 Retrieved {len(all_rows)} rows so far (page {page})...")
-            
-            # Parse results into DataFrame
-            if len(all_rows) == 0:
+            if df.empty:
                 logger.warning("  ⚠️  No data returned")
                 return pd.DataFrame()
             
-            # Extract data rows
-            data = []
-            for row in all_rows:
-                data.append([col.get('VarCharValue', None) for col in row['Data']])
-            
-            df = pd.DataFrame(data, columns=columns)
-            
-            logger.info(f"  ✅ Returned {len(df)} rows in {response['QueryExecution']['Statistics']['TotalExecutionTimeInMillis']/1000:.1f} seconds")
+            logger.info(f"  ✅ Returned {len(df)} rows in {time.time() - start:.1f} seconds")
             
             return df
             
         except Exception as e:
             logger.error(f"  ❌ Query execution failed: {str(e)}")
+            self.failed_queries.append(description)
             return pd.DataFrame()
     
     def extract_binary_files_metadata(self) -> pd.DataFrame:
@@ -431,6 +380,10 @@ class BinaryFilesExtractor:
             # Extract binary files metadata
             df = self.extract_binary_files_metadata()
             
+            if self.failed_queries:
+                logger.error(f"❌ Query failed: {', '.join(self.failed_queries)}")
+                return df
+            
             if df.empty:
                 logger.error("❌ No binary files metadata found")
                 return df
@@ -456,21 +409,25 @@ class BinaryFilesExtractor:
             raise
 
 
-def main():
-    """Main execution function."""
+def main(config: dict = None, engine: Optional[AthenaQueryEngine] = None):
+    """Main execution function (config/engine are supplied when run from cohort_batch_extraction)."""
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
-    extractor = BinaryFilesExtractor(patient_config=config)
+    extractor = BinaryFilesExtractor(patient_config=config, engine=engine)
     
     # Ensure output directory exists
     extractor.output_dir.mkdir(parents=True, exist_ok=True)
     
-    df = extractor.run()
-    return df
+    extractor.run()
+    return 1 if extractor.failed_queries else 0
 
 
 if __name__ == '__main__':
-    main()
+    file_handler = logging.FileHandler('extract_binary_files.log')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(file_handler)
+    sys.exit(main())
@@ -29,6 +29,11 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -37,7 +42,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class DiagnosesExtractor:
-    def __init__(self, patient_config: dict):
+    def __init__(self, patient_config: dict, engine: AthenaQueryEngine = None):
         """Initialize AWS Athena connection"""
         # Load from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -51,8 +56,19 @@ class DiagnosesExtractor:
             self.birth_date = None
         
         aws_profile = patient_config['aws_profile']
-        self.session = boto3.Session(profile_name=aws_profile)
-        self.athena = self.session.client('athena', region_name='us-east-1')
+        if engine is None:
+            self.session = boto3.Session(profile_name=aws_profile)
+            engine = AthenaQueryEngine(
+                self.session.client('athena', region_name='us-east-1'),
+                database=self.database,
+                output_location=self.s3_output,
+                aws_profile=aws_profile,
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
         
         logger.info("="*80)
         logger.info("🏥 DIAGNOSES METADATA EXTRACTOR")
@@ -72,45 +88,7 @@ class DiagnosesExtractor:
         start_time = time.time()
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.s3_output}
-            )
-            
-            query_id = response['QueryExecutionId']
-            
-            # Wait for query completion
-            while True:
-                status_response = self.athena.get_query_execution(QueryExecutionId=query_id)
-                status = status_response['QueryExecution']['Status']['State']
-                
-                if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                    break
-                time.sleep(0.5)
-            
-            if status != 'SUCCEEDED':
-                error_msg = status_response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
-                logger.error(f"  ❌ Query failed: {error_msg}")
-                return pd.DataFrame()
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            
-            # Parse results
-            if not results['ResultSet']['Rows']:
-                logger.info(f"  ⚠️  No results returned")
-                return pd.DataFrame()
-            
-            # Extract column names
-            columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-            
-            # Extract data rows
-            data = []
-            for row in results['ResultSet']['Rows'][1:]:
-                data.append([col.get('VarCharValue', '') for col in row['Data']])
-            
-            df = pd.DataFrame(data, columns=columns)
+            df = self.engine.query(query, typed=False, na_value='')
             
             duration = time.time() - start_time
             logger.info(f"  ✅ Returned {len(df)} rows in {duration:.1f} seconds")
@@ -119,6 +97,7 @@ class DiagnosesExtractor:
             
         except Exception as e:
             logger.error(f"  ❌ Query execution error: {str(e)}")
+            self.failed_queries.append(description)
             return pd.DataFrame()
     
     def extract_diagnoses(self):
@@ -273,20 +252,21 @@ class DiagnosesExtractor:
         logger.info(f"{'='*80}\n")
 
 
-def main():
-    """Main execution"""
+def main(config: dict = None, engine: AthenaQueryEngine = None):
+    """Main execution (config/engine are supplied when run from cohort_batch_extraction)"""
     start_time = datetime.now()
     
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
     logger.info("Starting diagnoses metadata extraction...")
     logger.info(f"Start time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
     
     # Initialize extractor
-    extractor = DiagnosesExtractor(patient_config=config)
+    extractor = DiagnosesExtractor(patient_config=config, engine=engine)
     
     # Ensure output directory exists
     extractor.output_dir.mkdir(parents=True, exist_ok=True)
@@ -294,6 +274,11 @@ def main():
     # Extract diagnoses
     diagnoses_df = extractor.extract_diagnoses()
     
+    # A failed query would look like missing data: report failure instead of writing partial output
+    if extractor.failed_queries:
+        logger.error(f"{len(extractor.failed_queries)} queries failed: {', '.join(extractor.failed_queries)}")
+        return 1
+    
     if diagnoses_df.empty:
         logger.error("No diagnoses found! Exiting.")
         return 1
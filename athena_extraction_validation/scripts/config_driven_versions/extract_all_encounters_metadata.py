@@ -6,18 +6,35 @@ Purpose: Comprehensive data dump for analysis before implementing filtering logi
 
 import boto3
 import pandas as pd
-import time
 import json
+import sys
 from datetime import datetime
 from pathlib import Path
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine, QueryBatch
+from athena_result_cache import QueryResultCache
+
 class AllEncountersExtractor:
-    def __init__(self, aws_profile: str, database: str, patient_config: dict):
+    def __init__(self, aws_profile: str, database: str, patient_config: dict, engine: AthenaQueryEngine = None):
         """Initialize AWS Athena connection"""
-        self.session = boto3.Session(profile_name=aws_profile)
-        self.athena = self.session.client('athena', region_name='us-east-1')
         self.database = database
         self.s3_output = 's3://aws-athena-query-results-343218191717-us-east-1/'
+        if engine is None:
+            self.session = boto3.Session(profile_name=aws_profile)
+            engine = AthenaQueryEngine(
+                self.session.client('athena', region_name='us-east-1'),
+                database=self.database,
+                output_location=self.s3_output,
+                aws_profile=aws_profile,
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
+        self.prefetched = None  # QueryBatch filled by prefetch()
         
         # Load patient details from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -44,50 +61,32 @@ class AllEncountersExtractor:
         print(f"🔍 {description}...", end=' ', flush=True)
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.s3_output}
-            )
-            
-            query_id = response['QueryExecutionId']
-            
-            # Wait for query completion
-            for _ in range(60):  # Increased timeout
-                status = self.athena.get_query_execution(QueryExecutionId=query_id)
-                state = status['QueryExecution']['Status']['State']
-                
-                if state == 'SUCCEEDED':
-                    break
-                elif state in ['FAILED', 'CANCELLED']:
-                    reason = status['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                    print(f"✗ Query {state}: {reason}")
-                    return []
-                
-                time.sleep(2)
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            
-            # Parse results
-            data_rows = []
-            if len(results['ResultSet']['Rows']) > 1:
-                columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-                
-                for row in results['ResultSet']['Rows'][1:]:
-                    row_data = {}
-                    for i, col in enumerate(columns):
-                        value = row['Data'][i].get('VarCharValue', '') if i < len(row['Data']) else ''
-                        row_data[col] = value
-                    data_rows.append(row_data)
+            df = self.prefetched.take(query) if self.prefetched is not None else None
+            if df is None:
+                df = self.engine.query(query, typed=False, na_value='')
+            data_rows = df.to_dict('records')
             
             print(f"✓ ({len(data_rows)} rows)")
             return data_rows
             
         except Exception as e:
             print(f"✗ Error: {str(e)}")
+            self.failed_queries.append(description)
             return []
     
+    def prefetch(self) -> None:
+        """Run the extractor's independent queries concurrently; execute_query() then reads their results"""
+        self.prefetched = QueryBatch(self.engine, {
+            'main_encounters': self.main_encounters_query(),
+            'encounter_types': self.encounter_types_query(),
+            'encounter_reasons': self.encounter_reasons_query(),
+            'encounter_diagnoses': self.encounter_diagnoses_query(),
+            'encounter_appointments': self.encounter_appointments_query(),
+            'appointments': self.appointments_query(),
+            'encounter_service_types': self.encounter_service_types_query(),
+            'encounter_locations': self.encounter_locations_query(),
+        }, typed=False, na_value='')
+    
     def calculate_age_days(self, date_str: str) -> int:
         """Calculate age in days from date string (only if birth_date provided)"""
         if not date_str or not self.birth_date:
@@ -98,13 +97,9 @@ class AllEncountersExtractor:
         except:
             return None
     
-    def extract_main_encounters(self) -> pd.DataFrame:
-        """Extract all encounters from main encounter table"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING MAIN ENCOUNTERS TABLE")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def main_encounters_query(self) -> str:
+        """SQL for extract_main_encounters()"""
+        return f"""
         SELECT 
             e.id as encounter_fhir_id,
             e.status,
@@ -122,6 +117,14 @@ class AllEncountersExtractor:
         WHERE e.subject_reference = '{self.patient_fhir_id}'
         ORDER BY e.period_start
         """
+    
+    def extract_main_encounters(self) -> pd.DataFrame:
+        """Extract all encounters from main encounter table"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING MAIN ENCOUNTERS TABLE")
+        print(f"{'='*80}\n")
+        
+        query = self.main_encounters_query()
         
         encounters = self.execute_query(query, "Query main encounters table")
         
@@ -153,13 +156,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_types(self) -> pd.DataFrame:
-        """Extract encounter types from subtable"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER TYPES")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_types_query(self) -> str:
+        """SQL for extract_encounter_types()"""
+        return f"""
         SELECT 
             et.encounter_id,
             et.type_coding,
@@ -171,6 +170,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_types(self) -> pd.DataFrame:
+        """Extract encounter types from subtable"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER TYPES")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_types_query()
         
         types = self.execute_query(query, "Query encounter_type subtable")
         
@@ -185,13 +192,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_reasons(self) -> pd.DataFrame:
-        """Extract encounter reason codes"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER REASON CODES")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_reasons_query(self) -> str:
+        """SQL for extract_encounter_reasons()"""
+        return f"""
         SELECT 
             erc.encounter_id,
             erc.reason_code_coding,
@@ -203,6 +206,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_reasons(self) -> pd.DataFrame:
+        """Extract encounter reason codes"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER REASON CODES")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_reasons_query()
         
         reasons = self.execute_query(query, "Query encounter_reason_code subtable")
         
@@ -217,13 +228,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_diagnoses(self) -> pd.DataFrame:
-        """Extract encounter diagnosis linkages"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER DIAGNOSES")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_diagnoses_query(self) -> str:
+        """SQL for extract_encounter_diagnoses()"""
+        return f"""
         SELECT 
             ed.encounter_id,
             ed.diagnosis_condition_reference,
@@ -237,6 +244,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_diagnoses(self) -> pd.DataFrame:
+        """Extract encounter diagnosis linkages"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER DIAGNOSES")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_diagnoses_query()
         
         diagnoses = self.execute_query(query, "Query encounter_diagnosis subtable")
         
@@ -251,13 +266,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_appointments(self) -> pd.DataFrame:
-        """Extract encounter-appointment linkages"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER-APPOINTMENT LINKS")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_appointments_query(self) -> str:
+        """SQL for extract_encounter_appointments()"""
+        return f"""
         SELECT 
             ea.encounter_id,
             ea.appointment_reference
@@ -268,6 +279,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_appointments(self) -> pd.DataFrame:
+        """Extract encounter-appointment linkages"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER-APPOINTMENT LINKS")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_appointments_query()
         
         appts = self.execute_query(query, "Query encounter_appointment subtable")
         
@@ -279,6 +298,18 @@ class AllEncountersExtractor:
         
         return df
     
+    def appointments_query(self) -> str:
+        """SQL for extract_appointments()"""
+        return f"""
+        SELECT DISTINCT a.*, ap.participant_actor_reference, ap.participant_actor_type, 
+               ap.participant_required, ap.participant_status, 
+               ap.participant_period_start, ap.participant_period_end
+        FROM {self.database}.appointment a
+        JOIN {self.database}.appointment_participant ap ON a.id = ap.appointment_id
+        WHERE ap.participant_actor_reference = 'Patient/{self.patient_fhir_id}'
+        ORDER BY a.start
+        """
+    
     def extract_appointments(self) -> pd.DataFrame:
         """Extract all appointments via appointment_participant pathway
         
@@ -294,15 +325,7 @@ class AllEncountersExtractor:
         # NOTE: Athena does NOT support column aliasing with JOINs in this context
         # Must use SELECT a.*, ap.* and rename columns in pandas for table prefixes
         # Data uses 'Patient/{fhir_id}' format in participant_actor_reference
-        query = f"""
-        SELECT DISTINCT a.*, ap.participant_actor_reference, ap.participant_actor_type, 
-               ap.participant_required, ap.participant_status, 
-               ap.participant_period_start, ap.participant_period_end
-        FROM {self.database}.appointment a
-        JOIN {self.database}.appointment_participant ap ON a.id = ap.appointment_id
-        WHERE ap.participant_actor_reference = 'Patient/{self.patient_fhir_id}'
-        ORDER BY a.start
-        """
+        query = self.appointments_query()
         
         appointments = self.execute_query(query, "Query appointment table via appointment_participant")
         
@@ -366,13 +389,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_service_types(self) -> pd.DataFrame:
-        """Extract encounter service type coding details"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER SERVICE TYPE CODING")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_service_types_query(self) -> str:
+        """SQL for extract_encounter_service_types()"""
+        return f"""
         SELECT 
             estc.encounter_id,
             estc.service_type_coding_system,
@@ -385,6 +404,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_service_types(self) -> pd.DataFrame:
+        """Extract encounter service type coding details"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER SERVICE TYPE CODING")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_service_types_query()
         
         service_types = self.execute_query(query, "Query encounter_service_type_coding subtable")
         
@@ -399,13 +426,9 @@ class AllEncountersExtractor:
         
         return df
     
-    def extract_encounter_locations(self) -> pd.DataFrame:
-        """Extract encounter location details"""
-        print(f"\n{'='*80}")
-        print("📋 EXTRACTING ENCOUNTER LOCATIONS")
-        print(f"{'='*80}\n")
-        
-        query = f"""
+    def encounter_locations_query(self) -> str:
+        """SQL for extract_encounter_locations()"""
+        return f"""
         SELECT 
             el.encounter_id,
             el.location_location_reference,
@@ -417,6 +440,14 @@ class AllEncountersExtractor:
             WHERE subject_reference = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_encounter_locations(self) -> pd.DataFrame:
+        """Extract encounter location details"""
+        print(f"\n{'='*80}")
+        print("📋 EXTRACTING ENCOUNTER LOCATIONS")
+        print(f"{'='*80}\n")
+        
+        query = self.encounter_locations_query()
         
         locations = self.execute_query(query, "Query encounter_location subtable")
         
@@ -535,22 +566,27 @@ class AllEncountersExtractor:
         
         return merged, appointments_df
 
-def main():
-    """Main execution"""
+def main(config: dict = None, engine: AthenaQueryEngine = None):
+    """Main execution (config/engine are supplied when run from cohort_batch_extraction)"""
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
     extractor = AllEncountersExtractor(
         aws_profile=config['aws_profile'],
         database=config['database'],
-        patient_config=config
+        patient_config=config,
+        engine=engine
     )
     
     # Ensure output directory exists
     extractor.output_dir.mkdir(parents=True, exist_ok=True)
     
+    # Run every query up front, concurrently; the steps below read their results
+    extractor.prefetch()
+    
     # Extract all data
     encounters_df = extractor.extract_main_encounters()
     types_df = extractor.extract_encounter_types()
@@ -561,6 +597,11 @@ def main():
     service_types_df = extractor.extract_encounter_service_types()
     locations_df = extractor.extract_encounter_locations()
     
+    # A failed query would leave its columns empty: report failure instead of writing partial output
+    if extractor.failed_queries:
+        print(f"\n❌ {len(extractor.failed_queries)} queries failed: {', '.join(extractor.failed_queries)}")
+        return 1
+    
     # Merge and export
     if not encounters_df.empty:
         merged, appts = extractor.merge_and_export(
@@ -577,6 +618,8 @@ def main():
         print(f"{'='*80}\n")
     else:
         print("\n❌ No encounters found!")
+    
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
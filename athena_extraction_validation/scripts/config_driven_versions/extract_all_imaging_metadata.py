@@ -26,7 +26,11 @@ import logging
 import json
 from datetime import datetime
 from pathlib import Path
-from pathlib import Path
+
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine, QueryBatch
+from athena_result_cache import QueryResultCache
 
 # Configure logging
 logging.basicConfig(
@@ -36,7 +40,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class ImagingExtractor:
-    def __init__(self, patient_config: dict):
+    def __init__(self, patient_config: dict, engine: AthenaQueryEngine = None):
         """Initialize AWS Athena connection from patient configuration"""
         # Load from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -50,8 +54,20 @@ class ImagingExtractor:
             self.birth_date = None
         
         aws_profile = patient_config['aws_profile']
-        self.session = boto3.Session(profile_name=aws_profile)
-        self.athena = self.session.client('athena', region_name='us-east-1')
+        if engine is None:
+            self.session = boto3.Session(profile_name=aws_profile)
+            engine = AthenaQueryEngine(
+                self.session.client('athena', region_name='us-east-1'),
+                database=self.database,
+                output_location=self.s3_output,
+                aws_profile=aws_profile,
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
+        self.prefetched = None  # QueryBatch filled by prefetch()
         
         logger.info("="*80)
         logger.info("📊 IMAGING STUDIES METADATA EXTRACTOR")
@@ -66,50 +82,14 @@ class ImagingExtractor:
     def execute_query(self, query: str, description: str) -> pd.DataFrame:
         """Execute Athena query and return results as DataFrame"""
         logger.info(f"\n📋 {description}")
-        logger.info(f"  Starting query execution...")
+        logger.info("  Starting query execution...")
         
         start_time = time.time()
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.s3_output}
-            )
-            
-            query_id = response['QueryExecutionId']
-            
-            # Wait for query completion
-            while True:
-                status_response = self.athena.get_query_execution(QueryExecutionId=query_id)
-                status = status_response['QueryExecution']['Status']['State']
-                
-                if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                    break
-                time.sleep(0.5)
-            
-            if status != 'SUCCEEDED':
-                error_msg = status_response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
-                logger.error(f"  ❌ Query failed: {error_msg}")
-                return pd.DataFrame()
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            
-            # Parse results
-            if not results['ResultSet']['Rows']:
-                logger.info(f"  ⚠️  No results returned")
-                return pd.DataFrame()
-            
-            # Extract column names
-            columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-            
-            # Extract data rows
-            data = []
-            for row in results['ResultSet']['Rows'][1:]:
-                data.append([col.get('VarCharValue', '') for col in row['Data']])
-            
-            df = pd.DataFrame(data, columns=columns)
+            df = self.prefetched.take(query) if self.prefetched is not None else None
+            if df is None:
+                df = self.engine.query(query, typed=False, na_value='')
             
             duration = time.time() - start_time
             logger.info(f"  ✅ Returned {len(df)} rows in {duration:.1f} seconds")
@@ -118,16 +98,31 @@ class ImagingExtractor:
             
         except Exception as e:
             logger.error(f"  ❌ Query execution error: {str(e)}")
+            self.failed_queries.append(description)
             return pd.DataFrame()
     
+    def prefetch(self) -> None:
+        """Run the extractor's independent queries concurrently; execute_query() then reads their results"""
+        self.prefetched = QueryBatch(self.engine, {
+            'show_tables': self.show_tables_query(),
+            'mri_imaging': self.mri_imaging_query(),
+            'mri_results': self.mri_results_query(),
+            'other_imaging': self.other_imaging_query(),
+            'diagnostic_reports': self.diagnostic_reports_query(),
+        }, typed=False, na_value='')
+    
+    def show_tables_query(self) -> str:
+        """SQL for discover_imaging_tables()"""
+        return f"""
+        SHOW TABLES IN {self.database}
+        """
+    
     def discover_imaging_tables(self):
         """Discover all imaging-related tables in the database"""
         logger.info("\n🔍 STEP 1: Discovering Imaging Tables")
         logger.info("-" * 80)
         
-        query = f"""
-        SHOW TABLES IN {self.database}
-        """
+        query = self.show_tables_query()
         
         df = self.execute_query(query, "Listing all tables")
         
@@ -145,6 +140,22 @@ class ImagingExtractor:
         
         return imaging_tables
     
+    def mri_imaging_query(self) -> str:
+        """SQL for extract_mri_imaging()"""
+        return f"""
+        SELECT 
+            patient_id,
+            '{self.patient_fhir_id}' as patient_mrn,
+            imaging_procedure_id,
+            result_datetime as imaging_date,
+            imaging_procedure,
+            result_diagnostic_report_id,
+            'MRI' as imaging_modality
+        FROM radiology_imaging_mri
+        WHERE patient_id = '{self.patient_fhir_id}'
+        ORDER BY result_datetime DESC
+        """
+    
     def extract_mri_imaging(self):
         """
         Extract MRI imaging from radiology_imaging_mri table
@@ -158,23 +169,23 @@ class ImagingExtractor:
         logger.info("-" * 80)
         
         # Use patient_id (FHIR ID) as documented in implementation guide
-        query = f"""
-        SELECT 
-            patient_id,
-            '{self.patient_fhir_id}' as patient_mrn,
-            imaging_procedure_id,
-            result_datetime as imaging_date,
-            imaging_procedure,
-            result_diagnostic_report_id,
-            'MRI' as imaging_modality
-        FROM radiology_imaging_mri
-        WHERE patient_id = '{self.patient_fhir_id}'
-        ORDER BY result_datetime DESC
-        """
+        query = self.mri_imaging_query()
         
         df = self.execute_query(query, "Querying radiology_imaging_mri table")
         return df
     
+    def mri_results_query(self) -> str:
+        """SQL for extract_mri_results()"""
+        return f"""
+        SELECT DISTINCT
+            results.imaging_procedure_id,
+            results.result_information,
+            results.result_display
+        FROM radiology_imaging_mri_results results
+        JOIN radiology_imaging_mri mri ON mri.imaging_procedure_id = results.imaging_procedure_id
+        WHERE mri.patient_id = '{self.patient_fhir_id}'
+        """
+    
     def extract_mri_results(self):
         """
         Extract MRI results/narratives from radiology_imaging_mri_results table
@@ -188,37 +199,15 @@ class ImagingExtractor:
         logger.info("\n📊 STEP 3: Extracting MRI Results/Narratives")
         logger.info("-" * 80)
         
-        # Simplified query - get all results, will JOIN in Python to avoid SQL complexity
-        query = f"""
-        SELECT DISTINCT
-            results.imaging_procedure_id,
-            results.result_information,
-            results.result_display
-        FROM radiology_imaging_mri_results results
-        WHERE EXISTS (
-            SELECT 1
-            FROM radiology_imaging_mri mri
-            WHERE mri.imaging_procedure_id = results.imaging_procedure_id
-            AND mri.patient_id = '{self.patient_fhir_id}'
-        )
-        """
+        # Joined to the patient's MRI rows: a top-level patient_id filter cohort batching can rewrite
+        query = self.mri_results_query()
         
         df = self.execute_query(query, "Querying radiology_imaging_mri_results table")
         return df
     
-    def extract_other_imaging(self):
-        """
-        Extract non-MRI imaging from radiology_imaging table
-        
-        Per IMAGING_CLINICAL_RELATED_IMPLEMENTATION_GUIDE.md:
-        - Table: radiology_imaging (other modalities - CT, X-ray, ultrasound)
-        - Same structure as radiology_imaging_mri
-        - Use patient_id for filtering
-        """
-        logger.info("\n📊 STEP 4: Extracting Other Imaging (CT, X-ray, etc.)")
-        logger.info("-" * 80)
-        
-        query = f"""
+    def other_imaging_query(self) -> str:
+        """SQL for extract_other_imaging()"""
+        return f"""
         SELECT 
             patient_id,
             '{self.patient_fhir_id}' as patient_mrn,
@@ -231,16 +220,27 @@ class ImagingExtractor:
         WHERE patient_id = '{self.patient_fhir_id}'
         ORDER BY result_datetime DESC
         """
+    
+    def extract_other_imaging(self):
+        """
+        Extract non-MRI imaging from radiology_imaging table
+        
+        Per IMAGING_CLINICAL_RELATED_IMPLEMENTATION_GUIDE.md:
+        - Table: radiology_imaging (other modalities - CT, X-ray, ultrasound)
+        - Same structure as radiology_imaging_mri
+        - Use patient_id for filtering
+        """
+        logger.info("\n📊 STEP 4: Extracting Other Imaging (CT, X-ray, etc.)")
+        logger.info("-" * 80)
+        
+        query = self.other_imaging_query()
         
         df = self.execute_query(query, "Querying radiology_imaging table")
         return df
     
-    def extract_diagnostic_reports(self):
-        """Extract diagnostic reports (radiology reports) by report_id"""
-        logger.info("\n📊 STEP 5: Extracting Diagnostic Reports")
-        logger.info("-" * 80)
-        
-        query = f"""
+    def diagnostic_reports_query(self) -> str:
+        """SQL for extract_diagnostic_reports()"""
+        return f"""
         WITH report_categories AS (
             SELECT 
                 diagnostic_report_id,
@@ -261,19 +261,22 @@ class ImagingExtractor:
             dr.effective_period_stop as report_effective_period_stop,
             dr.conclusion as report_conclusion
         FROM {self.database}.diagnostic_report dr
+        JOIN (
+            SELECT patient_id, result_diagnostic_report_id FROM radiology_imaging_mri
+            UNION ALL
+            SELECT patient_id, result_diagnostic_report_id FROM radiology_imaging
+        ) imaging ON imaging.result_diagnostic_report_id = dr.id
         LEFT JOIN report_categories rc ON dr.id = rc.diagnostic_report_id
-        WHERE dr.id IN (
-            SELECT DISTINCT result_diagnostic_report_id 
-            FROM radiology_imaging_mri 
-            WHERE patient_id = '{self.patient_fhir_id}'
-            AND result_diagnostic_report_id IS NOT NULL
-            UNION
-            SELECT DISTINCT result_diagnostic_report_id 
-            FROM radiology_imaging 
-            WHERE patient_id = '{self.patient_fhir_id}'
-            AND result_diagnostic_report_id IS NOT NULL
-        )
+        WHERE imaging.patient_id = '{self.patient_fhir_id}'
         """
+    
+    def extract_diagnostic_reports(self):
+        """Extract diagnostic reports (radiology reports) by report_id"""
+        logger.info("\n📊 STEP 5: Extracting Diagnostic Reports")
+        logger.info("-" * 80)
+        
+        # Reports of either imaging table, joined so the patient_id filter stays top-level (batchable)
+        query = self.diagnostic_reports_query()
         
         df = self.execute_query(query, "Querying diagnostic_report table")
         return df
@@ -334,7 +337,7 @@ class ImagingExtractor:
             merged_df['age_at_imaging_days'] = (merged_df['imaging_date_dt'] - birth_dt).dt.days
             merged_df['age_at_imaging_years'] = merged_df['age_at_imaging_days'] / 365.25
             merged_df = merged_df.drop('imaging_date_dt', axis=1)
-            logger.info(f"  ✅ Calculated age at imaging")
+            logger.info("  ✅ Calculated age at imaging")
         except Exception as e:
             logger.warning(f"  ⚠️  Could not calculate age: {str(e)}")
         
@@ -371,7 +374,7 @@ class ImagingExtractor:
             if 'imaging_date' in df.columns:
                 imaging_dates = pd.to_datetime(df['imaging_date'], errors='coerce').dropna()
                 if len(imaging_dates) > 0:
-                    logger.info(f"\nTemporal Coverage:")
+                    logger.info("\nTemporal Coverage:")
                     logger.info(f"  First imaging: {imaging_dates.min()}")
                     logger.info(f"  Last imaging: {imaging_dates.max()}")
                     logger.info(f"  Span: {(imaging_dates.max() - imaging_dates.min()).days} days")
@@ -380,7 +383,7 @@ class ImagingExtractor:
             if 'age_at_imaging_years' in df.columns:
                 ages = df['age_at_imaging_years'].dropna()
                 if len(ages) > 0:
-                    logger.info(f"\nAge at Imaging:")
+                    logger.info("\nAge at Imaging:")
                     logger.info(f"  Min: {ages.min():.1f} years")
                     logger.info(f"  Max: {ages.max():.1f} years")
                     logger.info(f"  Mean: {ages.mean():.1f} years")
@@ -390,22 +393,26 @@ class ImagingExtractor:
         logger.info(f"{'='*80}\n")
 
 
-def main():
-    """Main execution"""
+def main(config: dict = None, engine: AthenaQueryEngine = None):
+    """Main execution (config/engine are supplied when run from cohort_batch_extraction)"""
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     start_time = datetime.now()
     
     logger.info("Starting imaging metadata extraction...")
     logger.info(f"Start time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
     
     # Initialize extractor
-    extractor = ImagingExtractor(patient_config=config)
+    extractor = ImagingExtractor(patient_config=config, engine=engine)
+    
+    # Run every query up front, concurrently; the steps below read their results
+    extractor.prefetch()
     
     # Discover imaging tables
-    imaging_tables = extractor.discover_imaging_tables()
+    extractor.discover_imaging_tables()
     
     # Extract MRI imaging
     mri_df = extractor.extract_mri_imaging()
@@ -423,6 +430,11 @@ def main():
     # Extract diagnostic reports
     reports_df = extractor.extract_diagnostic_reports()
     
+    # A failed query would look like missing data: report failure instead of writing partial output
+    if extractor.failed_queries:
+        logger.error(f"{len(extractor.failed_queries)} queries failed: {', '.join(extractor.failed_queries)}")
+        return 1
+    
     # Merge all data
     final_df = extractor.merge_all_data(mri_df, mri_results_df, other_imaging_df, reports_df)
     
@@ -432,7 +444,7 @@ def main():
     
     # Save to CSV
     final_df.to_csv(extractor.output_dir / "imaging.csv", index=False)
-    logger.info(f"\n✅ Saved {len(final_df)} imaging studies to {extractor.output_dir / "imaging.csv"}")
+    logger.info(f"\n✅ Saved {len(final_df)} imaging studies to {extractor.output_dir / 'imaging.csv'}")
     
     # Generate summary
     extractor.generate_summary(final_df)
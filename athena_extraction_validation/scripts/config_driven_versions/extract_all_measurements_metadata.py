@@ -28,6 +28,11 @@ import logging
 from datetime import datetime
 from pathlib import Path
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine, QueryBatch
+from athena_result_cache import QueryResultCache
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -36,7 +41,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class MeasurementsExtractor:
-    def __init__(self, patient_config: dict):
+    def __init__(self, patient_config: dict, engine: AthenaQueryEngine = None):
         """Initialize AWS Athena connection"""
         # Load from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -50,8 +55,20 @@ class MeasurementsExtractor:
             self.birth_date = None
         
         aws_profile = patient_config['aws_profile']
-        self.session = boto3.Session(profile_name=aws_profile)
-        self.athena = self.session.client('athena', region_name='us-east-1')
+        if engine is None:
+            self.session = boto3.Session(profile_name=aws_profile)
+            engine = AthenaQueryEngine(
+                self.session.client('athena', region_name='us-east-1'),
+                database=self.database,
+                output_location=self.s3_output,
+                aws_profile=aws_profile,
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
+        self.prefetched = None  # QueryBatch filled by prefetch()
         
         logger.info("="*80)
         logger.info("📊 MEASUREMENTS METADATA EXTRACTOR")
@@ -71,45 +88,9 @@ class MeasurementsExtractor:
         start_time = time.time()
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.s3_output}
-            )
-            
-            query_id = response['QueryExecutionId']
-            
-            # Wait for query completion
-            while True:
-                status_response = self.athena.get_query_execution(QueryExecutionId=query_id)
-                status = status_response['QueryExecution']['Status']['State']
-                
-                if status in ['SUCCEEDED', 'FAILED', 'CANCELLED']:
-                    break
-                time.sleep(0.5)
-            
-            if status != 'SUCCEEDED':
-                error_msg = status_response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown error')
-                logger.error(f"  ❌ Query failed: {error_msg}")
-                return pd.DataFrame()
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            
-            # Parse results
-            if not results['ResultSet']['Rows']:
-                logger.info(f"  ⚠️  No results returned")
-                return pd.DataFrame()
-            
-            # Extract column names
-            columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-            
-            # Extract data rows
-            data = []
-            for row in results['ResultSet']['Rows'][1:]:
-                data.append([col.get('VarCharValue', '') for col in row['Data']])
-            
-            df = pd.DataFrame(data, columns=columns)
+            df = self.prefetched.take(query) if self.prefetched is not None else None
+            if df is None:
+                df = self.engine.query(query, typed=False, na_value='')
             
             duration = time.time() - start_time
             logger.info(f"  ✅ Returned {len(df)} rows in {duration:.1f} seconds")
@@ -118,24 +99,20 @@ class MeasurementsExtractor:
             
         except Exception as e:
             logger.error(f"  ❌ Query execution error: {str(e)}")
+            self.failed_queries.append(description)
             return pd.DataFrame()
     
-    def extract_anthropometric_observations(self):
-        """
-        Extract anthropometric measurements from observation table
-        
-        Per MEASUREMENTS_IMPLEMENTATION_GUIDE.md:
-        - Height: code_text LIKE '%height%' OR '%length%'
-        - Weight: code_text LIKE '%weight%' (exclude birth/discharge weight)
-        - Head Circumference: code_text LIKE '%head circumference%' OR '%ofc%'
-        
-        CRITICAL: observation table uses subject_reference = 'FHIR_ID' 
-        (WITHOUT 'Patient/' prefix, unlike other tables)
-        """
-        logger.info("\n📊 STEP 1: Extracting Anthropometric Observations")
-        logger.info("-" * 80)
-        
-        query = f"""
+    def prefetch(self) -> None:
+        """Run the extractor's independent queries concurrently; execute_query() then reads their results"""
+        self.prefetched = QueryBatch(self.engine, {
+            'anthropometric_observations': self.anthropometric_observations_query(),
+            'lab_tests': self.lab_tests_query(),
+            'lab_test_results': self.lab_test_results_query(),
+        }, typed=False, na_value='')
+    
+    def anthropometric_observations_query(self) -> str:
+        """SQL for extract_anthropometric_observations()"""
+        return f"""
         SELECT 
             subject_reference as patient_id,
             
@@ -164,21 +141,30 @@ class MeasurementsExtractor:
         )
         ORDER BY effective_datetime DESC
         """
-        
-        df = self.execute_query(query, "Querying observation table for anthropometric data")
-        return df
     
-    def extract_lab_tests(self):
+    def extract_anthropometric_observations(self):
         """
-        Extract laboratory tests from lab_tests table
+        Extract anthropometric measurements from observation table
         
-        Per documentation: 421 lab tests exist for C1277724
-        Tables: lab_tests (metadata) + lab_test_results (values)
+        Per MEASUREMENTS_IMPLEMENTATION_GUIDE.md:
+        - Height: code_text LIKE '%height%' OR '%length%'
+        - Weight: code_text LIKE '%weight%' (exclude birth/discharge weight)
+        - Head Circumference: code_text LIKE '%head circumference%' OR '%ofc%'
+        
+        CRITICAL: observation table uses subject_reference = 'FHIR_ID' 
+        (WITHOUT 'Patient/' prefix, unlike other tables)
         """
-        logger.info("\n📊 STEP 2: Extracting Laboratory Tests")
+        logger.info("\n📊 STEP 1: Extracting Anthropometric Observations")
         logger.info("-" * 80)
         
-        query = f"""
+        query = self.anthropometric_observations_query()
+        
+        df = self.execute_query(query, "Querying observation table for anthropometric data")
+        return df
+    
+    def lab_tests_query(self) -> str:
+        """SQL for extract_lab_tests()"""
+        return f"""
         SELECT 
             patient_id,
             
@@ -194,21 +180,25 @@ class MeasurementsExtractor:
         WHERE patient_id = '{self.patient_fhir_id}'
         ORDER BY result_datetime DESC
         """
-        
-        df = self.execute_query(query, "Querying lab_tests table")
-        return df
     
-    def extract_lab_test_results(self):
+    def extract_lab_tests(self):
         """
-        Extract laboratory test results/values from lab_test_results table
+        Extract laboratory tests from lab_tests table
         
-        Contains: test_component, value_string, value_quantity_value, value_quantity_unit,
-        value_range (reference ranges), value_codeable_concept_text, value_boolean, value_integer
+        Per documentation: 421 lab tests exist for C1277724
+        Tables: lab_tests (metadata) + lab_test_results (values)
         """
-        logger.info("\n📊 STEP 3: Extracting Laboratory Test Results")
+        logger.info("\n📊 STEP 2: Extracting Laboratory Tests")
         logger.info("-" * 80)
         
-        query = f"""
+        query = self.lab_tests_query()
+        
+        df = self.execute_query(query, "Querying lab_tests table")
+        return df
+    
+    def lab_test_results_query(self) -> str:
+        """SQL for extract_lab_test_results()"""
+        return f"""
         SELECT 
             ltr.test_id as lt_test_id,
             
@@ -231,6 +221,18 @@ class MeasurementsExtractor:
             WHERE patient_id = '{self.patient_fhir_id}'
         )
         """
+    
+    def extract_lab_test_results(self):
+        """
+        Extract laboratory test results/values from lab_test_results table
+        
+        Contains: test_component, value_string, value_quantity_value, value_quantity_unit,
+        value_range (reference ranges), value_codeable_concept_text, value_boolean, value_integer
+        """
+        logger.info("\n📊 STEP 3: Extracting Laboratory Test Results")
+        logger.info("-" * 80)
+        
+        query = self.lab_test_results_query()
         
         df = self.execute_query(query, "Querying lab_test_results table")
         return df
@@ -369,24 +371,28 @@ class MeasurementsExtractor:
         logger.info(f"{'='*80}\n")
 
 
-def main():
-    """Main execution"""
+def main(config: dict = None, engine: AthenaQueryEngine = None):
+    """Main execution (config/engine are supplied when run from cohort_batch_extraction)"""
     start_time = datetime.now()
     
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
     logger.info("Starting measurements metadata extraction...")
     logger.info(f"Start time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
     
     # Initialize extractor
-    extractor = MeasurementsExtractor(patient_config=config)
+    extractor = MeasurementsExtractor(patient_config=config, engine=engine)
     
     # Ensure output directory exists
     extractor.output_dir.mkdir(parents=True, exist_ok=True)
     
+    # Run every query up front, concurrently; the steps below read their results
+    extractor.prefetch()
+    
     # Extract anthropometric observations
     observations_df = extractor.extract_anthropometric_observations()
     
@@ -396,6 +402,11 @@ def main():
     # Extract lab test results
     lab_results_df = extractor.extract_lab_test_results()
     
+    # A failed query would look like missing data: report failure instead of writing partial output
+    if extractor.failed_queries:
+        logger.error(f"{len(extractor.failed_queries)} queries failed: {', '.join(extractor.failed_queries)}")
+        return 1
+    
     if observations_df.empty and lab_tests_df.empty:
         logger.error("No measurements found! Exiting.")
         return 1
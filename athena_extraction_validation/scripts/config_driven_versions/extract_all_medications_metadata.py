@@ -24,13 +24,16 @@ Output: medications.csv with 44 columns including complete temporal and clinical
 """
 
 import boto3
-import pandas as pd
-import time
 import json
 import logging
 from pathlib import Path
 from datetime import datetime
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -56,48 +59,29 @@ def execute_athena_query(athena_client, query, description, database, output_loc
     logger.info(f"Executing query: {description}")
     
     try:
-        response = athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': output_location}
-        )
-        
-        query_id = response['QueryExecutionId']
+        engine = AthenaQueryEngine(athena_client, database=database, output_location=output_location)
+        query_id = engine.start(query)
         logger.info(f"Query ID: {query_id}")
         
-        # Wait for query completion
-        max_attempts = 60
-        attempt = 0
-        
-        while attempt < max_attempts:
-            time.sleep(2)
-            attempt += 1
-            
-            result = athena_client.get_query_execution(QueryExecutionId=query_id)
-            status = result['QueryExecution']['Status']['State']
-            
-            if status == 'SUCCEEDED':
-                logger.info(f"Query succeeded after {attempt * 2} seconds")
-                return query_id
-            elif status in ['FAILED', 'CANCELLED']:
-                reason = result['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                logger.error(f"Query failed: {reason}")
-                raise Exception(f"Query {status}: {reason}")
-        
-        raise Exception(f"Query timeout after {max_attempts * 2} seconds")
+        execution = engine.wait(query_id)
+        elapsed_ms = execution.get('Statistics', {}).get('TotalExecutionTimeInMillis', 0)
+        logger.info(f"Query succeeded after {elapsed_ms / 1000:.1f} seconds")
+        return query_id
         
     except Exception as e:
         logger.error(f"Error executing query: {str(e)}")
         raise
 
 
-def get_query_results(athena_client, query_id):
+def get_query_results(athena_client, query_id, s3_client=None, fetch_mode='api'):
     """
-    Retrieve query results and convert to DataFrame
+    Retrieve all result pages and convert to DataFrame
     
     Args:
         athena_client: Boto3 Athena client
         query_id: Query execution ID
+        s3_client: Boto3 S3 client (needed for fetch_mode='s3_csv')
+        fetch_mode: 'api' (GetQueryResults paging) or 's3_csv' (one GET of the result CSV)
         
     Returns:
         Pandas DataFrame with results
@@ -105,27 +89,9 @@ def get_query_results(athena_client, query_id):
     logger.info(f"Retrieving results for query {query_id}")
     
     try:
-        results = athena_client.get_query_results(QueryExecutionId=query_id)
-        
-        # Extract column names
-        columns = [col['Name'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-        
-        # Extract data rows (skip header row)
-        rows = []
-        for row in results['ResultSet']['Rows'][1:]:
-            rows.append([col.get('VarCharValue', '') for col in row['Data']])
-        
-        # Handle pagination if needed
-        while 'NextToken' in results:
-            results = athena_client.get_query_results(
-                QueryExecutionId=query_id,
-                NextToken=results['NextToken']
-            )
-            for row in results['ResultSet']['Rows']:
-                rows.append([col.get('VarCharValue', '') for col in row['Data']])
-        
-        df = pd.DataFrame(rows, columns=columns)
-        logger.info(f"Retrieved {len(df)} rows with {len(columns)} columns")
+        engine = AthenaQueryEngine(athena_client, s3_client=s3_client)
+        df = engine.fetch_dataframe(query_id, typed=False, na_value='', fetch_mode=fetch_mode)
+        logger.info(f"Retrieved {len(df)} rows with {len(df.columns)} columns")
         
         return df
         
@@ -340,14 +306,15 @@ def build_comprehensive_query(database, patient_id):
     return query
 
 
-def main():
-    """Main execution function"""
+def main(config=None, engine=None):
+    """Main execution function (config/engine are supplied when run from cohort_batch_extraction)"""
     start_time = datetime.now()
     
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
     # Set configuration variables
     PATIENT_ID = config['fhir_id']
@@ -369,10 +336,11 @@ def main():
     logger.info("")
     
     try:
-        # Initialize AWS session
-        logger.info("Initializing AWS session...")
-        session = boto3.Session(profile_name=AWS_PROFILE, region_name=AWS_REGION)
-        athena = session.client('athena')
+        # Initialize AWS session (a cohort run supplies a shared engine instead)
+        if engine is None:
+            logger.info("Initializing AWS session...")
+            session = boto3.Session(profile_name=AWS_PROFILE, region_name=AWS_REGION)
+            athena = session.client('athena')
         
         # Build and execute query
         logger.info("")
@@ -394,17 +362,30 @@ def main():
         logger.info(" 11. care_plan_activity (activity status)")
         logger.info("")
         
-        # Execute query
-        query_id = execute_athena_query(
-            athena, 
-            query, 
-            "Extract all medications with complete metadata",
-            DATABASE,
-            OUTPUT_LOCATION
-        )
-        
-        # Get results
-        df = get_query_results(athena, query_id)
+        if engine is not None:
+            df = engine.query(query, typed=False, na_value='')
+        else:
+            # Local result cache (enabled with "athena_cache": true in patient_config.json)
+            cache = QueryResultCache.from_config(config)
+            df = cache.get(query, DATABASE, typed=False, na_value='')
+            if df is None:
+                # Execute query
+                query_id = execute_athena_query(
+                    athena, 
+                    query, 
+                    "Extract all medications with complete metadata",
+                    DATABASE,
+                    OUTPUT_LOCATION
+                )
+                
+                # Get results
+                df = get_query_results(
+                    athena,
+                    query_id,
+                    s3_client=session.client('s3'),
+                    fetch_mode=config.get('athena_fetch_mode', 'api')
+                )
+                cache.put(query, DATABASE, df, typed=False, na_value='')
         
         # Log summary statistics
         logger.info("")
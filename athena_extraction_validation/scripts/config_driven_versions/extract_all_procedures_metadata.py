@@ -18,18 +18,35 @@ This is a STAGING file - we extract everything first, then filter later.
 
 import boto3
 import pandas as pd
-import time
 import json
+import sys
 from datetime import datetime
 from pathlib import Path
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine, QueryBatch
+from athena_result_cache import QueryResultCache
+
 class AllProceduresExtractor:
-    def __init__(self, aws_profile: str, database: str, patient_config: dict):
+    def __init__(self, aws_profile: str, database: str, patient_config: dict, engine: AthenaQueryEngine = None):
         """Initialize AWS Athena connection and patient information"""
-        self.session = boto3.Session(profile_name=aws_profile)
-        self.athena = self.session.client('athena', region_name='us-east-1')
         self.database = database
         self.s3_output = 's3://aws-athena-query-results-343218191717-us-east-1/'
+        if engine is None:
+            self.session = boto3.Session(profile_name=aws_profile)
+            engine = AthenaQueryEngine(
+                self.session.client('athena', region_name='us-east-1'),
+                database=self.database,
+                output_location=self.s3_output,
+                aws_profile=aws_profile,
+                fetch_mode=patient_config.get('athena_fetch_mode', 'api'),
+                cache=QueryResultCache.from_config(patient_config)
+            )
+        self.engine = engine
+        self.athena = engine.athena
+        self.failed_queries = []  # descriptions of queries that raised; main() then reports failure
+        self.prefetched = None  # QueryBatch filled by prefetch()
         
         # Load patient details from config
         self.patient_fhir_id = patient_config['fhir_id']
@@ -57,54 +74,33 @@ class AllProceduresExtractor:
         print(f"  Query: {query[:100]}..." if len(query) > 100 else f"  Query: {query}")
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.s3_output}
-            )
-            
-            query_id = response['QueryExecutionId']
-            
-            # Wait for query completion
-            for _ in range(60):
-                status = self.athena.get_query_execution(QueryExecutionId=query_id)
-                state = status['QueryExecution']['Status']['State']
-                
-                if state == 'SUCCEEDED':
-                    break
-                elif state in ['FAILED', 'CANCELLED']:
-                    reason = status['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                    print(f"  ✗ Query {state}: {reason}\n")
-                    return pd.DataFrame()
-                
-                time.sleep(2)
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            
-            # Parse to DataFrame
-            data_rows = []
-            if len(results['ResultSet']['Rows']) > 1:
-                columns = [col['VarCharValue'] for col in results['ResultSet']['Rows'][0]['Data']]
-                
-                for row in results['ResultSet']['Rows'][1:]:
-                    row_data = {}
-                    for i, col in enumerate(columns):
-                        value = row['Data'][i].get('VarCharValue', '') if i < len(row['Data']) else ''
-                        row_data[col] = value if value else None
-                    data_rows.append(row_data)
-            
-            df = pd.DataFrame(data_rows)
+            df = self.prefetched.take(query) if self.prefetched is not None else None
+            if df is None:
+                df = self.engine.query(query, typed=False)
+            df = df.where(df != '', None)
             print(f"  ✓ ({len(df)} rows)\n")
             return df
             
         except Exception as e:
             print(f"  ✗ Error: {str(e)}\n")
+            self.failed_queries.append(description)
             return pd.DataFrame()
     
-    def extract_main_procedures(self) -> pd.DataFrame:
-        """Extract main procedure records"""
-        query = f"""
+    def prefetch(self) -> None:
+        """Run the extractor's independent queries concurrently; execute_query() then reads their results"""
+        self.prefetched = QueryBatch(self.engine, {
+            'main_procedures': self.main_procedures_query(),
+            'procedure_codes': self.procedure_codes_query(),
+            'procedure_categories': self.procedure_categories_query(),
+            'procedure_body_sites': self.procedure_body_sites_query(),
+            'procedure_performers': self.procedure_performers_query(),
+            'procedure_reasons': self.procedure_reasons_query(),
+            'procedure_reports': self.procedure_reports_query(),
+        }, typed=False)
+    
+    def main_procedures_query(self) -> str:
+        """SQL for extract_main_procedures()"""
+        return f"""
         SELECT 
             p.id as procedure_fhir_id,
             
@@ -133,6 +129,10 @@ class AllProceduresExtractor:
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         ORDER BY p.performed_date_time
         """
+    
+    def extract_main_procedures(self) -> pd.DataFrame:
+        """Extract main procedure records"""
+        query = self.main_procedures_query()
         
         df = self.execute_query(query, "EXTRACTING MAIN PROCEDURES TABLE")
         
@@ -149,9 +149,9 @@ class AllProceduresExtractor:
         
         return df
     
-    def extract_procedure_codes(self) -> pd.DataFrame:
-        """Extract CPT/HCPCS procedure codes"""
-        query = f"""
+    def procedure_codes_query(self) -> str:
+        """SQL for extract_procedure_codes()"""
+        return f"""
         SELECT 
             pcc.procedure_id as procedure_fhir_id,
             
@@ -164,6 +164,10 @@ class AllProceduresExtractor:
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         ORDER BY pcc.code_coding_code
         """
+    
+    def extract_procedure_codes(self) -> pd.DataFrame:
+        """Extract CPT/HCPCS procedure codes"""
+        query = self.procedure_codes_query()
         
         df = self.execute_query(query, "EXTRACTING PROCEDURE CODES (CPT/HCPCS)")
         
@@ -184,9 +188,9 @@ class AllProceduresExtractor:
         
         return df
     
-    def extract_procedure_categories(self) -> pd.DataFrame:
-        """Extract procedure categories"""
-        query = f"""
+    def procedure_categories_query(self) -> str:
+        """SQL for extract_procedure_categories()"""
+        return f"""
         SELECT 
             pcat.procedure_id as procedure_fhir_id,
             
@@ -198,12 +202,16 @@ class AllProceduresExtractor:
         JOIN {self.database}.procedure p ON pcat.procedure_id = p.id
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         """
+    
+    def extract_procedure_categories(self) -> pd.DataFrame:
+        """Extract procedure categories"""
+        query = self.procedure_categories_query()
         
         return self.execute_query(query, "EXTRACTING PROCEDURE CATEGORIES")
     
-    def extract_procedure_body_sites(self) -> pd.DataFrame:
-        """Extract anatomical body sites for procedures"""
-        query = f"""
+    def procedure_body_sites_query(self) -> str:
+        """SQL for extract_procedure_body_sites()"""
+        return f"""
         SELECT 
             pbs.procedure_id as procedure_fhir_id,
             
@@ -214,12 +222,16 @@ class AllProceduresExtractor:
         JOIN {self.database}.procedure p ON pbs.procedure_id = p.id
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         """
+    
+    def extract_procedure_body_sites(self) -> pd.DataFrame:
+        """Extract anatomical body sites for procedures"""
+        query = self.procedure_body_sites_query()
         
         return self.execute_query(query, "EXTRACTING PROCEDURE BODY SITES")
     
-    def extract_procedure_performers(self) -> pd.DataFrame:
-        """Extract procedure performers (surgeons, providers)"""
-        query = f"""
+    def procedure_performers_query(self) -> str:
+        """SQL for extract_procedure_performers()"""
+        return f"""
         SELECT 
             pp.procedure_id as procedure_fhir_id,
             
@@ -234,6 +246,10 @@ class AllProceduresExtractor:
         JOIN {self.database}.procedure p ON pp.procedure_id = p.id
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         """
+    
+    def extract_procedure_performers(self) -> pd.DataFrame:
+        """Extract procedure performers (surgeons, providers)"""
+        query = self.procedure_performers_query()
         
         df = self.execute_query(query, "EXTRACTING PROCEDURE PERFORMERS")
         
@@ -244,9 +260,9 @@ class AllProceduresExtractor:
         
         return df
     
-    def extract_procedure_reasons(self) -> pd.DataFrame:
-        """Extract reasons/indications for procedures"""
-        query = f"""
+    def procedure_reasons_query(self) -> str:
+        """SQL for extract_procedure_reasons()"""
+        return f"""
         SELECT 
             prc.procedure_id as procedure_fhir_id,
             
@@ -257,12 +273,16 @@ class AllProceduresExtractor:
         JOIN {self.database}.procedure p ON prc.procedure_id = p.id
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         """
+    
+    def extract_procedure_reasons(self) -> pd.DataFrame:
+        """Extract reasons/indications for procedures"""
+        query = self.procedure_reasons_query()
         
         return self.execute_query(query, "EXTRACTING PROCEDURE REASONS")
     
-    def extract_procedure_reports(self) -> pd.DataFrame:
-        """Extract procedure reports (operative notes, etc.)"""
-        query = f"""
+    def procedure_reports_query(self) -> str:
+        """SQL for extract_procedure_reports()"""
+        return f"""
         SELECT 
             pr.procedure_id as procedure_fhir_id,
             
@@ -274,6 +294,10 @@ class AllProceduresExtractor:
         JOIN {self.database}.procedure p ON pr.procedure_id = p.id
         WHERE p.subject_reference = '{self.patient_fhir_id}'
         """
+    
+    def extract_procedure_reports(self) -> pd.DataFrame:
+        """Extract procedure reports (operative notes, etc.)"""
+        query = self.procedure_reports_query()
         
         return self.execute_query(query, "EXTRACTING PROCEDURE REPORTS")
     
@@ -368,23 +392,28 @@ class AllProceduresExtractor:
         
         return merged
 
-def main():
-    """Main execution"""
+def main(config: dict = None, engine: AthenaQueryEngine = None):
+    """Main execution (config/engine are supplied when run from cohort_batch_extraction)"""
     try:
         # Load patient configuration
-        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-        with open(config_file) as f:
-            config = json.load(f)
+        if config is None:
+            config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+            with open(config_file) as f:
+                config = json.load(f)
         
         extractor = AllProceduresExtractor(
             aws_profile=config['aws_profile'],
             database=config['database'],
-            patient_config=config
+            patient_config=config,
+            engine=engine
         )
         
         # Ensure output directory exists
         extractor.output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Run every query up front, concurrently; the steps below read their results
+        extractor.prefetch()
+        
         # Extract from all procedure tables
         procedures_df = extractor.extract_main_procedures()
         codes_df = extractor.extract_procedure_codes()
@@ -394,6 +423,11 @@ def main():
         reasons_df = extractor.extract_procedure_reasons()
         reports_df = extractor.extract_procedure_reports()
         
+        # A failed query would leave its columns empty: report failure instead of writing partial output
+        if extractor.failed_queries:
+            print(f"\n❌ {len(extractor.failed_queries)} queries failed: {', '.join(extractor.failed_queries)}\n")
+            return 1
+        
         # Merge and export
         if not procedures_df.empty:
             merged_df = extractor.merge_and_export(
@@ -418,11 +452,14 @@ def main():
             print(f"\n{'='*80}\n")
         else:
             print("\n❌ No procedures found\n")
+        
+        return 0
     
     except Exception as e:
         print(f"\n❌ Error: {str(e)}\n")
         import traceback
         traceback.print_exc()
+        return 1
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -33,13 +33,17 @@ Example:
 
 import boto3
 import pandas as pd
-import time
 import json
 import logging
 from datetime import datetime
 from pathlib import Path
 import sys
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -49,39 +53,30 @@ logger = logging.getLogger(__name__)
 
 
 def execute_athena_query(athena_client, query, description, database, output_location):
-    """Execute Athena query and wait for completion"""
+    """
+    Execute Athena query and wait for completion
+    
+    Args:
+        athena_client: Boto3 Athena client
+        query: SQL query string
+        description: Description for logging
+        database: Database name
+        output_location: S3 output location
+        
+    Returns:
+        Query execution ID
+    """
     logger.info(f"Executing query: {description}")
     
     try:
-        response = athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': output_location}
-        )
-        
-        query_id = response['QueryExecutionId']
+        engine = AthenaQueryEngine(athena_client, database=database, output_location=output_location)
+        query_id = engine.start(query)
         logger.info(f"Query ID: {query_id}")
         
-        # Wait for query completion
-        max_attempts = 30
-        attempt = 0
-        
-        while attempt < max_attempts:
-            time.sleep(1)
-            attempt += 1
-            
-            result = athena_client.get_query_execution(QueryExecutionId=query_id)
-            status = result['QueryExecution']['Status']['State']
-            
-            if status == 'SUCCEEDED':
-                logger.info(f"Query succeeded after {attempt} seconds")
-                return query_id
-            elif status in ['FAILED', 'CANCELLED']:
-                reason = result['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                logger.error(f"Query failed: {reason}")
-                raise Exception(f"Query {status}: {reason}")
-        
-        raise Exception(f"Query timeout after {max_attempts} seconds")
+        execution = engine.wait(query_id)
+        elapsed_ms = execution.get('Statistics', {}).get('TotalExecutionTimeInMillis', 0)
+        logger.info(f"Query succeeded after {elapsed_ms / 1000:.1f} seconds")
+        return query_id
         
     except Exception as e:
         logger.error(f"Error executing query: {str(e)}")
@@ -89,22 +84,21 @@ def execute_athena_query(athena_client, query, description, database, output_loc
 
 
 def get_query_results(athena_client, query_id):
-    """Retrieve query results and convert to DataFrame"""
+    """
+    Retrieve all result pages and convert to DataFrame
+    
+    Args:
+        athena_client: Boto3 Athena client
+        query_id: Query execution ID
+        
+    Returns:
+        Pandas DataFrame with results
+    """
     logger.info(f"Retrieving results for query {query_id}")
     
     try:
-        results = athena_client.get_query_results(QueryExecutionId=query_id)
-        
-        # Extract column names
-        columns = [col['Name'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-        
-        # Extract data rows (skip header row)
-        rows = []
-        for row in results['ResultSet']['Rows'][1:]:
-            rows.append([col.get('VarCharValue', '') for col in row['Data']])
-        
-        df = pd.DataFrame(rows, columns=columns)
-        logger.info(f"Retrieved {len(df)} rows with {len(columns)} columns")
+        df = AthenaQueryEngine(athena_client).fetch_dataframe(query_id, typed=False, na_value='')
+        logger.info(f"Retrieved {len(df)} rows with {len(df.columns)} columns")
         
         return df
         
@@ -221,16 +215,21 @@ def extract_demographics(config_path, output_dir):
     logger.info("="*80)
     
     query = build_demographics_query(database, patient_id)
-    query_id = execute_athena_query(
-        athena_client, 
-        query, 
-        "Extract patient demographics",
-        database,
-        s3_output
-    )
+    # Local result cache (enabled with "athena_cache": true in patient_config.json)
+    cache = QueryResultCache.from_config(config)
+    df = cache.get(query, database, typed=False, na_value='')
+    if df is None:
+        query_id = execute_athena_query(
+            athena_client, 
+            query, 
+            "Extract patient demographics",
+            database,
+            s3_output
+        )
     
-    # Get results
-    df = get_query_results(athena_client, query_id)
+        # Get results
+        df = get_query_results(athena_client, query_id)
+        cache.put(query, database, df, typed=False, na_value='')
     
     if len(df) == 0:
         logger.warning("⚠️  No demographics found for patient")
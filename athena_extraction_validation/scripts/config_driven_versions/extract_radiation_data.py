@@ -41,13 +41,21 @@ Updated: 2025-10-12 - Refactored to config-driven pattern
 """
 
 import boto3
-import time
 import pandas as pd
 import json
 import re
+import threading
 from pathlib import Path
 
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine, AthenaQueryError, QueryBatch
+from athena_result_cache import QueryResultCache
+
 # NOTE: Configuration loaded from patient_config.json (no hardcoded values)
+# Settings of the current run (database, engine, prefetched, failed_queries), set in main().
+# Thread-local: run_all_extractions.py runs several patients' main() concurrently in one process.
+_RUN = threading.local()
 
 # RT-SPECIFIC search terms for radiation therapy identification
 # NOTE: These are RT-SPECIFIC keywords, not general oncology terms
@@ -80,47 +88,45 @@ RADIATION_SEARCH_TERMS = [
 ]
 
 
-def execute_athena_query(athena_client, query, database, max_wait=180):
+def execute_athena_query(athena_client, query, database):
     """
-    Execute an Athena query and wait for results.
+    Execute an Athena query on the run's engine (or take its prefetched result).
     
     Args:
-        athena_client: boto3 Athena client
+        athena_client: boto3 Athena client (the run's engine wraps the same client)
         query: SQL query string
         database: Database name
-        max_wait: Maximum wait time in seconds
         
     Returns:
-        Query results or None if failed
+        Query results (all pages merged into one ResultSet) or None if failed
     """
     try:
-        response = athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': S3_OUTPUT}
-        )
-        
-        query_id = response['QueryExecutionId']
+        df = _RUN.prefetched.take(query) if _RUN.prefetched is not None else None
+        if df is None:
+            df = _RUN.engine.query(query, database=database, typed=False)
         
-        # Wait for query completion
-        for _ in range(max_wait):
-            status_result = athena_client.get_query_execution(QueryExecutionId=query_id)
-            state = status_result['QueryExecution']['Status']['State']
-            
-            if state == 'SUCCEEDED':
-                return athena_client.get_query_results(QueryExecutionId=query_id, MaxResults=1000)
-            elif state in ['FAILED', 'CANCELLED']:
-                reason = status_result['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                print(f"Query failed: {reason}")
-                return None
-            
-            time.sleep(1)
+        # Same shape as GetQueryResults: header row first, NULL cells without VarCharValue
+        header = {'Data': [{'VarCharValue': column} for column in df.columns]}
+        rows = [
+            {'Data': [{} if value is None else {'VarCharValue': value} for value in row]}
+            for row in df.itertuples(index=False, name=None)
+        ]
+        return {'ResultSet': {
+            'Rows': [header] + rows,
+            'ResultSetMetadata': {'ColumnInfo': [{'Name': column, 'Label': column} for column in df.columns]},
+        }}
         
-        print(f"Query timeout after {max_wait} seconds")
+    except TimeoutError:
+        print(f"Query timeout after {_RUN.engine.timeout:.0f} seconds")
+        _RUN.failed_queries.append(f"timeout after {_RUN.engine.timeout:.0f}s")
+        return None
+    except AthenaQueryError as e:
+        print(f"Query failed: {e}")
+        _RUN.failed_queries.append(str(e))
         return None
-        
     except Exception as e:
         print(f"Error executing query: {e}")
+        _RUN.failed_queries.append(str(e))
         return None
 
 
@@ -158,6 +164,16 @@ def parse_service_type_display(service_type_json):
     return ''
 
 
+def radiation_oncology_consults_query(patient_fhir_id):
+    """SQL for extract_radiation_oncology_consults()"""
+    return f"""
+    SELECT DISTINCT ast.appointment_id, ast.service_type_coding
+    FROM {_RUN.database}.appointment_service_type ast
+    JOIN {_RUN.database}.appointment_participant ap ON ast.appointment_id = ap.appointment_id
+    WHERE ap.participant_actor_reference = '{patient_fhir_id}'
+    """
+
+
 def extract_radiation_oncology_consults(athena_client, patient_fhir_id):
     """
     Extract radiation oncology consultation appointments.
@@ -174,14 +190,9 @@ def extract_radiation_oncology_consults(athena_client, patient_fhir_id):
     print("="*80)
     
     # First get all appointments with service types (Athena limitation: must use simple SELECT)
-    query = f"""
-    SELECT DISTINCT ast.appointment_id, ast.service_type_coding
-    FROM {DATABASE}.appointment_service_type ast
-    JOIN {DATABASE}.appointment_participant ap ON ast.appointment_id = ap.appointment_id
-    WHERE ap.participant_actor_reference = '{patient_fhir_id}'
-    """
+    query = radiation_oncology_consults_query(patient_fhir_id)
     
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No appointment service types found.")
@@ -216,12 +227,12 @@ def extract_radiation_oncology_consults(athena_client, patient_fhir_id):
     
     query2 = f"""
     SELECT DISTINCT a.*
-    FROM {DATABASE}.appointment a
+    FROM {_RUN.database}.appointment a
     WHERE a.id IN ('{appointment_ids}')
     ORDER BY a.start
     """
     
-    results2 = execute_athena_query(athena_client, query2, DATABASE)
+    results2 = execute_athena_query(athena_client, query2, _RUN.database)
     
     if not results2 or len(results2['ResultSet']['Rows']) <= 1:
         print("Could not retrieve appointment details.")
@@ -255,6 +266,17 @@ def extract_radiation_oncology_consults(athena_client, patient_fhir_id):
     return df
 
 
+def radiation_treatment_appointments_query(patient_fhir_id):
+    """SQL for extract_radiation_treatment_appointments()"""
+    return f"""
+    SELECT DISTINCT a.*
+    FROM {_RUN.database}.appointment a
+    JOIN {_RUN.database}.appointment_participant ap ON a.id = ap.appointment_id
+    WHERE ap.participant_actor_reference = '{patient_fhir_id}'
+    ORDER BY a.start
+    """
+
+
 def extract_radiation_treatment_appointments(athena_client, patient_fhir_id):
     """
     Extract all radiation treatment-related appointments from text fields.
@@ -271,16 +293,10 @@ def extract_radiation_treatment_appointments(athena_client, patient_fhir_id):
     print("="*80)
     
     # Get ALL appointments first (Athena limitation workaround)
-    query = f"""
-    SELECT DISTINCT a.*
-    FROM {DATABASE}.appointment a
-    JOIN {DATABASE}.appointment_participant ap ON a.id = ap.appointment_id
-    WHERE ap.participant_actor_reference = '{patient_fhir_id}'
-    ORDER BY a.start
-    """
+    query = radiation_treatment_appointments_query(patient_fhir_id)
     
     print("\nQuerying all appointments...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No appointments found.")
@@ -354,6 +370,24 @@ def extract_radiation_treatment_appointments(athena_client, patient_fhir_id):
     return rad_df
 
 
+def care_plan_notes_query(patient_id):
+    """SQL for extract_care_plan_notes()"""
+    return f"""
+    SELECT 
+        child.care_plan_id,
+        child.note_text as cpn_note_text,
+        parent.status as cp_status,
+        parent.intent as cp_intent,
+        parent.title as cp_title,
+        parent.period_start as cp_period_start,
+        parent.period_end as cp_period_end
+    FROM {_RUN.database}.care_plan_note child
+    JOIN {_RUN.database}.care_plan parent ON child.care_plan_id = parent.id
+    WHERE parent.subject_reference = '{patient_id}'
+    ORDER BY parent.period_start
+    """
+
+
 def extract_care_plan_notes(athena_client, patient_id):
     """
     Extract radiation-related notes from care_plan_note table.
@@ -369,23 +403,10 @@ def extract_care_plan_notes(athena_client, patient_id):
     print("EXTRACTING CARE PLAN NOTES")
     print("="*80)
     
-    query = f"""
-    SELECT 
-        child.care_plan_id,
-        child.note_text as cpn_note_text,
-        parent.status as cp_status,
-        parent.intent as cp_intent,
-        parent.title as cp_title,
-        parent.period_start as cp_period_start,
-        parent.period_end as cp_period_end
-    FROM {DATABASE}.care_plan_note child
-    JOIN {DATABASE}.care_plan parent ON child.care_plan_id = parent.id
-    WHERE parent.subject_reference = '{patient_id}'
-    ORDER BY parent.period_start
-    """
+    query = care_plan_notes_query(patient_id)
     
     print("\nQuerying care_plan_note...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No care plan notes found.")
@@ -439,6 +460,24 @@ def extract_care_plan_notes(athena_client, patient_id):
     return rad_notes
 
 
+def care_plan_hierarchy_query(patient_id):
+    """SQL for extract_care_plan_hierarchy()"""
+    return f"""
+    SELECT 
+        child.care_plan_id,
+        child.part_of_reference as cppo_part_of_reference,
+        parent.status as cp_status,
+        parent.intent as cp_intent,
+        parent.title as cp_title,
+        parent.period_start as cp_period_start,
+        parent.period_end as cp_period_end
+    FROM {_RUN.database}.care_plan_part_of child
+    JOIN {_RUN.database}.care_plan parent ON child.care_plan_id = parent.id
+    WHERE parent.subject_reference = '{patient_id}'
+    ORDER BY parent.period_start
+    """
+
+
 def extract_care_plan_hierarchy(athena_client, patient_id):
     """
     Extract care plan hierarchy from care_plan_part_of table.
@@ -454,23 +493,10 @@ def extract_care_plan_hierarchy(athena_client, patient_id):
     print("EXTRACTING CARE PLAN HIERARCHY")
     print("="*80)
     
-    query = f"""
-    SELECT 
-        child.care_plan_id,
-        child.part_of_reference as cppo_part_of_reference,
-        parent.status as cp_status,
-        parent.intent as cp_intent,
-        parent.title as cp_title,
-        parent.period_start as cp_period_start,
-        parent.period_end as cp_period_end
-    FROM {DATABASE}.care_plan_part_of child
-    JOIN {DATABASE}.care_plan parent ON child.care_plan_id = parent.id
-    WHERE parent.subject_reference = '{patient_id}'
-    ORDER BY parent.period_start
-    """
+    query = care_plan_hierarchy_query(patient_id)
     
     print("\nQuerying care_plan_part_of...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No care plan hierarchy found.")
@@ -509,6 +535,26 @@ def extract_care_plan_hierarchy(athena_client, patient_id):
     return rad_hierarchy
 
 
+def service_request_notes_query(patient_id):
+    """SQL for extract_service_request_notes()"""
+    return f"""
+    SELECT 
+        parent.id as service_request_id,
+        parent.intent as sr_intent,
+        parent.status as sr_status,
+        parent.authored_on as sr_authored_on,
+        parent.occurrence_date_time as sr_occurrence_date_time,
+        parent.occurrence_period_start as sr_occurrence_period_start,
+        parent.occurrence_period_end as sr_occurrence_period_end,
+        note.note_text as srn_note_text,
+        note.note_time as srn_note_time
+    FROM {_RUN.database}.service_request_note note
+    JOIN {_RUN.database}.service_request parent ON note.service_request_id = parent.id
+    WHERE parent.subject_reference = '{patient_id}'
+    ORDER BY COALESCE(note.note_time, parent.occurrence_date_time, parent.occurrence_period_start, parent.authored_on)
+    """
+
+
 def extract_service_request_notes(athena_client, patient_id):
     """
     Extract radiation-related notes from service_request_note table.
@@ -524,25 +570,10 @@ def extract_service_request_notes(athena_client, patient_id):
     print("EXTRACTING SERVICE REQUEST NOTES")
     print("="*80)
     
-    query = f"""
-    SELECT 
-        parent.id as service_request_id,
-        parent.intent as sr_intent,
-        parent.status as sr_status,
-        parent.authored_on as sr_authored_on,
-        parent.occurrence_date_time as sr_occurrence_date_time,
-        parent.occurrence_period_start as sr_occurrence_period_start,
-        parent.occurrence_period_end as sr_occurrence_period_end,
-        note.note_text as srn_note_text,
-        note.note_time as srn_note_time
-    FROM {DATABASE}.service_request_note note
-    JOIN {DATABASE}.service_request parent ON note.service_request_id = parent.id
-    WHERE parent.subject_reference = '{patient_id}'
-    ORDER BY COALESCE(note.note_time, parent.occurrence_date_time, parent.occurrence_period_start, parent.authored_on)
-    """
+    query = service_request_notes_query(patient_id)
     
     print("\nQuerying service_request_note...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No service request notes found.")
@@ -601,6 +632,26 @@ def extract_service_request_notes(athena_client, patient_id):
     return rad_notes
 
 
+def service_request_reason_codes_query(patient_id):
+    """SQL for extract_service_request_reason_codes()"""
+    return f"""
+    SELECT 
+        parent.id as service_request_id,
+        parent.intent as sr_intent,
+        parent.status as sr_status,
+        parent.authored_on as sr_authored_on,
+        parent.occurrence_date_time as sr_occurrence_date_time,
+        parent.occurrence_period_start as sr_occurrence_period_start,
+        parent.occurrence_period_end as sr_occurrence_period_end,
+        reason.reason_code_coding as srrc_reason_code_coding,
+        reason.reason_code_text as srrc_reason_code_text
+    FROM {_RUN.database}.service_request_reason_code reason
+    JOIN {_RUN.database}.service_request parent ON reason.service_request_id = parent.id
+    WHERE parent.subject_reference = '{patient_id}'
+    ORDER BY COALESCE(parent.occurrence_date_time, parent.occurrence_period_start, parent.authored_on)
+    """
+
+
 def extract_service_request_reason_codes(athena_client, patient_id):
     """
     Extract RT history codes from service_request_reason_code table.
@@ -616,25 +667,10 @@ def extract_service_request_reason_codes(athena_client, patient_id):
     print("EXTRACTING SERVICE REQUEST REASON CODES (RT HISTORY)")
     print("="*80)
     
-    query = f"""
-    SELECT 
-        parent.id as service_request_id,
-        parent.intent as sr_intent,
-        parent.status as sr_status,
-        parent.authored_on as sr_authored_on,
-        parent.occurrence_date_time as sr_occurrence_date_time,
-        parent.occurrence_period_start as sr_occurrence_period_start,
-        parent.occurrence_period_end as sr_occurrence_period_end,
-        reason.reason_code_coding as srrc_reason_code_coding,
-        reason.reason_code_text as srrc_reason_code_text
-    FROM {DATABASE}.service_request_reason_code reason
-    JOIN {DATABASE}.service_request parent ON reason.service_request_id = parent.id
-    WHERE parent.subject_reference = '{patient_id}'
-    ORDER BY COALESCE(parent.occurrence_date_time, parent.occurrence_period_start, parent.authored_on)
-    """
+    query = service_request_reason_codes_query(patient_id)
     
     print("\nQuerying service_request_reason_code...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No service request reason codes found.")
@@ -710,22 +746,9 @@ def extract_service_request_reason_codes(athena_client, patient_id):
     return rad_df
 
 
-def extract_procedure_rt_codes(athena_client, patient_id):
-    """
-    Extract RT procedures via CPT codes from procedure_code_coding.
-    
-    Args:
-        athena_client: boto3 Athena client
-        patient_id: Patient ID (WITHOUT 'Patient/' prefix - procedure uses bare IDs)
-        
-    Returns:
-        DataFrame with RT procedure codes
-    """
-    print("\n" + "="*80)
-    print("EXTRACTING PROCEDURE RT CODES (CPT 77xxx)")
-    print("="*80)
-    
-    query = f"""
+def procedure_rt_codes_query(patient_id):
+    """SQL for extract_procedure_rt_codes()"""
+    return f"""
     SELECT 
         parent.id as procedure_id,
         parent.performed_date_time as proc_performed_date_time,
@@ -737,8 +760,8 @@ def extract_procedure_rt_codes(athena_client, patient_id):
         coding.code_coding_code as pcc_code,
         coding.code_coding_display as pcc_display,
         coding.code_coding_system as pcc_system
-    FROM {DATABASE}.procedure_code_coding coding
-    JOIN {DATABASE}.procedure parent ON coding.procedure_id = parent.id
+    FROM {_RUN.database}.procedure_code_coding coding
+    JOIN {_RUN.database}.procedure parent ON coding.procedure_id = parent.id
     WHERE parent.subject_reference = '{patient_id}'
       AND (
           coding.code_coding_code LIKE '77%'
@@ -749,9 +772,27 @@ def extract_procedure_rt_codes(athena_client, patient_id):
       )
     ORDER BY parent.performed_date_time
     """
+
+
+def extract_procedure_rt_codes(athena_client, patient_id):
+    """
+    Extract RT procedures via CPT codes from procedure_code_coding.
+    
+    Args:
+        athena_client: boto3 Athena client
+        patient_id: Patient ID (WITHOUT 'Patient/' prefix - procedure uses bare IDs)
+        
+    Returns:
+        DataFrame with RT procedure codes
+    """
+    print("\n" + "="*80)
+    print("EXTRACTING PROCEDURE RT CODES (CPT 77xxx)")
+    print("="*80)
+    
+    query = procedure_rt_codes_query(patient_id)
     
     print("\nQuerying procedure_code_coding...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No RT procedure codes found.")
@@ -798,6 +839,27 @@ def extract_procedure_rt_codes(athena_client, patient_id):
     return df
 
 
+def procedure_notes_query(patient_id):
+    """SQL for extract_procedure_notes()"""
+    return f"""
+    SELECT 
+        parent.id as procedure_id,
+        parent.performed_date_time as proc_performed_date_time,
+        parent.performed_period_start as proc_performed_period_start,
+        parent.performed_period_end as proc_performed_period_end,
+        parent.status as proc_status,
+        parent.code_text as proc_code_text,
+        note.note_text as pn_note_text,
+        note.note_time as pn_note_time,
+        note.note_author_reference_display as pn_author_display
+    FROM {_RUN.database}.procedure_note note
+    JOIN {_RUN.database}.procedure parent ON note.procedure_id = parent.id
+    WHERE parent.subject_reference = '{patient_id}'
+      AND note.note_text IS NOT NULL
+    ORDER BY parent.performed_date_time
+    """
+
+
 def extract_procedure_notes(athena_client, patient_id):
     """
     Extract RT-related procedure notes.
@@ -813,26 +875,10 @@ def extract_procedure_notes(athena_client, patient_id):
     print("EXTRACTING PROCEDURE NOTES (RT-SPECIFIC)")
     print("="*80)
     
-    query = f"""
-    SELECT 
-        parent.id as procedure_id,
-        parent.performed_date_time as proc_performed_date_time,
-        parent.performed_period_start as proc_performed_period_start,
-        parent.performed_period_end as proc_performed_period_end,
-        parent.status as proc_status,
-        parent.code_text as proc_code_text,
-        note.note_text as pn_note_text,
-        note.note_time as pn_note_time,
-        note.note_author_reference_display as pn_author_display
-    FROM {DATABASE}.procedure_note note
-    JOIN {DATABASE}.procedure parent ON note.procedure_id = parent.id
-    WHERE parent.subject_reference = '{patient_id}'
-      AND note.note_text IS NOT NULL
-    ORDER BY parent.performed_date_time
-    """
+    query = procedure_notes_query(patient_id)
     
     print("\nQuerying procedure_note...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No procedure notes found.")
@@ -876,27 +922,9 @@ def extract_procedure_notes(athena_client, patient_id):
     return rad_notes
 
 
-def extract_radiation_oncology_documents(athena_client, patient_id):
-    """
-    Extract radiation oncology DocumentReferences, prioritizing external records.
-    
-    Focus on:
-    - Practice setting = 'Radiation Oncology' 
-    - Non-HTML/RTF formats (PDFs, images) - likely from external institutions
-    - RT keywords in description
-    
-    Args:
-        athena_client: boto3 Athena client
-        patient_id: Patient ID (WITHOUT 'Patient/' prefix)
-        
-    Returns:
-        DataFrame with RT-related document references
-    """
-    print("\n" + "="*80)
-    print("EXTRACTING RADIATION ONCOLOGY DOCUMENTS")
-    print("="*80)
-    
-    query = f"""
+def radiation_oncology_documents_query(patient_id):
+    """SQL for extract_radiation_oncology_documents()"""
+    return f"""
     SELECT DISTINCT
         dr.id as document_id,
         dr.date as doc_date,
@@ -912,14 +940,14 @@ def extract_radiation_oncology_documents(athena_client, patient_id):
         setting.context_practice_setting_coding_code as doc_practice_code,
         de.context_encounter_reference as doc_encounter_ref,
         dt.type_coding_display as doc_type_coding_display
-    FROM {DATABASE}.document_reference dr
-    JOIN {DATABASE}.document_reference_content dc 
+    FROM {_RUN.database}.document_reference dr
+    JOIN {_RUN.database}.document_reference_content dc 
         ON dc.document_reference_id = dr.id
-    LEFT JOIN {DATABASE}.document_reference_context_practice_setting_coding setting 
+    LEFT JOIN {_RUN.database}.document_reference_context_practice_setting_coding setting 
         ON setting.document_reference_id = dr.id
-    LEFT JOIN {DATABASE}.document_reference_context_encounter de
+    LEFT JOIN {_RUN.database}.document_reference_context_encounter de
         ON de.document_reference_id = dr.id
-    LEFT JOIN {DATABASE}.document_reference_type_coding dt
+    LEFT JOIN {_RUN.database}.document_reference_type_coding dt
         ON dt.document_reference_id = dr.id
     WHERE dr.subject_reference = '{patient_id}'
       AND (
@@ -944,9 +972,32 @@ def extract_radiation_oncology_documents(athena_client, patient_id):
       )
     ORDER BY dr.date DESC
     """
+
+
+def extract_radiation_oncology_documents(athena_client, patient_id):
+    """
+    Extract radiation oncology DocumentReferences, prioritizing external records.
+    
+    Focus on:
+    - Practice setting = 'Radiation Oncology' 
+    - Non-HTML/RTF formats (PDFs, images) - likely from external institutions
+    - RT keywords in description
+    
+    Args:
+        athena_client: boto3 Athena client
+        patient_id: Patient ID (WITHOUT 'Patient/' prefix)
+        
+    Returns:
+        DataFrame with RT-related document references
+    """
+    print("\n" + "="*80)
+    print("EXTRACTING RADIATION ONCOLOGY DOCUMENTS")
+    print("="*80)
+    
+    query = radiation_oncology_documents_query(patient_id)
     
     print("\nQuerying document_reference tables...")
-    results = execute_athena_query(athena_client, query, DATABASE)
+    results = execute_athena_query(athena_client, query, _RUN.database)
     
     if not results or len(results['ResultSet']['Rows']) <= 1:
         print("No radiation oncology documents found.")
@@ -1155,13 +1206,13 @@ def generate_summary_report(patient_id, consults_df, treatments_df, courses):
     return summary
 
 
-def main():
-    """Main extraction workflow using patient_config.json."""
+def main(config=None, engine=None):
+    """Main extraction workflow using patient_config.json (or a supplied config/engine)."""
     
     # Load patient configuration
     config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
     
-    if not config_file.exists():
+    if config is None and not config_file.exists():
         print(f"❌ Configuration file not found: {config_file}")
         print("\nPlease create patient_config.json with:")
         print("""{
@@ -1172,10 +1223,11 @@ def main():
   "aws_profile": "343218191717_AWSAdministratorAccess",
   "s3_output": "s3://aws-athena-query-results-343218191717-us-east-1/"
 }""")
-        return None
+        return 1
     
-    with open(config_file, 'r') as f:
-        config = json.load(f)
+    if config is None:
+        with open(config_file, 'r') as f:
+            config = json.load(f)
     
     # Extract configuration
     patient_fhir_id = config['fhir_id']
@@ -1202,20 +1254,42 @@ def main():
     print(f"AWS Profile: {aws_profile}")
     print(f"Output Directory: {output_dir}")
     
-    # Initialize AWS session
-    try:
-        session = boto3.Session(profile_name=aws_profile)
-        athena = session.client('athena', region_name=region)
-        print("\n✅ AWS session initialized")
-    except Exception as e:
-        print(f"\n❌ Failed to initialize AWS session: {e}")
-        return None
+    # Initialize AWS session (or reuse the shared engine's client)
+    if engine is not None:
+        athena = engine.athena
+    else:
+        try:
+            session = boto3.Session(profile_name=aws_profile)
+            athena = session.client('athena', region_name=region)
+            print("\n✅ AWS session initialized")
+        except Exception as e:
+            print(f"\n❌ Failed to initialize AWS session: {e}")
+            return 1
+    
+    # One engine for the whole run, honouring the configured fetch mode and result cache
+    if engine is None:
+        engine = AthenaQueryEngine(
+            athena, database=database, output_location=s3_output, region_name=region, timeout=180,
+            fetch_mode=config.get('athena_fetch_mode', 'api'), cache=QueryResultCache.from_config(config)
+        )
     
-    # Store config values in global scope for use by helper functions
-    global DATABASE, S3_OUTPUT, OUTPUT_DIR
-    DATABASE = database
-    S3_OUTPUT = s3_output
-    OUTPUT_DIR = output_dir
+    # Store config values for use by helper functions (per thread)
+    _RUN.database = database
+    _RUN.engine = engine
+    _RUN.failed_queries = []
+    
+    # Run the independent first-stage queries up front, concurrently; the extract steps read their results
+    _RUN.prefetched = QueryBatch(engine, {
+        'consults': radiation_oncology_consults_query(patient_fhir_ref),
+        'treatment_appointments': radiation_treatment_appointments_query(patient_fhir_ref),
+        'care_plan_notes': care_plan_notes_query(patient_id),
+        'care_plan_hierarchy': care_plan_hierarchy_query(patient_id),
+        'service_request_notes': service_request_notes_query(patient_id),
+        'service_request_reason_codes': service_request_reason_codes_query(patient_id),
+        'procedure_rt_codes': procedure_rt_codes_query(patient_id),
+        'procedure_notes': procedure_notes_query(patient_id),
+        'documents': radiation_oncology_documents_query(patient_id),
+    }, database=database, typed=False)
     
     # Extract data
     consults_df = extract_radiation_oncology_consults(athena, patient_fhir_ref)
@@ -1232,6 +1306,11 @@ def main():
     # NEW: document_reference tables (external RT records)
     documents_df = extract_radiation_oncology_documents(athena, patient_id)
     
+    # A failed query would look like missing data: report failure instead of writing partial output
+    if _RUN.failed_queries:
+        print(f"\n❌ {len(_RUN.failed_queries)} queries failed: {'; '.join(_RUN.failed_queries)}")
+        return 1
+    
     # Identify treatment courses
     courses = identify_treatment_courses(treatments_df)
     
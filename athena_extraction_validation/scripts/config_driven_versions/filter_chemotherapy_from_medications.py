@@ -10,6 +10,9 @@ Integration Strategy:
 4. Care plan linkage ('ONCOLOGY TREATMENT' category)
 5. Reason code filtering ('antineoplastic chemotherapy')
 
+The reference files are compiled once into a cached index (src/chemo_reference_index.py)
+and each strategy runs as one vectorized pass over the medications.
+
 Reference: /Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/docs/MATERIALIZED_VIEW_STRATEGY_VALIDATION.md
 """
 
@@ -21,6 +24,12 @@ import json
 from pathlib import Path
 from datetime import datetime
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from text_matching import AliasAutomaton
+from chemo_reference_index import (
+    column_values, explode_rxnorm_codes, group_codes, load_reference_index
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -50,25 +59,25 @@ def normalize_text(text):
 
 
 def load_reference_data():
-    """Load RADIANT unified drug reference files"""
+    """Load RADIANT unified drug reference files (compiled index, cached across runs)"""
     logger.info("Loading RADIANT unified drug reference files...")
     
-    # Load drugs.csv
-    drugs_df = pd.read_csv(DRUGS_REF)
-    logger.info(f"  Loaded {len(drugs_df)} drugs from drugs.csv")
-    logger.info(f"    - FDA approved: {(drugs_df['approval_status'] == 'FDA_approved').sum()}")
-    logger.info(f"    - Investigational: {(drugs_df['approval_status'] == 'investigational').sum()}")
-    logger.info(f"    - Supportive care flagged: {drugs_df['is_supportive_care'].sum()}")
+    reference = load_reference_index(DRUGS_REF, DRUG_ALIAS_REF, RXNORM_MAP_REF)
+    counts = reference.counts
+    
+    # drugs.csv
+    logger.info(f"  Loaded {counts['drugs']} drugs from drugs.csv")
+    logger.info(f"    - FDA approved: {counts['fda_approved']}")
+    logger.info(f"    - Investigational: {counts['investigational']}")
+    logger.info(f"    - Supportive care flagged: {counts['supportive_care']}")
     
-    # Load drug_alias.csv
-    drug_alias_df = pd.read_csv(DRUG_ALIAS_REF)
-    logger.info(f"  Loaded {len(drug_alias_df)} drug aliases from drug_alias.csv")
+    # drug_alias.csv
+    logger.info(f"  Loaded {counts['aliases']} drug aliases from drug_alias.csv")
     
-    # Load rxnorm_code_map.csv
-    rxnorm_map_df = pd.read_csv(RXNORM_MAP_REF)
-    logger.info(f"  Loaded {len(rxnorm_map_df)} RxNorm code mappings from rxnorm_code_map.csv")
+    # rxnorm_code_map.csv
+    logger.info(f"  Loaded {counts['rxnorm_mappings']} RxNorm code mappings from rxnorm_code_map.csv")
     
-    return drugs_df, drug_alias_df, rxnorm_map_df
+    return reference
 
 
 def parse_rxnorm_codes(rx_norm_codes_str):
@@ -85,115 +94,94 @@ def parse_rxnorm_codes(rx_norm_codes_str):
     return codes
 
 
-def match_by_rxnorm_ingredient(medications_df, drugs_df):
+def explode_medication_codes(medications_df):
+    """Every medication's RxNorm codes, one row per code (position, code text, integer rxcui)"""
+    codes = explode_rxnorm_codes(medications_df['rx_norm_codes'])
+    codes['rxcui'] = codes['code'].map(int)
+    return codes
+
+
+def match_by_rxnorm_ingredient(medications_df, reference, codes=None):
     """
     Strategy 1: Direct RxNorm ingredient matching
     Match rx_norm_codes against drugs.rxnorm_in
     """
     logger.info("\nStrategy 1: RxNorm ingredient matching...")
     
-    # Filter to non-supportive care chemo drugs
-    chemo_drugs = drugs_df[
-        (drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
-        (drugs_df['is_supportive_care'] == False)
-    ].copy()
+    # Valid RxNorm IN codes of the non-supportive care chemo drugs
+    logger.info(f"  Found {len(reference.valid_ingredients)} valid chemotherapy RxNorm IN codes")
     
-    # Get valid RxNorm IN codes
-    valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int))
-    logger.info(f"  Found {len(valid_rxnorm_in)} valid chemotherapy RxNorm IN codes")
+    # Join all medications' codes against them at once
+    if codes is None:
+        codes = explode_medication_codes(medications_df)
+    matched_codes = group_codes(reference.ingredient_matches(codes, on='rxcui'), 'rxcui')
     
-    # Parse and match RxNorm codes from medications
+    index = medications_df.index.tolist()
     matches = []
-    for idx, row in medications_df.iterrows():
-        rx_codes = parse_rxnorm_codes(row['rx_norm_codes'])
-        matched_codes = [code for code in rx_codes if code in valid_rxnorm_in]
-        
-        if matched_codes:
-            matches.append({
-                'index': idx,
-                'strategy': 'rxnorm_ingredient',
-                'matched_codes': matched_codes,
-                'confidence': 'high'
-            })
+    for position, rx_codes in matched_codes.items():
+        matches.append({
+            'index': index[position],
+            'strategy': 'rxnorm_ingredient',
+            'matched_codes': rx_codes,
+            'confidence': 'high'
+        })
     
     logger.info(f"  Matched {len(matches)} medications by RxNorm ingredient codes")
     return matches
 
 
-def match_by_product_code_mapping(medications_df, drugs_df, rxnorm_map_df):
+def match_by_product_code_mapping(medications_df, reference, codes=None):
     """
     Strategy 2: Product code to ingredient mapping
     Use rxnorm_code_map to convert product/brand codes to ingredient codes
     """
     logger.info("\nStrategy 2: Product-to-ingredient RxNorm mapping...")
     
-    # Get valid ingredient RxNorm codes (non-supportive care chemo)
-    chemo_drugs = drugs_df[
-        (drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
-        (drugs_df['is_supportive_care'] == False)
-    ].copy()
-    valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int))
-    
-    # Create product-to-ingredient lookup
-    product_to_ingredient = {}
-    for _, row in rxnorm_map_df.iterrows():
-        if pd.notna(row['ingredient_rxcui']) and pd.notna(row['code_cui']):
-            ingredient_cui = int(row['ingredient_rxcui'])
-            if ingredient_cui in valid_rxnorm_in:
-                product_to_ingredient[int(row['code_cui'])] = ingredient_cui
-    
-    logger.info(f"  Found {len(product_to_ingredient)} product codes mapping to chemotherapy ingredients")
+    logger.info(f"  Found {len(reference.product_to_ingredient)} product codes mapping to chemotherapy ingredients")
     
     # Match medications
+    if codes is None:
+        codes = explode_medication_codes(medications_df)
+    hits = reference.product_matches(codes, on='rxcui')
+    matched_products = group_codes(hits, 'rxcui')
+    mapped_ingredients = group_codes(hits, 'ingredient')
+    
+    index = medications_df.index.tolist()
     matches = []
-    for idx, row in medications_df.iterrows():
-        rx_codes = parse_rxnorm_codes(row['rx_norm_codes'])
-        matched_products = [code for code in rx_codes if code in product_to_ingredient]
-        
-        if matched_products:
-            matches.append({
-                'index': idx,
-                'strategy': 'product_code_mapping',
-                'matched_codes': matched_products,
-                'mapped_ingredients': [product_to_ingredient[code] for code in matched_products],
-                'confidence': 'high'
-            })
+    for position, rx_codes in matched_products.items():
+        matches.append({
+            'index': index[position],
+            'strategy': 'product_code_mapping',
+            'matched_codes': rx_codes,
+            'mapped_ingredients': mapped_ingredients[position],
+            'confidence': 'high'
+        })
     
     logger.info(f"  Matched {len(matches)} medications by product code mapping")
     return matches
 
 
-def match_by_drug_alias(medications_df, drug_alias_df, drugs_df):
+def match_by_drug_alias(medications_df, reference):
     """
     Strategy 3: Name-based matching via drug_alias
     Normalize medication names and match against drug_alias.normalized_key
     """
     logger.info("\nStrategy 3: Name-based matching via drug aliases...")
     
-    # Get drug IDs for non-supportive care chemo (from drugs_df)
-    chemo_drug_ids = set(drugs_df[
-        (drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
-        (drugs_df['is_supportive_care'] == False)
-    ]['drug_id'])
-    
-    # Filter drug aliases to only chemotherapy drugs
-    chemo_aliases = drug_alias_df[
-        drug_alias_df['drug_id'].isin(chemo_drug_ids)
-    ].copy()
-    
-    # Create normalized name lookup
-    alias_lookup = {}
-    for _, row in chemo_aliases.iterrows():
-        normalized = row['normalized_key'] if pd.notna(row['normalized_key']) else normalize_text(row.iloc[1])
-        if normalized:
-            alias_lookup[normalized] = row['drug_id']
-    
+    # Normalized alias -> drug_id of the non-supportive care chemo drugs
+    alias_lookup = reference.alias_lookup
     logger.info(f"  Created lookup with {len(alias_lookup)} normalized chemotherapy drug names")
     
-    # Normalize and match medication names
+    # Normalize each distinct medication name once and match
+    names = medications_df['medication_name'].tolist()
+    normalized = {}
+    for name in names:
+        if name not in normalized:
+            normalized[name] = normalize_text(name)
+    
     matches = []
-    for idx, row in medications_df.iterrows():
-        normalized_name = normalize_text(row['medication_name'])
+    for idx, name in zip(medications_df.index.tolist(), names):
+        normalized_name = normalized[name]
         
         if normalized_name in alias_lookup:
             matches.append({
@@ -215,15 +203,20 @@ def match_by_care_plan_oncology(medications_df):
     """
     logger.info("\nStrategy 4: Care plan ONCOLOGY TREATMENT category matching...")
     
+    categories = column_values(medications_df, 'care_plan_categories', '')
+    oncology = {}
+    for value in categories:
+        if value not in oncology:
+            oncology[value] = 'ONCOLOGY TREATMENT' in str(value).upper()
+    titles = column_values(medications_df, 'care_plan_title', '')
+    
     matches = []
-    for idx, row in medications_df.iterrows():
-        care_plan_categories = str(row.get('care_plan_categories', ''))
-        
-        if 'ONCOLOGY TREATMENT' in care_plan_categories.upper():
+    for idx, value, title in zip(medications_df.index.tolist(), categories, titles):
+        if oncology[value]:
             matches.append({
                 'index': idx,
                 'strategy': 'care_plan_oncology',
-                'care_plan_title': row.get('care_plan_title', ''),
+                'care_plan_title': title,
                 'confidence': 'high'
             })
     
@@ -231,6 +224,15 @@ def match_by_care_plan_oncology(medications_df):
     return matches
 
 
+REASON_CODE_PATTERNS = [
+    'antineoplastic chemotherapy',
+    'chemotherapy encounter',
+    'encounter for antineoplastic',
+    'chemotherapy administration'
+]
+REASON_CODE_AUTOMATON = AliasAutomaton({pattern: [pattern] for pattern in REASON_CODE_PATTERNS})
+
+
 def match_by_reason_codes(medications_df):
     """
     Strategy 5: Reason codes containing chemotherapy indicators
@@ -238,19 +240,12 @@ def match_by_reason_codes(medications_df):
     """
     logger.info("\nStrategy 5: Reason code chemotherapy indicators...")
     
-    chemo_patterns = [
-        'antineoplastic chemotherapy',
-        'chemotherapy encounter',
-        'encounter for antineoplastic',
-        'chemotherapy administration'
-    ]
+    # One automaton pass per distinct reason code text
+    matched = REASON_CODE_AUTOMATON.match_values(column_values(medications_df, 'reason_codes', ''))
     
     matches = []
-    for idx, row in medications_df.iterrows():
-        reason_codes = str(row.get('reason_codes', '')).lower()
-        
-        if any(pattern in reason_codes for pattern in chemo_patterns):
-            matched_patterns = [p for p in chemo_patterns if p in reason_codes]
+    for idx, matched_patterns in zip(medications_df.index.tolist(), matched):
+        if matched_patterns:
             matches.append({
                 'index': idx,
                 'strategy': 'reason_codes',
@@ -363,14 +358,15 @@ def generate_summary(chemo_df, matched_indices, medications_df, output_file):
     logger.info(f"{'='*80}\n")
 
 
-def main():
-    """Main execution"""
+def main(config=None):
+    """Main execution (config is supplied when run from run_all_extractions.py)"""
     start_time = datetime.now()
     
     # Load patient configuration
-    config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
-    with open(config_file) as f:
-        config = json.load(f)
+    if config is None:
+        config_file = Path(__file__).parent.parent.parent / 'patient_config.json'
+        with open(config_file) as f:
+            config = json.load(f)
     
     output_dir = Path(config['output_dir'])
     input_file = output_dir / 'medications.csv'
@@ -394,21 +390,22 @@ def main():
     logger.info(f"  Loaded {len(medications_df)} medication records\n")
     
     # Load reference data
-    drugs_df, drug_alias_df, rxnorm_map_df = load_reference_data()
+    reference = load_reference_data()
+    codes = explode_medication_codes(medications_df)
     
     # Execute all matching strategies
     all_matches = []
     
     # Strategy 1: RxNorm ingredient matching
-    matches_1 = match_by_rxnorm_ingredient(medications_df, drugs_df)
+    matches_1 = match_by_rxnorm_ingredient(medications_df, reference, codes)
     all_matches.append(matches_1)
     
     # Strategy 2: Product code mapping
-    matches_2 = match_by_product_code_mapping(medications_df, drugs_df, rxnorm_map_df)
+    matches_2 = match_by_product_code_mapping(medications_df, reference, codes)
     all_matches.append(matches_2)
     
     # Strategy 3: Drug alias name matching
-    matches_3 = match_by_drug_alias(medications_df, drug_alias_df, drugs_df)
+    matches_3 = match_by_drug_alias(medications_df, reference)
     all_matches.append(matches_3)
     
     # Strategy 4: Care plan ONCOLOGY category
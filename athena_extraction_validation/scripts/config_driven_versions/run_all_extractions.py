@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Run All Config-Driven Extractions (parallel DAG)
+
+Replaces the sequential run_all_extractions.sh loop. The extraction scripts are
+modelled as a dependency graph and run in-process:
+
+- Independent extractors (encounters, medications, procedures, imaging,
+  measurements, diagnoses, radiation, binary files) run concurrently, as
+  threads of one process: each node's print() output is buffered and written
+  out in one block when the node ends, and the scripts keep per-run state off
+  module globals
+- A node fails if its main() raises or returns non-zero (the scripts return 1
+  when an Athena query fails)
+- filter_chemotherapy_from_medications starts as soon as medications finishes
+- All nodes share one AthenaQueryEngine (one boto3 session/client)
+- A failed node is retried on its own; its dependents are skipped if it never succeeds
+- Many patients run at once through one bounded worker pool
+- A per-node timing report (CSV) shows where the wall-clock time goes
+
+Usage:
+    # Patient in ../../patient_config.json
+    python3 run_all_extractions.py
+
+    # Whole cohort, 8 concurrent nodes, batched Athena scans (see cohort_batch_extraction.py)
+    python3 run_all_extractions.py --cohort-config ../../cohort_config.json --workers 8 --batch-size 100
+
+    # Subset of nodes (dependencies are added automatically)
+    python3 run_all_extractions.py --only filter_chemotherapy
+"""
+
+import argparse
+import importlib
+import io
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# Shared Athena query engine (src/athena_query_engine.py)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
+from cohort_batch_extraction import CohortPatientEngine, CohortQueryBatcher, load_cohort_config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExtractionNode:
+    """One extraction script in the dependency graph"""
+    name: str
+    module: str
+    depends_on: Tuple[str, ...] = ()
+    uses_engine: bool = True  # main(config, engine) vs main(config)
+
+
+EXTRACTION_DAG = [
+    ExtractionNode('encounters', 'extract_all_encounters_metadata'),
+    ExtractionNode('medications', 'extract_all_medications_metadata'),
+    ExtractionNode('procedures', 'extract_all_procedures_metadata'),
+    ExtractionNode('imaging', 'extract_all_imaging_metadata'),
+    ExtractionNode('measurements', 'extract_all_measurements_metadata'),
+    ExtractionNode('diagnoses', 'extract_all_diagnoses_metadata'),
+    ExtractionNode('radiation', 'extract_radiation_data'),
+    ExtractionNode('binary_files', 'extract_all_binary_files_metadata'),
+    ExtractionNode('filter_chemotherapy', 'filter_chemotherapy_from_medications',
+                   depends_on=('medications',), uses_engine=False),
+]
+
+
+def select_nodes(nodes: List[ExtractionNode], only: Optional[List[str]] = None) -> List[ExtractionNode]:
+    """
+    Validate the graph and restrict it to `only` plus their dependencies.
+
+    Args:
+        nodes: Full node list
+        only: Node names to run (None = all)
+
+    Returns:
+        Node list in dependency order
+
+    Raises:
+        ValueError: Unknown node/dependency names or a dependency cycle
+    """
+    by_name = {node.name: node for node in nodes}
+    for node in nodes:
+        for dep in node.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"{node.name} depends on unknown node {dep}")
+
+    wanted = set(by_name) if not only else set()
+    stack = list(only or [])
+    while stack:
+        name = stack.pop()
+        if name not in by_name:
+            raise ValueError(f"Unknown extraction node: {name}")
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(by_name[name].depends_on)
+
+    # Topological order (Kahn's algorithm), stable with respect to the input order
+    remaining = {node.name: set(node.depends_on) for node in nodes if node.name in wanted}
+    ordered = []
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dependency cycle between: {', '.join(sorted(remaining))}")
+        for name in ready:
+            del remaining[name]
+            ordered.append(by_name[name])
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return ordered
+
+
+class NodeOutput(io.TextIOBase):
+    """
+    sys.stdout while nodes run: print() from a node's thread goes to that node's buffer.
+
+    Threads without a buffer (the scheduler) write straight through.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if getattr(self._local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def start(self):
+        self._local.buffer = io.StringIO()
+
+    def finish(self, header: str):
+        """Write this thread's buffered output as one block."""
+        text = self._local.buffer.getvalue()
+        self._local.buffer = None
+        if text:
+            with self._lock:
+                self.stream.write(f"\n----- {header} -----\n{text}")
+                self.stream.flush()
+
+
+def run_node(node: ExtractionNode, config: dict, engine) -> Dict:
+    """
+    Run one extraction script for one patient.
+
+    Returns:
+        Dict with status ('success'/'failed'), start/end timestamps and error text
+    """
+    module = importlib.import_module(node.module)
+    output = sys.stdout if isinstance(sys.stdout, NodeOutput) else None
+    if output is not None:
+        output.start()
+    start = time.time()
+    error = None
+
+    try:
+        if node.uses_engine:
+            result = module.main(config=config, engine=engine)
+        else:
+            result = module.main(config=config)
+        # Scripts signal failure (a failed Athena query included) with a non-zero int
+        if result is None:
+            error = "main() returned no status"
+        elif isinstance(result, int) and result != 0:
+            error = f"exit code {result}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if output is not None:
+            output.finish(f"{node.name} ({config['fhir_id']})")
+
+    return {
+        'status': 'failed' if error else 'success',
+        'start': start,
+        'end': time.time(),
+        'error': error,
+    }
+
+
+class ExtractionDAGRunner:
+    """
+    Schedule (patient, node) tasks onto a bounded thread pool in dependency order.
+    """
+
+    def __init__(
+        self,
+        engine: AthenaQueryEngine,
+        nodes: List[ExtractionNode],
+        workers: int = 4,
+        retries: int = 1,
+        retry_delay: float = 5.0,
+        batch_size: int = 1
+    ):
+        """
+        Initialize runner.
+
+        Args:
+            engine: Shared engine used by every node
+            nodes: Nodes to run (already validated by select_nodes)
+            workers: Maximum concurrently running nodes across all patients
+            retries: Extra attempts for a failed node
+            retry_delay: Seconds before the first retry (doubles each attempt)
+            batch_size: Patients sharing batched Athena scans (1 = per-patient queries)
+        """
+        self.engine = engine
+        self.nodes = nodes
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+
+    def _patient_engines(self, patient_configs: List[dict]) -> List:
+        """One engine per patient: the shared engine, or a cohort batch proxy."""
+        if self.batch_size <= 1:
+            return [self.engine] * len(patient_configs)
+
+        engines = []
+        for offset in range(0, len(patient_configs), self.batch_size):
+            batch = patient_configs[offset:offset + self.batch_size]
+            batcher = CohortQueryBatcher(self.engine, [c['fhir_id'] for c in batch])
+            engines.extend(CohortPatientEngine(batcher, c['fhir_id']) for c in batch)
+        return engines
+
+    def _attempt(self, node: ExtractionNode, config: dict, engine, attempt: int) -> Dict:
+        if attempt > 1:
+            time.sleep(self.retry_delay * 2 ** (attempt - 2))
+        return run_node(node, config, engine)
+
+    def run(self, patient_configs: List[dict]) -> List[Dict]:
+        """
+        Run every node for every patient.
+
+        Args:
+            patient_configs: patient_config.json-style dicts
+
+        Returns:
+            One report row per (patient, node)
+        """
+        engines = self._patient_engines(patient_configs)
+        # Import-time setup (logging, sys.path) runs once, here, rather than racing in the workers
+        for node in self.nodes:
+            importlib.import_module(node.module)
+        state = {}  # (patient index, node name) -> status
+        attempts = {}
+        report = []
+
+        def ready_tasks():
+            for p, _ in enumerate(patient_configs):
+                for node in self.nodes:
+                    if (p, node.name) in state:
+                        continue
+                    dep_states = [state.get((p, dep)) for dep in node.depends_on]
+                    if any(s in ('failed', 'skipped') for s in dep_states):
+                        state[(p, node.name)] = 'skipped'
+                        report.append(self._row(patient_configs[p], node, 'skipped', 0, None,
+                                                f"dependency failed: {', '.join(node.depends_on)}"))
+                    elif all(s == 'success' for s in dep_states):
+                        yield p, node
+
+        stdout = sys.stdout
+        sys.stdout = NodeOutput(stdout)  # print() per node, not interleaved
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                in_flight = {}
+
+                def submit(p, node):
+                    attempts[(p, node.name)] = attempts.get((p, node.name), 0) + 1
+                    state[(p, node.name)] = 'running'
+                    future = executor.submit(
+                        self._attempt, node, patient_configs[p], engines[p], attempts[(p, node.name)]
+                    )
+                    in_flight[future] = (p, node)
+
+                for p, node in list(ready_tasks()):
+                    submit(p, node)
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        p, node = in_flight.pop(future)
+                        result = future.result()
+                        key = (p, node.name)
+                        patient_id = patient_configs[p]['fhir_id']
+
+                        if result['status'] == 'failed' and attempts[key] <= self.retries:
+                            logger.warning(f"  ⚠️  {node.name} failed for {patient_id} "
+                                           f"(attempt {attempts[key]}): {result['error']} - retrying")
+                            submit(p, node)
+                            continue
+
+                        state[key] = result['status']
+                        report.append(self._row(patient_configs[p], node, result['status'],
+                                                attempts[key], result, result['error']))
+                        icon = '✅' if result['status'] == 'success' else '❌'
+                        logger.info(f"  {icon} {node.name} for {patient_id} "
+                                    f"in {result['end'] - result['start']:.1f}s")
+
+                    for p, node in list(ready_tasks()):
+                        submit(p, node)
+        finally:
+            sys.stdout = stdout
+
+        return report
+
+    @staticmethod
+    def _row(config: dict, node: ExtractionNode, status: str, attempts: int,
+             result: Optional[Dict], error: Optional[str]) -> Dict:
+        return {
+            'patient_fhir_id': config['fhir_id'],
+            'node': node.name,
+            'depends_on': ','.join(node.depends_on),
+            'status': status,
+            'attempts': attempts,
+            'start_time': datetime.fromtimestamp(result['start']).isoformat() if result else '',
+            'end_time': datetime.fromtimestamp(result['end']).isoformat() if result else '',
+            'duration_seconds': round(result['end'] - result['start'], 2) if result else 0.0,
+            'error': error or '',
+        }
+
+
+def summarize_report(report_df: pd.DataFrame, wall_seconds: float):
+    """Log per-node timing totals so the slow stages stand out"""
+    logger.info(f"\n{'='*80}")
+    logger.info("PER-NODE TIMING")
+    logger.info(f"{'='*80}")
+
+    ran = report_df[report_df['status'] != 'skipped']
+    if not ran.empty:
+        per_node = ran.groupby('node')['duration_seconds'].agg(['count', 'sum', 'mean', 'max'])
+        per_node = per_node.sort_values('sum', ascending=False)
+        logger.info(f"  {'node':<22}{'runs':>6}{'total s':>10}{'mean s':>10}{'max s':>10}")
+        for node, row in per_node.iterrows():
+            logger.info(f"  {node:<22}{int(row['count']):>6}{row['sum']:>10.1f}{row['mean']:>10.1f}{row['max']:>10.1f}")
+        busy = ran['duration_seconds'].sum()
+        logger.info(f"\n  Node time: {busy:.1f}s  Wall clock: {wall_seconds:.1f}s  "
+                    f"Speedup vs sequential: {busy / wall_seconds if wall_seconds else 0:.1f}x")
+
+    counts = report_df['status'].value_counts().to_dict()
+    logger.info(f"  Status: {counts}")
+
+    failed = report_df[report_df['status'] == 'failed']
+    for _, row in failed.iterrows():
+        logger.info(f"  ❌ {row['node']} ({row['patient_fhir_id']}): {row['error']}")
+
+
+def main():
+    """Main execution"""
+    parser = argparse.ArgumentParser(description='Run config-driven extractions as a parallel DAG')
+    parser.add_argument('--config', type=Path,
+                        default=Path(__file__).parent.parent.parent / 'patient_config.json',
+                        help='Single patient_config.json (ignored with --cohort-config)')
+    parser.add_argument('--cohort-config', type=Path,
+                        help='Cohort config JSON (shared settings + patients list)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Maximum concurrently running extraction nodes')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='Extra attempts for a failed node')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Patients sharing batched Athena scans (1 = per-patient queries)')
+    parser.add_argument('--only', nargs='+', choices=[node.name for node in EXTRACTION_DAG],
+                        help='Run only these nodes (plus their dependencies)')
+    parser.add_argument('--report', type=Path, default=Path('extraction_timing_report.csv'),
+                        help='Per-node timing report CSV')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore the Athena result cache even if patient_config.json enables it')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Re-run every query and overwrite its cached result')
+    args = parser.parse_args()
+
+    if args.cohort_config:
+        patient_configs = load_cohort_config(args.cohort_config)
+    else:
+        if not args.config.exists():
+            logger.error(f"❌ patient_config.json not found at {args.config}")
+            logger.error("Run this first: python3 scripts/initialize_patient_config.py <patient_fhir_id>")
+            return 1
+        with open(args.config) as f:
+            patient_configs = [json.load(f)]
+
+    nodes = select_nodes(EXTRACTION_DAG, args.only)
+
+    logger.info("=" * 80)
+    logger.info("RUNNING ALL CONFIG-DRIVEN EXTRACTIONS (PARALLEL DAG)")
+    logger.info("=" * 80)
+    logger.info(f"Patients: {len(patient_configs)}")
+    logger.info(f"Nodes: {', '.join(node.name for node in nodes)}")
+    logger.info(f"Workers: {args.workers}  Retries: {args.retries}  Batch size: {args.batch_size}")
+
+    cache_options = {'refresh': args.refresh}
+    if args.no_cache:
+        cache_options['enabled'] = False
+    engine = AthenaQueryEngine.from_patient_config(
+        patient_configs[0], cache=QueryResultCache.from_config(patient_configs[0], **cache_options)
+    )
+    runner = ExtractionDAGRunner(
+        engine, nodes, workers=args.workers, retries=args.retries, batch_size=args.batch_size
+    )
+
+    start = time.time()
+    report = runner.run(patient_configs)
+    wall_seconds = time.time() - start
+
+    report_df = pd.DataFrame(report)
+    report_df.to_csv(args.report, index=False)
+    summarize_report(report_df, wall_seconds)
+    if engine.cache is not None:
+        logger.info(f"  {engine.cache.summary()}")
+    logger.info(f"\nTiming report: {args.report}")
+
+    return 1 if (report_df['status'] != 'success').any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
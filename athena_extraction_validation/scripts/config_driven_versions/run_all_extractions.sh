@@ -2,7 +2,7 @@
 #
 # Run all config-driven extraction scripts for the patient specified in patient_config.json
 #
-# Usage: ./run_all_extractions.sh
+# Usage: ./run_all_extractions.sh [run_all_extractions.py options]
 #
 
 set -e  # Exit on error
@@ -34,48 +34,14 @@ echo "Patient FHIR ID: $PATIENT_ID"
 echo "Output Directory: ../../$OUTPUT_DIR"
 echo ""
 
-# Array of extraction scripts
-SCRIPTS=(
-    "extract_all_encounters_metadata.py"
-    "extract_all_medications_metadata.py"
-    "extract_all_procedures_metadata.py"
-    "extract_all_imaging_metadata.py"
-    "extract_all_measurements_metadata.py"
-    "extract_all_diagnoses_metadata.py"
-    "extract_radiation_data.py"
-    "extract_all_binary_files_metadata.py"
-)
-
-# Run each script
-TOTAL=${#SCRIPTS[@]}
-CURRENT=0
-
-for SCRIPT in "${SCRIPTS[@]}"; do
-    CURRENT=$((CURRENT + 1))
-    echo "--------------------------------------------------------------------------------"
-    echo "[$CURRENT/$TOTAL] Running: $SCRIPT"
-    echo "--------------------------------------------------------------------------------"
-    
-    if [ ! -f "$SCRIPT" ]; then
-        echo "⚠️  Script not found: $SCRIPT (skipping)"
-        echo ""
-        continue
-    fi
-    
-    START_TIME=$(date +%s)
-    
-    if python3 "$SCRIPT" 2>&1 | tail -20; then
-        END_TIME=$(date +%s)
-        DURATION=$((END_TIME - START_TIME))
-        echo "✅ Completed in ${DURATION}s"
-    else
-        echo "❌ Failed"
-        exit 1
-    fi
-    
-    echo ""
-done
+# Extraction scripts run as a parallel dependency graph (see run_all_extractions.py):
+# independent extractors run concurrently, filter_chemotherapy_from_medications
+# waits for medications, failed nodes are retried, and a per-node timing report
+# is written to extraction_timing_report.csv. Extra arguments are passed through
+# (e.g. --workers 8, --only medications filter_chemotherapy).
+python3 run_all_extractions.py --config "$CONFIG_FILE" "$@"
 
+echo ""
 echo "================================================================================"
 echo "ALL EXTRACTIONS COMPLETE"
 echo "================================================================================"
@@ -29,7 +29,11 @@ import json
 from datetime import datetime, timedelta
 from pathlib import Path
 import sys
-import time
+
+# Shared Athena query engine + result cache (src/)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache, add_cache_arguments
 
 class DiagnosisValidator:
     """Validate diagnosis extraction against gold standard"""
@@ -56,14 +60,20 @@ class DiagnosisValidator:
     }
     
     def __init__(self, aws_profile: str, database: str, patient_fhir_id: str, 
-                 patient_research_id: str, birth_date: str):
+                 patient_research_id: str, birth_date: str, cache: QueryResultCache = None):
         self.session = boto3.Session(profile_name=aws_profile)
         self.athena = self.session.client('athena', region_name='us-east-1')
         self.database = database
+        self.output_location = 's3://aws-athena-query-results-343218191717-us-east-1/'
+        self.engine = AthenaQueryEngine(
+            self.athena,
+            database=self.database,
+            output_location=self.output_location,
+            cache=cache
+        )
         self.patient_fhir_id = patient_fhir_id
         self.patient_research_id = patient_research_id
         self.birth_date = datetime.strptime(birth_date, '%Y-%m-%d')
-        self.output_location = 's3://aws-athena-query-results-343218191717-us-east-1/'
     
     def molecular_tests_match(self, athena_val: str, gold_val: str) -> bool:
         """Check if molecular test names are semantically equivalent"""
@@ -95,63 +105,20 @@ class DiagnosisValidator:
         return False
         
     def execute_query(self, query: str, description: str = "") -> list:
-        """Execute Athena query and return results"""
+        """Execute Athena query (or read it from the local result cache) and return results"""
         print(f"  Executing: {description}...", end='', flush=True)
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.output_location}
-            )
-            
-            query_execution_id = response['QueryExecutionId']
-            
-            # Wait for query to complete
-            max_attempts = 30
-            attempt = 0
-            while attempt < max_attempts:
-                attempt += 1
-                query_status = self.athena.get_query_execution(
-                    QueryExecutionId=query_execution_id
-                )
-                status = query_status['QueryExecution']['Status']['State']
-                
-                if status == 'SUCCEEDED':
-                    break
-                elif status in ['FAILED', 'CANCELLED']:
-                    reason = query_status['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                    print(f" FAILED: {reason}")
-                    return []
-                
-                time.sleep(1)
+            hits_before = self.engine.cache.hits if self.engine.cache else 0
+            df = self.engine.query(query, typed=False)
+            cached = ' cached' if self.engine.cache and self.engine.cache.hits > hits_before else ''
             
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_execution_id)
-            
-            # Parse results
-            if not results.get('ResultSet', {}).get('Rows'):
-                print(" No results")
-                return []
-            
-            rows = results['ResultSet']['Rows']
-            if len(rows) <= 1:  # Only header
+            if df.empty:
                 print(" No data rows")
                 return []
             
-            # Extract column names
-            columns = [col['VarCharValue'] for col in rows[0]['Data']]
-            
-            # Extract data rows
-            data_rows = []
-            for row in rows[1:]:
-                row_data = {}
-                for i, col in enumerate(row['Data']):
-                    value = col.get('VarCharValue', None)
-                    row_data[columns[i]] = value
-                data_rows.append(row_data)
-            
-            print(f" ✓ ({len(data_rows)} rows)")
+            data_rows = df.to_dict('records')
+            print(f" ✓ ({len(data_rows)} rows{cached})")
             return data_rows
             
         except Exception as e:
@@ -730,8 +697,10 @@ def main():
                        help='AWS profile name')
     parser.add_argument('--database', default='fhir_v2_prd_db',
                        help='Athena database name')
+    add_cache_arguments(parser)
     
     args = parser.parse_args()
+    cache = QueryResultCache.from_args(args)
     
     print("=" * 60)
     print("DIAGNOSIS CSV VALIDATION")
@@ -748,11 +717,13 @@ def main():
         database=args.database,
         patient_fhir_id=args.patient_fhir_id,
         patient_research_id=args.patient_research_id,
-        birth_date=args.patient_birth_date
+        birth_date=args.patient_birth_date,
+        cache=cache
     )
     
     # Extract from Athena
     athena_events = validator.extract_from_athena()
+    print(f"\n{cache.summary()}")
     
     if not athena_events:
         print("\n❌ FAILED: Could not extract diagnosis data from Athena")
@@ -19,18 +19,28 @@ import pandas as pd
 from datetime import datetime
 from pathlib import Path
 import sys
-import time
 from typing import List, Dict, Optional
 import hashlib
 
+# Shared Athena query engine + result cache (src/)
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache, add_cache_arguments
+
 class EncountersValidator:
     """Validate encounters extraction against gold standard"""
     
-    def __init__(self, aws_profile: str, database: str):
+    def __init__(self, aws_profile: str, database: str, cache: QueryResultCache = None):
         self.session = boto3.Session(profile_name=aws_profile)
         self.athena = self.session.client('athena', region_name='us-east-1')
         self.database = database
         self.output_location = 's3://aws-athena-query-results-343218191717-us-east-1/'
+        self.engine = AthenaQueryEngine(
+            self.athena,
+            database=self.database,
+            output_location=self.output_location,
+            cache=cache
+        )
         
         # Patient C1277724 details
         self.patient_research_id = "C1277724"
@@ -38,51 +48,20 @@ class EncountersValidator:
         self.birth_date = datetime.strptime('2005-05-13', '%Y-%m-%d')
         
     def execute_query(self, query: str, description: str = "") -> List[Dict]:
-        """Execute Athena query and return results"""
+        """Execute Athena query (or read it from the local result cache) and return results"""
         print(f"  Executing: {description}...", end='', flush=True)
         
         try:
-            response = self.athena.start_query_execution(
-                QueryString=query,
-                QueryExecutionContext={'Database': self.database},
-                ResultConfiguration={'OutputLocation': self.output_location}
-            )
-            
-            query_execution_id = response['QueryExecutionId']
+            hits_before = self.engine.cache.hits if self.engine.cache else 0
+            df = self.engine.query(query, typed=False)
+            cached = ' cached' if self.engine.cache and self.engine.cache.hits > hits_before else ''
             
-            # Poll for completion
-            max_attempts = 60
-            for attempt in range(max_attempts):
-                status_response = self.athena.get_query_execution(QueryExecutionId=query_execution_id)
-                status = status_response['QueryExecution']['Status']['State']
-                
-                if status == 'SUCCEEDED':
-                    break
-                elif status in ['FAILED', 'CANCELLED']:
-                    reason = status_response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                    print(f" ✗ ({reason})")
-                    return []
-                
-                time.sleep(1)
-            
-            # Get results
-            results = self.athena.get_query_results(QueryExecutionId=query_execution_id)
-            
-            if not results.get('ResultSet', {}).get('Rows') or len(results['ResultSet']['Rows']) <= 1:
+            if df.empty:
                 print(f" ✓ (0 rows)")
                 return []
             
-            rows = results['ResultSet']['Rows']
-            columns = [col['VarCharValue'] for col in rows[0]['Data']]
-            
-            data_rows = []
-            for row in rows[1:]:
-                row_data = {}
-                for i, col in enumerate(row['Data']):
-                    row_data[columns[i]] = col.get('VarCharValue', None)
-                data_rows.append(row_data)
-            
-            print(f" ✓ ({len(data_rows)} rows)")
+            data_rows = df.to_dict('records')
+            print(f" ✓ ({len(data_rows)} rows{cached})")
             return data_rows
             
         except Exception as e:
@@ -382,11 +361,13 @@ def main():
     parser.add_argument('--gold-standard',
                        default='data/20250723_multitab_csvs/20250723_multitab__encounters.csv',
                        help='Path to gold standard encounters CSV')
+    add_cache_arguments(parser)
     
     args = parser.parse_args()
+    cache = QueryResultCache.from_args(args)
     
     # Initialize validator
-    validator = EncountersValidator(args.aws_profile, args.database)
+    validator = EncountersValidator(args.aws_profile, args.database, cache=cache)
     
     # Print configuration
     print(f"{'='*60}")
@@ -401,6 +382,7 @@ def main():
     
     # Extract from Athena
     extracted = validator.extract_encounters_from_athena()
+    print(f"\n{cache.summary()}")
     
     # Load gold standard
     gold_standard = validator.load_gold_standard(args.gold_standard)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Athena result fetch modes
+
+Compares rows/sec for:
+1. legacy     - the per-row dict building used by the old execute_query methods
+2. api        - AthenaQueryEngine GetQueryResults paging (fetch_mode='api')
+3. s3_csv     - one streaming GET of the result CSV from S3 (fetch_mode='s3_csv')
+
+No AWS access needed: Athena is replaced by an in-process stand-in that serves
+GetQueryResults pages, and S3 is served by moto (pip install moto).
+--page-latency adds a simulated round trip per GetQueryResults call (real
+Athena pages typically take 100-300ms each); the S3 GET is charged once.
+
+Usage:
+    python benchmarks/benchmark_athena_fetch.py --rows 50000 --columns 20 --page-latency 0.15
+"""
+
+import argparse
+import csv
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+from athena_query_engine import AthenaQueryEngine
+
+BUCKET = 'benchmark-athena-results'
+QUERY_ID = 'benchmark-query'
+
+
+class StandInAthena:
+    """Minimal Athena client serving one pre-built result set."""
+
+    def __init__(self, columns, rows, output_location, page_latency=0.0):
+        self.columns = columns
+        self.rows = rows
+        self.output_location = output_location
+        self.page_latency = page_latency
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': {
+            'QueryExecutionId': QueryExecutionId,
+            'Status': {'State': 'SUCCEEDED'},
+            'ResultConfiguration': {'OutputLocation': self.output_location},
+        }}
+
+    def get_query_results(self, QueryExecutionId, MaxResults=1000, NextToken=None):
+        time.sleep(self.page_latency)
+        start = int(NextToken or 0)
+        page = []
+        if start == 0:
+            page.append({'Data': [{'VarCharValue': c} for c in self.columns]})
+        end = min(len(self.rows), start + MaxResults - len(page))
+        for row in self.rows[start:end]:
+            page.append({'Data': [{'VarCharValue': v} if v != '' else {} for v in row]})
+
+        response = {'ResultSet': {
+            'Rows': page,
+            'ResultSetMetadata': {'ColumnInfo': [
+                {'Name': c, 'Label': c, 'Type': 'varchar'} for c in self.columns
+            ]},
+        }}
+        if end < len(self.rows):
+            response['NextToken'] = str(end)
+        return response
+
+
+def legacy_fetch(athena, query_id):
+    """The row-by-row parsing the extractors used before the shared engine."""
+    data_rows = []
+    columns = None
+    next_token = None
+    while True:
+        kwargs = {'QueryExecutionId': query_id, 'MaxResults': 1000}
+        if next_token:
+            kwargs['NextToken'] = next_token
+        results = athena.get_query_results(**kwargs)
+        rows = results['ResultSet']['Rows']
+        if columns is None:
+            columns = [col['VarCharValue'] for col in rows[0]['Data']]
+            rows = rows[1:]
+        for row in rows:
+            row_data = {}
+            for i, col in enumerate(columns):
+                value = row['Data'][i].get('VarCharValue', '') if i < len(row['Data']) else ''
+                row_data[col] = value
+            data_rows.append(row_data)
+        next_token = results.get('NextToken')
+        if not next_token:
+            break
+    return data_rows
+
+
+def build_result_set(n_rows, n_columns):
+    columns = [f'col_{i}' for i in range(n_columns)]
+    rows = [
+        [f'value-{r}-{c}' if (r + c) % 11 else '' for c in range(n_columns)]
+        for r in range(n_rows)
+    ]
+    return columns, rows
+
+
+def to_athena_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def timed(label, n_rows, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {elapsed:8.3f}s  {n_rows / elapsed:>12,.0f} rows/sec")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Athena result fetch modes')
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--columns', type=int, default=20)
+    parser.add_argument('--page-latency', type=float, default=0.0,
+                        help='Simulated seconds per GetQueryResults/GetObject round trip')
+    args = parser.parse_args()
+
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        print("❌ moto is required for the S3 stand-in: pip install moto")
+        return 1
+
+    columns, rows = build_result_set(args.rows, args.columns)
+    output_location = f's3://{BUCKET}/results/{QUERY_ID}.csv'
+    athena = StandInAthena(columns, rows, output_location, args.page_latency)
+
+    print(f"\n{'='*60}")
+    print(f"ATHENA FETCH BENCHMARK: {args.rows:,} rows x {args.columns} columns")
+    print(f"{'='*60}")
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket=BUCKET)
+        s3.put_object(Bucket=BUCKET, Key=f'results/{QUERY_ID}.csv', Body=to_athena_csv(columns, rows))
+
+        engine = AthenaQueryEngine(athena, s3_client=s3)
+
+        def fetch_csv():
+            time.sleep(args.page_latency)
+            return engine.fetch_dataframe(QUERY_ID, typed=False, na_value='', fetch_mode='s3_csv')
+
+        legacy = timed('legacy', args.rows, lambda: legacy_fetch(athena, QUERY_ID))
+        api_df = timed('api', args.rows, lambda: engine.fetch_dataframe(
+            QUERY_ID, typed=False, na_value='', fetch_mode='api'))
+        csv_df = timed('s3_csv', args.rows, fetch_csv)
+
+    identical = (
+        len(legacy) == len(api_df) == len(csv_df)
+        and api_df.astype(object).equals(csv_df.astype(object))
+        and legacy[-1] == api_df.iloc[-1].to_dict()
+    )
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-variable vs batched LLM extraction
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient
+(project/variables/decisions CSVs in a temp dir) against a simulated Ollama
+model that answers deterministically and sleeps per call and per prompt token:
+1. per-variable - one call per (variable, document) pair (the default loop)
+2. batched      - --batch-variables: one JSON-answer call per (variable batch,
+                  document), batches sized to --context-tokens
+
+Reports LLM calls, prompt tokens and wall-clock time, and checks that both
+modes produce the same variable_results rows.
+
+Usage:
+    python benchmarks/benchmark_batched_extraction.py --variables 24 --documents 50 --context-tokens 16384
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+
+WORDS = ('patient tumor resection MRI enhancement cerebellar pilocytic astrocytoma stable '
+         'residual vinblastine carboplatin ataxia headache follow-up imaging ventricle '
+         'hydrocephalus shunt BRAF fusion KIAA1549 grade WHO pathology biopsy').split()
+
+
+class SimulatedOllama:
+    """Stand-in for the ollama module: deterministic answers, latency per call and per token."""
+
+    def __init__(self, call_latency, latency_per_1k_tokens):
+        self.call_latency = call_latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    @staticmethod
+    def answer(instruction, note_id):
+        return hashlib.sha1(f'{instruction}|{note_id}'.encode()).hexdigest()[:10]
+
+    def chat(self, model, messages, options=None, format=None, **kwargs):
+        from local_llm_extraction_pipeline_with_ollama import estimate_tokens
+
+        prompt = messages[-1]['content']
+        tokens = estimate_tokens(prompt)
+        self.calls += 1
+        self.prompt_tokens += tokens
+        time.sleep(self.call_latency + self.latency_per_1k_tokens * tokens / 1000)
+
+        note_id = re.search(r'- NOTE_ID: (\S+)', prompt).group(1)
+        # Task sections end at the document (task-first layout) or at the instructions (document-first)
+        task_end = r'\n\n(?:DOCUMENT TEXT|INSTRUCTIONS):'
+        if 'EXTRACTION TASKS:' in prompt:
+            tasks = re.search(r'EXTRACTION TASKS:\n(.*?)' + task_end, prompt, re.S).group(1)
+            answer = {}
+            for block in tasks.split('\n\n'):
+                name, instruction = block[4:].split('\n', 1)
+                answer[name] = self.answer(instruction, note_id)
+            content = json.dumps(answer)
+        else:
+            instruction = re.search(r'EXTRACTION TASK:\n(.*?)' + task_end, prompt, re.S).group(1)
+            content = self.answer(instruction, note_id)
+        return {'message': {'content': content}}
+
+
+def write_inputs(directory, n_variables, n_documents, seed=5):
+    """project/variables/decisions CSVs and a config file for one synthetic patient."""
+    rng = random.Random(seed)
+    patient = 'eBenchmarkPatient'
+    pd.DataFrame([{
+        'NOTE_ID': f'DOC_{i + 1:04d}',
+        'PERSON_ID': 'BENCH',
+        'NOTE_DATETIME': '2020-01-01 00:00:00',
+        'NOTE_TEXT': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(300, 1500))),
+        'NOTE_TITLE': rng.choice(['Progress Notes', 'Pathology', 'MR Brain W & W/O IV Contrast']),
+    } for i in range(n_documents)]).to_csv(directory / f'project_{patient}.csv', index=False)
+    pd.DataFrame([{
+        'variable_name': f'variable_{v:02d}',
+        'instruction': f'Extract finding {v} from the note. Return the value verbatim, or "Unavailable" '
+                       f'if it is not documented. ' + ' '.join(rng.choice(WORDS) for _ in range(40)),
+        'variable_type': 'text',
+        'scope': 'one_per_patient' if v % 4 == 0 else 'many_per_note',
+    } for v in range(n_variables)]).to_csv(directory / f'variables_{patient}.csv', index=False)
+    pd.DataFrame([{'decision_name': 'summary', 'instruction': 'Summarize variable_00'}]).to_csv(
+        directory / f'decisions_{patient}.csv', index=False)
+
+    config = directory / 'config.yaml'
+    config.write_text(yaml.safe_dump({'patient_fhir_id': patient, 'output_dir': str(directory)}))
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-variable vs batched LLM extraction')
+    parser.add_argument('--variables', type=int, default=24)
+    parser.add_argument('--documents', type=int, default=50)
+    parser.add_argument('--context-tokens', type=int, default=16384)
+    parser.add_argument('--call-latency', type=float, default=0.01, help='Simulated seconds per LLM call')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.005,
+                        help='Simulated prompt-processing seconds per 1,000 prompt tokens')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+    model = SimulatedOllama(args.call_latency, args.latency_per_1k_tokens)
+    sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    print(f"\n{'='*60}")
+    print(f"BATCHED EXTRACTION BENCHMARK: {args.variables} variables x {args.documents} documents, "
+          f"{args.context_tokens:,} token context")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = write_inputs(Path(tmp), args.variables, args.documents)
+        for label, batched in (('per-variable', False), ('batched', True)):
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated',
+                                                  batch_variables=batched, context_tokens=args.context_tokens)
+            pipeline.load_input_files()
+            model.calls = model.prompt_tokens = 0
+            start = time.perf_counter()
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<13} {elapsed:7.2f}s  calls={model.calls:6,}  prompt tokens={model.prompt_tokens:11,}")
+            results[label] = (model.calls, model.prompt_tokens, elapsed, [
+                {k: v for k, v in row.items() if k != 'extraction_timestamp'} for row in pipeline.variable_results
+            ])
+
+    base, batch = results['per-variable'], results['batched']
+    print(f"\n  Reduction: {base[0] / batch[0]:.1f}x calls, {base[1] / batch[1]:.1f}x prompt tokens, "
+          f"{base[2] / batch[2]:.1f}x wall-clock")
+
+    identical = base[3] == batch[3]
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: local Binary document store
+
+Runs the same document retrieval twice against a local S3 stand-in (moto):
+1. direct      - get_object + base64 decode per document (the old retrievers)
+2. cold store  - BinaryDocumentStore.prefetch + get_text (first run, fills the store)
+3. warm store  - a new store over the same directory (second run)
+
+The warm run must make zero S3 reads. Also reports the on-disk size after
+compression and content-hash deduplication, and checks LRU eviction.
+
+Usage:
+    python benchmarks/benchmark_binary_store.py --documents 2000 --request-latency 0.02
+"""
+
+import argparse
+import base64
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+
+def build_documents(n_documents, duplicate_fraction=0.2):
+    """Binary ID -> HTML note; some IDs share identical content (copied attachments)."""
+    documents = {}
+    for i in range(n_documents):
+        source = i if (i * 37 % 100) >= duplicate_fraction * 100 else i // 10
+        body = ''.join(f'<p>Progress note {source}: patient seen, MRI stable, plan {j}.</p>' for j in range(40))
+        binary_id = f'Binary/e{i:06d}.Doc-{i * 7919 % 100000:05d}' if i % 2 else f'Binary/f{i:06d}Doc'
+        documents[binary_id] = f'<html><body>{body}</body></html>'
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the local Binary document store')
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--request-latency', type=float, default=0.01,
+                        help='Simulated seconds per S3 request')
+    args = parser.parse_args()
+
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        print("❌ moto is required for the S3 stand-in: pip install moto")
+        return 1
+
+    from botocore.config import Config
+    from binary_document_store import BinaryDocumentStore, DEFAULT_S3_BUCKET, DEFAULT_S3_PREFIX, normalize_binary_id
+
+    documents = build_documents(args.documents)
+
+    print(f"\n{'='*60}")
+    print(f"BINARY DOCUMENT STORE BENCHMARK: {args.documents:,} documents")
+    print(f"{'='*60}")
+
+    with mock_aws(), tempfile.TemporaryDirectory() as store_dir:
+        s3 = boto3.client('s3', region_name='us-east-1',
+                          config=Config(max_pool_connections=args.workers))
+        s3.create_bucket(Bucket=DEFAULT_S3_BUCKET)
+        for binary_id, html in documents.items():
+            s3.put_object(Bucket=DEFAULT_S3_BUCKET, Key=DEFAULT_S3_PREFIX + normalize_binary_id(binary_id),
+                          Body=json.dumps({'resourceType': 'Binary', 'contentType': 'text/html',
+                                           'data': base64.b64encode(html.encode()).decode()}))
+
+        def add_latency(**kwargs):
+            time.sleep(args.request_latency)
+        s3.meta.events.register('before-send.s3', add_latency)
+
+        results = {}
+
+        start = time.perf_counter()
+        direct = {}
+        for binary_id in documents:
+            body = s3.get_object(Bucket=DEFAULT_S3_BUCKET,
+                                 Key=DEFAULT_S3_PREFIX + normalize_binary_id(binary_id))['Body'].read()
+            direct[binary_id] = base64.b64decode(json.loads(body)['data']).decode('utf-8', errors='ignore')
+        results['direct'] = (time.perf_counter() - start, len(documents), direct)
+
+        for label in ('cold store', 'warm store'):
+            store = BinaryDocumentStore(s3_client=s3, store_dir=store_dir, max_workers=args.workers)
+            start = time.perf_counter()
+            store.prefetch(documents)
+            texts = {binary_id: store.get_text(binary_id) for binary_id in documents}
+            results[label] = (time.perf_counter() - start, store.s3_reads, texts)
+            stats = store.stats()
+            store.close()
+
+        for label, (elapsed, reads, _) in results.items():
+            print(f"  {label:<11} {elapsed:8.2f}s  {args.documents / elapsed:>10,.0f} docs/sec  S3 reads={reads:,}")
+
+        print(f"\n  Stored: {stats['documents']:,} documents in {stats['blobs']:,} blobs, "
+              f"{stats['stored_bytes'] / 1024:,.0f} KB on disk ({stats['raw_bytes'] / 1024:,.0f} KB raw)")
+
+        store = BinaryDocumentStore(s3_client=s3, store_dir=store_dir)
+        store.evict(max_bytes=stats['stored_bytes'] // 2)
+        evicted = store.stats()
+        print(f"  Evicted to half size: {evicted['blobs']:,} blobs, {evicted['stored_bytes'] / 1024:,.0f} KB")
+
+    identical = all(texts == direct for _, _, texts in results.values())
+    warm_reads = results['warm store'][1]
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    print(f"  Second run S3 reads: {warm_reads} {'✅' if warm_reads == 0 else '❌'}")
+    return 0 if identical and warm_reads == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
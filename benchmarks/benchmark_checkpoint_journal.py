@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: append-only extraction journal vs pickle checkpoints
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient (see
+benchmark_batched_extraction.py) against a simulated Ollama model:
+1. checkpoint bytes - bytes written by re-pickling variable_results after every
+   variable (the previous save_checkpoint) vs the journal file
+2. crash + resume  - a worker process is killed (os._exit) after --crash-after
+   LLM calls; a second run resumes from the journal without prompting and only
+   calls the model for the pairs that were not journaled
+3. live reader     - a thread polls journal_progress() during the resumed run
+
+Checks that the resumed run returns the same variable_results as an
+uninterrupted run.
+
+Usage:
+    python benchmarks/benchmark_checkpoint_journal.py --variables 12 --documents 60 --crash-after 400
+"""
+
+import argparse
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import SimulatedOllama, write_inputs
+
+
+def make_pipeline(config, crash_after=None):
+    """Pipeline on the simulated model; the process exits hard after crash_after calls."""
+    model = SimulatedOllama(0.001, 0.001)
+    if crash_after:
+        chat = model.chat
+
+        def crashing_chat(*args, **kwargs):
+            if model.calls >= crash_after:
+                os._exit(3)
+            return chat(*args, **kwargs)
+        sys.modules['ollama'] = types.SimpleNamespace(chat=crashing_chat)
+    else:
+        sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated')
+    return pipeline, model
+
+
+def extract(pipeline):
+    """The extraction steps of run() (decisions need a real model)."""
+    resumed = pipeline.load_checkpoint()
+    pipeline.journal.start_run(patient_fhir_id=pipeline.patient_fhir_id, resumed=resumed)
+    pipeline.load_input_files()
+    pipeline.extract_variables()
+    pipeline.journal.close()
+    return [{k: v for k, v in row.items() if k != 'extraction_timestamp'} for row in pipeline.variable_results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction journal')
+    parser.add_argument('--variables', type=int, default=12)
+    parser.add_argument('--documents', type=int, default=60)
+    parser.add_argument('--crash-after', type=int, default=400, help='LLM calls before the worker is killed')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+
+    if args.worker:
+        pipeline, _ = make_pipeline(args.worker, crash_after=args.crash_after)
+        extract(pipeline)
+        return 0
+
+    print(f"\n{'='*60}")
+    print(f"CHECKPOINT JOURNAL BENCHMARK: {args.variables} variables x {args.documents} documents")
+    print(f"{'='*60}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        config = write_inputs(tmp, args.variables, args.documents)
+
+        # Uninterrupted reference run
+        pipeline, model = make_pipeline(config)
+        expected = extract(pipeline)
+        total_calls = model.calls
+        pipeline.cleanup_checkpoint()
+
+        # 1. Bytes written: previous pickle checkpoint after every variable vs the journal
+        pickle_bytes = 0
+        for i in range(1, args.variables + 1):
+            rows = pipeline.variable_results[:i * args.documents]
+            pickle_bytes += len(pickle.dumps({'variable_results': rows, 'completed_variables': set(),
+                                              'last_variable': '', 'timestamp': ''}))
+        pipeline.journal.reset()
+        for row in pipeline.variable_results:
+            pipeline.journal.append_result(row)
+        journal_bytes = pipeline.journal.path.stat().st_size
+        pipeline.journal.reset()
+        ratio = pickle_bytes / max(journal_bytes, 1)
+        ratio = f"{ratio:.1f}x less" if ratio >= 1 else f"{1 / ratio:.1f}x more"
+        print(f"  checkpoint bytes: pickle per variable={pickle_bytes:,}  journal={journal_bytes:,}  ({ratio})")
+
+        # 2. Crash after --crash-after calls, then resume
+        worker = subprocess.run([sys.executable, __file__, '--worker', str(config),
+                                 '--crash-after', str(args.crash_after)], cwd=tmp)
+        journaled = len(pipeline.journal.load()[0])
+        print(f"  worker killed (exit {worker.returncode}) after {args.crash_after} calls: "
+              f"{journaled} results journaled")
+
+        pipeline, model = make_pipeline(config)
+        reads, errors, stop = [0], [], threading.Event()
+
+        def poll():
+            from extraction_journal import journal_progress
+            while not stop.is_set():
+                try:
+                    journal_progress(pipeline.journal.path)
+                    reads[0] += 1
+                except Exception as e:
+                    errors.append(e)
+                time.sleep(0.005)
+        reader = threading.Thread(target=poll)
+        reader.start()
+        start = time.perf_counter()
+        resumed = extract(pipeline)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        reader.join()
+
+        print(f"  resumed run: {model.calls} LLM calls (uninterrupted run: {total_calls}) in {elapsed:.2f}s, "
+              f"no prompt")
+        print(f"  live reader: {reads[0]} journal reads during the run, {len(errors)} errors")
+
+    identical = resumed == expected and not errors and model.calls == total_calls - journaled
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Benchmark: compiled chemotherapy reference index against per-row matching
+
+Runs the five chemotherapy matching strategies of
+ComprehensiveChemotherapyIdentifier and of
+athena_extraction_validation/scripts/filter_chemotherapy_from_medications.py
+over synthetic RADIANT reference files and --patients synthetic medication
+frames:
+1. row scans  - the strategies before the index: iterrows() per strategy,
+                rx_norm_codes re-parsed per row, drugs_df scanned per code,
+                product_to_ingredient rebuilt on every call
+2. index      - reference compiled once (src/chemo_reference_index.py),
+                codes exploded and merged, names matched by automaton
+
+Each is timed per patient and over the whole cohort in one frame. Also reports
+how long the index takes to compile from the CSVs and to load from its cache.
+Checks that both modes return the same matches, chemotherapy frames and
+summaries.
+
+Usage:
+    python benchmarks/benchmark_chemo_matcher.py --patients 5 --meds 1000
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'local_llm_extraction' / 'event_based_extraction'))
+sys.path.insert(0, str(ROOT / 'athena_extraction_validation' / 'scripts'))
+
+NAMES = ['Carboplatin 450 mg IV', 'vinBLASTine sulfate', 'AVASTIN infusion', 'Koselugo 25mg cap',
+         'temodar', 'ondansetron 4 mg', 'acetaminophen', 'sodium chloride 0.9%', 'CCNU', '5-FU pump',
+         'dexamethasone', 'methotrexate intrathecal', 'Platinol', 'ifex']
+CATEGORIES = ['ONCOLOGY TREATMENT', 'oncology treatment|OTHER', 'ASSESSMENT', 'Oncology follow-up', '']
+REASONS = ['Encounter for antineoplastic chemotherapy', 'Malignant neoplasm of brain', 'fever',
+           'CHEMOTHERAPY ADMINISTRATION', 'nausea', '']
+
+
+# --- Reference implementations: the strategies as row scans, before the index ---
+
+def scan_parse_codes(value, as_int):
+    if pd.isna(value) or value == '':
+        return []
+    codes = []
+    for code in str(value).split(';'):
+        code = code.strip()
+        if code and code.isdigit():
+            codes.append(int(code) if as_int else code)
+    return codes
+
+
+def scan_identifier_matches(identifier, drugs_df, rxnorm_map_df, medications_df):
+    """ComprehensiveChemotherapyIdentifier's five strategies before the index."""
+    chemo_drugs = drugs_df[
+        (drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
+        (drugs_df['is_supportive_care'] == False)
+    ]
+    valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int).astype(str))
+
+    rxnorm = []
+    for idx, row in medications_df.iterrows():
+        matched_codes = [code for code in scan_parse_codes(row.get('rx_norm_codes', ''), False)
+                         if code in valid_rxnorm_in]
+        if matched_codes:
+            drug_names = []
+            for code in matched_codes:
+                drug = chemo_drugs[chemo_drugs['rxnorm_in'] == int(code)]
+                if not drug.empty:
+                    drug_names.append(drug.iloc[0]['preferred_name'])
+            rxnorm.append({'index': idx, 'strategy': 'rxnorm_ingredient', 'matched_codes': matched_codes,
+                           'drug_names': drug_names, 'medication_name': row.get('medication_name', ''),
+                           'confidence': 'high'})
+
+    product_to_ingredient = {}
+    for _, row in rxnorm_map_df.iterrows():
+        if pd.notna(row['ingredient_rxcui']) and pd.notna(row['code_cui']):
+            ingredient_cui = str(int(row['ingredient_rxcui']))
+            if ingredient_cui in valid_rxnorm_in:
+                product_to_ingredient[str(int(row['code_cui']))] = ingredient_cui
+    product = []
+    for idx, row in medications_df.iterrows():
+        matched_products = [code for code in scan_parse_codes(row.get('rx_norm_codes', ''), False)
+                            if code in product_to_ingredient]
+        if matched_products:
+            product.append({'index': idx, 'strategy': 'product_mapping', 'matched_codes': matched_products,
+                            'mapped_ingredients': [product_to_ingredient[code] for code in matched_products],
+                            'medication_name': row.get('medication_name', ''), 'confidence': 'high'})
+
+    def pattern_drugs(text):
+        matched = []
+        for drug_name, patterns in identifier.CHEMO_PATTERNS.items():
+            for pattern in patterns:
+                if pattern.lower() in text:
+                    matched.append(drug_name)
+                    break
+        return matched
+
+    name = []
+    for idx, row in medications_df.iterrows():
+        matched_drugs = pattern_drugs(str(row.get('medication_name', '')).lower())
+        if matched_drugs:
+            name.append({'index': idx, 'strategy': 'name_pattern', 'matched_drugs': matched_drugs,
+                         'medication_name': row.get('medication_name', ''), 'confidence': 'high'})
+
+    care_plan = []
+    for idx, row in medications_df.iterrows():
+        categories = str(row.get('cpc_categories_aggregated', ''))
+        if 'ONCOLOGY' in categories.upper():
+            care_plan.append({'index': idx, 'strategy': 'oncology_care_plan', 'care_plan_categories': categories,
+                              'care_plan_title': row.get('cp_title', ''),
+                              'matched_drugs': pattern_drugs(str(row.get('cp_title', '')).lower()),
+                              'medication_name': row.get('medication_name', ''), 'confidence': 'high'})
+
+    indicators = identifier.REASON_CODE_INDICATORS
+    reason = []
+    for idx, row in medications_df.iterrows():
+        reason_codes = str(row.get('mrr_reason_code_text_aggregated', '')).lower()
+        if any(indicator in reason_codes for indicator in indicators):
+            reason.append({'index': idx, 'strategy': 'reason_codes',
+                           'matched_indicators': [ind for ind in indicators if ind in reason_codes],
+                           'medication_name': row.get('medication_name', ''), 'confidence': 'medium'})
+
+    return [rxnorm, product, name, care_plan, reason]
+
+
+def scan_filter_matches(chemo_filter, drugs_df, drug_alias_df, rxnorm_map_df, medications_df):
+    """filter_chemotherapy_from_medications.py's five strategies before the index."""
+    chemo_drugs = drugs_df[
+        (drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
+        (drugs_df['is_supportive_care'] == False)
+    ].copy()
+    valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int))
+
+    rxnorm = []
+    for idx, row in medications_df.iterrows():
+        matched_codes = [code for code in scan_parse_codes(row['rx_norm_codes'], True) if code in valid_rxnorm_in]
+        if matched_codes:
+            rxnorm.append({'index': idx, 'strategy': 'rxnorm_ingredient', 'matched_codes': matched_codes,
+                           'confidence': 'high'})
+
+    product_to_ingredient = {}
+    for _, row in rxnorm_map_df.iterrows():
+        if pd.notna(row['ingredient_rxcui']) and pd.notna(row['code_cui']):
+            ingredient_cui = int(row['ingredient_rxcui'])
+            if ingredient_cui in valid_rxnorm_in:
+                product_to_ingredient[int(row['code_cui'])] = ingredient_cui
+    product = []
+    for idx, row in medications_df.iterrows():
+        matched_products = [code for code in scan_parse_codes(row['rx_norm_codes'], True)
+                            if code in product_to_ingredient]
+        if matched_products:
+            product.append({'index': idx, 'strategy': 'product_code_mapping', 'matched_codes': matched_products,
+                            'mapped_ingredients': [product_to_ingredient[code] for code in matched_products],
+                            'confidence': 'high'})
+
+    chemo_aliases = drug_alias_df[drug_alias_df['drug_id'].isin(set(chemo_drugs['drug_id']))].copy()
+    alias_lookup = {}
+    for _, row in chemo_aliases.iterrows():
+        normalized = (row['normalized_key'] if pd.notna(row['normalized_key'])
+                      else chemo_filter.normalize_text(row.iloc[1]))
+        if normalized:
+            alias_lookup[normalized] = row['drug_id']
+    alias = []
+    for idx, row in medications_df.iterrows():
+        normalized_name = chemo_filter.normalize_text(row['medication_name'])
+        if normalized_name in alias_lookup:
+            alias.append({'index': idx, 'strategy': 'drug_alias', 'matched_name': normalized_name,
+                          'drug_id': alias_lookup[normalized_name], 'confidence': 'high'})
+
+    care_plan = []
+    for idx, row in medications_df.iterrows():
+        if 'ONCOLOGY TREATMENT' in str(row.get('care_plan_categories', '')).upper():
+            care_plan.append({'index': idx, 'strategy': 'care_plan_oncology',
+                              'care_plan_title': row.get('care_plan_title', ''), 'confidence': 'high'})
+
+    reason = []
+    for idx, row in medications_df.iterrows():
+        reason_codes = str(row.get('reason_codes', '')).lower()
+        if any(pattern in reason_codes for pattern in chemo_filter.REASON_CODE_PATTERNS):
+            reason.append({'index': idx, 'strategy': 'reason_codes',
+                           'matched_patterns': [p for p in chemo_filter.REASON_CODE_PATTERNS if p in reason_codes],
+                           'confidence': 'medium'})
+
+    return [rxnorm, product, alias, care_plan, reason]
+
+
+# --- Synthetic data ---
+
+def write_reference(folder, rng, n_drugs):
+    """drugs.csv, drug_alias.csv, rxnorm_code_map.csv with the quirks of the real files."""
+    folder.mkdir(parents=True, exist_ok=True)
+    rxnorm_in = rng.choice(np.arange(1000, 1000 + n_drugs * 3), n_drugs, replace=False).astype(float)
+    rxnorm_in[rng.random(n_drugs) < 0.05] = np.nan
+    rxnorm_in[:3] = [1500.5, 1500.5, 2000]  # fractional code, duplicate code
+    drug_ids = [f'D{i:05d}' for i in range(n_drugs)]
+    drugs = pd.DataFrame({
+        'drug_id': drug_ids,
+        'preferred_name': [f'drug{i}' for i in range(n_drugs)],
+        'approval_status': rng.choice(['FDA_approved', 'investigational', 'withdrawn'], n_drugs, p=[.6, .3, .1]),
+        'rxnorm_in': rxnorm_in,
+        'is_supportive_care': rng.random(n_drugs) < 0.1,
+    })
+    drugs.to_csv(folder / 'drugs.csv', index=False)
+
+    n_alias = n_drugs * 6
+    alias_drugs = rng.choice(drug_ids, n_alias)
+    alias_names = [f'{name} {i % 7}' for i, name in enumerate(rng.choice(NAMES + ['DRUG'], n_alias))]
+    keys = pd.Series([''.join(ch for ch in name.lower() if ch.isalnum()) for name in alias_names], dtype=object)
+    keys[rng.random(n_alias) < 0.1] = np.nan
+    pd.DataFrame({'drug_id': alias_drugs, 'alias': alias_names, 'normalized_key': keys}).to_csv(
+        folder / 'drug_alias.csv', index=False)
+
+    n_map = n_drugs * 15
+    ingredient = rng.choice(rxnorm_in, n_map)
+    product = rng.integers(50_000, 50_000 + n_map, n_map).astype(float)  # repeated products: later rows win
+    product[rng.random(n_map) < 0.02] = np.nan
+    pd.DataFrame({'code_cui': product, 'ingredient_rxcui': ingredient}).to_csv(
+        folder / 'rxnorm_code_map.csv', index=False)
+    return drugs, pd.read_csv(folder / 'drug_alias.csv'), pd.read_csv(folder / 'rxnorm_code_map.csv')
+
+
+def medications(rng, drugs_df, rxnorm_map_df, n):
+    ingredient_codes = drugs_df['rxnorm_in'].dropna().astype(int).astype(str).tolist()
+    product_codes = rxnorm_map_df['code_cui'].dropna().astype(int).astype(str).tolist()
+    pool = ingredient_codes + product_codes + ['x12', '', '0' + ingredient_codes[5], ' 7 ']
+
+    codes = [';'.join(rng.choice(pool, rng.integers(1, 5))) if rng.random() < 0.8 else ''
+             for _ in range(n)]
+    codes = pd.Series(codes, dtype=object)
+    codes[rng.random(n) < 0.1] = np.nan
+    names = pd.Series(rng.choice(NAMES, n), dtype=object)
+    names[rng.random(n) < 0.02] = np.nan
+    titles = pd.Series(rng.choice(['Carboplatin/vincristine', 'LGG protocol', 'avastin + irinotecan', ''], n),
+                       dtype=object)
+    titles[rng.random(n) < 0.2] = np.nan
+    categories = pd.Series(rng.choice(CATEGORIES, n), dtype=object)
+    categories[rng.random(n) < 0.3] = np.nan
+    reasons = pd.Series(rng.choice(REASONS, n), dtype=object)
+    reasons[rng.random(n) < 0.3] = np.nan
+    return pd.DataFrame({
+        'medication_name': names,
+        'rx_norm_codes': codes,
+        'authored_on': pd.date_range('2018-01-01', periods=n, freq='6h').astype(str),
+        'cp_title': titles,
+        'cpc_categories_aggregated': categories,
+        'mrr_reason_code_text_aggregated': reasons,
+        'care_plan_title': titles.fillna(''),
+        'care_plan_categories': categories,
+        'reason_codes': reasons,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the compiled chemotherapy reference index')
+    parser.add_argument('--patients', type=int, default=5)
+    parser.add_argument('--meds', type=int, default=1000, help='Medication records per patient')
+    parser.add_argument('--drugs', type=int, default=3000, help='Drugs in the synthetic reference')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    import chemo_reference_index
+    import filter_chemotherapy_from_medications as chemo_filter
+    from comprehensive_chemotherapy_identifier import ComprehensiveChemotherapyIdentifier
+    logging.disable(logging.WARNING)
+
+    print(f"\n{'='*60}")
+    print(f"CHEMOTHERAPY MATCHER BENCHMARK: {args.patients} patients x {args.meds} medications")
+    print(f"{'='*60}")
+
+    rng = np.random.default_rng(24)
+    identical = True
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_dir = Path(tmp) / 'unified_chemo_index'
+        drugs_df, drug_alias_df, rxnorm_map_df = write_reference(reference_dir, rng, args.drugs)
+        files = [reference_dir / name for name in ('drugs.csv', 'drug_alias.csv', 'rxnorm_code_map.csv')]
+        os.environ['CHEMO_INDEX_DIR'] = str(Path(tmp) / 'index_cache')
+
+        start = time.perf_counter()
+        reference = chemo_reference_index.load_reference_index(*files)
+        compile_s = time.perf_counter() - start
+        chemo_reference_index._LOADED_INDEXES.clear()
+        start = time.perf_counter()
+        chemo_reference_index.load_reference_index(*files)
+        load_s = time.perf_counter() - start
+        print(f"  {reference.summary()}")
+        print(f"  index compiled in {compile_s * 1000:.0f} ms, loaded from cache in {load_s * 1000:.1f} ms")
+
+        identifier = ComprehensiveChemotherapyIdentifier(reference_dir)
+        patients = [medications(rng, drugs_df, rxnorm_map_df, args.meds) for _ in range(args.patients)]
+        cohort = pd.concat(patients, ignore_index=True)
+
+        def indexed_identifier(df):
+            return [identifier._match_by_rxnorm_ingredient(df), identifier._match_by_product_mapping(df),
+                    identifier._match_by_name(df), identifier._match_by_care_plan_category(df),
+                    identifier._match_by_reason_codes(df)]
+
+        def indexed_filter(df):
+            codes = chemo_filter.explode_medication_codes(df)
+            return [chemo_filter.match_by_rxnorm_ingredient(df, reference, codes),
+                    chemo_filter.match_by_product_code_mapping(df, reference, codes),
+                    chemo_filter.match_by_drug_alias(df, reference),
+                    chemo_filter.match_by_care_plan_oncology(df),
+                    chemo_filter.match_by_reason_codes(df)]
+
+        modes = {
+            'identifier, row scans': lambda df: scan_identifier_matches(identifier, drugs_df, rxnorm_map_df, df),
+            'identifier, index': indexed_identifier,
+            'filter, row scans': lambda df: scan_filter_matches(chemo_filter, drugs_df, drug_alias_df,
+                                                                rxnorm_map_df, df),
+            'filter, index': indexed_filter,
+        }
+        results = {}
+        for label, run in modes.items():
+            per_patient = []
+            answers = []
+            for df in patients:
+                start = time.perf_counter()
+                answers.append(run(df))
+                per_patient.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            answers.append(run(cohort))
+            cohort_s = time.perf_counter() - start
+            results[label] = answers
+            print(f"  {label:<22} per patient p50 {statistics.median(per_patient) * 1000:8.1f} ms   "
+                  f"cohort {cohort_s:7.2f}s")
+
+        for kind in ('identifier', 'filter'):
+            same = repr(results[f'{kind}, row scans']) == repr(results[f'{kind}, index'])
+            print(f"  {kind} matches identical: {'✅' if same else '❌'}")
+            identical &= same
+
+        # Consolidated output, end to end
+        for df in patients[:3] + [cohort]:
+            old_df, old_summary = identifier._consolidate_matches(
+                scan_identifier_matches(identifier, drugs_df, rxnorm_map_df, df), df)
+            new_df, new_summary = identifier.identify_chemotherapy(df)
+            identical &= old_df.equals(new_df) and repr(old_summary) == repr(new_summary)
+
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
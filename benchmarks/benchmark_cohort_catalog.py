@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cohort SQL catalog against per-patient CSV loops
+
+Answers two cohort questions over --patients synthetic staging folders:
+- patients with more than one tumor surgery day and an MRI within --hours
+  after one of them (TumorSurgeryClassifier vocabulary)
+- chemotherapy exposure by agent: patients, records, first/last start
+  (ComprehensiveChemotherapyIdentifier name patterns)
+
+1. per-patient loop - read each patient's CSVs with pandas and compute the
+                      answer per patient, once per question (as cohort code did)
+2. catalog, cold    - build the SQLite catalog, then two queries
+3. catalog, warm    - reopen the catalog (refresh finds every CSV unchanged),
+                      then two queries
+4. catalog, queries - the two queries alone
+
+Reports wall-clock per mode and checks that every mode gives the same answers.
+
+Usage:
+    python benchmarks/benchmark_cohort_catalog.py --patients 60 --scale 0.2
+"""
+
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'local_llm_extraction' / 'event_based_extraction'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmark_staging_store import timestamps, write_patient
+
+SURGERIES = ['Craniotomy for tumor resection', 'Stereotactic biopsy of brain lesion', 'Craniectomy, excision of mass']
+OTHER_PROCEDURES = ['Ventriculoperitoneal shunt revision', 'Lumbar puncture', 'Central line placement', 'MRI brain']
+
+
+def write_cohort_patient(staging, patient_id, rng, scale):
+    """Staging folder with 0-3 tumor surgeries, some followed by a post-op MRI within a few days."""
+    write_patient(staging, patient_id, rng, scale)
+    folder = staging / f'patient_{patient_id}'
+
+    procedures = pd.read_csv(folder / 'procedures.csv')
+    procedures['proc_code_text'] = rng.choice(OTHER_PROCEDURES, len(procedures))
+    surgery_times = pd.to_datetime(timestamps(rng, rng.integers(0, 4)), utc=True)
+    rows = procedures.index[:len(surgery_times)]
+    procedures.loc[rows, 'proc_code_text'] = rng.choice(SURGERIES, len(rows))
+    procedures.loc[rows, 'procedure_date'] = surgery_times.strftime('%Y-%m-%dT%H:%M:%SZ')
+    procedures.to_csv(folder / 'procedures.csv', index=False)
+
+    imaging = pd.read_csv(folder / 'imaging.csv')
+    imaging['imaging_modality'] = rng.choice(['CT', 'XR', 'US'], len(imaging))
+    for i, time_ in enumerate(surgery_times[:len(imaging)]):
+        if rng.random() < 0.6:
+            after = pd.Timedelta(minutes=int(rng.integers(30, 6 * 1440)))
+            imaging.loc[i, ['imaging_modality', 'imaging_date']] = ['MR', (time_ + after).strftime('%Y-%m-%dT%H:%M:%SZ')]
+    imaging.to_csv(folder / 'imaging.csv', index=False)
+
+
+def first_present(df, columns):
+    values = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for column in columns:
+        if column in df.columns:
+            values = values.where(values.notna(), df[column])
+    return values
+
+
+def loop_surgeries_with_postop_mri(staging, patients, include, exclude, hours, min_surgeries=2):
+    from cohort_catalog import IMAGING_DATE_COLUMNS, IMAGING_MODALITY_COLUMNS, PROCEDURE_DATE_COLUMNS
+
+    rows = []
+    for patient_id in patients:
+        folder = staging / f'patient_{patient_id}'
+        procedures = pd.read_csv(folder / 'procedures.csv')
+        imaging = pd.read_csv(folder / 'imaging.csv')
+        text = procedures['proc_code_text'].fillna('').str.lower()
+        if 'proc_description' in procedures.columns:
+            text = text + ' ' + procedures['proc_description'].fillna('').str.lower()
+        tumor = text.apply(lambda t: any(term in t for term in include) and not any(term in t for term in exclude))
+        times = pd.to_datetime(first_present(procedures, PROCEDURE_DATE_COLUMNS), utc=True)[tumor].dropna()
+        mri = pd.Series(False, index=imaging.index)
+        for column in IMAGING_MODALITY_COLUMNS:
+            if column in imaging.columns:
+                mri |= imaging[column].fillna('').str.upper().str.startswith('MR')
+        mri_times = pd.to_datetime(first_present(imaging, IMAGING_DATE_COLUMNS), utc=True)[mri].dropna()
+
+        days = {}
+        for time_ in times.drop_duplicates():
+            postop = bool(((mri_times > time_) & (mri_times <= time_ + pd.Timedelta(hours=hours))).any())
+            first, seen = days.get(time_.date(), (time_, False))
+            days[time_.date()] = (min(first, time_), seen or postop)
+        if len(days) >= min_surgeries and any(postop for _, postop in days.values()):
+            starts = [first for first, _ in days.values()]
+            rows.append({'patient_id': patient_id, 'tumor_surgery_days': len(days),
+                         'surgery_days_with_postop_mri': sum(postop for _, postop in days.values()),
+                         'first_surgery': min(starts).strftime('%Y-%m-%d %H:%M:%S'),
+                         'last_surgery': max(starts).strftime('%Y-%m-%d %H:%M:%S')})
+    return pd.DataFrame(rows)
+
+
+def loop_exposure_by_agent(staging, patients, patterns):
+    from cohort_catalog import MEDICATION_START_COLUMNS
+
+    totals = {}
+    for patient_id in patients:
+        medications = pd.read_csv(staging / f'patient_{patient_id}' / 'medications.csv')
+        names = medications['medication_name'].str.lower()
+        starts = pd.to_datetime(first_present(medications, MEDICATION_START_COLUMNS), utc=True)
+        for agent, aliases in patterns.items():
+            mask = names.apply(lambda name: isinstance(name, str) and any(alias in name for alias in aliases))
+            if mask.any():
+                patients_, records, first, last = totals.get(agent, (0, 0, None, None))
+                agent_starts = starts[mask].dropna()
+                if len(agent_starts):
+                    first = min(filter(None, [first, agent_starts.min()]))
+                    last = max(filter(None, [last, agent_starts.max()]))
+                totals[agent] = (patients_ + 1, records + int(mask.sum()), first, last)
+    rows = [{'agent': agent, 'patients': p, 'medication_records': r,
+             'first_start': first.strftime('%Y-%m-%d %H:%M:%S') if first is not None else None,
+             'last_start': last.strftime('%Y-%m-%d %H:%M:%S') if last is not None else None}
+            for agent, (p, r, first, last) in totals.items()]
+    df = pd.DataFrame(rows)
+    return df.sort_values(['patients', 'medication_records', 'agent'], ascending=[False, False, True])
+
+
+def canonical(df):
+    return df.reset_index(drop=True).astype(object).where(df.reset_index(drop=True).notna(), None).to_dict('records')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cohort SQL catalog')
+    parser.add_argument('--patients', type=int, default=60)
+    parser.add_argument('--scale', type=float, default=0.2, help='Multiplier on rows per staging file')
+    parser.add_argument('--hours', type=float, default=72, help='Post-op MRI window')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    from cohort_catalog import CohortCatalog
+    from comprehensive_chemotherapy_identifier import ComprehensiveChemotherapyIdentifier
+    from tumor_surgery_classifier import TumorSurgeryClassifier
+
+    indicators = TumorSurgeryClassifier.TUMOR_SURGERY_INDICATORS
+    include = indicators['resection_terms'] + indicators['biopsy_terms'] + indicators['specific_procedures']
+    exclude = TumorSurgeryClassifier.NON_TUMOR_PROCEDURES
+    patterns = ComprehensiveChemotherapyIdentifier(Path('/nonexistent')).CHEMO_PATTERNS
+
+    print(f"\n{'='*60}")
+    print(f"COHORT CATALOG BENCHMARK: {args.patients} patients, scale {args.scale:g}")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        staging = Path(tmp) / 'staging'
+        rng = np.random.default_rng(23)
+        patients = [f'eCohort{i:03d}.x' for i in range(args.patients)]
+        for patient_id in patients:
+            write_cohort_patient(staging, patient_id, rng, args.scale)
+        csv_mb = sum(path.stat().st_size for path in staging.rglob('*.csv')) / 1024 ** 2
+        print(f"  {csv_mb:.0f} MB of staging CSVs")
+
+        def catalog_answers(catalog):
+            return (catalog.tumor_surgeries_with_postop_mri(include, exclude, hours=args.hours),
+                    catalog.exposure_by_agent(patterns))
+
+        db = Path(tmp) / 'catalog.sqlite'
+        catalog = None
+        try:
+            for label in ('per-patient loop', 'catalog, cold', 'catalog, warm', 'catalog, queries'):
+                if label in ('catalog, cold', 'catalog, warm') and catalog is not None:
+                    catalog.close()
+                start = time.perf_counter()
+                if label == 'per-patient loop':
+                    answers = (loop_surgeries_with_postop_mri(staging, patients, include, exclude, args.hours),
+                               loop_exposure_by_agent(staging, patients, patterns))
+                elif label == 'catalog, queries':
+                    answers = catalog_answers(catalog)
+                else:
+                    catalog = CohortCatalog(staging, db_path=db)
+                    counts = catalog.refresh()
+                    answers = catalog_answers(catalog)
+                elapsed = time.perf_counter() - start
+                extra = f"  partitions loaded={counts['loaded']:>4} unchanged={counts['unchanged']:>4}" \
+                    if label.startswith('catalog') and label != 'catalog, queries' else ''
+                print(f"  {label:<17} {elapsed:7.2f}s{extra}")
+                results[label] = [canonical(df) for df in answers]
+
+            surgeries, agents = answers
+            print(f"\n  {catalog.summary()}")
+            print(f"  {len(surgeries)} patients with >1 tumor surgery day and a post-op MRI within {args.hours:g}h")
+            print("  Top agents: " + ', '.join(f"{row.agent} ({row.patients} patients)"
+                                            for row in agents.head(4).itertuples()))
+        finally:
+            # Closed before the temporary directory holding its database is removed
+            if catalog is not None:
+                catalog.close()
+
+    first = results['per-patient loop']
+    identical = all(answer == first for answer in results.values())
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark: token-budgeted windows for long notes
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient with
+long notes (operative notes, MRI reports) whose finding sits at a random depth,
+against a simulated Ollama model that only answers if the finding is in the
+prompt:
+1. whole notes - --context-tokens large enough for every note (one call per pair)
+2. windowed    - --chunk-tokens: notes split at sections/sentences, only windows
+                 mentioning the variable's keywords are sent, answers merged
+
+Reports LLM calls, total and largest prompt, wall-clock, and how many findings
+a blind [:2000] truncation would have lost. Checks that windowed extraction
+returns the same values as whole-note extraction.
+
+Usage:
+    python benchmarks/benchmark_document_chunking.py --documents 60 --chunk-tokens 1000
+"""
+
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+
+FILLER = ('The patient tolerated the procedure without complication. Vital signs remained stable overnight. '
+          'Family was updated at the bedside and questions were answered. Pain is controlled on the current '
+          'regimen. Neurologic examination is unchanged from the prior assessment.').split('. ')
+SECTIONS = ['HISTORY', 'TECHNIQUE', 'FINDINGS', 'HOSPITAL COURSE', 'PLAN']
+FINDINGS = {
+    'surgery_extent': ['gross total resection of the tumor was achieved',
+                       'subtotal resection with residual tumor along the brainstem'],
+    'metastasis_present': ['no evidence of leptomeningeal metastatic disease',
+                           'nodular leptomeningeal metastasis along the cervical spine'],
+}
+
+
+class FindingModel:
+    """Stand-in for the ollama module: answers with the finding present in the document text."""
+
+    def __init__(self, call_latency, latency_per_1k_tokens):
+        self.call_latency = call_latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+
+    def chat(self, model, messages, options=None, format=None, **kwargs):
+        from local_llm_extraction_pipeline_with_ollama import estimate_tokens
+
+        prompt = messages[-1]['content']
+        tokens = estimate_tokens(prompt)
+        self.calls += 1
+        self.prompt_tokens += tokens
+        self.max_prompt_tokens = max(self.max_prompt_tokens, tokens)
+        time.sleep(self.call_latency + self.latency_per_1k_tokens * tokens / 1000)
+
+        variable = re.search(r'Extract (\w+) ', prompt).group(1)
+        document = re.search(r'DOCUMENT TEXT:\n(.*?)\n\n(?:INSTRUCTIONS|EXTRACTION TASK):', prompt, re.S).group(1)
+        found = [finding for finding in FINDINGS[variable] if finding in document.lower()]
+        return {'message': {'content': found[0] if found else 'Unavailable'}}
+
+
+def write_inputs(directory, n_documents, min_tokens, max_tokens, seed=3):
+    """project/variables/decisions CSVs and a config file; returns (config, finding offsets)."""
+    rng = random.Random(seed)
+    patient = 'eChunkingPatient'
+    documents, offsets = [], []
+    for i in range(n_documents):
+        target = rng.randint(min_tokens, max_tokens) * 4
+        sections = []
+        per_section = target // len(SECTIONS)
+        for header in SECTIONS:
+            body = []
+            while sum(len(s) + 2 for s in body) < per_section:
+                body.append(rng.choice(FILLER))
+            sections.append(f"{header}: " + '. '.join(body) + '.')
+        text = '\n'.join(sections)
+        variable = rng.choice(list(FINDINGS))
+        finding = rng.choice(FINDINGS[variable]).capitalize() + '.'
+        sentence_ends = [m.end() for m in re.finditer(r'\. ', text)]
+        cut = rng.choice(sentence_ends)
+        text = text[:cut] + finding + ' ' + text[cut:]
+        offsets.append(cut)
+        documents.append({'NOTE_ID': f'DOC_{i + 1:04d}', 'PERSON_ID': 'BENCH', 'NOTE_DATETIME': '2020-01-01',
+                          'NOTE_TEXT': text, 'NOTE_TITLE': rng.choice(['OP Note - Complete', 'MR Brain W & W/O'])})
+    pd.DataFrame(documents).to_csv(directory / f'project_{patient}.csv', index=False)
+    pd.DataFrame([{
+        'variable_name': name,
+        'instruction': f'Extract {name} from the note. Return the finding verbatim, or "Unavailable".',
+        'variable_type': 'text',
+        'scope': 'many_per_note',
+    } for name in FINDINGS]).to_csv(directory / f'variables_{patient}.csv', index=False)
+    pd.DataFrame([{'decision_name': 'summary', 'instruction': 'Summarize surgery_extent'}]).to_csv(
+        directory / f'decisions_{patient}.csv', index=False)
+
+    config = directory / 'config.yaml'
+    config.write_text(yaml.safe_dump({'patient_fhir_id': patient, 'output_dir': str(directory)}))
+    return config, offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark token-budgeted windows for long notes')
+    parser.add_argument('--documents', type=int, default=60)
+    parser.add_argument('--min-note-tokens', type=int, default=500)
+    parser.add_argument('--max-note-tokens', type=int, default=12000)
+    parser.add_argument('--chunk-tokens', type=int, default=1000)
+    parser.add_argument('--call-latency', type=float, default=0.002, help='Simulated seconds per LLM call')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.005,
+                        help='Simulated prompt-processing seconds per 1,000 prompt tokens')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+    model = FindingModel(args.call_latency, args.latency_per_1k_tokens)
+    sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    print(f"\n{'='*60}")
+    print(f"DOCUMENT CHUNKING BENCHMARK: {args.documents} notes of {args.min_note_tokens:,}-"
+          f"{args.max_note_tokens:,} tokens, {args.chunk_tokens:,} token windows")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config, offsets = write_inputs(Path(tmp), args.documents, args.min_note_tokens, args.max_note_tokens)
+        for label, kwargs in (('whole notes', {'context_tokens': args.max_note_tokens * 2}),
+                              ('windowed', {'chunk_tokens': args.chunk_tokens})):
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated',
+                                                  relevance_filter=False, **kwargs)
+            pipeline.load_input_files()
+            model.calls = model.prompt_tokens = model.max_prompt_tokens = 0
+            start = time.perf_counter()
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<12} {elapsed:6.2f}s  calls={model.calls:5,}  prompt tokens={model.prompt_tokens:10,}  "
+                  f"largest prompt={model.max_prompt_tokens:6,}")
+            results[label] = [(row['variable_name'], row['NOTE_ID'], row['extracted_value'])
+                              for row in pipeline.variable_results]
+
+    truncated = sum(offset >= 2000 for offset in offsets)
+    print(f"\n  Findings beyond a [:2000] truncation: {truncated}/{len(offsets)}")
+    found = sum(value != 'Unavailable' for _, _, value in results['windowed'])
+    print(f"  Findings extracted from windows: {found}/{len(offsets)}")
+
+    identical = results['whole notes'] == results['windowed']
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
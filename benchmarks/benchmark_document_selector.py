@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass document scoring against per-term and per-event passes
+
+Scores --docs synthetic binary documents of a patient with Phase 3's
+IntelligentDocumentSelector and selects the top --max-documents:
+1. per-term passes - _score_documents() before: one str.contains() over the
+                     descriptions per KEY_TERMS term, nested np.where per key
+                     date, reasons concatenated as strings; _select_top_documents()
+                     walking the sorted documents with iterrows()
+2. single pass     - one automaton scan per distinct description, one
+                     documents x events proximity array, reason code arrays,
+                     groupby/cumcount quota selection
+
+Checks that both give the same scores, the same reasons (codes decoded to the
+old strings) and the same selected documents.
+
+Usage:
+    python benchmarks/benchmark_document_selector.py --docs 20000 --repeats 5
+"""
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'local_llm_extraction' / 'event_based_extraction'))
+
+FILE_NAMES = ['Operative note', 'Pathology report', 'MRI brain', 'Progress note', 'Oncology clinic visit',
+              'Discharge summary', 'Radiology read', 'Telephone encounter', 'Molecular genomic panel', 'Consult']
+PHRASES = ['Gross total resection achieved', 'pilocytic ASTROCYTOMA, WHO grade I', 'stable disease',
+           'New enhancement concerning for progression', 'BRAF fusion, Ki-67 2%', 'no residual tumor',
+           'leptomeningeal spread; drop metastasis in spine', 'routine follow up', 'IDH wildtype glioma',
+           'mixed response after partial resection', '']
+
+
+def scan_selector(base):
+    """The selector with scoring and selection as before: per-term and per-event passes, iterrows()."""
+
+    class ScanDocumentSelector(base):
+
+        def _score_documents(self, df, key_dates):
+            df['priority_score'] = 0
+            df['scoring_reasons'] = ''
+            df['type_score'] = df['document_type'].map(lambda x: 11 - self.DOCUMENT_PRIORITIES.get(x, 6))
+            df['priority_score'] += df['type_score']
+            if 'document_date' in df.columns:
+                df['temporal_score'] = 0
+                for event_name, event_date in key_dates.items():
+                    if pd.notna(event_date):
+                        days_diff = np.abs((df['document_date'] - event_date).dt.days)
+                        proximity_score = np.where(
+                            days_diff <= 7, 10,
+                            np.where(days_diff <= 30, 7,
+                            np.where(days_diff <= 90, 4,
+                            np.where(days_diff <= 180, 2,
+                            0)))
+                        )
+                        df['temporal_score'] = np.maximum(df['temporal_score'], proximity_score)
+                        high_score_mask = proximity_score >= 7
+                        if high_score_mask.any():
+                            df.loc[high_score_mask, 'scoring_reasons'] += \
+                                f'{event_name}({proximity_score[high_score_mask].max()});'
+                df['priority_score'] += df['temporal_score']
+            if 'description' in df.columns or 'content_preview' in df.columns:
+                content_col = 'description' if 'description' in df.columns else 'content_preview'
+                df['content_score'] = 0
+                for category, terms in self.KEY_TERMS.items():
+                    for term in terms:
+                        mask = df[content_col].str.contains(term, case=False, na=False)
+                        df.loc[mask, 'content_score'] += 1
+                        df.loc[mask, 'scoring_reasons'] += f'{category}:{term};'
+                df['content_score'] = np.minimum(df['content_score'], 5)
+                df['priority_score'] += df['content_score']
+            if 'document_date' in df.columns:
+                recent_cutoff = pd.Timestamp.now(tz='UTC') - timedelta(days=730)
+                df.loc[df['document_date'] > recent_cutoff, 'priority_score'] += 2
+                df.loc[df['document_date'] > recent_cutoff, 'scoring_reasons'] += 'recent;'
+            return df
+
+        def _select_top_documents(self, df, max_documents):
+            df = df.sort_values('priority_score', ascending=False)
+            selected = []
+            doc_types_count = {}
+            for idx, doc in df.iterrows():
+                doc_type = doc['document_type']
+                current_count = doc_types_count.get(doc_type, 0)
+                if current_count < self.MAX_PER_TYPE.get(doc_type, 10):
+                    selected.append(doc)
+                    doc_types_count[doc_type] = current_count + 1
+                if len(selected) >= max_documents:
+                    break
+            return pd.DataFrame(selected)
+
+    return ScanDocumentSelector
+
+
+def binary_metadata(rng, n):
+    dates = pd.Timestamp('2018-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 8 * 365 * 24, n), unit='h')
+    dates = pd.Series(dates)
+    dates[rng.random(n) < 0.03] = pd.NaT
+    description = pd.Series([' / '.join(rng.choice(PHRASES, rng.integers(1, 4))) + f' (doc {i % 5000})'
+                             for i in range(n)], dtype=object)
+    description[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        'document_id': [f'Binary/{i}' for i in range(n)],
+        'file_name': rng.choice(FILE_NAMES, n),
+        'document_date': dates,
+        'description': description,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Phase 3 document scoring and selection')
+    parser.add_argument('--docs', type=int, default=20000, help='Binary documents of the patient')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-documents', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    from phase3_intelligent_document_selector import IntelligentDocumentSelector
+    logging.disable(logging.WARNING)
+
+    print(f"\n{'='*60}")
+    print(f"DOCUMENT SELECTOR BENCHMARK: {args.docs} documents, top {args.max_documents}")
+    print(f"{'='*60}")
+
+    rng = np.random.default_rng(25)
+    metadata = binary_metadata(rng, args.docs)
+    metadata['document_type'] = metadata['file_name'].apply(IntelligentDocumentSelector._classify_document_type)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        selectors = {
+            'per-term passes': scan_selector(IntelligentDocumentSelector)(tmp, tmp),
+            'single pass': IntelligentDocumentSelector(tmp, tmp),
+        }
+        key_dates = selectors['single pass']._extract_key_dates({
+            'diagnosis_date': '2018-05-20',
+            'chronological_events': [{'event_type': 'Progression', 'date': '2020-11-02'}],
+        })
+        key_dates['missing'] = pd.NaT
+
+        results = {}
+        for label, selector in selectors.items():
+            scoring, selecting = [], []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                scored = selector._score_documents(metadata.copy(), key_dates)
+                scoring.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                selected = selector._select_top_documents(scored, args.max_documents)
+                selecting.append(time.perf_counter() - start)
+            results[label] = (scored, selected)
+            print(f"  {label:<16} score {statistics.median(scoring) * 1000:8.1f} ms   "
+                  f"select {statistics.median(selecting) * 1000:7.1f} ms")
+
+    (old_scored, old_selected), (new_scored, new_selected) = results['per-term passes'], results['single pass']
+    reasons = IntelligentDocumentSelector.scoring_reason_text
+    columns = ['priority_score', 'type_score', 'temporal_score', 'content_score']
+    identical = (
+        list(old_scored.columns) == list(new_scored.columns)
+        and old_scored[columns].astype(int).equals(new_scored[columns].astype(int))
+        and old_scored['scoring_reasons'].tolist() == reasons(new_scored).tolist()
+        and old_selected.index.tolist() == new_selected.index.tolist()
+        and old_selected['scoring_reasons'].tolist() == reasons(new_selected).tolist()
+    )
+    codes = sum(len(c) for c in new_scored['scoring_reasons'])
+    print(f"\n  {codes} reason codes over {len(new_scored.attrs['scoring_reason_labels'])} labels "
+          f"({new_scored['scoring_reasons'].map(len).mean():.1f} per document)")
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark: early-exit evidence accumulation for one_per_patient variables
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient with
+--documents notes against a simulated Ollama model that answers patient-level
+facts (gender, date of birth, diagnosis) from the notes that mention them,
+"Unavailable" elsewhere, and a wrong value in a few notes:
+1. every document - each one_per_patient variable asks every selected note
+2. early exit     - --early-exit: notes in priority order until
+                    --agreement answers agree
+
+Reports LLM calls per one_per_patient variable and wall-clock, and checks that
+the early-exit consensus equals the majority answer of the full run and that
+many_per_note rows are unchanged.
+
+Usage:
+    python benchmarks/benchmark_early_exit.py --documents 300 --agreement 3
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import WORDS
+
+# variable -> (phrase in the note, answer, wrong answer given by a few notes)
+FACTS = {
+    'patient_gender': ('the patient is a female', 'Female', 'Male'),
+    'date_of_birth': ('DOB 2009-04-02', '2009-04-02', '2009-02-04'),
+    'primary_diagnosis': ('pilocytic astrocytoma', 'Pilocytic astrocytoma', 'Ependymoma'),
+}
+TITLES = ['Progress Notes', 'Pathology', 'MR Brain W & W/O IV Contrast', 'Operative Note', 'Discharge Summary',
+          'Telephone Encounter', 'Oncology Clinic Note', 'Nursing Note']
+
+
+class FactModel:
+    """Stand-in for the ollama module: facts from the notes that state them, latency per call."""
+
+    def __init__(self, call_latency, wrong_rate):
+        self.call_latency = call_latency
+        self.wrong_rate = wrong_rate
+        self.calls = Counter()
+
+    def chat(self, model, messages, options=None, format=None, **kwargs):
+        prompt = messages[-1]['content']
+        note_id = re.search(r'- NOTE_ID: (\S+)', prompt).group(1)
+        text = re.search(r'DOCUMENT TEXT:\n(.*?)\n\nEXTRACTION TASK:', prompt, re.S).group(1)
+        variable = re.search(r'EXTRACTION TASK:\n\[(\w+)\]', prompt).group(1)
+        self.calls[variable] += 1
+        time.sleep(self.call_latency)
+
+        if variable in FACTS:
+            phrase, answer, wrong = FACTS[variable]
+            if phrase not in text:
+                content = 'Unavailable'
+            else:
+                roll = int(hashlib.sha1(f'{variable}|{note_id}'.encode()).hexdigest()[:8], 16) / 0xffffffff
+                content = wrong if roll < self.wrong_rate else answer
+        else:
+            content = hashlib.sha1(f'{variable}|{note_id}'.encode()).hexdigest()[:10]
+        return {'message': {'content': content}}
+
+
+def write_inputs(directory, n_documents, seed=7):
+    """project/variables/decisions CSVs and a config file for one synthetic patient."""
+    rng = random.Random(seed)
+    patient = 'eEarlyExitPatient'
+    rows = []
+    for i in range(n_documents):
+        title = rng.choice(TITLES)
+        words = [rng.choice(WORDS) for _ in range(rng.randint(150, 600))]
+        for phrase, _, _ in FACTS.values():
+            if rng.random() < (0.6 if title in ('Pathology', 'Operative Note') else 0.25):
+                words.insert(rng.randrange(len(words)), phrase)
+        rows.append({'NOTE_ID': f'DOC_{i + 1:04d}', 'PERSON_ID': 'BENCH', 'NOTE_DATETIME': '2020-01-01 00:00:00',
+                     'NOTE_TEXT': ' '.join(words), 'NOTE_TITLE': title})
+    pd.DataFrame(rows).to_csv(directory / f'project_{patient}.csv', index=False)
+
+    variables = [{'variable_name': name, 'scope': 'one_per_patient',
+                  'instruction': f'[{name}] Return the {name.replace("_", " ")} stated in the note, '
+                                 f'or "Unavailable" if it is not documented.'} for name in FACTS]
+    variables += [{'variable_name': f'finding_{v}', 'scope': 'many_per_note',
+                   'instruction': f'[finding_{v}] Return finding {v} verbatim, or "Unavailable".'} for v in range(2)]
+    pd.DataFrame(variables).to_csv(directory / f'variables_{patient}.csv', index=False)
+    pd.DataFrame([{'decision_name': 'summary', 'instruction': 'Summarize primary_diagnosis'}]).to_csv(
+        directory / f'decisions_{patient}.csv', index=False)
+
+    config = directory / 'config.yaml'
+    config.write_text(yaml.safe_dump({'patient_fhir_id': patient, 'output_dir': str(directory)}))
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark early-exit evidence accumulation')
+    parser.add_argument('--documents', type=int, default=300)
+    parser.add_argument('--agreement', type=int, default=3, help='Agreeing answers needed to stop')
+    parser.add_argument('--wrong-rate', type=float, default=0.05, help='Notes that state a wrong value')
+    parser.add_argument('--call-latency', type=float, default=0.005, help='Simulated seconds per LLM call')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+
+    from evidence_accumulation import is_informative, normalize_answer
+
+    print(f"\n{'='*60}")
+    print(f"EARLY EXIT BENCHMARK: {args.documents} documents, {len(FACTS)} one_per_patient variables, "
+          f"agreement={args.agreement}")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = write_inputs(Path(tmp), args.documents)
+        for label, early_exit in (('every document', False), ('early exit', True)):
+            model = FactModel(args.call_latency, args.wrong_rate)
+            sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+            from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated',
+                                                  resume=False, early_exit=early_exit,
+                                                  early_exit_agreement=args.agreement)
+            pipeline.load_input_files()
+            start = time.perf_counter()
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+            pipeline.cleanup_checkpoint()
+
+            fact_calls = sum(model.calls[name] for name in FACTS)
+            print(f"  {label:<15} {elapsed:6.2f}s  LLM calls={sum(model.calls.values()):,}  "
+                  f"one_per_patient calls={fact_calls:,} ({fact_calls / len(FACTS):.1f} per variable)")
+            rows = pipeline.variable_results
+            values = {}
+            for name in FACTS:
+                answers = Counter(normalize_answer(row['extracted_value']) for row in rows
+                                  if row['variable_name'] == name and is_informative(row['extracted_value']))
+                values[name] = answers.most_common(1)[0][0] if answers else None
+            if early_exit:
+                for summary in pipeline.early_exit_results:
+                    print(f"    {summary['variable_name']:<18} {summary['consensus_value']!r:<26} "
+                          f"{summary['documents_consulted']}/{summary['documents_available']} documents consulted")
+            results[label] = (values, [(row['variable_name'], row['NOTE_ID'], row['extracted_value'])
+                                       for row in rows if row['variable_name'] not in FACTS])
+
+    identical = results['every document'] == results['early exit']
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
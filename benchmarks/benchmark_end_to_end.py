@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end extraction pipelines against the mock LLM server
+
+Runs the three extraction entry points over a synthetic cohort against
+mock_llm_server.MockOllamaServer (rule-based answers, configurable latency and
+tokens/sec), so their throughput can be compared without a GPU or Ollama:
+1. local-llm    - LocalLLMExtractionPipeline.extract_variables per patient
+                  (BRIM project/variables CSVs, see benchmark_batched_extraction.py)
+2. production   - ProductionExtractionPipeline.run_batch_extraction (Athena
+                  staging files, operative/pathology/imaging documents served
+                  from a pre-filled BinaryDocumentStore, post-op imaging check)
+3. orchestrator - UnifiedWorkflowOrchestrator.process_cohort (phases 1-5 on the
+                  same staging files; phase 4 does not call an LLM yet, so this
+                  row is structured-data and document-selection time)
+
+Each pipeline runs --repeat times. Reports wall-clock, LLM calls, calls/sec,
+prompt tokens and p50/p95 call latency (taken from the mock server), and checks
+that every repeat returns the same results.
+
+Usage:
+    python benchmarks/benchmark_end_to_end.py --patients 4 --variables 8 --documents 12
+    python benchmarks/benchmark_end_to_end.py --tokens-per-second 30 --json e2e.json
+"""
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction' / 'event_based_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import WORDS, write_inputs
+from mock_llm_server import MockOllamaServer, install_client_modules
+
+# Answers for the surgical-event prompts (checked in order; other prompts get a hashed answer)
+RULES = [
+    (r'extent of (tumor )?resection', 'Gross total resection (GTR)'),
+    (r'anatomical location', 'Cerebellum'),
+    (r'metastatic disease', 'No'),
+    (r'site of progression', 'Local'),
+]
+
+BIRTH_DATE = '2010-03-14'
+DOCUMENT_TYPES = [
+    # (offset days from surgery, dr_type_text, file_name)
+    (0, 'Operative Record', 'operative_note.html'),
+    (1, 'Operative Record', 'brief_operative_note.html'),
+    (3, 'Pathology study', 'pathology_report.html'),
+    (-1, 'MRI Brain Report', 'mri_report_preop.html'),
+    (2, 'MRI Brain Report', 'mri_report_postop.html'),
+    (10, 'Progress Notes', 'progress_note.html'),
+    (-5, 'Consult Note', 'consultation.html'),
+    (7, 'Discharge Summary', 'discharge_summary.html'),
+]
+
+
+class FakeS3:
+    """get_object() for the FHIR Binary resources of the synthetic documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def get_object(self, Bucket, Key):
+        text = self.documents[Key.rsplit('/', 1)[-1]]
+        body = json.dumps({'resourceType': 'Binary', 'contentType': 'text/plain',
+                           'data': base64.b64encode(text.encode()).decode()})
+        return {'Body': io.BytesIO(body.encode())}
+
+
+def note_text(rng, heading, words=(200, 600)):
+    return f"{heading}\n" + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*words)))
+
+
+def write_staging(staging, patient_id, rng):
+    """Athena staging files for one patient; returns {binary_id: text} of its documents."""
+    patient_dir = staging / f'patient_{patient_id}'
+    patient_dir.mkdir(parents=True)
+    surgery = pd.Timestamp('2018-01-01') + pd.Timedelta(days=rng.randint(0, 900))
+    day = lambda offset: (surgery + pd.Timedelta(days=offset)).strftime('%Y-%m-%d')
+
+    pd.DataFrame([
+        {'procedure_source_value': '61518', 'procedure_source_name': 'Craniectomy for excision of brain tumor',
+         'proc_code_text': 'Craniectomy tumor resection', 'procedure_date': day(0)},
+        {'procedure_source_value': '62223', 'procedure_source_name': 'VP shunt placement',
+         'proc_code_text': 'Ventriculoperitoneal shunt', 'procedure_date': day(40)},
+    ]).to_csv(patient_dir / 'procedures.csv', index=False)
+
+    documents, rows = {}, []
+    for i, (offset, dr_type, file_name) in enumerate(DOCUMENT_TYPES):
+        binary_id = f'f{patient_id}.{i:03d}'
+        documents[binary_id] = note_text(rng, f'{dr_type.upper()} - cerebellar tumor resection')
+        rows.append({'dc_binary_id': f'Binary/{binary_id}', 'dr_date': day(offset), 'dr_type_text': dr_type,
+                     'dr_description': f'{dr_type} cerebellum resection', 'file_name': file_name,
+                     'document_date': day(offset), 'description': dr_type, 'document_id': binary_id,
+                     'file_path': f'Binary/{binary_id}'})
+    pd.DataFrame(rows).to_csv(patient_dir / 'binary_files.csv', index=False)
+
+    pd.DataFrame([
+        {'imaging_date': day(offset), 'imaging_modality': 'MRI',
+         'result_information': note_text(rng, f'MRI BRAIN. IMPRESSION: {finding}', (150, 400))}
+        for offset, finding in ((-1, 'Posterior fossa mass.'),
+                                (2, 'Postoperative changes, gross total resection of the cerebellar tumor.'),
+                                (95, 'No residual or recurrent enhancing tumor.'))
+    ]).to_csv(patient_dir / 'imaging.csv', index=False)
+    pd.DataFrame([{'report_date': day(3), 'result_text': note_text(rng, 'Pilocytic astrocytoma, WHO grade 1')}]
+                 ).to_csv(patient_dir / 'pathology.csv', index=False)
+    pd.DataFrame([
+        {'medication_name': name, 'medication_start_date': day(start), 'medication_end_date': day(start + 70)}
+        for name, start in (('carboplatin 175 mg/m2', 60), ('vinblastine 6 mg/m2', 200), ('ondansetron 4 mg', 60))
+    ]).to_csv(patient_dir / 'medications.csv', index=False)
+    pd.DataFrame([{'encounter_date': day(offset)} for offset in (-5, 0, 10, 95, 300)]).to_csv(
+        patient_dir / 'encounters.csv', index=False)
+    pd.DataFrame([{'pld_diagnosis_name': 'Pilocytic astrocytoma of cerebellum', 'pld_clinical_status': 'Active',
+                   'pld_onset_date': day(-2), 'pld_icd10_code': 'D33.1'}]).to_csv(
+        patient_dir / 'problem_list_diagnoses.csv', index=False)
+    return documents
+
+
+def write_cohort(root, n_patients, n_variables, n_documents):
+    """BRIM inputs, staging files and a pre-filled Binary store for n_patients patients."""
+    rng = random.Random(11)
+    patients = [f'eSynthetic{i:03d}' for i in range(n_patients)]
+    staging = root / 'staging'
+    documents, configs = {}, []
+    for i, patient_id in enumerate(patients):
+        brim_dir = root / 'brim' / patient_id
+        brim_dir.mkdir(parents=True)
+        configs.append(write_inputs(brim_dir, n_variables, n_documents, seed=i))
+        documents.update(write_staging(staging, patient_id, rng))
+    (root / 'patient_config.json').write_text(json.dumps({'birth_date': BIRTH_DATE}))
+    patient_list = root / 'patients.csv'
+    pd.DataFrame({'patient_id': patients}).to_csv(patient_list, index=False)
+
+    from binary_document_store import BinaryDocumentStore
+    store = BinaryDocumentStore(s3_client=FakeS3(documents), store_dir=root / 'binary_store')
+    store.prefetch(documents)
+    store.close()
+    return patients, configs, staging, patient_list
+
+
+def run_local_llm(configs, parallel):
+    from llm_scheduler import LLMScheduler
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    results = []
+    for config in configs:
+        pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='mock',
+                                              relevance_filter=False, resume=False)
+        pipeline.scheduler = LLMScheduler(max_in_flight={'ollama': parallel})
+        pipeline.load_input_files()
+        pipeline.extract_variables()
+        pipeline.scheduler.shutdown()
+        pipeline.cleanup_checkpoint()
+        results.extend((row['variable_name'], row['NOTE_ID'], row['extracted_value'])
+                       for row in pipeline.variable_results)
+    return results
+
+
+def run_production(patient_list, staging, output_dir, workers):
+    from production_extraction_pipeline import ProductionExtractionPipeline
+
+    pipeline = ProductionExtractionPipeline(str(patient_list), output_dir=str(output_dir), staging_dir=str(staging))
+    pipeline.run_batch_extraction(max_workers=workers)
+    results = []
+    for path in sorted(pipeline.patient_dir.glob('patient_*.json')):
+        patient = json.loads(path.read_text())
+        for event in patient.get('events', []):
+            for name, value in sorted(event.get('extracted_variables', {}).items()):
+                results.append((patient['patient_id'], event['event_date'], name, value.get('value')))
+    return results
+
+
+def run_orchestrator(root, patients, output_dir):
+    from unified_workflow_orchestrator import UnifiedWorkflowOrchestrator
+
+    config = dict(UnifiedWorkflowOrchestrator._load_config(None, None))
+    config['paths'] = {'staging_base': str(root / 'staging'), 'binary_base': str(root / 'binary_store'),
+                       'brim_base': str(root / 'brim'), 'output_base': str(output_dir)}
+    config_path = root / 'workflow_config.yaml'
+    config_path.write_text(yaml.safe_dump(config))
+    summary = UnifiedWorkflowOrchestrator(config_path).process_cohort(patients)
+    columns = ['patient_id', 'status', 'diagnosis_date', 'documents_selected', 'brim_success_rate']
+    return [tuple(str(value) for value in row) for row in summary.reindex(columns=columns).itertuples(index=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the extraction pipelines end to end')
+    parser.add_argument('--patients', type=int, default=4)
+    parser.add_argument('--variables', type=int, default=8, help='local-llm variables per patient')
+    parser.add_argument('--documents', type=int, default=12, help='local-llm documents per patient')
+    parser.add_argument('--parallel', type=int, default=4, help='Mock server concurrent generations')
+    parser.add_argument('--workers', type=int, default=4, help='production pipeline patient workers')
+    parser.add_argument('--request-overhead', type=float, default=0.01, help='Mock seconds per request')
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=8000.0, help='Mock prompt processing')
+    parser.add_argument('--tokens-per-second', type=float, default=400.0, help='Mock generation speed')
+    parser.add_argument('--answer-tokens', type=int, default=8, help='Mock tokens generated per answer')
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--json', help='Write the measurements to this file')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_MAX_IN_FLIGHT_OLLAMA'] = str(args.parallel)
+    server = MockOllamaServer(parallel=args.parallel, request_overhead=args.request_overhead,
+                              prefill_tokens_per_second=args.prefill_tokens_per_second,
+                              tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens,
+                              rules=RULES).start()
+    install_client_modules(server.url)
+
+    print(f"\n{'='*60}")
+    print(f"END-TO-END BENCHMARK: {args.patients} patients, server parallel={args.parallel}, "
+          f"{args.tokens_per_second:g} tokens/s")
+    print(f"{'='*60}")
+
+    measurements, identical = [], True
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        os.environ['BINARY_STORE_DIR'] = str(root / 'binary_store')
+        os.environ['STAGING_STORE_DIR'] = str(root / 'staging_store')
+        patients, configs, staging, patient_list = write_cohort(root, args.patients, args.variables, args.documents)
+        os.chdir(root)  # the production pipeline logs to ./extraction_pipeline.log
+        pipelines = {
+            'local-llm': lambda run: run_local_llm(configs, args.parallel),
+            'production': lambda run: run_production(patient_list, staging, root / f'production_{run}', args.workers),
+            'orchestrator': lambda run: run_orchestrator(root, patients, root / f'orchestrator_{run}'),
+        }
+        try:
+            print(f"\n  {'pipeline':<13} {'wall':>8} {'calls':>7} {'calls/s':>8} {'prompt tokens':>14} "
+                  f"{'p50':>7} {'p95':>7}")
+            for name, run_pipeline in pipelines.items():
+                runs = []
+                for run in range(args.repeat):
+                    server.clear_caches()
+                    server.reset_counters()
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):  # the pipelines print their own reports
+                        runs.append(run_pipeline(run))
+                    elapsed = time.perf_counter() - start
+                    s = server.stats()
+                    row = {'pipeline': name, 'run': run, 'wall_seconds': elapsed, 'calls': s['requests'],
+                           'calls_per_second': s['requests'] / elapsed, 'prompt_tokens': s['prompt_tokens'],
+                           'latency_p50': s['latency_p50'], 'latency_p95': s['latency_p95'],
+                           'results': len(runs[-1])}
+                    measurements.append(row)
+                    print(f"  {name if run == 0 else '':<13} {elapsed:7.2f}s {s['requests']:>7,} "
+                          f"{row['calls_per_second']:>8.1f} {s['prompt_tokens']:>14,} "
+                          f"{s['latency_p50'] * 1000:>5.0f}ms {s['latency_p95'] * 1000:>5.0f}ms")
+                same = all(result == runs[0] for result in runs) and bool(runs[0])
+                identical &= same
+                print(f"  {'':<13} {len(runs[0])} results, {'identical' if same else 'DIFFERENT'} across runs")
+        finally:
+            os.chdir(cwd)
+
+    server.stop()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(measurements, f, indent=2)
+        print(f"\n  Measurements written to {args.json}")
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: persistent LLM response cache
+
+Runs LocalLLMExtractionPipeline.extract_variables three times over the same
+synthetic patient against a simulated Ollama model (see
+benchmark_batched_extraction.py), sharing one LLMResponseCache directory:
+1. cold      - empty cache, every prompt goes to the model
+2. rerun     - identical inputs (e.g. resuming after a crash): all cache hits
+3. one edit  - one variable's instruction changed: only its prompts are recomputed
+
+Checks that cached runs return the same variable_results as the cold run.
+
+Usage:
+    python benchmarks/benchmark_llm_cache.py --variables 12 --documents 40
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import SimulatedOllama, write_inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the persistent LLM response cache')
+    parser.add_argument('--variables', type=int, default=12)
+    parser.add_argument('--documents', type=int, default=40)
+    parser.add_argument('--call-latency', type=float, default=0.01, help='Simulated seconds per LLM call')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.005,
+                        help='Simulated prompt-processing seconds per 1,000 prompt tokens')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+    model = SimulatedOllama(args.call_latency, args.latency_per_1k_tokens)
+    sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+
+    print(f"\n{'='*60}")
+    print(f"LLM RESPONSE CACHE BENCHMARK: {args.variables} variables x {args.documents} documents")
+    print(f"{'='*60}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['LLM_CACHE_DIR'] = str(Path(tmp) / 'llm_cache')
+        from llm_response_cache import get_response_cache
+        from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+        config = write_inputs(Path(tmp), args.variables, args.documents)
+        variables_file = next(Path(tmp).glob('variables_*.csv'))
+
+        def run(label):
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated')
+            pipeline.load_input_files()
+            model.calls = model.prompt_tokens = 0
+            cache = get_response_cache()
+            hits_before = cache.hits
+            start = time.perf_counter()
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<9} {elapsed:7.2f}s  model calls={model.calls:5,}  "
+                  f"cache hits={cache.hits - hits_before:5,}  prompt tokens={model.prompt_tokens:10,}")
+            return [{k: v for k, v in row.items() if k != 'extraction_timestamp'} for row in pipeline.variable_results]
+
+        cold = run('cold')
+        rerun = run('rerun')
+
+        variables = pd.read_csv(variables_file)
+        variables.loc[0, 'instruction'] += ' Prefer the most recent value.'
+        variables.to_csv(variables_file, index=False)
+        edited = run('one edit')
+
+        print(f"\n  {get_response_cache().summary()}")
+        get_response_cache().close()
+
+    edited_name = variables.loc[0, 'variable_name']
+    identical = rerun == cold and [r for r in edited if r['variable_name'] != edited_name] == \
+        [r for r in cold if r['variable_name'] != edited_name]
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
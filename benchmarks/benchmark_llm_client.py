@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pooled, streaming LLM client against per-call clients
+
+Sends the same extraction prompts to mock_llm_server.MockOllamaServer from
+--threads threads, the way the event-based extractors call the model:
+1. per-call connection - OllamaHTTPClient, a new connection per call (like a
+                         Client built per component), complete responses
+2. pooled              - llm_client.LLMClient over the shared session, complete
+                         responses (LLM_STREAM=0)
+3. pooled + streaming  - LLMClient streaming, stopping at the answer delimiter
+
+The mock model answers with the extracted value followed by a paragraph of
+commentary (--commentary-words), as chat models tend to. Reports wall-clock,
+TCP connections opened, tokens the server generated and streams cancelled,
+and checks that every mode returns the same values (the per-call client's
+answers cut at the same delimiter). A stream stopped early drops its
+connection (that is what stops the server generating), so streaming opens
+one connection per early-stopped call. Pooling only saves connection setup
+(TCP and TLS handshakes), which a local mock server barely shows.
+
+Usage:
+    python benchmarks/benchmark_llm_client.py --calls 120 --threads 4 --commentary-words 60
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from mock_llm_server import MockOllamaServer, OllamaHTTPClient
+
+EXTENTS = ['Gross total resection (GTR)', 'Near-total resection (>95%)', 'Subtotal resection (50-95%)',
+           'Partial resection (<50%)', 'Biopsy only']
+
+
+def prompts(n):
+    """Post-op imaging extraction prompts; the answer is chosen by the report's EXTENT_<i> marker."""
+    return [f"Post-operative MRI report {i}: findings EXTENT_{i % len(EXTENTS)} ...\n\n"
+            f"Extract the extent of resection.\n\nProvide ONLY the extent category:" for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pooled streaming LLM client')
+    parser.add_argument('--calls', type=int, default=120)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--parallel', type=int, default=4, help='Mock server concurrent generations')
+    parser.add_argument('--tokens-per-second', type=float, default=400.0, help='Mock generation speed')
+    parser.add_argument('--commentary-words', type=int, default=60, help='Words the model adds after the value')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    commentary = ' '.join(['the report describes the resection cavity'] * (args.commentary_words // 6 + 1))
+    rules = [(f'EXTENT_{i}\\b', f'{extent}\n\nExplanation: {commentary}') for i, extent in enumerate(EXTENTS)]
+    server = MockOllamaServer(parallel=args.parallel, tokens_per_second=args.tokens_per_second,
+                              request_overhead=0.002, rules=rules).start()
+    os.environ['OLLAMA_HOST'] = server.url
+
+    import llm_client
+    from llm_client import ANSWER_DELIMITERS, find_delimiter
+
+    print(f"\n{'='*60}")
+    print(f"LLM CLIENT BENCHMARK: {args.calls} calls from {args.threads} threads, server parallel={args.parallel}, "
+          f"{args.commentary_words} words of commentary per answer")
+    print(f"{'='*60}")
+
+    def per_call(prompt):
+        content = OllamaHTTPClient(server.url).chat(model='mock', messages=[{'role': 'user', 'content': prompt}],
+                                                    options={'temperature': 0.0})['message']['content']
+        cut = find_delimiter(content, ANSWER_DELIMITERS)
+        return (content[:cut] if cut >= 0 else content).strip()
+
+    def pooled(client):
+        def call(prompt):
+            return client.chat(model='mock', messages=[{'role': 'user', 'content': prompt}],
+                               variable_type='single_value')['message']['content'].strip()
+        return call
+
+    results = {}
+    batch = prompts(args.calls)
+    for label, stream in (('per-call connection', None), ('pooled', False), ('pooled + streaming', True)):
+        if stream is None:
+            call = per_call
+        else:
+            llm_client.reset_llm_clients()
+            call = pooled(llm_client.LLMClient(llm_client.OllamaBackend(), stream=stream))
+        server.reset_counters()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            answers = list(pool.map(call, batch))
+        elapsed = time.perf_counter() - start
+        time.sleep(0.1)  # let cancelled streams record their counters
+        s = server.stats()
+        print(f"  {label:<20} {elapsed:6.2f}s  connections={s['connections']:>4}  "
+              f"generated tokens={s['completion_tokens']:>6,}  cancelled={s['cancelled']:>4}  "
+              f"latency p50={s['latency_p50'] * 1000:.0f}ms")
+        results[label] = answers
+
+    print("\n  " + llm_client.LLMClient(llm_client.OllamaBackend()).summary())
+    for line in llm_client.metrics_text().splitlines():
+        if line.startswith(('llm_early_stops_total', 'llm_completion_tokens_total', 'llm_requests_total')):
+            print(f"    {line}")
+
+    server.stop()
+    identical = results['per-call connection'] == results['pooled'] == results['pooled + streaming']
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: LLM request scheduler against a mock Ollama HTTP server
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient
+(see benchmark_batched_extraction.py) against mock_llm_server.MockOllamaServer,
+which serves --parallel generations at a time and fails a fraction of requests
+with HTTP 503:
+1. serial    - scheduler limited to 1 call in flight (the previous serial loop)
+2. scheduled - scheduler with --max-in-flight calls in flight
+
+Both modes retry failed calls with jittered backoff. Reports wall-clock,
+latency percentiles, peak queue depth, retries and tokens/s, and checks that
+both modes produce the same variable_results rows.
+
+Usage:
+    python benchmarks/benchmark_llm_scheduler.py --parallel 4 --max-in-flight 4 --failure-rate 0.03
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import write_inputs
+from mock_llm_server import MockOllamaServer, install_client_modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the LLM request scheduler')
+    parser.add_argument('--variables', type=int, default=8)
+    parser.add_argument('--documents', type=int, default=30)
+    parser.add_argument('--parallel', type=int, default=4, help='Mock server concurrent generations')
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help='Mock generation speed')
+    parser.add_argument('--failure-rate', type=float, default=0.03, help='Fraction of requests failing with 503')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    server = MockOllamaServer(parallel=args.parallel, tokens_per_second=args.tokens_per_second,
+                              failure_rate=args.failure_rate).start()
+    install_client_modules(server.url)
+
+    from llm_scheduler import LLMScheduler
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    print(f"\n{'='*60}")
+    print(f"LLM SCHEDULER BENCHMARK: {args.variables} variables x {args.documents} documents, "
+          f"server parallel={args.parallel}, failure rate={args.failure_rate:.0%}")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = write_inputs(Path(tmp), args.variables, args.documents)
+        for label, max_in_flight in (('serial', 1), ('scheduled', args.max_in_flight)):
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='mock')
+            pipeline.scheduler = LLMScheduler(max_in_flight={'ollama': max_in_flight}, backoff_base=0.05)
+            pipeline.load_input_files()
+            server.reset_counters()
+
+            start = time.perf_counter()
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+
+            m = pipeline.scheduler.metrics()['ollama']
+            pipeline.scheduler.shutdown()
+            print(f"  {label:<10} {elapsed:7.2f}s  in flight={max_in_flight}  calls={m['completed']:,}  "
+                  f"retries={m['retries']}  failed={m['failed']}")
+            print(f"  {'':<10} latency p50={m['latency_p50']:.3f}s p95={m['latency_p95']:.3f}s  "
+                  f"peak queue={m['max_queue_depth']}  server peak active={server.peak_active}  "
+                  f"{m['throughput_tokens_per_second']:.0f} tokens/s")
+            results[label] = (elapsed, [
+                {k: v for k, v in row.items() if k != 'extraction_timestamp'} for row in pipeline.variable_results
+            ])
+
+    server.stop()
+    print(f"\n  Speedup: {results['serial'][0] / results['scheduled'][0]:.1f}x")
+
+    identical = results['serial'][1] == results['scheduled'][1] and \
+        not any(row['extracted_value'] == 'ERROR' for row in results['scheduled'][1])
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: patient -> NDJSON byte-offset index
+
+Finds one patient's DocumentReference records among many NDJSON files in a
+local S3 stand-in (moto):
+1. per-file scan - one request per NDJSON file, filtered client-side (the
+                   request pattern of the old per-file S3 Select loop; moto's
+                   S3 Select needs extra dependencies, so a full GET stands in)
+2. index build   - NDJSONPatientIndex.build() over every file (one-off)
+3. incremental   - build() again after new files land (only new files are read)
+4. lookup        - fetch_records(): ranged GETs on the files holding the patient
+
+Usage:
+    python benchmarks/benchmark_ndjson_index.py --files 500 --request-latency 0.02
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+BUCKET = 'benchmark-ndjson-bucket'
+PREFIX = 'prd/source/DocumentReference/'
+
+
+def build_file(file_number, records_per_file, n_patients):
+    """One NDJSON file of DocumentReferences spread over n_patients."""
+    lines = []
+    for i in range(records_per_file):
+        patient = f'p{(file_number * 31 + i * 7) % n_patients:05d}.X'
+        lines.append(json.dumps({
+            'resourceType': 'DocumentReference',
+            'id': f'doc-{file_number}-{i}',
+            'subject': {'reference': f'Patient/{patient}', 'display': 'Test'},
+            'type': {'text': 'Progress Notes'},
+            'content': [{'attachment': {'url': f'Binary/b{file_number}-{i}', 'contentType': 'text/html'}}],
+            'description': 'x' * 400,
+        }))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the patient -> NDJSON byte-offset index')
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--records-per-file', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--request-latency', type=float, default=0.01,
+                        help='Simulated seconds per S3 request')
+    args = parser.parse_args()
+
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        print("❌ moto is required for the S3 stand-in: pip install moto")
+        return 1
+
+    from botocore.config import Config
+    from ndjson_patient_index import NDJSONPatientIndex
+
+    patient_id = 'p00042.X'
+    new_files = max(1, args.files // 20)
+
+    print(f"\n{'='*60}")
+    print(f"NDJSON INDEX BENCHMARK: {args.files:,} files x {args.records_per_file:,} records")
+    print(f"{'='*60}")
+
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp:
+        s3 = boto3.client('s3', region_name='us-east-1', config=Config(max_pool_connections=args.workers))
+        s3.create_bucket(Bucket=BUCKET)
+        for n in range(args.files):
+            s3.put_object(Bucket=BUCKET, Key=f'{PREFIX}part-{n:05d}.ndjson',
+                          Body=build_file(n, args.records_per_file, args.patients))
+
+        requests = {'count': 0}
+
+        def add_latency(**kwargs):
+            requests['count'] += 1
+            time.sleep(args.request_latency)
+        s3.meta.events.register('before-send.s3', add_latency)
+
+        # 1. Per-file scan
+        start = time.perf_counter()
+        requests['count'] = 0
+        scanned = []
+        keys = [obj['Key'] for page in s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET, Prefix=PREFIX)
+                for obj in page.get('Contents', [])]
+        for key in keys:
+            for line in s3.get_object(Bucket=BUCKET, Key=key)['Body'].read().splitlines():
+                record = json.loads(line)
+                if patient_id in record['subject']['reference']:
+                    scanned.append(record)
+        print(f"  {'per-file':<12} {time.perf_counter() - start:8.2f}s  requests={requests['count']:,}")
+
+        index = NDJSONPatientIndex(s3, BUCKET, index_path=Path(tmp) / 'index.sqlite',
+                                   max_workers=args.workers)
+
+        # 2. Index build
+        start = time.perf_counter()
+        counts = index.build(PREFIX)
+        print(f"  {'build':<12} {time.perf_counter() - start:8.2f}s  indexed={counts['indexed']:,} files, "
+              f"{counts['records']:,} records")
+
+        # 3. Incremental build after new files land
+        for n in range(args.files, args.files + new_files):
+            s3.put_object(Bucket=BUCKET, Key=f'{PREFIX}part-{n:05d}.ndjson',
+                          Body=build_file(n, args.records_per_file, args.patients))
+        start = time.perf_counter()
+        counts = index.build(PREFIX)
+        print(f"  {'incremental':<12} {time.perf_counter() - start:8.2f}s  indexed={counts['indexed']:,} new, "
+              f"unchanged={counts['unchanged']:,}")
+
+        # 4. Lookup
+        start = time.perf_counter()
+        requests['count'] = 0
+        fetched = index.fetch_records(patient_id, PREFIX)
+        print(f"  {'lookup':<12} {time.perf_counter() - start:8.2f}s  requests={requests['count']:,}  "
+              f"records={len(fetched):,}")
+        print(f"\n  Index size: {(Path(tmp) / 'index.sqlite').stat().st_size / 1024 ** 2:.1f} MB  {index.stats()}")
+
+        # Only records in the original files are comparable with the scan
+        original = [r for r in fetched if int(r['id'].split('-')[1]) < args.files]
+        index.close()
+
+    identical = sorted(r['id'] for r in original) == sorted(r['id'] for r in scanned) and scanned
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
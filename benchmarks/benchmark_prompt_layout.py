@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prefix-stable prompt layout against a mock server with prompt caching
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient
+(see benchmark_batched_extraction.py) against mock_llm_server.MockOllamaServer,
+which reuses the KV cache of each slot's previous prompt (Ollama) and caches
+prefixes up to a cache_control breakpoint (Anthropic):
+1. task-first     - the previous layout: task before the document, calls queued
+                    variable by variable, no keep_alive / cache_control
+2. document-first - prompt_layout: document before the task, calls queued
+                    document by document, keep_alive and cache_control set
+
+Both layouts run on the Ollama and the Anthropic endpoint. Reports prompt
+tokens served from the cache, time to first token, wall-clock and (Anthropic)
+billed input tokens, and checks that both layouts produce the same
+variable_results rows.
+
+Usage:
+    python benchmarks/benchmark_prompt_layout.py --variables 12 --documents 15 --parallel 4
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from benchmark_batched_extraction import write_inputs
+from mock_llm_server import MockOllamaServer, install_client_modules
+
+# Anthropic prompt caching prices relative to base input tokens
+CACHE_WRITE_PRICE = 1.25
+CACHE_READ_PRICE = 0.1
+
+
+def task_first_pipeline():
+    """Pipeline with the previous task-first prompt, variable-major order and no cache hints."""
+    from llm_scheduler import PRIORITY_DEFAULT, scope_priority
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    class TaskFirstPipeline(LocalLLMExtractionPipeline):
+        def build_extraction_prompt(self, instruction, note_id, note_text, note_title):
+            return f"""You are a medical data extraction assistant. Your task is to extract specific information from clinical documents.
+
+DOCUMENT INFORMATION:
+- NOTE_ID: {note_id}
+- NOTE_TITLE: {note_title}
+
+EXTRACTION TASK:
+{instruction}
+
+DOCUMENT TEXT:
+{note_text}
+
+INSTRUCTIONS:
+1. Read the document carefully
+2. Extract ONLY the requested information following the exact format specified
+3. If the information is not found or not applicable, return the default value specified in the instruction
+4. Return ONLY the extracted value, no explanation or preamble
+
+EXTRACTED VALUE:"""
+
+        def order_pairs(self, pairs):
+            return sorted(pairs, key=lambda pair: (scope_priority(pair[1].get('scope', 'many_per_note')),
+                                                   pair[0], pair[2]))
+
+        def submit_llm(self, prompt, max_tokens=None, json_output=False, priority=PRIORITY_DEFAULT,
+                       cache_prefix=None, variable_type=None):
+            return super().submit_llm(prompt, max_tokens, json_output, priority, variable_type=variable_type)
+
+    return TaskFirstPipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prefix-stable prompt layout')
+    parser.add_argument('--variables', type=int, default=12)
+    parser.add_argument('--documents', type=int, default=15)
+    parser.add_argument('--parallel', type=int, default=4, help='Mock server concurrent generations')
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=8000.0, help='Mock prompt processing')
+    parser.add_argument('--tokens-per-second', type=float, default=400.0, help='Mock generation speed')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    server = MockOllamaServer(parallel=args.parallel, prefill_tokens_per_second=args.prefill_tokens_per_second,
+                              tokens_per_second=args.tokens_per_second).start()
+    install_client_modules(server.url)
+
+    from llm_scheduler import LLMScheduler
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    print(f"\n{'='*60}")
+    print(f"PROMPT LAYOUT BENCHMARK: {args.variables} variables x {args.documents} documents, "
+          f"server parallel={args.parallel}")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config = write_inputs(Path(tmp), args.variables, args.documents)
+        for backend in ('ollama', 'anthropic'):
+            print(f"\n  {backend}:")
+            for label, pipeline_class in (('task-first', task_first_pipeline()),
+                                          ('document-first', LocalLLMExtractionPipeline)):
+                pipeline = pipeline_class(str(config), use_ollama=backend == 'ollama', ollama_model='mock',
+                                          relevance_filter=False, resume=False)
+                if label == 'task-first' and backend == 'ollama':
+                    pipeline.ollama_keep_alive = None
+                pipeline.scheduler = LLMScheduler(max_in_flight={backend: args.parallel})
+                pipeline.load_input_files()
+                server.clear_caches()
+                server.reset_counters()
+
+                start = time.perf_counter()
+                pipeline.extract_variables()
+                elapsed = time.perf_counter() - start
+                pipeline.scheduler.shutdown()
+                pipeline.cleanup_checkpoint()
+
+                s = server.stats()
+                line = (f"    {label:<15} {elapsed:6.2f}s  calls={s['requests']:,}  prompt tokens={s['prompt_tokens']:,}  "
+                        f"cached={s['prefix_reuse']:.0%}  TTFT p50={s['ttft_p50'] * 1000:.0f}ms "
+                        f"p95={s['ttft_p95'] * 1000:.0f}ms")
+                if backend == 'anthropic':
+                    uncached = s['prompt_tokens'] - s['cached_prompt_tokens'] - s['cache_write_tokens']
+                    billed = (uncached + CACHE_WRITE_PRICE * s['cache_write_tokens']
+                              + CACHE_READ_PRICE * s['cached_prompt_tokens'])
+                    line += f"  billed input={billed:,.0f}"
+                print(line)
+                results[(backend, label)] = [(row['variable_name'], row['NOTE_ID'], row['extracted_value'])
+                                             for row in pipeline.variable_results]
+
+    server.stop()
+    identical = all(results[(backend, 'task-first')] == results[(backend, 'document-first')]
+                    for backend in ('ollama', 'anthropic')) and \
+        results[('ollama', 'document-first')] == results[('anthropic', 'document-first')]
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmark: indexed structured data query engine against per-query row scans
+
+Replays the tool calls an extraction run makes against Phase 4's
+StructuredDataQueryEngine (QUERY_SURGERY_DATES, QUERY_MEDICATIONS,
+QUERY_IMAGING_ON_DATE around every surgery, QUERY_ENCOUNTERS_RANGE per year,
+QUERY_DIAGNOSIS, ...), each query asked --repeats times as several documents
+of a patient ask it, over --patients synthetic patients:
+1. row scans          - each query fetches the staging frame and walks it with
+                        iterrows() (the engine before indexing)
+2. indexed, no memo   - per-patient indexes, every query computed
+                        (QUERY_CACHE_SIZE=0)
+3. indexed + memo     - indexes plus the LRU of answered queries
+
+Staging frames come from a warm staging store in every mode, so the timings
+are query work only. Reports per-query latency and checks that every mode
+returns the same answers (compared by repr, so types count too).
+
+Usage:
+    python benchmarks/benchmark_query_engine.py --patients 4 --repeats 5
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'local_llm_extraction' / 'event_based_extraction'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmark_staging_store import write_patient
+
+DRUGS = ['carboplatin', 'Vinblastine', 'BEVACIZUMAB', 'selumetinib', 'temozolomide', 'nan']
+
+
+class ScanQueryEngine:
+    """The engine's queries as row scans over the staging frames, as before indexing."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.store = engine.staging_store
+
+    def query_surgery_dates(self, patient_id):
+        procedures_df = self.store.frame(patient_id, 'procedures')
+        if procedures_df is None:
+            return []
+        surgeries = []
+        for idx, row in procedures_df.iterrows():
+            proc_text = str(row.get('proc_code_text', '')).lower()
+            if any(keyword in proc_text for keyword in ['resection', 'craniotomy', 'biopsy', 'excision']):
+                date_col = None
+                for col in ['proc_performed_period_start', 'proc_performed_date_time', 'procedure_date']:
+                    if col in procedures_df.columns and pd.notna(row.get(col)):
+                        date_col = col
+                        break
+                if date_col:
+                    surgeries.append({'date': str(row[date_col])[:10],
+                                      'type': 'resection' if 'resection' in proc_text else 'biopsy',
+                                      'description': row.get('proc_code_text', 'Unknown')})
+        return surgeries
+
+    def query_diagnosis(self, patient_id):
+        problems_df = self.store.frame(patient_id, 'problem_list')
+        if problems_df is not None:
+            for idx, row in problems_df.iterrows():
+                diagnosis = str(row.get('pld_diagnosis_name', '')).lower()
+                if any(keyword in diagnosis for keyword in ['astrocytoma', 'glioma', 'brain', 'neoplasm']):
+                    return {'diagnosis': row.get('pld_diagnosis_name'), 'icd10': row.get('pld_icd10cm_code'),
+                            'date': str(row.get('pld_recorded_time', ''))[:10], 'status': row.get('pld_status')}
+        diagnoses_df = self.store.frame(patient_id, 'diagnoses')
+        if diagnoses_df is not None and not diagnoses_df.empty:
+            first_diagnosis = diagnoses_df.iloc[0]
+            return {'diagnosis': first_diagnosis.get('diagnosis_name', 'Unknown'),
+                    'date': str(first_diagnosis.get('diagnosis_date', ''))[:10]}
+        return {}
+
+    def query_medications(self, patient_id, drug_name):
+        meds_df = self.store.frame(patient_id, 'medications')
+        if meds_df is None:
+            return []
+        drug_lower = drug_name.lower()
+        matches = []
+        for idx, row in meds_df.iterrows():
+            if drug_lower in str(row.get('medication_name', '')).lower():
+                start_date = None
+                for col in ['medication_start_date', 'mr_authoredon', 'cp_period_start']:
+                    if col in meds_df.columns and pd.notna(row.get(col)):
+                        start_date = str(row[col])[:10]
+                        break
+                matches.append({'medication': row.get('medication_name'), 'start_date': start_date,
+                                'end_date': str(row.get('cp_period_end', ''))[:10] if 'cp_period_end' in row else None,
+                                'status': row.get('medication_status')})
+        return matches
+
+    def query_molecular_tests(self, patient_id):
+        molecular_df = self.store.frame(patient_id, 'molecular_tests_metadata')
+        if molecular_df is None:
+            return []
+        return [{'test_name': row.get('mt_lab_test_name', 'Unknown'),
+                 'test_date': str(row.get('mt_test_date', ''))[:10],
+                 'specimen_date': str(row.get('mt_specimen_collection_date', ''))[:10],
+                 'result_summary': row.get('mt_result', 'No result')} for idx, row in molecular_df.iterrows()]
+
+    def query_imaging_on_date(self, patient_id, target_date, tolerance_days=7):
+        imaging_df = self.store.frame(patient_id, 'imaging')
+        if imaging_df is None:
+            return []
+        target = pd.to_datetime(target_date, utc=True)
+        matches = []
+        for idx, row in imaging_df.iterrows():
+            img_date = None
+            for col in ['imaging_date', 'img_performed_period_start', 'study_date']:
+                if col in imaging_df.columns and pd.notna(row.get(col)):
+                    img_date = pd.to_datetime(row[col], utc=True)
+                    break
+            if img_date and abs((img_date - target).days) <= tolerance_days:
+                matches.append({'date': str(img_date)[:10], 'modality': row.get('img_modality', 'Unknown'),
+                                'body_part': row.get('img_body_part_examined', 'Unknown'),
+                                'days_from_target': int((img_date - target).days)})
+        return matches
+
+    def query_problem_list(self, patient_id):
+        problems_df = self.store.frame(patient_id, 'problem_list')
+        if problems_df is None:
+            return []
+        return [{'problem': row.get('pld_diagnosis_name'), 'icd10': row.get('pld_icd10cm_code'),
+                 'recorded_date': str(row.get('pld_recorded_time', ''))[:10],
+                 'category': self.engine._categorize_problem(row.get('pld_diagnosis_name', ''))}
+                for idx, row in problems_df.iterrows() if str(row.get('pld_status', '')).lower() == 'active']
+
+    def query_encounters_range(self, patient_id, start_date, end_date):
+        encounters_df = self.store.frame(patient_id, 'encounters')
+        if encounters_df is None:
+            return []
+        start = pd.to_datetime(start_date, utc=True)
+        end = pd.to_datetime(end_date, utc=True)
+        matches = []
+        for idx, row in encounters_df.iterrows():
+            enc_date = None
+            for col in ['enc_period_start', 'encounter_date', 'admission_date']:
+                if col in encounters_df.columns and pd.notna(row.get(col)):
+                    enc_date = pd.to_datetime(row[col], utc=True)
+                    break
+            if enc_date and start <= enc_date <= end:
+                matches.append({'date': str(enc_date)[:10], 'type': row.get('enc_class_display', 'Unknown'),
+                                'reason': row.get('enc_reasoncode_display', 'Unknown'),
+                                'department': row.get('enc_service_provider_name', 'Unknown')})
+        return matches
+
+
+def add_gaps(folder, rng):
+    """Missing values and extra columns, so the first-present-column rules are exercised."""
+    meds = pd.read_csv(folder / 'medications.csv')
+    meds.loc[rng.random(len(meds)) < 0.2, 'medication_start_date'] = np.nan
+    meds['cp_period_start'] = meds['med_date_given_start']
+    meds['cp_period_end'] = meds['medication_end_date'].where(rng.random(len(meds)) < 0.5)
+    meds.loc[rng.random(len(meds)) < 0.05, 'medication_name'] = np.nan
+    meds.to_csv(folder / 'medications.csv', index=False)
+
+    encounters = pd.read_csv(folder / 'encounters.csv')
+    encounters.loc[rng.random(len(encounters)) < 0.3, 'enc_period_start'] = np.nan
+    encounters['enc_reasoncode_display'] = rng.choice(['Follow-up', 'Chemotherapy', None], len(encounters))
+    encounters.to_csv(folder / 'encounters.csv', index=False)
+
+    imaging = pd.read_csv(folder / 'imaging.csv')
+    imaging['img_modality'] = imaging.pop('imaging_modality')
+    imaging.loc[rng.random(len(imaging)) < 0.1, 'imaging_date'] = np.nan
+    imaging.to_csv(folder / 'imaging.csv', index=False)
+
+
+def workload(engine, patient_id):
+    """The queries one patient's documents ask; surgery dates drive the imaging lookups."""
+    queries = [('query_surgery_dates', ()), ('query_diagnosis', ()), ('query_problem_list', ()),
+               ('query_molecular_tests', ())]
+    queries += [('query_medications', (drug,)) for drug in DRUGS]
+    for surgery in engine.query_surgery_dates(patient_id)[:40]:
+        queries += [('query_imaging_on_date', (surgery['date'],)), ('query_imaging_on_date', (surgery['date'], 3))]
+    queries += [('query_encounters_range', (f'{year}-01-01', f'{year}-12-31')) for year in range(2015, 2024)]
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the indexed structured data query engine')
+    parser.add_argument('--patients', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5, help='Times each query is asked per patient')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on rows per staging file')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"\n{'='*60}")
+    print(f"QUERY ENGINE BENCHMARK: {args.patients} patients, each query asked {args.repeats}x")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['STAGING_STORE_DIR'] = str(Path(tmp) / 'store')
+        os.environ['STAGING_STORE_PATIENTS'] = str(args.patients)
+        from phase4_llm_with_query_capability import StructuredDataQueryEngine
+        from structured_query_index import QueryIndex
+
+        staging = Path(tmp) / 'staging'
+        rng = np.random.default_rng(11)
+        patients = [f'eQuery{i:03d}.x' for i in range(args.patients)]
+        for patient_id in patients:
+            write_patient(staging, patient_id, rng, args.scale)
+            add_gaps(staging / f'patient_{patient_id}', rng)
+
+        scans = ScanQueryEngine(StructuredDataQueryEngine(staging))
+        plan = {patient_id: workload(scans, patient_id) for patient_id in patients}  # also warms the store
+        total = sum(len(queries) for queries in plan.values()) * args.repeats
+
+        for label in ('row scans', 'indexed, no memo', 'indexed + memo'):
+            if label == 'row scans':
+                engine = scans
+            else:
+                engine = StructuredDataQueryEngine(staging)
+                engine.index = QueryIndex(engine.staging_store, cache_size=0 if label == 'indexed, no memo' else None)
+            latencies, answers = [], []
+            start = time.perf_counter()
+            for patient_id, queries in plan.items():
+                for _ in range(args.repeats):
+                    for name, query_args in queries:
+                        began = time.perf_counter()
+                        answer = getattr(engine, name)(patient_id, *query_args)
+                        latencies.append(time.perf_counter() - began)
+                        answers.append(repr(answer))
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            print(f"  {label:<17} {elapsed:7.2f}s  {total} queries  "
+                  f"mean={statistics.mean(latencies) * 1000:8.3f}ms  p50={latencies[len(latencies) // 2] * 1000:7.3f}ms  "
+                  f"p99={latencies[int(len(latencies) * 0.99)] * 1000:8.3f}ms")
+            results[label] = answers
+        print(f"\n  {engine.index.summary()}")
+
+    identical = results['row scans'] == results['indexed, no memo'] == results['indexed + memo']
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
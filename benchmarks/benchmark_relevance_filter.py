@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: document relevance pre-filter
+
+Runs LocalLLMExtractionPipeline.extract_variables over a synthetic patient with
+typed notes (operative notes, MRI reports, pathology, oncology visits,
+medication reconciliations, nursing notes) and BRIM variables, against a
+simulated Ollama model (see benchmark_batched_extraction.py):
+1. all pairs - --no-relevance-filter: every variable against every document
+2. filtered  - each variable only against documents its relevance spec matches
+
+Reports LLM calls, prompt tokens, wall-clock and skipped pairs, and checks
+that the filter kept every document written for a variable (recall) and that
+kept pairs produce the same values as the unfiltered run.
+
+Usage:
+    python benchmarks/benchmark_relevance_filter.py --documents 200
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'local_llm_extraction'))
+
+from benchmark_batched_extraction import SimulatedOllama
+
+FILLER = ('patient seen today family at bedside plan discussed questions answered will continue to monitor '
+          'vital signs reviewed afebrile tolerating diet ambulating without assistance').split()
+
+NOTE_TYPES = {
+    'OP Note - Complete': 'craniotomy for resection of posterior fossa tumor gross total resection achieved '
+                          'surgical specimen sent to pathology',
+    'MR Brain W & W/O IV Contrast': 'MRI brain with contrast impression no residual enhancing lesion '
+                                    'stable postoperative changes no new enhancement',
+    'Pathology': 'surgical pathology specimen pilocytic astrocytoma WHO grade I histologic sections '
+                 'molecular testing KIAA1549 BRAF fusion detected',
+    'Oncology Progress Note': 'oncology visit cycle 4 of vinblastine chemotherapy tolerated infusion '
+                              'well continue current regimen',
+    'Medication Reconciliation': 'home medication list reviewed ondansetron 4 mg tablet as needed '
+                                 'levetiracetam 250 mg twice daily',
+    'Nursing Note': '',
+}
+
+# Variable -> note types written to contain its answer
+VARIABLES = {
+    'surgery_extent': ['OP Note - Complete', 'MR Brain W & W/O IV Contrast'],
+    'primary_diagnosis': ['Pathology'],
+    'braf_status': ['Pathology'],
+    'chemotherapy_agents': ['Oncology Progress Note'],
+    'imaging_findings': ['MR Brain W & W/O IV Contrast'],
+    'concomitant_medications': ['Medication Reconciliation'],
+    'patient_gender': [],  # no relevance spec: every document
+}
+
+
+def write_inputs(directory, n_documents, seed=11):
+    """project/variables/decisions CSVs and a config file for one synthetic patient."""
+    rng = random.Random(seed)
+    patient = 'eRelevancePatient'
+    documents = []
+    for i in range(n_documents):
+        title = rng.choice(list(NOTE_TYPES))
+        words = [rng.choice(FILLER) for _ in range(rng.randint(150, 600))]
+        words.insert(rng.randint(0, len(words)), NOTE_TYPES[title])
+        documents.append({'NOTE_ID': f'DOC_{i + 1:04d}', 'PERSON_ID': 'BENCH', 'NOTE_DATETIME': '2020-01-01',
+                          'NOTE_TEXT': ' '.join(words), 'NOTE_TITLE': title})
+    project = pd.DataFrame(documents)
+    project.to_csv(directory / f'project_{patient}.csv', index=False)
+    pd.DataFrame([{
+        'variable_name': name,
+        'instruction': f'Extract {name.replace("_", " ")} from the note, or "Unavailable".',
+        'variable_type': 'text',
+        'scope': 'many_per_note',
+    } for name in VARIABLES]).to_csv(directory / f'variables_{patient}.csv', index=False)
+    pd.DataFrame([{'decision_name': 'summary', 'instruction': 'Summarize surgery_extent'}]).to_csv(
+        directory / f'decisions_{patient}.csv', index=False)
+
+    config = directory / 'config.yaml'
+    config.write_text(yaml.safe_dump({'patient_fhir_id': patient, 'output_dir': str(directory)}))
+    return config, project
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the document relevance pre-filter')
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--call-latency', type=float, default=0.002, help='Simulated seconds per LLM call')
+    parser.add_argument('--latency-per-1k-tokens', type=float, default=0.002,
+                        help='Simulated prompt-processing seconds per 1,000 prompt tokens')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    os.environ['LLM_CACHE'] = '0'  # measure model calls, not the response cache
+    os.environ['LLM_TRANSPORT'] = 'sdk'  # the simulated model stands in for the ollama package
+    model = SimulatedOllama(args.call_latency, args.latency_per_1k_tokens)
+    sys.modules['ollama'] = types.SimpleNamespace(chat=model.chat)
+    from local_llm_extraction_pipeline_with_ollama import LocalLLMExtractionPipeline
+
+    print(f"\n{'='*60}")
+    print(f"RELEVANCE FILTER BENCHMARK: {len(VARIABLES)} variables x {args.documents} documents")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        config, project = write_inputs(Path(tmp), args.documents)
+        for label, relevance_filter in (('all pairs', False), ('filtered', True)):
+            pipeline = LocalLLMExtractionPipeline(str(config), use_ollama=True, ollama_model='simulated',
+                                                  relevance_filter=relevance_filter)
+            start = time.perf_counter()
+            pipeline.load_input_files()
+            index_seconds = time.perf_counter() - start
+            model.calls = model.prompt_tokens = 0
+            pipeline.extract_variables()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<10} {elapsed:7.2f}s  calls={model.calls:6,}  prompt tokens={model.prompt_tokens:10,}  "
+                  f"skipped={len(pipeline.skipped_extractions):,}  (load + index {index_seconds:.2f}s)")
+            results[label] = (model.calls, elapsed, {
+                (row['variable_name'], row['NOTE_ID']): row['extracted_value'] for row in pipeline.variable_results
+            })
+
+    base, filtered = results['all pairs'], results['filtered']
+    print(f"\n  Reduction: {base[0] / filtered[0]:.1f}x calls, {base[1] / filtered[1]:.1f}x wall-clock")
+
+    kept = set(filtered[2])
+    titles = dict(zip(project['NOTE_ID'], project['NOTE_TITLE']))
+    missed = [(name, note_id) for name, types_ in VARIABLES.items() for note_id, title in titles.items()
+              if (not types_ or title in types_) and (name, note_id) not in kept]
+    print(f"  Relevant pairs dropped by the filter: {len(missed)}")
+
+    identical = not missed and all(base[2][pair] == value for pair, value in filtered[2].items())
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Binary S3 availability check modes
+
+Compares S3AvailabilityChecker modes against a local S3 stand-in (moto):
+1. sequential - the original one head_object per row loop
+2. head       - bounded concurrent head_object calls
+3. list       - list_objects_v2 over the Binary prefix + set membership
+
+--request-latency adds a simulated round trip to every S3 call (real S3 HEADs
+take ~20-50ms), which is what the concurrent and listing modes save.
+Also checks that an interrupted head run resumes from its progress file.
+
+Usage:
+    python benchmarks/benchmark_s3_availability.py --binaries 5000 --request-latency 0.02
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'athena_extraction_validation' / 'scripts'))
+
+
+def build_metadata(n_binaries, available_fraction=0.62):
+    """Binary IDs (some with periods, some missing) and the subset present in S3."""
+    ids = [f'e{i:06d}.Bin-{i * 7919 % 100000:05d}' if i % 3 else f'f{i:06d}Bin{i}' for i in range(n_binaries)]
+    ids[::50] = [None] * len(ids[::50])
+    present = [b for i, b in enumerate(ids) if b is not None and (i * 37 % 100) < available_fraction * 100]
+    return pd.DataFrame({'binary_id': ids, 'document_type': 'Progress Notes'}), present
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Binary S3 availability check modes')
+    parser.add_argument('--binaries', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--request-latency', type=float, default=0.01,
+                        help='Simulated seconds per S3 request')
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        print("❌ moto is required for the S3 stand-in: pip install moto")
+        return 1
+
+    from botocore.config import Config
+
+    # Importing the checker opens check_s3_availability.log in the working directory;
+    # import it from a temporary one so the log stays out of the tree
+    log_dir = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(log_dir.name)
+    try:
+        from check_binary_s3_availability import S3AvailabilityChecker
+    finally:
+        os.chdir(cwd)
+
+    metadata, present = build_metadata(args.binaries)
+
+    print(f"\n{'='*60}")
+    print(f"S3 AVAILABILITY BENCHMARK: {args.binaries:,} binaries, {len(present):,} in S3")
+    print(f"{'='*60}")
+
+    with mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1',
+                          config=Config(max_pool_connections=args.workers))
+
+        def add_latency(**kwargs):
+            time.sleep(args.request_latency)
+        s3.meta.events.register('before-send.s3', add_latency)
+
+        checker = S3AvailabilityChecker(s3_client=s3)
+        s3.create_bucket(Bucket=checker.s3_bucket)
+        for binary_id in present:
+            s3.put_object(Bucket=checker.s3_bucket,
+                          Key=checker.s3_prefix + binary_id.replace('.', '_'), Body=b'x')
+        # Objects for other patients under the same prefix
+        for i in range(args.binaries // 2):
+            s3.put_object(Bucket=checker.s3_bucket, Key=f'{checker.s3_prefix}other-{i}', Body=b'x')
+
+        results = {}
+        modes = ['head', 'list'] if args.skip_sequential else ['sequential', 'head', 'list']
+        for mode in modes:
+            checker.mode = mode
+            checker.max_workers = args.workers
+            start = time.perf_counter()
+            df = checker.check_all_s3_availability(metadata.copy())
+            elapsed = time.perf_counter() - start
+            results[mode] = df
+            print(f"  {mode:<11} {elapsed:8.2f}s  {args.binaries / elapsed:>10,.0f} ids/sec  "
+                  f"available={int((df['s3_available'] == 'Yes').sum())}")
+
+        # Resume: record half the keys, then check the rest
+        with tempfile.TemporaryDirectory() as tmp:
+            checker.mode = 'head'
+            checker.progress_file = os.path.join(tmp, 'progress.csv')
+            checker.check_all_s3_availability(metadata.iloc[: args.binaries // 2].copy())
+            start = time.perf_counter()
+            resumed = checker.check_all_s3_availability(metadata.copy())
+            print(f"  {'resumed':<11} {time.perf_counter() - start:8.2f}s  (half already in progress file)")
+            checker.progress_file = None
+
+    reference = results[modes[0]]
+    identical = all(
+        df[['s3_available', 's3_key', 's3_bucket']].astype(object).equals(
+            reference[['s3_available', 's3_key', 's3_bucket']].astype(object))
+        for df in list(results.values()) + [resumed]
+    )
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    logging.shutdown()
+    log_dir.cleanup()
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark: columnar staging store against per-component CSV reads
+
+Runs the staging readers of one orchestrator pass (Phase 1 availability and
+harvest, timeline builder, surgery classifier, survival endpoints, cross-source
+validator load, structured query engine) over --patients synthetic patients,
+each mode in a fresh process:
+1. CSV         - STAGING_STORE=0: every component reads and parses the CSVs
+2. store, cold - first run: each CSV is converted to Arrow once, then shared
+3. store, warm - rerun: Arrow files are memory-mapped, no CSV is read
+
+Reports wall-clock, peak RSS above the interpreter's baseline and the store
+counters, and checks that every mode produces the same component outputs
+(frames handed back to the caller are compared with their date columns parsed,
+since the store returns those as timestamps).
+
+Usage:
+    python benchmarks/benchmark_staging_store.py --patients 6 --scale 1.0
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).parent.parent
+BIRTH_DATE = '2010-03-14'
+DOCUMENT_TYPES = ['Progress Notes', 'OP Note - Complete', 'Pathology study', 'MR Brain W & W/O IV Contrast',
+                  'Telephone Encounter', 'Discharge Summary', 'Consult Note', 'Nursing Note']
+MEDICATIONS = ['carboplatin 175 mg/m2', 'vinblastine 6 mg/m2', 'ondansetron 4 mg', 'dexamethasone 2 mg',
+               'bevacizumab 10 mg/kg', 'acetaminophen 325 mg', 'selumetinib 25 mg', 'heparin flush']
+PROCEDURES = ['Craniectomy tumor resection', 'Ventriculoperitoneal shunt', 'MRI brain', 'Biopsy of brain lesion',
+              'Lumbar puncture', 'Central line placement']
+FINDINGS = ['Stable postoperative changes.', 'Interval increase in enhancing tumor, progression.',
+            'No residual enhancing tumor.', 'New enhancement at resection site, recurrent disease.']
+
+
+def timestamps(rng, n, start='2015-01-01', days=3000, date_only=False):
+    values = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 1440, n), unit='min')
+    return values.strftime('%Y-%m-%d') if date_only else values.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def write_patient(staging, patient_id, rng, scale):
+    """Athena staging CSVs for one patient, sized like a long-followed oncology patient."""
+    folder = staging / f'patient_{patient_id}'
+    folder.mkdir(parents=True)
+    size = lambda n: max(1, int(n * scale))
+    words = np.array('tumor cerebellar resection enhancement postoperative cavity stable patient '
+                     'ventricle hydrocephalus contrast signal mass lesion margin'.split())
+    text = lambda n, k: [' '.join(rng.choice(words, k)) for _ in range(n)]
+
+    n = size(300)
+    pd.DataFrame({'procedure_id': [f'Procedure/{i}' for i in range(n)],
+                  'proc_code_text': rng.choice(PROCEDURES, n),
+                  'procedure_date': timestamps(rng, n),
+                  'proc_encounter_reference': [f'Encounter/{i}' for i in range(n)],
+                  'is_surgical_keyword': rng.choice([True, False], n)}).to_csv(folder / 'procedures.csv', index=False)
+    n = size(4000)
+    pd.DataFrame({'dr_id': [f'DocumentReference/{i}' for i in range(n)],
+                  'dc_binary_id': [f'Binary/f{patient_id}.{i}' for i in range(n)],
+                  'dr_type_text': rng.choice(DOCUMENT_TYPES, n), 'dr_date': timestamps(rng, n),
+                  'dc_context_period_start': timestamps(rng, n),
+                  'dr_description': text(n, 6), 'content_type': 'text/html'}).to_csv(folder / 'binary_files.csv',
+                                                                                     index=False)
+    n = size(6000)
+    pd.DataFrame({'medication_name': rng.choice(MEDICATIONS, n), 'medication_start_date': timestamps(rng, n),
+                  'medication_end_date': timestamps(rng, n), 'med_date_given_start': timestamps(rng, n),
+                  'rx_norm_codes': rng.integers(1000, 99999, n).astype(str),
+                  'medication_status': rng.choice(['active', 'completed', 'stopped'], n)}).to_csv(
+        folder / 'medications.csv', index=False)
+    n = size(800)
+    pd.DataFrame({'imaging_procedure_id': [f'img{i}' for i in range(n)], 'imaging_date': timestamps(rng, n),
+                  'imaging_modality': rng.choice(['MRI', 'CT'], n), 'imaging_procedure': 'MR Brain',
+                  'result_information': [f"{t} IMPRESSION: {rng.choice(FINDINGS)}" for t in text(n, 200)]}).to_csv(
+        folder / 'imaging.csv', index=False)
+    n = size(3000)
+    pd.DataFrame({'encounter_date': timestamps(rng, n, date_only=True), 'enc_period_start': timestamps(rng, n),
+                  'enc_class_display': rng.choice(['Outpatient', 'Inpatient', 'Telehealth'], n)}).to_csv(
+        folder / 'encounters.csv', index=False)
+    n = size(400)
+    pd.DataFrame({'diagnosis_name': rng.choice(['Pilocytic astrocytoma', 'Hydrocephalus', 'Nausea'], n),
+                  'icd10_code': rng.choice(['D33.1', 'G91.9', 'R11.0'], n),
+                  'onset_date_time': timestamps(rng, n), 'recorded_date': timestamps(rng, n),
+                  'cond_recorded_date': timestamps(rng, n)}).to_csv(folder / 'diagnoses.csv', index=False)
+    n = size(10000)
+    pd.DataFrame({'measurement_type': rng.choice(['Weight', 'Height', 'BSA'], n),
+                  'measurement_date': timestamps(rng, n), 'value': rng.random(n) * 50}).to_csv(
+        folder / 'measurements.csv', index=False)
+    n = size(20000)
+    pd.DataFrame({'observation_name': rng.choice(['WBC', 'Hgb', 'Platelets', 'ANC'], n),
+                  'observation_date': timestamps(rng, n), 'value': rng.random(n) * 10}).to_csv(
+        folder / 'observations.csv', index=False)
+    pd.DataFrame({'pld_diagnosis_name': ['Pilocytic astrocytoma of cerebellum', 'Obstructive hydrocephalus'],
+                  'pld_status': ['Active', 'Resolved'], 'pld_icd10cm_code': ['D33.1', 'G91.1'],
+                  'pld_recorded_time': timestamps(rng, 2)}).to_csv(folder / 'problem_list.csv', index=False)
+    pd.DataFrame({'mt_lab_test_name': ['BRAF fusion panel'], 'mt_test_date': timestamps(rng, 1),
+                  'mt_specimen_collection_date': timestamps(rng, 1), 'mt_result': ['KIAA1549-BRAF']}).to_csv(
+        folder / 'molecular_tests_metadata.csv', index=False)
+    pd.DataFrame({'start_date': timestamps(rng, 2, date_only=True), 'end_date': timestamps(rng, 2, date_only=True),
+                  'total_dose_gy': [54.0, 54.0]}).to_csv(folder / 'radiation_treatment_courses.csv', index=False)
+
+
+def run_worker(staging, patients):
+    """One mode in this process: every component's staging reads for every patient."""
+    import logging
+    import resource
+    import types
+
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, str(ROOT / 'local_llm_extraction' / 'event_based_extraction'))
+    from enhanced_clinical_prioritization import EnhancedClinicalPrioritization
+    from phase1_structured_harvester import StructuredDataHarvester
+    from phase2_timeline_builder import ClinicalTimelineBuilder
+    from phase4_llm_with_query_capability import StructuredDataQueryEngine
+    from phase5_cross_source_validation import CrossSourceValidator
+    from staging_store import get_staging_store, type_date_columns
+    from tumor_surgery_classifier import TumorSurgeryClassifier
+    from unified_workflow_orchestrator import UnifiedWorkflowOrchestrator
+
+    def typed(df):
+        """Returned frames hold staging dates as text (CSV) or timestamps (store); compare them typed."""
+        df = df.copy()
+        type_date_columns(df)
+        return df
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    store = get_staging_store(staging)
+    orchestrator = types.SimpleNamespace(staging_base=staging, staging_store=store)
+    harvester = StructuredDataHarvester(staging)
+    timeline = ClinicalTimelineBuilder(staging, {})
+    classifier = TumorSurgeryClassifier(staging)
+    prioritizer = EnhancedClinicalPrioritization(staging)
+    validator = CrossSourceValidator(staging)
+    queries = StructuredDataQueryEngine(staging)
+
+    digest = hashlib.sha256()
+    start = time.perf_counter()
+    for patient_id in patients:
+        surgeries = queries.query_surgery_dates(patient_id)
+        outputs = [
+            UnifiedWorkflowOrchestrator._execute_phase1(orchestrator, patient_id),
+            harvester.harvest_for_patient(patient_id, BIRTH_DATE),
+            [(e.event_type, e.event_date, e.description, e.age_at_event_days)
+             for e in timeline.build_timeline(patient_id, BIRTH_DATE)],
+            {name: typed(df).to_csv() for name, df in classifier.process_patient(patient_id).items()},
+            prioritizer.extract_survival_endpoints(patient_id),
+            {name: (df.shape, list(df.columns)) for name, df in validator._load_structured_data(patient_id).items()},
+            surgeries, queries.query_diagnosis(patient_id), queries.query_medications(patient_id, 'carboplatin'),
+            queries.query_molecular_tests(patient_id), queries.query_problem_list(patient_id),
+            queries.query_imaging_on_date(patient_id, surgeries[0]['date'], 30),
+            queries.query_encounters_range(patient_id, '2016-01-01', '2016-12-31'),
+        ]
+        digest.update(json.dumps(outputs, default=str, sort_keys=True).encode())
+        store.evict(patient_id)  # as the orchestrator does after each patient
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'peak_mb': (peak - baseline) / 1024, 'digest': digest.hexdigest(),
+                      'stats': store.stats()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the columnar staging store')
+    parser.add_argument('--patients', type=int, default=6)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on rows per staging file')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(ROOT / 'src'))
+    if args.worker:
+        run_worker(Path(args.worker), [f'eStaging{i:03d}.x' for i in range(args.patients)])
+        return 0
+
+    print(f"\n{'='*60}")
+    print(f"STAGING STORE BENCHMARK: {args.patients} patients, scale {args.scale:g}")
+    print(f"{'='*60}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        staging = root / 'staging'
+        rng = np.random.default_rng(5)
+        for i in range(args.patients):
+            write_patient(staging, f'eStaging{i:03d}.x', rng, args.scale)
+        csv_mb = sum(path.stat().st_size for path in staging.rglob('*.csv')) / 1024 ** 2
+        print(f"  {csv_mb:.0f} MB of staging CSVs")
+
+        for label, env in (('CSV', {'STAGING_STORE': '0'}), ('store, cold', {}), ('store, warm', {})):
+            env = {**os.environ, 'STAGING_STORE_DIR': str(root / 'store'), **env}
+            out = subprocess.run([sys.executable, __file__, '--worker', str(staging), '--patients', str(args.patients)],
+                                 env=env, capture_output=True, text=True)
+            if out.returncode:
+                print(out.stderr)
+                return 1
+            run = json.loads(out.stdout.strip().splitlines()[-1])
+            s = run['stats']
+            print(f"  {label:<12} {run['seconds']:6.2f}s  peak RSS +{run['peak_mb']:6.0f} MB  "
+                  f"CSV reads={s['csv_reads']:>4}  conversions={s['conversions']:>3}  "
+                  f"Arrow loads={s['loads']:>3}  shared hits={s['hits']:>4}")
+            results[label] = run
+
+    warm, csv = results['store, warm'], results['CSV']
+    memory = csv['peak_mb'] / max(warm['peak_mb'], 1)
+    memory = f"{memory:.1f}x lower" if memory >= 1 else f"{1 / memory:.1f}x higher"
+    print(f"\n  Warm store vs per-component CSV reads: {csv['seconds'] / warm['seconds']:.1f}x faster, "
+          f"peak memory {memory}")
+    identical = len({run['digest'] for run in results.values()}) == 1
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
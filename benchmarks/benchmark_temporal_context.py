@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HINT column generation for one patient
+
+Computes HINT_SURGERY_NUMBER, HINT_DIAGNOSIS, HINT_WHO_GRADE and
+HINT_MEDICATIONS for every note of a synthetic long-follow-up patient:
+1. per-note - FHIRExtractor.assign_surgery_number / get_relevant_diagnosis /
+              extract_who_grade / get_active_medications for each note (the
+              previous BRIMCSVGenerator.generate_project_csv loop). This takes
+              about a second per note with hundreds of medication orders, so it
+              runs on --sample notes and the full-patient time is extrapolated
+2. index    - TemporalContextIndex(fhir_context).hint_columns(dates), one
+              vectorized pass over all notes (includes building the index)
+
+Note dates are parsed once up front for both (the generator parses them anyway).
+Checks that both produce the same values for every sampled note.
+
+Usage:
+    python benchmarks/benchmark_temporal_context.py --notes 5000 --medications 800 --sample 100
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+DIAGNOSES = [
+    'Pilocytic astrocytoma of cerebellum',
+    'Pilocytic astrocytoma, WHO grade I',
+    'Low-grade glioma, grade II',
+    'Recurrent pilocytic astrocytoma',
+    'Anaplastic astrocytoma WHO III',
+]
+MEDICATIONS = ['vinblastine', 'carboplatin', 'vincristine', 'bevacizumab', 'selumetinib',
+               'ondansetron', 'dexamethasone', 'levetiracetam', 'acetaminophen']
+
+
+def build_patient(n_notes, n_surgeries, n_diagnoses, n_medications, seed=11):
+    """FHIR context and note dates spread over ~12 years of follow-up."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    start = pd.Timestamp('2012-03-01')
+    span_seconds = 12 * 365 * 86400
+
+    def random_date():
+        return start + pd.Timedelta(seconds=rng.randint(0, span_seconds))
+
+    surgeries = [{'procedure_date': random_date().strftime('%Y-%m-%d'),
+                  'procedure_display': 'Craniotomy for tumor resection'} for _ in range(n_surgeries)]
+    diagnoses = [{'diagnosis_text': rng.choice(DIAGNOSES),
+                  'recorded_date': random_date().strftime('%Y-%m-%dT%H:%M:%S'),
+                  'onset_date': None} for _ in range(n_diagnoses)]
+    medications = [{'medication_name': rng.choice(MEDICATIONS),
+                    'authored_date': random_date().strftime('%Y-%m-%dT%H:%M:%S')} for _ in range(n_medications)]
+    note_dates = [random_date().strftime('%Y-%m-%dT%H:%M:%S') for _ in range(n_notes)]
+
+    context = {'surgeries': surgeries, 'diagnoses': diagnoses, 'medications': medications}
+    return context, note_dates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HINT column generation for one patient')
+    parser.add_argument('--notes', type=int, default=5000)
+    parser.add_argument('--surgeries', type=int, default=6)
+    parser.add_argument('--diagnoses', type=int, default=40)
+    parser.add_argument('--medications', type=int, default=800)
+    parser.add_argument('--sample', type=int, default=100, help='Notes to run the per-note path on')
+    args = parser.parse_args()
+
+    import pandas as pd
+    from fhir_extractor import FHIRExtractor
+    from temporal_context import TemporalContextIndex
+
+    context, note_dates = build_patient(args.notes, args.surgeries, args.diagnoses, args.medications)
+    document_dates = [pd.to_datetime(date) for date in note_dates]
+    sample = random.Random(3).sample(range(args.notes), min(args.sample, args.notes))
+
+    print(f"\n{'='*60}")
+    print(f"TEMPORAL CONTEXT BENCHMARK: {args.notes:,} notes, {args.surgeries} surgeries, "
+          f"{args.diagnoses} diagnoses, {args.medications:,} medications")
+    print(f"{'='*60}")
+
+    # 1. Per-note
+    extractor = FHIRExtractor(None)
+    start = time.perf_counter()
+    per_note = []
+    for i in sample:
+        document_date = document_dates[i]
+        diagnosis = extractor.get_relevant_diagnosis(document_date, context['diagnoses'])
+        active_meds = extractor.get_active_medications(document_date, context['medications'])
+        per_note.append((
+            extractor.assign_surgery_number(document_date, context['surgeries']),
+            diagnosis,
+            extractor.extract_who_grade(diagnosis),
+            '; '.join(active_meds) if active_meds else '',
+        ))
+    per_note_time = (time.perf_counter() - start) * args.notes / len(sample)
+    print(f"  {'per-note':<10} {per_note_time:8.2f}s  {args.notes / per_note_time:10,.1f} notes/s  "
+          f"(extrapolated from {len(sample):,} notes)")
+
+    # 2. Index
+    start = time.perf_counter()
+    hints = TemporalContextIndex(context).hint_columns(document_dates)
+    index_time = time.perf_counter() - start
+    print(f"  {'index':<10} {index_time:8.2f}s  {args.notes / index_time:10,.1f} notes/s")
+
+    print(f"\n  Speedup: {per_note_time / index_time:.0f}x")
+
+    vectorized = [tuple(row) for row in hints.itertuples(index=False)]
+    identical = [vectorized[i] for i in sample] == per_note
+    print(f"\n  Results identical across modes: {'✅' if identical else '❌'}")
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: HTML/RTF text normalization throughput
+
+Compares MB/s on a corpus of clinical-note-shaped documents:
+1. beautifulsoup - the previous BRIMCSVGenerator.sanitize_html (html.parser) and
+                   the three-regex extract_text_from_rtf
+2. normalize     - text_normalization.normalize_text, one document at a time
+3. pool          - text_normalization.normalize_many across a process pool
+
+The corpus is generated (progress notes with tables/styles/scripts/entities,
+multi-MB radiology-style reports, RTF notes with font tables and escapes), or
+read from --corpus-dir (*.html, *.htm, *.xml, *.rtf, *.txt). --write-corpus
+saves the generated corpus for reuse.
+
+Checks that the HTML output is identical to the BeautifulSoup implementation.
+
+Usage:
+    python benchmarks/benchmark_text_normalization.py --documents 300 --large 4
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+WORDS = ('patient tumor resection MRI enhancement cerebellar pilocytic astrocytoma stable '
+         'residual vinblastine carboplatin ataxia headache follow-up imaging ventricle '
+         'hydrocephalus shunt BRAF fusion KIAA1549 grade WHO pathology biopsy').split()
+
+
+def _sentence(rng, n=14):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def html_note(rng, paragraphs):
+    """Epic-style HTML note: head/style/script, sections, a results table, entities."""
+    body = []
+    for p in range(paragraphs):
+        if p % 10 == 0:
+            body.append(f'<h2>Section {p // 10}</h2>')
+        if p % 25 == 5:
+            rows = ''.join(f'<tr><td>Na&nbsp;{rng.randint(130, 145)}</td><td>mmol/L</td>'
+                           f'<td>{rng.choice(["H", "L", "N"])}</td></tr>' for _ in range(8))
+            body.append(f'<table class="labs"><tbody>{rows}</tbody></table>')
+        body.append(f'<p style="margin:0"><span class="s1">{_sentence(rng)}</span> '
+                    f'<b>{_sentence(rng, 5)}</b> &amp; {_sentence(rng, 8)}<br/>{_sentence(rng, 6)}</p>')
+    return ('<html><head><meta charset="utf-8"><title>Progress Note</title>'
+            '<style>.s1{font-family:Arial} p{margin:0}</style>'
+            '<script>var x = "<p>not text</p>";</script></head>'
+            f'<body><div class="note">{"".join(body)}</div><!-- end of note --></body></html>')
+
+
+def rtf_note(rng, paragraphs):
+    """RTF note: font/color tables, generator destination, hex and unicode escapes."""
+    body = []
+    for _ in range(paragraphs):
+        body.append(f"\\pard\\f0\\fs20 {_sentence(rng)} Temp 38\\'b0C \\u8211? {{\\b {_sentence(rng, 5)}}}\\par\n")
+    return ('{\\rtf1\\ansi\\ansicpg1252\\deff0{\\fonttbl{\\f0\\fswiss Arial;}{\\f1\\fmodern Courier New;}}'
+            '{\\colortbl;\\red0\\green0\\blue0;}{\\*\\generator Riched20 10.0;}\\viewkind4\\uc1\n'
+            + ''.join(body) + '}')
+
+
+def build_corpus(n_documents, n_large, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n_documents):
+        if i % 5 == 4:
+            corpus.append(('rtf', rtf_note(rng, rng.randint(10, 80))))
+        else:
+            corpus.append(('html', html_note(rng, rng.randint(20, 200))))
+    for _ in range(n_large):
+        # Multi-MB radiology/progress notes, the CPU hot spot of project CSV generation
+        corpus.append(('html', html_note(rng, 12000)))
+    return corpus
+
+
+def load_corpus(corpus_dir):
+    corpus = []
+    for path in sorted(Path(corpus_dir).iterdir()):
+        if path.suffix.lower() in ('.html', '.htm', '.xml', '.rtf', '.txt'):
+            content = path.read_text(encoding='utf-8', errors='ignore')
+            corpus.append(('rtf' if content.lstrip().startswith('{\\rtf') else 'html', content))
+    return corpus
+
+
+def bs4_sanitize(content):
+    """Previous BRIMCSVGenerator.sanitize_html."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(['script', 'style', 'meta', 'link', 'head']):
+        element.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    return ' '.join(text.split())
+
+
+def regex_rtf(content):
+    """Previous retrieve_binary_documents.extract_text_from_rtf."""
+    text = re.sub(r'\\[a-z]+\d*\s?', '', content)
+    text = re.sub(r'[{}]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HTML/RTF text normalization throughput')
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--large', type=int, default=2, help='Additional multi-MB HTML notes')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--corpus-dir', default=None, help='Benchmark these documents instead')
+    parser.add_argument('--write-corpus', default=None, help='Save the generated corpus here')
+    args = parser.parse_args()
+
+    from text_normalization import LXML_AVAILABLE, normalize_many, normalize_text
+
+    corpus = load_corpus(args.corpus_dir) if args.corpus_dir else build_corpus(args.documents, args.large)
+    if args.write_corpus:
+        out = Path(args.write_corpus)
+        out.mkdir(parents=True, exist_ok=True)
+        for i, (fmt, content) in enumerate(corpus):
+            (out / f'note_{i:05d}.{fmt}').write_text(content, encoding='utf-8')
+
+    contents = [content for _, content in corpus]
+    total_mb = sum(len(c.encode('utf-8')) for c in contents) / 1024 ** 2
+    largest_mb = max(len(c.encode('utf-8')) for c in contents) / 1024 ** 2
+
+    print(f"\n{'='*60}")
+    print(f"TEXT NORMALIZATION BENCHMARK: {len(corpus):,} documents, {total_mb:.1f} MB "
+          f"(largest {largest_mb:.1f} MB), lxml={'yes' if LXML_AVAILABLE else 'no'}")
+    print(f"{'='*60}")
+
+    def run(label, fn):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<14} {elapsed:8.2f}s  {total_mb / elapsed:8.1f} MB/s")
+        return result, elapsed
+
+    baseline, base_time = run('beautifulsoup', lambda: [
+        regex_rtf(c) if fmt == 'rtf' else bs4_sanitize(c) for fmt, c in corpus])
+    serial, serial_time = run('normalize', lambda: [normalize_text(c) for c in contents])
+    pooled, pool_time = run('pool', lambda: normalize_many(contents, workers=args.workers, min_parallel_bytes=0))
+
+    print(f"\n  Speedup: {base_time / serial_time:.1f}x single process, {base_time / pool_time:.1f}x pool")
+
+    html_identical = all(s == b for (fmt, _), s, b in zip(corpus, serial, baseline) if fmt == 'html')
+    pool_identical = pooled == serial
+    rtf_clean = all('\\' not in s and 'Arial' not in s for (fmt, _), s in zip(corpus, serial) if fmt == 'rtf')
+    print(f"\n  HTML identical to BeautifulSoup: {'✅' if html_identical else '❌'}")
+    print(f"  Pool identical to single process: {'✅' if pool_identical else '❌'}")
+    print(f"  RTF free of control words/font tables: {'✅' if rtf_clean else '❌'}")
+    return 0 if html_identical and pool_identical and rtf_clean else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+Mock Ollama / Anthropic HTTP server for benchmarks
+
+Serves ``POST /api/chat`` and ``GET /api/tags`` like a local Ollama server and
+``POST /v1/messages`` like the Anthropic Messages API, without model weights:
+- Deterministic answers: the first rule (regex) matching the prompt, else a
+  hash of the prompt's lines, so runs are comparable and do not depend on the
+  order of the prompt's sections
+- ``--parallel`` concurrent generations (like OLLAMA_NUM_PARALLEL); further
+  requests wait for a slot, as they do on a real server
+- Ollama prompt (KV) cache: each slot remembers its last prompt; a request
+  takes the free slot sharing the longest prefix and only the remaining tokens
+  are prefilled. Slots are cleared once the model has been idle longer than
+  the request's ``keep_alive`` (default 5m)
+- Anthropic prompt caching: prefixes ending at a ``cache_control`` block are
+  cached for 5 minutes (refreshed on use, at least ``min_cache_tokens``);
+  ``usage`` reports input / cache creation / cache read tokens
+- Latency = per-request overhead + uncached prompt tokens / prefill rate +
+  answer tokens / generation rate (an answer is at least ``answer_tokens``
+  tokens, ~4 characters each)
+- Streaming (``"stream": true``): Ollama NDJSON chunks or Anthropic server-sent
+  events, one token at a time; a client that disconnects stops the generation
+- Optional failure injection (HTTP 503) to exercise client retries
+- Counters: requests, failures, TCP connections, peak concurrent and peak
+  waiting requests, prompt tokens and cached (reused) prompt tokens, generated
+  tokens, streams cancelled by the client, time to first token and request
+  latency (p50/p95)
+
+``OllamaHTTPClient`` and ``AnthropicHTTPClient`` are stdlib stand-ins for
+``ollama.Client`` (``chat()``) and ``anthropic.Anthropic``
+(``messages.create()``) with the same arguments and response shapes, for
+machines without those packages. ``install_client_modules()`` registers them
+as the ``ollama`` and ``anthropic`` modules, so unmodified pipelines
+(``from ollama import Client``) talk to the mock server.
+
+Usage:
+    python benchmarks/mock_llm_server.py --port 11434 --parallel 4 --rules rules.json
+
+    # rules.json: [["extent of (tumor )?resection", "Gross total resection (GTR)"], ...]
+
+    server = MockOllamaServer(parallel=4, rules=[(r'metasta', 'No')]).start()
+    install_client_modules(server.url)
+    client = OllamaHTTPClient(server.url)
+    client.chat(model='gemma2:27b', messages=[{'role': 'user', 'content': '...'}])
+    AnthropicHTTPClient(server.url).messages.create(model='claude', max_tokens=64, messages=[...])
+    print(server.stats())
+    server.stop()
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+DEFAULT_KEEP_ALIVE_SECONDS = 300.0
+ANTHROPIC_CACHE_TTL_SECONDS = 300.0
+
+
+def shared_prefix_length(a: str, b: str) -> int:
+    """Length of the common prefix of two strings."""
+    limit = min(len(a), len(b))
+    if a[:limit] == b[:limit]:
+        return limit
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def parse_duration(value, default: float = DEFAULT_KEEP_ALIVE_SECONDS) -> float:
+    """Seconds for an Ollama duration ('30m', '1h', '90s', 300); negative means forever."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float('inf') if value < 0 else float(value)
+    match = re.fullmatch(r'\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*', str(value))
+    if not match:
+        return default
+    seconds = float(match.group(1)) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, None: 1}[match.group(2)]
+    return float('inf') if seconds < 0 else seconds
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class MockOllamaServer:
+    """Threaded mock Ollama (and Anthropic Messages API) server on localhost."""
+
+    def __init__(self, port: int = 0, parallel: int = 4, request_overhead: float = 0.01,
+                 prefill_tokens_per_second: float = 20000.0, tokens_per_second: float = 100.0,
+                 answer_tokens: int = 8, failure_rate: float = 0.0, min_cache_tokens: int = 1024,
+                 rules=None, seed: int = 0):
+        self.parallel = parallel
+        self.request_overhead = request_overhead
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.failure_rate = failure_rate
+        self.min_cache_tokens = min_cache_tokens
+        self.rules = [(re.compile(pattern, re.IGNORECASE), answer) for pattern, answer in (rules or [])]
+        self._random = random.Random(seed)
+
+        self.requests = 0
+        self.failures = 0
+        self.active = 0
+        self.waiting = 0
+        self.peak_active = 0
+        self.peak_waiting = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.cache_write_tokens = 0
+        self.completion_tokens = 0
+        self.connections = 0
+        self.cancelled = 0
+        self.ttft = []
+        self.latency = []
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._free_slots = list(range(parallel))
+        self._slot_prompts = [''] * parallel
+        self._idle_since = time.monotonic()
+        self._anthropic_cache = {}  # prefix hash -> expiry (monotonic)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self._thread = None
+
+    def start(self) -> 'MockOllamaServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = self.failures = self.peak_active = self.peak_waiting = 0
+            self.prompt_tokens = self.cached_prompt_tokens = self.cache_write_tokens = 0
+            self.completion_tokens = self.connections = self.cancelled = 0
+            self.ttft = []
+            self.latency = []
+
+    def clear_caches(self):
+        """Forget slot prompts and Anthropic cache entries (a cold server)."""
+        with self._lock:
+            self._slot_prompts = [''] * self.parallel
+            self._anthropic_cache = {}
+
+    def stats(self):
+        return {'requests': self.requests, 'failures': self.failures,
+                'peak_active': self.peak_active, 'peak_waiting': self.peak_waiting,
+                'prompt_tokens': self.prompt_tokens, 'cached_prompt_tokens': self.cached_prompt_tokens,
+                'cache_write_tokens': self.cache_write_tokens, 'completion_tokens': self.completion_tokens,
+                'connections': self.connections, 'cancelled': self.cancelled,
+                'prefix_reuse': self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                'ttft_p50': _percentile(self.ttft, 0.50), 'ttft_p95': _percentile(self.ttft, 0.95),
+                'latency_p50': _percentile(self.latency, 0.50), 'latency_p95': _percentile(self.latency, 0.95)}
+
+    def answer(self, prompt: str) -> str:
+        """Deterministic answer for a prompt: first matching rule, else a hash of its (sorted) lines."""
+        for pattern, answer in self.rules:
+            if pattern.search(prompt):
+                return answer
+        lines = '\n'.join(sorted(prompt.split('\n')))
+        return 'value-' + hashlib.sha1(lines.encode('utf-8')).hexdigest()[:10]
+
+    def _acquire_slot(self, prompt: str, keep_alive: float):
+        """Wait for a free slot; the one sharing the longest prefix with prompt. Returns (slot, cached chars)."""
+        with self._slot_free:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            while not self._free_slots:
+                self._slot_free.wait()
+            self.waiting -= 1
+            if not self.active and time.monotonic() - self._idle_since > keep_alive:
+                self._slot_prompts = [''] * self.parallel  # model was unloaded
+            slot = max(self._free_slots, key=lambda s: shared_prefix_length(self._slot_prompts[s], prompt))
+            self._free_slots.remove(slot)
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return slot, shared_prefix_length(self._slot_prompts[slot], prompt)
+
+    def _release_slot(self, slot: int, prompt: str = None):
+        with self._slot_free:
+            if prompt is not None:
+                self._slot_prompts[slot] = prompt
+            self._free_slots.append(slot)
+            self.active -= 1
+            if not self.active:
+                self._idle_since = time.monotonic()
+            self._slot_free.notify()
+
+    @staticmethod
+    def answer_pieces(answer: str):
+        """The answer as generated tokens (~4 characters each)."""
+        return [answer[i:i + CHARS_PER_TOKEN] for i in range(0, len(answer), CHARS_PER_TOKEN)] or ['']
+
+    def _generate(self, received: float, prompt_tokens: int, cached_tokens: int, write_tokens: int = 0,
+                  completion_tokens: int = 0) -> float:
+        """Sleep for prefill and generation; record counters. Returns the request duration."""
+        completion_tokens = max(self.answer_tokens, completion_tokens)
+        time.sleep(self.request_overhead + (prompt_tokens - cached_tokens) / self.prefill_tokens_per_second)
+        first_token = time.monotonic()
+        time.sleep(completion_tokens / self.tokens_per_second)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_tokens
+            self.cache_write_tokens += write_tokens
+            self.completion_tokens += completion_tokens
+            self.ttft.append(first_token - received)
+            self.latency.append(time.monotonic() - received)
+        return time.monotonic() - received
+
+    def _stream(self, received: float, prompt_tokens: int, cached_tokens: int, pieces, piece_event, end_event,
+                release, write_tokens: int = 0):
+        """
+        Generator of encoded stream events, one token at a time.
+
+        Closing it (the client disconnected) stops generation; release() frees the slot.
+        """
+        generated = 0
+        first_token = None
+        try:
+            time.sleep(self.request_overhead + (prompt_tokens - cached_tokens) / self.prefill_tokens_per_second)
+            first_token = time.monotonic()
+            for piece in pieces:
+                time.sleep(1 / self.tokens_per_second)
+                generated += 1
+                yield piece_event(piece)
+            # Tokens the model spends without adding text (end of sequence, formatting)
+            padding = max(0, self.answer_tokens - len(pieces))
+            time.sleep(padding / self.tokens_per_second)
+            generated += padding
+            yield end_event(generated)
+        except GeneratorExit:
+            with self._lock:
+                self.cancelled += 1
+            raise
+        finally:
+            release()
+            with self._lock:
+                self.prompt_tokens += prompt_tokens
+                self.cached_prompt_tokens += cached_tokens
+                self.cache_write_tokens += write_tokens
+                self.completion_tokens += generated
+                if first_token is not None:
+                    self.ttft.append(first_token - received)
+                self.latency.append(time.monotonic() - received)
+
+    def _inject_failure(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if fail:
+            time.sleep(self.request_overhead)
+        return fail
+
+    def chat(self, body: dict):
+        """(status, response body) for an /api/chat request."""
+        received = time.monotonic()
+        prompt = '\n'.join(str(m.get('content', '')) for m in body.get('messages', []))
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+
+        slot, cached_chars = self._acquire_slot(prompt, parse_duration(body.get('keep_alive')))
+        if self._inject_failure():
+            self._release_slot(slot)
+            return 503, {'error': 'server busy (injected failure)'}
+        cached_tokens = min(cached_chars // CHARS_PER_TOKEN, prompt_tokens - 1)
+        answer = self.answer(prompt)
+        pieces = self.answer_pieces(answer)
+        created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+        if body.get('stream'):
+            def piece_event(piece):
+                return json.dumps({'model': body.get('model'), 'created_at': created_at,
+                                   'message': {'role': 'assistant', 'content': piece}, 'done': False}) + '\n'
+
+            def end_event(generated):
+                return json.dumps({'model': body.get('model'), 'created_at': created_at,
+                                   'message': {'role': 'assistant', 'content': ''}, 'done': True,
+                                   'done_reason': 'stop', 'total_duration': int((time.monotonic() - received) * 1e9),
+                                   'prompt_eval_count': prompt_tokens - cached_tokens,
+                                   'eval_count': generated}) + '\n'
+
+            return 200, self._stream(received, prompt_tokens, cached_tokens, pieces, piece_event, end_event,
+                                     lambda: self._release_slot(slot, prompt))
+
+        try:
+            duration = self._generate(received, prompt_tokens, cached_tokens, completion_tokens=len(pieces))
+        finally:
+            self._release_slot(slot, prompt)
+
+        return 200, {
+            'model': body.get('model'),
+            'created_at': created_at,
+            'message': {'role': 'assistant', 'content': answer},
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int(duration * 1e9),
+            'prompt_eval_count': prompt_tokens - cached_tokens,
+            'eval_count': max(self.answer_tokens, len(pieces)),
+        }
+
+    def messages(self, body: dict):
+        """(status, response body) for an Anthropic /v1/messages request."""
+        received = time.monotonic()
+        system = body.get('system') or []
+        blocks = [{'type': 'text', 'text': system}] if isinstance(system, str) else list(system)
+        for message in body.get('messages', []):
+            content = message.get('content', '')
+            blocks.extend([{'type': 'text', 'text': content}] if isinstance(content, str) else content)
+        texts = [str(block.get('text', '')) for block in blocks]
+        prompt = ''.join(texts)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+
+        # Cache prefixes end at cache_control blocks; the longest cached one is read
+        breakpoints = []
+        for i, block in enumerate(blocks):
+            if block.get('cache_control'):
+                prefix = json.dumps([body.get('model'), texts[:i + 1]])
+                tokens = len(''.join(texts[:i + 1])) // CHARS_PER_TOKEN
+                if tokens >= self.min_cache_tokens:
+                    breakpoints.append((hashlib.sha1(prefix.encode('utf-8')).hexdigest(), tokens))
+        slot, _ = self._acquire_slot('', float('inf'))
+        if self._inject_failure():
+            self._release_slot(slot)
+            return 529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}}
+        now = time.monotonic()
+        read_tokens = write_tokens = 0
+        with self._lock:
+            for key, tokens in breakpoints:
+                if self._anthropic_cache.get(key, 0) > now:
+                    read_tokens = tokens
+            write_tokens = max([tokens - read_tokens for key, tokens in breakpoints
+                                if self._anthropic_cache.get(key, 0) <= now], default=0)
+        answer = self.answer(prompt)
+        pieces = self.answer_pieces(answer)
+        message_id = f'msg_mock_{hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:12]}'
+        usage = {
+            'input_tokens': prompt_tokens - read_tokens - write_tokens,
+            'cache_creation_input_tokens': write_tokens,
+            'cache_read_input_tokens': read_tokens,
+        }
+
+        def release():
+            self._release_slot(slot)
+            # Entries become readable once the request that wrote them has been processed
+            with self._lock:
+                for key, _ in breakpoints:
+                    self._anthropic_cache[key] = time.monotonic() + ANTHROPIC_CACHE_TTL_SECONDS
+
+        if body.get('stream'):
+            def sse(event, data):
+                return f'event: {event}\ndata: {json.dumps({"type": event, **data})}\n\n'
+
+            start = sse('message_start', {'message': {'id': message_id, 'type': 'message', 'role': 'assistant',
+                                                      'model': body.get('model'), 'content': [],
+                                                      'usage': {**usage, 'output_tokens': 1}}})
+            start += sse('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+            first = [True]
+
+            def piece_event(piece):
+                event = sse('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': piece}})
+                if first[0]:
+                    first[0] = False
+                    event = start + event
+                return event
+
+            def end_event(generated):
+                return (sse('content_block_stop', {'index': 0})
+                        + sse('message_delta', {'delta': {'stop_reason': 'end_turn'},
+                                                'usage': {'output_tokens': generated}})
+                        + sse('message_stop', {}))
+
+            return 200, self._stream(received, prompt_tokens, read_tokens, pieces, piece_event, end_event,
+                                     release, write_tokens)
+
+        try:
+            self._generate(received, prompt_tokens, read_tokens, write_tokens, completion_tokens=len(pieces))
+        finally:
+            release()
+
+        return 200, {
+            'id': message_id,
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model'),
+            'content': [{'type': 'text', 'text': answer}],
+            'stop_reason': 'end_turn',
+            'usage': {**usage, 'output_tokens': max(self.answer_tokens, len(pieces))},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _send(self, status, body):
+                if isinstance(body, types.GeneratorType):
+                    self._send_stream(status, body)
+                    return
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, status, events):
+                """Chunked response, one chunk per event; stops generating once the client disconnects."""
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/event-stream' if self.path == '/v1/messages'
+                                 else 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for event in events:
+                        data = event.encode('utf-8')
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b'0\r\n\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    events.close()
+                    self.close_connection = True
+
+            def do_GET(self):
+                if self.path == '/api/tags':
+                    self._send(200, {'models': [{'name': 'mock:latest'}]})
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path == '/api/chat':
+                    self._send(*server.chat(body))
+                elif self.path == '/v1/messages':
+                    self._send(*server.messages(body))
+                else:
+                    self._send(404, {'error': 'not found'})
+
+        return Handler
+
+
+def _request(url: str, body, timeout: float, service: str):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f'{service} HTTP {e.code}: {e.read().decode(errors="ignore")}') from e
+
+
+class OllamaHTTPClient:
+    """Minimal ``ollama.Client`` stand-in over urllib (chat() and list())."""
+
+    def __init__(self, host: str = 'http://127.0.0.1:11434', timeout: float = 600.0):
+        self.host = host.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        return _request(f'{self.host}{path}', body, self.timeout, 'Ollama')
+
+    def chat(self, model, messages, options=None, format=None, stream=False, **kwargs):
+        body = {'model': model, 'messages': messages, 'stream': False}
+        if options is not None:
+            body['options'] = options
+        if format is not None:
+            body['format'] = format
+        body.update(kwargs)
+        return self._request('/api/chat', body)
+
+    def list(self):
+        return self._request('/api/tags')
+
+
+def _attributes(value):
+    """JSON response as nested attribute objects (like the anthropic SDK's models)."""
+    if isinstance(value, dict):
+        return types.SimpleNamespace(**{key: _attributes(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_attributes(item) for item in value]
+    return value
+
+
+class _AnthropicMessages:
+    def __init__(self, client: 'AnthropicHTTPClient'):
+        self._client = client
+
+    def create(self, **kwargs):
+        kwargs.pop('stream', None)
+        return _attributes(_request(f'{self._client.base_url}/v1/messages', kwargs, self._client.timeout,
+                                    'Anthropic'))
+
+
+class AnthropicHTTPClient:
+    """Minimal ``anthropic.Anthropic`` stand-in over urllib (messages.create())."""
+
+    def __init__(self, base_url: str = 'http://127.0.0.1:11434', api_key: str = None, timeout: float = 600.0):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.messages = _AnthropicMessages(self)
+
+
+def install_client_modules(url: str):
+    """
+    Register ``ollama`` and ``anthropic`` modules whose clients call the mock server at url.
+
+    Covers the ways the pipelines use them: ``ollama.chat()``,
+    ``ollama.Client(host=...)`` (the host is ignored) and
+    ``anthropic.Anthropic(api_key=...)``. ``OLLAMA_HOST`` and
+    ``ANTHROPIC_BASE_URL`` are pointed at the server too, for ``llm_client``.
+    """
+    os.environ['OLLAMA_HOST'] = url
+    os.environ['ANTHROPIC_BASE_URL'] = url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'mock')
+    if 'llm_client' in sys.modules:
+        sys.modules['llm_client'].reset_llm_clients()
+    default = OllamaHTTPClient(url)
+    sys.modules['ollama'] = types.SimpleNamespace(
+        Client=lambda host=None, **kwargs: OllamaHTTPClient(url), chat=default.chat, list=default.list)
+    sys.modules['anthropic'] = types.SimpleNamespace(
+        Anthropic=lambda api_key=None, **kwargs: AnthropicHTTPClient(url, api_key=api_key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Ollama / Anthropic HTTP server')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--parallel', type=int, default=4)
+    parser.add_argument('--tokens-per-second', type=float, default=40.0)
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=20000.0)
+    parser.add_argument('--request-overhead', type=float, default=0.01, help='Seconds per request')
+    parser.add_argument('--answer-tokens', type=int, default=8)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--rules', help='JSON file: [[regex, answer], ...] checked in order against the prompt')
+    args = parser.parse_args()
+
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)
+    server = MockOllamaServer(port=args.port, parallel=args.parallel, tokens_per_second=args.tokens_per_second,
+                              prefill_tokens_per_second=args.prefill_tokens_per_second,
+                              request_overhead=args.request_overhead, answer_tokens=args.answer_tokens,
+                              failure_rate=args.failure_rate, rules=rules)
+    print(f"Mock Ollama / Anthropic server on {server.url} (parallel={args.parallel})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
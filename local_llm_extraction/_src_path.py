@@ -0,0 +1,12 @@
+"""
+Puts the repository's shared modules (src/) on sys.path.
+
+Scripts in this directory import it for that side effect before importing from src/.
+"""
+
+import sys
+from pathlib import Path
+
+SRC_DIR = str(Path(__file__).resolve().parents[1] / 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
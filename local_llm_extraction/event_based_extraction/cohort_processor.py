@@ -16,7 +16,12 @@ import argparse
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import traceback
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from cohort_catalog import CohortCatalog
+
+from comprehensive_chemotherapy_identifier import ComprehensiveChemotherapyIdentifier
 from enhanced_clinical_prioritization import process_patient_enhanced
+from tumor_surgery_classifier import TumorSurgeryClassifier
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -50,6 +55,9 @@ class CohortProcessor:
         (self.output_base / "patient_results").mkdir(exist_ok=True)
         (self.output_base / "cohort_summaries").mkdir(exist_ok=True)
 
+        # SQL catalog over every patient's staging CSVs (opened on first cohort query)
+        self.catalog = None
+
     def _get_default_config(self) -> Dict:
         """Get default configuration for cohort processing"""
         return {
@@ -95,6 +103,37 @@ class CohortProcessor:
         logger.info(f"Discovered {len(patients)} patients in {self.staging_base}")
         return sorted(patients)
 
+    def cohort_catalog(self) -> CohortCatalog:
+        """
+        Cohort-wide SQL catalog of the staging CSVs, refreshed on first use
+
+        Returns:
+            CohortCatalog with one table per staging source and a patient_id column
+        """
+        if self.catalog is None:
+            self.catalog = CohortCatalog(self.staging_base)
+            self.catalog.refresh()
+        return self.catalog
+
+    def query_cohort(self, sql: str) -> pd.DataFrame:
+        """Run SQL across every patient's staging tables"""
+        return self.cohort_catalog().query(sql)
+
+    def surgeries_with_postop_mri(self, min_surgeries: int = 2, hours: float = 72) -> pd.DataFrame:
+        """
+        Patients with at least min_surgeries tumor surgeries and a post-op MRI within hours of one,
+        using the tumor surgery classifier's vocabulary
+        """
+        indicators = TumorSurgeryClassifier.TUMOR_SURGERY_INDICATORS
+        surgery_terms = indicators['resection_terms'] + indicators['biopsy_terms'] + indicators['specific_procedures']
+        return self.cohort_catalog().tumor_surgeries_with_postop_mri(
+            surgery_terms, TumorSurgeryClassifier.NON_TUMOR_PROCEDURES, min_surgeries, hours)
+
+    def chemotherapy_exposure_by_agent(self) -> pd.DataFrame:
+        """Patients and medication records per chemotherapy agent (name patterns of the chemo identifier)"""
+        patterns = ComprehensiveChemotherapyIdentifier().CHEMO_PATTERNS
+        return self.cohort_catalog().exposure_by_agent(patterns)
+
     def process_single_patient(self, patient_id: str) -> Dict:
         """
         Process a single patient with full framework
@@ -228,6 +267,10 @@ class CohortProcessor:
     def _create_cohort_summary(self, results: List[Dict]) -> pd.DataFrame:
         """
         Create summary DataFrame from all patient results
+
+        Not a cohort_catalog() query: the columns come from process_patient_enhanced
+        (imaging priorities, survival endpoints, chemotherapy changes), which the
+        staging tables do not hold.
         """
         summary_rows = []
 
@@ -317,12 +360,30 @@ def main():
                        help='Enable parallel processing')
     parser.add_argument('--test', action='store_true',
                        help='Test mode - process first 3 patients only')
+    parser.add_argument('--sql', default=None,
+                       help='Run a cohort SQL query over the staging tables and exit')
+    parser.add_argument('--report', choices=['surgery-postop-mri', 'chemo-by-agent'], default=None,
+                       help='Print a cohort report from the staging tables and exit')
+    parser.add_argument('--hours', type=float, default=72,
+                       help='Post-op MRI window for --report surgery-postop-mri')
 
     args = parser.parse_args()
 
     # Initialize processor
     processor = CohortProcessor(args.staging_path, args.output_path, args.config)
 
+    # Cohort questions answered from the staging catalog
+    if args.sql or args.report:
+        if args.sql:
+            result = processor.query_cohort(args.sql)
+        elif args.report == 'surgery-postop-mri':
+            result = processor.surgeries_with_postop_mri(hours=args.hours)
+        else:
+            result = processor.chemotherapy_exposure_by_agent()
+        print(result.to_string(index=False))
+        result.to_csv(processor.output_base / "cohort_summaries" / f"cohort_query_{args.report or 'sql'}.csv", index=False)
+        return
+
     # Get patient list
     if args.test:
         all_patients = processor.discover_patients()
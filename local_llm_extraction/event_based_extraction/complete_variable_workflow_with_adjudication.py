@@ -22,8 +22,10 @@ import numpy as np
 # Add parent directory to path
 import sys
 sys.path.append(str(Path(__file__).parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
 
 from phase4_llm_with_query_capability import StructuredDataQueryEngine
+from document_relevance_index import DocumentRelevanceIndex, relevance_spec
 
 logging.basicConfig(
     level=logging.INFO,
@@ -114,6 +116,8 @@ class CompleteVariableWorkflow:
         self.extraction_results = {}
         self.adjudication_results = {}
         self.document_cache = {}
+        self.relevance_index = None  # DocumentRelevanceIndex over the current binary_metadata
+        self.skipped_documents = {}  # var_name -> [{'document_id', 'reason'}]
 
     def process_patient(self, patient_id: str) -> Dict:
         """
@@ -304,6 +308,7 @@ class CompleteVariableWorkflow:
             )
 
             result['documents_selected'] = len(documents)
+            result['documents_skipped'] = self.skipped_documents.get(var_name, [])
             result['extractions'] = []
 
             for doc in documents:
@@ -368,6 +373,21 @@ class CompleteVariableWorkflow:
         if 'dr_date' in filtered.columns:
             filtered = filtered.sort_values('dr_date', ascending=False)
 
+        # Keep the 10 most relevant to the variable (most recent first on equal scores)
+        spec = relevance_spec(var_name)
+        if spec is not None:
+            if self.relevance_index is None or self.relevance_index.documents is not binary_metadata:
+                self.relevance_index = DocumentRelevanceIndex(binary_metadata)
+            spec.update(top_k=10, min_score=None)
+            selected, skipped = self.relevance_index.select(
+                spec, candidates=binary_metadata.index.get_indexer(filtered.index)
+            )
+            self.skipped_documents[var_name] = [
+                {'document_id': binary_metadata.iloc[position].get('dc_binary_id', 'unknown'), 'reason': reason}
+                for position, reason in skipped.items()
+            ]
+            filtered = binary_metadata.iloc[selected]
+
         # Convert to list of dicts for processing
         documents = []
         for idx, row in filtered.head(10).iterrows():  # Max 10 documents
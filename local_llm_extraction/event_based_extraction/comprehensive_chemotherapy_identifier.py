@@ -3,6 +3,9 @@ Comprehensive Chemotherapy Identification with Treatment Periods
 =================================================================
 Full 5-Strategy Approach with Standardized Date Processing
 Based on RADIANT unified drug reference system
+
+The reference files are compiled once into a cached index (src/chemo_reference_index.py);
+every strategy is a single vectorized pass over the medications frame.
 """
 
 import pandas as pd
@@ -13,6 +16,12 @@ from typing import Dict, List, Set, Tuple, Any, Optional
 from datetime import datetime, timedelta
 from pathlib import Path
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from text_matching import AliasAutomaton
+from chemo_reference_index import (
+    ChemoReferenceIndex, column_values, explode_rxnorm_codes, group_codes, load_reference_index
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,38 +37,41 @@ class ComprehensiveChemotherapyIdentifier:
     Plus: Treatment period extraction and standardization
     """
 
+    REASON_CODE_INDICATORS = [
+        'antineoplastic chemotherapy',
+        'chemotherapy encounter',
+        'encounter for antineoplastic',
+        'chemotherapy administration',
+        'malignant neoplasm'
+    ]
+
     def __init__(self, reference_dir: Optional[Path] = None):
         """Initialize with RADIANT reference files if available"""
         self.reference_dir = reference_dir or Path('/Users/resnick/Downloads/RADIANT_Portal/RADIANT_PCA/unified_chemo_index')
-        self.drugs_df = None
-        self.drug_alias_df = None
-        self.rxnorm_map_df = None
+        self.reference = ChemoReferenceIndex()
 
         # Try to load reference files
         self._load_reference_data()
 
         # Comprehensive chemotherapy patterns (for name matching)
         self.CHEMO_PATTERNS = self._build_chemo_patterns()
+        self.chemo_automaton = AliasAutomaton(self.CHEMO_PATTERNS)
+        self.reason_automaton = AliasAutomaton({indicator: [indicator] for indicator in self.REASON_CODE_INDICATORS})
 
     def _load_reference_data(self):
-        """Load RADIANT unified drug reference files"""
+        """Load RADIANT unified drug reference files (compiled index, cached across runs)"""
         try:
             if self.reference_dir.exists():
-                drugs_file = self.reference_dir / 'drugs.csv'
-                alias_file = self.reference_dir / 'drug_alias.csv'
-                rxnorm_file = self.reference_dir / 'rxnorm_code_map.csv'
-
-                if drugs_file.exists():
-                    self.drugs_df = pd.read_csv(drugs_file)
-                    logger.info(f"Loaded {len(self.drugs_df)} drugs from reference")
-
-                if alias_file.exists():
-                    self.drug_alias_df = pd.read_csv(alias_file)
-                    logger.info(f"Loaded {len(self.drug_alias_df)} drug aliases")
-
-                if rxnorm_file.exists():
-                    self.rxnorm_map_df = pd.read_csv(rxnorm_file)
-                    logger.info(f"Loaded {len(self.rxnorm_map_df)} RxNorm mappings")
+                files = [self.reference_dir / name for name in ('drugs.csv', 'drug_alias.csv', 'rxnorm_code_map.csv')]
+                self.reference = load_reference_index(*[path if path.exists() else None for path in files])
+
+                counts = self.reference.counts
+                if self.reference.has_drugs:
+                    logger.info(f"Loaded {counts['drugs']} drugs from reference")
+                if self.reference.has_aliases:
+                    logger.info(f"Loaded {counts['aliases']} drug aliases")
+                if self.reference.has_rxnorm_map:
+                    logger.info(f"Loaded {counts['rxnorm_mappings']} RxNorm mappings")
         except Exception as e:
             logger.warning(f"Could not load reference files: {e}")
 
@@ -135,12 +147,12 @@ class ComprehensiveChemotherapyIdentifier:
         all_matches = []
 
         # Strategy 1: RxNorm ingredient matching
-        if 'rx_norm_codes' in medications_df.columns and self.drugs_df is not None:
+        if 'rx_norm_codes' in medications_df.columns and self.reference.has_drugs:
             rxnorm_matches = self._match_by_rxnorm_ingredient(medications_df)
             all_matches.append(rxnorm_matches)
 
         # Strategy 2: Product-to-ingredient mapping
-        if 'rx_norm_codes' in medications_df.columns and self.rxnorm_map_df is not None:
+        if 'rx_norm_codes' in medications_df.columns and self.reference.has_rxnorm_map:
             product_matches = self._match_by_product_mapping(medications_df)
             all_matches.append(product_matches)
 
@@ -168,34 +180,24 @@ class ComprehensiveChemotherapyIdentifier:
         """Strategy 1: Direct RxNorm ingredient matching"""
         logger.info("Strategy 1: RxNorm ingredient matching...")
 
-        # Get valid chemotherapy RxNorm IN codes
-        chemo_drugs = self.drugs_df[
-            (self.drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
-            (self.drugs_df['is_supportive_care'] == False)
-        ]
-        valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int).astype(str))
+        # Every row's codes in one frame, joined against the chemotherapy ingredients
+        hits = self.reference.ingredient_matches(explode_rxnorm_codes(medications_df['rx_norm_codes']))
+        matched_codes = group_codes(hits, 'code')
+        drug_names = group_codes(hits[hits['named']], 'drug_name')
 
-        matches = []
-        for idx, row in medications_df.iterrows():
-            rx_codes = self.parse_rxnorm_codes(row.get('rx_norm_codes', ''))
-            matched_codes = [code for code in rx_codes if code in valid_rxnorm_in]
-
-            if matched_codes:
-                # Look up drug names for matched codes
-                drug_names = []
-                for code in matched_codes:
-                    drug = chemo_drugs[chemo_drugs['rxnorm_in'] == int(code)]
-                    if not drug.empty:
-                        drug_names.append(drug.iloc[0]['preferred_name'])
+        index = medications_df.index.tolist()
+        names = column_values(medications_df, 'medication_name', '')
 
-                matches.append({
-                    'index': idx,
-                    'strategy': 'rxnorm_ingredient',
-                    'matched_codes': matched_codes,
-                    'drug_names': drug_names,
-                    'medication_name': row.get('medication_name', ''),
-                    'confidence': 'high'
-                })
+        matches = []
+        for position, codes in matched_codes.items():
+            matches.append({
+                'index': index[position],
+                'strategy': 'rxnorm_ingredient',
+                'matched_codes': codes,
+                'drug_names': drug_names.get(position, []),
+                'medication_name': names[position],
+                'confidence': 'high'
+            })
 
         logger.info(f"  Found {len(matches)} medications by RxNorm ingredient")
         return matches
@@ -204,35 +206,23 @@ class ComprehensiveChemotherapyIdentifier:
         """Strategy 2: Product code to ingredient mapping"""
         logger.info("Strategy 2: Product-to-ingredient mapping...")
 
-        # Get chemotherapy ingredient codes
-        chemo_drugs = self.drugs_df[
-            (self.drugs_df['approval_status'].isin(['FDA_approved', 'investigational'])) &
-            (self.drugs_df['is_supportive_care'] == False)
-        ]
-        valid_rxnorm_in = set(chemo_drugs['rxnorm_in'].dropna().astype(int).astype(str))
-
-        # Build product-to-ingredient mapping
-        product_to_ingredient = {}
-        for _, row in self.rxnorm_map_df.iterrows():
-            if pd.notna(row['ingredient_rxcui']) and pd.notna(row['code_cui']):
-                ingredient_cui = str(int(row['ingredient_rxcui']))
-                if ingredient_cui in valid_rxnorm_in:
-                    product_to_ingredient[str(int(row['code_cui']))] = ingredient_cui
+        hits = self.reference.product_matches(explode_rxnorm_codes(medications_df['rx_norm_codes']))
+        matched_products = group_codes(hits, 'code')
+        mapped_ingredients = group_codes(hits, 'ingredient')
 
-        matches = []
-        for idx, row in medications_df.iterrows():
-            rx_codes = self.parse_rxnorm_codes(row.get('rx_norm_codes', ''))
-            matched_products = [code for code in rx_codes if code in product_to_ingredient]
+        index = medications_df.index.tolist()
+        names = column_values(medications_df, 'medication_name', '')
 
-            if matched_products:
-                matches.append({
-                    'index': idx,
-                    'strategy': 'product_mapping',
-                    'matched_codes': matched_products,
-                    'mapped_ingredients': [product_to_ingredient[code] for code in matched_products],
-                    'medication_name': row.get('medication_name', ''),
-                    'confidence': 'high'
-                })
+        matches = []
+        for position, codes in matched_products.items():
+            matches.append({
+                'index': index[position],
+                'strategy': 'product_mapping',
+                'matched_codes': codes,
+                'mapped_ingredients': [str(code) for code in mapped_ingredients[position]],
+                'medication_name': names[position],
+                'confidence': 'high'
+            })
 
         logger.info(f"  Found {len(matches)} medications by product mapping")
         return matches
@@ -241,23 +231,17 @@ class ComprehensiveChemotherapyIdentifier:
         """Strategy 3: Medication name pattern matching"""
         logger.info("Strategy 3: Medication name pattern matching...")
 
-        matches = []
-        for idx, row in medications_df.iterrows():
-            med_name = str(row.get('medication_name', '')).lower()
-
-            matched_drugs = []
-            for drug_name, patterns in self.CHEMO_PATTERNS.items():
-                for pattern in patterns:
-                    if pattern.lower() in med_name:
-                        matched_drugs.append(drug_name)
-                        break
+        names = column_values(medications_df, 'medication_name', '')
+        matched = self.chemo_automaton.match_values(names)
 
+        matches = []
+        for idx, name, matched_drugs in zip(medications_df.index.tolist(), names, matched):
             if matched_drugs:
                 matches.append({
                     'index': idx,
                     'strategy': 'name_pattern',
                     'matched_drugs': matched_drugs,
-                    'medication_name': row.get('medication_name', ''),
+                    'medication_name': name,
                     'confidence': 'high'
                 })
 
@@ -268,30 +252,27 @@ class ComprehensiveChemotherapyIdentifier:
         """Strategy 4: Care plan ONCOLOGY TREATMENT category"""
         logger.info("Strategy 4: Care plan ONCOLOGY category...")
 
-        matches = []
-        for idx, row in medications_df.iterrows():
-            categories = str(row.get('cpc_categories_aggregated', ''))
-
-            if 'ONCOLOGY' in categories.upper():
-                # Also check care plan title for drug names
-                cp_title = str(row.get('cp_title', '')).lower()
-                matched_drugs = []
+        categories = [str(value) for value in column_values(medications_df, 'cpc_categories_aggregated', '')]
+        oncology = {value: 'ONCOLOGY' in value.upper() for value in set(categories)}
+        positions = [i for i, value in enumerate(categories) if oncology[value]]
 
-                for drug_name, patterns in self.CHEMO_PATTERNS.items():
-                    for pattern in patterns:
-                        if pattern.lower() in cp_title:
-                            matched_drugs.append(drug_name)
-                            break
+        # Also check care plan title for drug names
+        index = medications_df.index.tolist()
+        titles = column_values(medications_df, 'cp_title', '')
+        names = column_values(medications_df, 'medication_name', '')
+        matched = self.chemo_automaton.match_values([titles[i] for i in positions])
 
-                matches.append({
-                    'index': idx,
-                    'strategy': 'oncology_care_plan',
-                    'care_plan_categories': categories,
-                    'care_plan_title': row.get('cp_title', ''),
-                    'matched_drugs': matched_drugs,
-                    'medication_name': row.get('medication_name', ''),
-                    'confidence': 'high'
-                })
+        matches = []
+        for i, matched_drugs in zip(positions, matched):
+            matches.append({
+                'index': index[i],
+                'strategy': 'oncology_care_plan',
+                'care_plan_categories': categories[i],
+                'care_plan_title': titles[i],
+                'matched_drugs': matched_drugs,
+                'medication_name': names[i],
+                'confidence': 'high'
+            })
 
         logger.info(f"  Found {len(matches)} medications in ONCOLOGY care plans")
         return matches
@@ -300,25 +281,18 @@ class ComprehensiveChemotherapyIdentifier:
         """Strategy 5: Reason code chemotherapy indicators"""
         logger.info("Strategy 5: Reason code indicators...")
 
-        chemo_indicators = [
-            'antineoplastic chemotherapy',
-            'chemotherapy encounter',
-            'encounter for antineoplastic',
-            'chemotherapy administration',
-            'malignant neoplasm'
-        ]
+        reasons = column_values(medications_df, 'mrr_reason_code_text_aggregated', '')
+        matched = self.reason_automaton.match_values(reasons)
+        names = column_values(medications_df, 'medication_name', '')
 
         matches = []
-        for idx, row in medications_df.iterrows():
-            reason_codes = str(row.get('mrr_reason_code_text_aggregated', '')).lower()
-
-            if any(indicator in reason_codes for indicator in chemo_indicators):
-                matched_indicators = [ind for ind in chemo_indicators if ind in reason_codes]
+        for idx, name, matched_indicators in zip(medications_df.index.tolist(), names, matched):
+            if matched_indicators:
                 matches.append({
                     'index': idx,
                     'strategy': 'reason_codes',
                     'matched_indicators': matched_indicators,
-                    'medication_name': row.get('medication_name', ''),
+                    'medication_name': name,
                     'confidence': 'medium'
                 })
 
@@ -14,6 +14,9 @@ from datetime import datetime, timedelta
 import json
 import yaml
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from staging_store import get_staging_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -50,6 +53,7 @@ class EnhancedClinicalPrioritization:
 
     def __init__(self, staging_path: Path, config: Optional[Dict] = None):
         self.staging_path = Path(staging_path)
+        self.staging_store = get_staging_store(self.staging_path)
         self.config = config if config else self.DEFAULT_CONFIG
 
     def identify_chemotherapy_changes(self, chemo_df: pd.DataFrame) -> List[Dict]:
@@ -260,7 +264,7 @@ class EnhancedClinicalPrioritization:
         - last_lab: Last laboratory result
         - vital_status: If available
         """
-        patient_path = self.staging_path / f"patient_{patient_id}"
+        store = self.staging_store
         endpoints = {
             'patient_id': patient_id,
             'date_of_birth': None,
@@ -284,53 +288,48 @@ class EnhancedClinicalPrioritization:
                     endpoints['date_of_birth'] = config['birth_date']
 
         # Check encounters/appointments
-        encounters_file = patient_path / "encounters.csv"
-        if encounters_file.exists():
-            encounters = pd.read_csv(encounters_file)
-            date_cols = ['encounter_date', 'period_start', 'period_end']
+        date_cols = ['encounter_date', 'period_start', 'period_end']
+        encounters = store.frame(patient_id, 'encounters', dates=date_cols)
+        if encounters is not None:
             for col in date_cols:
                 if col in encounters.columns:
-                    dates = pd.to_datetime(encounters[col], utc=True, errors='coerce')
+                    dates = encounters[col]
                     if dates.notna().any():
                         max_date = dates.max()
                         if endpoints['last_clinical_contact'] is None or max_date > endpoints['last_clinical_contact']:
                             endpoints['last_clinical_contact'] = max_date
 
         # Check imaging
-        imaging_file = patient_path / "imaging.csv"
-        if imaging_file.exists():
-            imaging = pd.read_csv(imaging_file)
+        imaging = store.frame(patient_id, 'imaging', dates=['imaging_date'])
+        if imaging is not None:
             if 'imaging_date' in imaging.columns:
-                dates = pd.to_datetime(imaging['imaging_date'], utc=True, errors='coerce')
+                dates = imaging['imaging_date']
                 if dates.notna().any():
                     endpoints['last_imaging'] = dates.max()
 
         # Check medications (last treatment)
-        meds_file = patient_path / "medications.csv"
-        if meds_file.exists():
-            meds = pd.read_csv(meds_file)
-            date_cols = ['medication_start_date', 'medication_end_date', 'cp_period_end']
+        date_cols = ['medication_start_date', 'medication_end_date', 'cp_period_end']
+        meds = store.frame(patient_id, 'medications', dates=date_cols)
+        if meds is not None:
             for col in date_cols:
                 if col in meds.columns:
-                    dates = pd.to_datetime(meds[col], utc=True, errors='coerce')
+                    dates = meds[col]
                     if dates.notna().any():
                         max_date = dates.max()
                         if endpoints['last_treatment'] is None or max_date > endpoints['last_treatment']:
                             endpoints['last_treatment'] = max_date
 
         # Check observations/labs
-        obs_file = patient_path / "observations.csv"
-        if obs_file.exists():
-            obs = pd.read_csv(obs_file)
+        obs = store.frame(patient_id, 'observations', dates=['observation_date'])
+        if obs is not None:
             if 'observation_date' in obs.columns:
-                dates = pd.to_datetime(obs['observation_date'], utc=True, errors='coerce')
+                dates = obs['observation_date']
                 if dates.notna().any():
                     endpoints['last_lab'] = dates.max()
 
         # Check vital status
-        patient_file = patient_path / "patient_demographics.csv"
-        if patient_file.exists():
-            demographics = pd.read_csv(patient_file)
+        demographics = store.frame(patient_id, 'patient_demographics')
+        if demographics is not None:
             if not demographics.empty:
                 if 'deceased_boolean' in demographics.columns:
                     if demographics['deceased_boolean'].iloc[0]:
@@ -345,9 +344,8 @@ class EnhancedClinicalPrioritization:
                     endpoints['vital_status'] = 'alive'
 
         # Get diagnosis date from diagnoses file
-        diagnoses_file = patient_path / "diagnoses.csv"
-        if diagnoses_file.exists():
-            diagnoses = pd.read_csv(diagnoses_file)
+        diagnoses = store.frame(patient_id, 'diagnoses', dates=['onset_date_time', 'recorded_date'])
+        if diagnoses is not None:
             # Look for brain tumor diagnoses - use onset_date_time or recorded_date
             date_col = None
             if 'onset_date_time' in diagnoses.columns:
@@ -356,7 +354,7 @@ class EnhancedClinicalPrioritization:
                 date_col = 'recorded_date'
 
             if date_col:
-                dates = pd.to_datetime(diagnoses[date_col], utc=True, errors='coerce')
+                dates = diagnoses[date_col]
                 if dates.notna().any():
                     endpoints['diagnosis_date'] = dates.min()  # Earliest diagnosis
 
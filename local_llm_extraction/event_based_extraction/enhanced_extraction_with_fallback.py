@@ -10,7 +10,6 @@ import json
 import logging
 import pandas as pd
 import boto3
-import base64
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
@@ -20,6 +19,9 @@ import os
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from binary_document_store import BinaryDocumentStore
+from llm_client import get_extraction_client
 
 # Configure logging
 logging.basicConfig(
@@ -28,15 +30,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Import Ollama client
-from ollama import Client
-
 # AWS Configuration
 AWS_PROFILE = '343218191717_AWSAdministratorAccess'
 AWS_REGION = 'us-east-1'
 S3_BUCKET = 'radiant-prd-343218191717-us-east-1-prd-ehr-pipeline'
 S3_PREFIX = 'prd/source/Binary/'
 
+STAGING_DIR = '/Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/athena_extraction_validation/staging_files'
+
 
 class StrategicDocumentRetriever:
     """
@@ -55,6 +56,10 @@ class StrategicDocumentRetriever:
         except Exception as e:
             logger.warning(f"S3 not available: {e}")
 
+        # Documents already in the local store are served without S3
+        self.document_store = BinaryDocumentStore(
+            s3_client=self.s3_client, s3_bucket=S3_BUCKET, s3_prefix=S3_PREFIX)
+
     def get_primary_documents(self, patient_id: str, event_date: datetime,
                             binary_metadata: pd.DataFrame) -> Dict[str, List]:
         """
@@ -262,26 +267,11 @@ class StrategicDocumentRetriever:
 
         # Try S3 retrieval for binary documents
         binary_id = document_info.get('dc_binary_id', '')
-        if self.s3_client and binary_id:
+        if binary_id:
             try:
-                # Format S3 key
-                if binary_id.startswith('Binary/'):
-                    s3_binary_id = binary_id[7:]
-                else:
-                    s3_binary_id = binary_id
-
-                s3_binary_id = s3_binary_id.replace('.', '_')
-                s3_key = f"{S3_PREFIX}{s3_binary_id}"
-
-                # Get from S3
-                response = self.s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
-                content = response['Body'].read()
-
-                # Parse and decode
-                binary_data = json.loads(content)
-                if 'data' in binary_data:
-                    decoded = base64.b64decode(binary_data['data']).decode('utf-8', errors='ignore')
-
+                # Local document store first, S3 only on a miss
+                decoded = self.document_store.get_text(binary_id)
+                if decoded is not None:
                     # Extract text from HTML
                     if '<html' in decoded.lower():
                         soup = BeautifulSoup(decoded, 'html.parser')
@@ -302,8 +292,8 @@ class MultiSourceExtractor:
     """
 
     def __init__(self):
-        self.ollama_client = Client(host='http://127.0.0.1:11434')
-        self.model_name = 'gemma2:27b'
+        self.ollama_client = get_extraction_client()
+        self.model_name = self.ollama_client.model
         logger.info(f"Initialized multi-source extractor with {self.model_name}")
 
     def extract_with_multiple_sources(self, variable_name: str,
@@ -384,7 +374,8 @@ Provide only: Local/Metastatic/Cannot determine:"""
         try:
             response = self.ollama_client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                variable_type='single_value'
             )
 
             return {
@@ -449,7 +440,7 @@ class EnhancedExtractionPipeline:
         self.extractor = MultiSourceExtractor()
 
     def extract_surgical_event(self, patient_id: str, event: Dict,
-                              binary_metadata: pd.DataFrame) -> Dict:
+                              binary_metadata: pd.DataFrame, include_fallback: bool = True) -> Dict:
         """
         Extract all variables for a surgical event with fallback strategies
         """
@@ -531,7 +522,7 @@ class EnhancedExtractionPipeline:
                 missing_variables.append(variable)
 
         # Fallback: Get additional documents for missing variables
-        if missing_variables:
+        if missing_variables and include_fallback:
             logger.info(f"Attempting fallback extraction for: {missing_variables}")
 
             fallback_docs = self.retriever.get_fallback_documents(
@@ -568,11 +559,40 @@ class EnhancedExtractionPipeline:
         return results
 
 
+class EnhancedEventExtractor:
+    """
+    Per-event entry point used by production_extraction_pipeline.py
+    """
+
+    def __init__(self, staging_dir: str = STAGING_DIR):
+        self.staging_dir = Path(staging_dir)
+        self.pipeline = EnhancedExtractionPipeline(self.staging_dir)
+
+    def extract_for_event(self, patient_id: str, event_date: str, include_fallback: bool = True) -> Dict:
+        """
+        Extract all variables for one surgical event
+
+        Returns:
+            Dict of variable name -> aggregated extraction (value, confidence, sources, ...)
+        """
+        binary_path = self.staging_dir / f'patient_{patient_id}' / 'binary_files.csv'
+        if not binary_path.exists():
+            logger.warning(f"No binary_files.csv for patient {patient_id}")
+            return {}
+
+        binary_metadata = pd.read_csv(binary_path)
+        results = self.pipeline.extract_surgical_event(
+            patient_id, {'date': event_date, 'type': 'Initial'}, binary_metadata,
+            include_fallback=include_fallback
+        )
+        return results['extractions']
+
+
 def main():
     """
     Run enhanced extraction pipeline
     """
-    staging_dir = Path('/Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/athena_extraction_validation/staging_files')
+    staging_dir = Path(STAGING_DIR)
     patient_id = 'e4BwD8ZYDBccepXcJ.Ilo3w3'
 
     # Initialize pipeline
@@ -15,6 +15,8 @@ import os
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from llm_client import backend_available, get_extraction_client
 
 # Configure logging
 logging.basicConfig(
@@ -26,13 +28,11 @@ logger = logging.getLogger(__name__)
 # Import the query engine from phase4
 from phase4_llm_with_query_capability import StructuredDataQueryEngine
 
-# Import Ollama client
-try:
-    from ollama import Client
-    OLLAMA_AVAILABLE = True
-except ImportError:
-    OLLAMA_AVAILABLE = False
-    logger.warning("Ollama not available. Install with: pip install ollama")
+# Shared pooled LLM client (src/llm_client.py; OLLAMA_HOST, LLM_OLLAMA_MODEL)
+# The server is probed when an extractor is created, not here
+OLLAMA_AVAILABLE = backend_available('ollama')
+if not OLLAMA_AVAILABLE:
+    logger.warning("Ollama client not available. Check LLM_TRANSPORT (the sdk transport needs: pip install ollama)")
 
 class EventBasedLLMExtraction:
     """
@@ -45,9 +45,13 @@ class EventBasedLLMExtraction:
         self.use_medgemma = use_medgemma
 
         if not use_medgemma and OLLAMA_AVAILABLE:
-            self.ollama_client = Client(host='http://127.0.0.1:11434')
-            self.model_name = 'gemma2:27b'
+            self.ollama_client = get_extraction_client()
+            self.model_name = self.ollama_client.model
             logger.info(f"Using Ollama with model: {self.model_name}")
+            # An unreachable server fails every call (rows marked as extraction errors)
+            if not backend_available('ollama', probe=True):
+                logger.error("Ollama server not reachable - LLM extractions will fail. "
+                             "Start it with: ollama serve (check OLLAMA_HOST)")
         elif use_medgemma:
             logger.info("MedGemma mode selected (would need implementation)")
         else:
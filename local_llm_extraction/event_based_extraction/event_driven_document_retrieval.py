@@ -9,7 +9,6 @@ import json
 import logging
 import pandas as pd
 import boto3
-import base64
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
@@ -20,6 +19,9 @@ import re
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from binary_document_store import BinaryDocumentStore
+from llm_client import backend_available, get_extraction_client
 
 # Configure logging
 logging.basicConfig(
@@ -31,13 +33,11 @@ logger = logging.getLogger(__name__)
 # Import the query engine from phase4
 from phase4_llm_with_query_capability import StructuredDataQueryEngine
 
-# Import Ollama client
-try:
-    from ollama import Client
-    OLLAMA_AVAILABLE = True
-except ImportError:
-    OLLAMA_AVAILABLE = False
-    logger.warning("Ollama not available. Install with: pip install ollama")
+# Shared pooled LLM client (src/llm_client.py; OLLAMA_HOST, LLM_OLLAMA_MODEL)
+# The server is probed when an extractor is created, not here
+OLLAMA_AVAILABLE = backend_available('ollama')
+if not OLLAMA_AVAILABLE:
+    logger.warning("Ollama client not available. Check LLM_TRANSPORT (the sdk transport needs: pip install ollama)")
 
 # AWS Configuration (optional - for actual retrieval)
 AWS_PROFILE = '343218191717_AWSAdministratorAccess'
@@ -65,6 +65,9 @@ class EventDrivenDocumentRetriever:
                 logger.warning(f"AWS initialization failed: {e}. Will use simulation mode.")
                 self.use_aws = False
 
+        self.document_store = BinaryDocumentStore(
+            s3_client=self.s3_client, s3_bucket=S3_BUCKET, s3_prefix=S3_PREFIX)
+
     def identify_key_clinical_events(self, patient_id: str) -> Dict:
         """
         Identify key clinical events from patient journey
@@ -207,23 +210,9 @@ class EventDrivenDocumentRetriever:
         if self.use_aws and self.s3_client and binary_id:
             # Actual S3 retrieval
             try:
-                # Remove "Binary/" prefix and convert periods
-                if binary_id.startswith('Binary/'):
-                    s3_binary_id = binary_id[7:]
-                else:
-                    s3_binary_id = binary_id
-                s3_binary_id = s3_binary_id.replace('.', '_')
-                s3_key = f"{S3_PREFIX}{s3_binary_id}"
-
-                # Get from S3
-                response = self.s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
-                content = response['Body'].read()
-
-                # Parse JSON and decode base64
-                binary_data = json.loads(content)
-                if 'data' in binary_data:
-                    decoded = base64.b64decode(binary_data['data']).decode('utf-8', errors='ignore')
-
+                # Local document store first, S3 only on a miss
+                decoded = self.document_store.get_text(binary_id)
+                if decoded is not None:
                     # Extract text from HTML if needed
                     if '<html' in decoded.lower():
                         soup = BeautifulSoup(decoded, 'html.parser')
@@ -272,9 +261,13 @@ class EventBasedLLMExtractor:
         self.query_engine = StructuredDataQueryEngine(staging_dir)
 
         if OLLAMA_AVAILABLE:
-            self.ollama_client = Client(host='http://127.0.0.1:11434')
-            self.model_name = 'gemma2:27b'
+            self.ollama_client = get_extraction_client()
+            self.model_name = self.ollama_client.model
             logger.info(f"Using Ollama with model: {self.model_name}")
+            # An unreachable server fails every call (rows marked as extraction errors)
+            if not backend_available('ollama', probe=True):
+                logger.error("Ollama server not reachable - LLM extractions will fail. "
+                             "Start it with: ollama serve (check OLLAMA_HOST)")
 
     def extract_surgical_variables(self, documents: List[Tuple[pd.Series, str]],
                                   event: Dict) -> Dict:
@@ -303,7 +296,8 @@ class EventBasedLLMExtractor:
             extent = self._extract_with_ollama(
                 operative_note,
                 'extent_of_resection',
-                "Extract the extent of tumor resection. Use terms: Gross total resection, Near-total resection (>95%), Subtotal resection (50-95%), Partial resection (<50%), or Biopsy only."
+                "Extract the extent of tumor resection. Use terms: Gross total resection, Near-total resection (>95%), Subtotal resection (50-95%), Partial resection (<50%), or Biopsy only.",
+                variable_type='single_value'
             )
             variables['extent_of_resection'] = extent
 
@@ -327,9 +321,13 @@ class EventBasedLLMExtractor:
 
         return variables
 
-    def _extract_with_ollama(self, document: str, variable: str, instruction: str) -> str:
+    def _extract_with_ollama(self, document: str, variable: str, instruction: str,
+                             variable_type: Optional[str] = None) -> str:
         """
         Extract variable using Ollama
+
+        variable_type='single_value' stops at the end of a single value; free-text
+        answers (the default) run to the end
         """
         if not OLLAMA_AVAILABLE:
             return f"[Mock: {variable}]"
@@ -344,7 +342,8 @@ Extract only the requested information. Be concise and precise."""
         try:
             response = self.ollama_client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                variable_type=variable_type
             )
             return response['message']['content'].strip()
         except Exception as e:
@@ -12,6 +12,9 @@ from typing import Dict, List, Optional, Any
 import logging
 from pathlib import Path
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from staging_store import get_staging_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,7 @@ class StructuredDataHarvester:
 
     def __init__(self, staging_path: str):
         self.staging_path = Path(staging_path)
+        self.staging_store = get_staging_store(self.staging_path)
         self.extracted_features = {}
         self.data_sources = {}
 
@@ -104,13 +108,9 @@ class StructuredDataHarvester:
         }
 
         for source, date_cols in sources.items():
-            file_path = self.patient_path / f"{source}.csv"
-            if file_path.exists():
-                df = pd.read_csv(file_path)
-                # Parse date columns and normalize timezones
-                for col in date_cols:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+            # Shared staging frame, date columns parsed as UTC
+            df = self.staging_store.frame(self.patient_id, source, dates=date_cols)
+            if df is not None:
                 self.data_sources[source] = df
                 logger.info(f"  Loaded {source}: {len(df)} records")
             else:
@@ -405,9 +405,8 @@ class StructuredDataHarvester:
         has_radiation = False
 
         for file_name in radiation_files:
-            file_path = self.patient_path / file_name
-            if file_path.exists():
-                df = pd.read_csv(file_path)
+            df = self.staging_store.frame(self.patient_id, Path(file_name).stem)
+            if df is not None:
                 if not df.empty:
                     has_radiation = True
 
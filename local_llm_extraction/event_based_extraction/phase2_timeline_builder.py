@@ -14,6 +14,10 @@ from dataclasses import dataclass, field
 import logging
 from pathlib import Path
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from document_chunking import relevant_snippet
+from staging_store import get_staging_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -52,6 +56,7 @@ class ClinicalTimelineBuilder:
 
     def __init__(self, staging_path: str, structured_features: Dict[str, any]):
         self.staging_path = Path(staging_path)
+        self.staging_store = get_staging_store(self.staging_path)
         self.structured_features = structured_features
         self.events = []
         self.data_sources = {}
@@ -134,12 +139,9 @@ class ClinicalTimelineBuilder:
         }
 
         for source, date_cols in sources_to_load.items():
-            file_path = self.patient_path / f"{source}.csv"
-            if file_path.exists():
-                df = pd.read_csv(file_path)
-                for col in date_cols:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
+            # Shared staging frame, date columns parsed as UTC (events are compared in UTC)
+            df = self.staging_store.frame(self.patient_id, source, dates=date_cols)
+            if df is not None:
                 self.data_sources[source] = df
             else:
                 self.data_sources[source] = pd.DataFrame()
@@ -428,18 +430,9 @@ class ClinicalTimelineBuilder:
 
         return binary_refs
 
-    def _extract_relevant_snippet(self, text: str, keywords: List[str], context_chars: int = 100) -> str:
-        """Extract relevant snippet from text around keywords"""
-        text_lower = text.lower()
-
-        for keyword in keywords:
-            if keyword in text_lower:
-                pos = text_lower.find(keyword)
-                start = max(0, pos - context_chars)
-                end = min(len(text), pos + len(keyword) + context_chars)
-                return text[start:end]
-
-        return text[:200]  # Return first 200 chars if no keyword found
+    def _extract_relevant_snippet(self, text: str, keywords: List[str], max_chars: int = 500) -> str:
+        """Extract relevant snippet from text around keywords (whole sentences, up to max_chars)"""
+        return relevant_snippet(text, keywords, max_chars=max_chars)
 
     def _deduplicate_and_link_events(self, events: List[ClinicalEvent]) -> List[ClinicalEvent]:
         """Deduplicate events and link related ones"""
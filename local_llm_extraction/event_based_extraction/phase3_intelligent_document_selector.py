@@ -3,6 +3,11 @@ Phase 3: Intelligent Binary Document Selection
 ==============================================
 Selects most relevant documents from binary files for focused BRIM extraction
 based on clinical timeline and event priorities
+
+Scoring is one pass over the documents: all key terms are matched by a single
+automaton scan of each distinct description, proximity to every key date is one
+documents x events array computation, and the reasons behind each score are kept
+as compact code arrays (decode them with scoring_reason_text()).
 """
 
 import pandas as pd
@@ -13,9 +18,14 @@ import logging
 from datetime import datetime, timedelta
 import json
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from text_matching import AliasAutomaton
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+NS_PER_DAY = 86_400 * 10 ** 9
+
 class IntelligentDocumentSelector:
     """
     Select high-priority documents for BRIM extraction based on:
@@ -67,10 +77,28 @@ class IntelligentDocumentSelector:
         ]
     }
 
+    # Temporal proximity: (max days from a key event, points), closest window first
+    PROXIMITY_WINDOWS = [(7, 10), (30, 7), (90, 4), (180, 2)]
+
+    # Documents kept per type when selecting (others: 10)
+    MAX_PER_TYPE = {
+        'operative_note': 10,
+        'pathology_report': 10,
+        'mri_report': 20,
+        'oncology_note': 15,
+        'other': 30
+    }
+
     def __init__(self, staging_path: Path, binary_files_path: Path):
         self.staging_path = Path(staging_path)
         self.binary_files_path = Path(binary_files_path)
 
+        # Every KEY_TERMS term as one automaton key, in category/term order
+        self.term_labels = [f'{category}:{term}' for category, terms in self.KEY_TERMS.items() for term in terms]
+        self.term_automaton = AliasAutomaton({
+            rank: [term] for rank, term in enumerate(term for terms in self.KEY_TERMS.values() for term in terms)
+        })
+
     def select_priority_documents(self, patient_id: str,
                                  clinical_timeline: Dict,
                                  max_documents: int = 100) -> pd.DataFrame:
@@ -134,7 +162,13 @@ class IntelligentDocumentSelector:
 
         return df
 
-    def _classify_document_type(self, filename: str) -> str:
+    @classmethod
+    def document_type_priority(cls, filename: str) -> int:
+        """Priority (1=highest) of a document from its filename or title"""
+        return cls.DOCUMENT_PRIORITIES.get(cls._classify_document_type(filename), cls.DOCUMENT_PRIORITIES['other'])
+
+    @staticmethod
+    def _classify_document_type(filename: str) -> str:
         """Classify document type from filename"""
         filename_lower = str(filename).lower()
 
@@ -199,101 +233,118 @@ class IntelligentDocumentSelector:
         2. Temporal proximity to key events (0-10 points)
         3. Content relevance (0-5 points)
         4. Recency bonus (0-2 points)
+
+        ``scoring_reasons`` holds each document's reason codes (int16 array),
+        indexes into ``df.attrs['scoring_reason_labels']``.
         """
+        n_docs = len(df)
+        labels: List[str] = []
+        reasons: List[np.ndarray] = []  # docs x labels blocks, in label order
         df['priority_score'] = 0
-        df['scoring_reasons'] = ''
+        df['scoring_reasons'] = None
 
         # 1. Document type scoring
-        df['type_score'] = df['document_type'].map(
-            lambda x: 11 - self.DOCUMENT_PRIORITIES.get(x, 6)
-        )
-        df['priority_score'] += df['type_score']
+        df['type_score'] = 11 - df['document_type'].map(self.DOCUMENT_PRIORITIES).fillna(6).astype(int)
+        priority_score = df['type_score'].to_numpy(dtype=np.int64)
 
-        # 2. Temporal proximity scoring
+        # 2. Temporal proximity scoring, all documents x all key events at once
         if 'document_date' in df.columns:
-            df['temporal_score'] = 0
-
-            for event_name, event_date in key_dates.items():
-                if pd.notna(event_date):
-                    # Calculate days from event
-                    days_diff = np.abs((df['document_date'] - event_date).dt.days)
-
-                    # Score based on proximity (max 10 points per event)
-                    proximity_score = np.where(
-                        days_diff <= 7, 10,  # Within 1 week
-                        np.where(days_diff <= 30, 7,  # Within 1 month
-                        np.where(days_diff <= 90, 4,  # Within 3 months
-                        np.where(days_diff <= 180, 2,  # Within 6 months
-                        0)))  # Beyond 6 months
-                    )
+            events = [(name, date) for name, date in key_dates.items() if pd.notna(date)]
+            temporal_score = np.zeros(n_docs, dtype=np.int64)
+
+            if events:
+                doc_ns = pd.to_datetime(df['document_date'], utc=True).to_numpy(dtype='datetime64[ns]').view(np.int64)
+                event_ns = pd.to_datetime(pd.Series([date for _, date in events]), utc=True) \
+                    .to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+                # Whole days from each event (floored, as Timedelta.days), documents without a date score 0
+                days = np.abs(np.floor_divide(doc_ns[:, None] - event_ns[None, :], NS_PER_DAY))
+                dated = (doc_ns != np.iinfo(np.int64).min)[:, None]
+                proximity = np.select(
+                    [dated & (days <= limit) for limit, _ in self.PROXIMITY_WINDOWS],
+                    [points for _, points in self.PROXIMITY_WINDOWS],
+                    0
+                )
 
-                    # Keep maximum score across all events
-                    df['temporal_score'] = np.maximum(df['temporal_score'], proximity_score)
+                # Keep maximum score across all events
+                temporal_score = proximity.max(axis=1)
 
-                    # Track which event drove the score
-                    high_score_mask = proximity_score >= 7
-                    df.loc[high_score_mask, 'scoring_reasons'] += f'{event_name}({proximity_score[high_score_mask].max()});'
+                # Track which events drove the score (with the best score each gave)
+                high = proximity >= 7
+                for j, (event_name, _) in enumerate(events):
+                    if high[:, j].any():
+                        labels.append(f'{event_name}({proximity[high[:, j], j].max()})')
+                        reasons.append(high[:, j:j + 1])
 
-            df['priority_score'] += df['temporal_score']
+            df['temporal_score'] = temporal_score
+            priority_score = priority_score + temporal_score
 
-        # 3. Content relevance (if description available)
+        # 3. Content relevance (if description available): one scan per distinct description
         if 'description' in df.columns or 'content_preview' in df.columns:
             content_col = 'description' if 'description' in df.columns else 'content_preview'
 
-            df['content_score'] = 0
-            for category, terms in self.KEY_TERMS.items():
-                for term in terms:
-                    mask = df[content_col].str.contains(term, case=False, na=False)
-                    df.loc[mask, 'content_score'] += 1
-                    df.loc[mask, 'scoring_reasons'] += f'{category}:{term};'
+            codes, texts = pd.factorize(df[content_col])
+            term_hits = np.zeros((len(texts) + 1, len(self.term_labels)), dtype=bool)  # last row: no text
+            for i, text in enumerate(texts):
+                if isinstance(text, str):
+                    term_hits[i, self.term_automaton.keys_in(text.lower())] = True
+            term_hits = term_hits[codes]
+
+            labels.extend(self.term_labels)
+            reasons.append(term_hits)
 
             # Cap content score at 5
-            df['content_score'] = np.minimum(df['content_score'], 5)
-            df['priority_score'] += df['content_score']
+            df['content_score'] = np.minimum(term_hits.sum(axis=1), 5)
+            priority_score = priority_score + df['content_score'].to_numpy()
 
         # 4. Recency bonus (documents from last 2 years)
         if 'document_date' in df.columns:
             recent_cutoff = pd.Timestamp.now(tz='UTC') - timedelta(days=730)
-            df.loc[df['document_date'] > recent_cutoff, 'priority_score'] += 2
-            df.loc[df['document_date'] > recent_cutoff, 'scoring_reasons'] += 'recent;'
+            recent = (df['document_date'] > recent_cutoff).to_numpy(dtype=bool)
+            priority_score = priority_score + 2 * recent
+            labels.append('recent')
+            reasons.append(recent[:, None])
+
+        df['priority_score'] = priority_score
+        df['scoring_reasons'] = self._reason_codes(reasons, n_docs)
+        df.attrs['scoring_reason_labels'] = labels
 
         return df
 
+    @staticmethod
+    def _reason_codes(blocks: List[np.ndarray], n_docs: int) -> np.ndarray:
+        """Per document, the label codes set in the docs x labels reason blocks, in label order."""
+        matrix = np.hstack(blocks) if blocks else np.zeros((n_docs, 0), dtype=bool)
+        docs, codes = np.nonzero(matrix)
+        bounds = np.searchsorted(docs, np.arange(n_docs + 1)).tolist()
+        codes = codes.astype(np.int16)
+        per_doc = np.empty(n_docs, dtype=object)
+        for i in range(n_docs):
+            per_doc[i] = codes[bounds[i]:bounds[i + 1]]
+        return per_doc
+
+    @staticmethod
+    def scoring_reason_text(df: pd.DataFrame) -> pd.Series:
+        """Scoring reasons as text ('initial_surgery(10);tumor_pathology:glioma;recent;')"""
+        labels = df.attrs.get('scoring_reason_labels', [])
+        return pd.Series([''.join(f'{labels[code]};' for code in codes) for codes in df['scoring_reasons']],
+                         index=df.index, dtype=object)
+
     def _select_top_documents(self, df: pd.DataFrame, max_documents: int) -> pd.DataFrame:
         """Select top scoring documents with diversity constraints"""
 
         # Sort by priority score
         df = df.sort_values('priority_score', ascending=False)
 
-        selected = []
-        doc_types_count = {}
-
-        # Ensure diversity - limit documents per type
-        max_per_type = {
-            'operative_note': 10,
-            'pathology_report': 10,
-            'mri_report': 20,
-            'oncology_note': 15,
-            'other': 30
-        }
-
-        for idx, doc in df.iterrows():
-            doc_type = doc['document_type']
-            current_count = doc_types_count.get(doc_type, 0)
-            max_allowed = max_per_type.get(doc_type, 10)
-
-            if current_count < max_allowed:
-                selected.append(doc)
-                doc_types_count[doc_type] = current_count + 1
-
-            if len(selected) >= max_documents:
-                break
-
-        selected_df = pd.DataFrame(selected)
+        # Ensure diversity - limit documents per type: keep a document while fewer
+        # of its type rank above it than the type allows, then the top max_documents
+        rank_in_type = df.groupby('document_type', sort=False, dropna=False).cumcount()
+        max_allowed = df['document_type'].map(self.MAX_PER_TYPE).fillna(10)
+        selected_df = df[(rank_in_type < max_allowed).to_numpy()].head(max_documents).copy()
 
         # Log selection summary
         logger.info("Document selection summary:")
-        for doc_type, count in doc_types_count.items():
+        for doc_type, count in selected_df.groupby('document_type', sort=False, dropna=False).size().items():
             logger.info(f"  {doc_type}: {count}")
 
         return selected_df
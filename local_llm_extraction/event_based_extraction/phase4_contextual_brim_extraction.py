@@ -317,7 +317,7 @@ class ContextualBRIMExtractor:
         # Save results
         results_path = self.output_base / f"brim_results_{patient_id}.json"
         with open(results_path, 'w') as f:
-            json.dump(results, f, indent=2)
+            json.dump(results, f, indent=2, default=str)
 
         logger.info(f"BRIM extraction complete: {results['statistics']['success_rate']:.1%} success rate")
 
@@ -14,6 +14,9 @@ from datetime import datetime
 import subprocess
 import time
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from document_relevance_index import DocumentRelevanceIndex, relevance_spec
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -28,6 +31,8 @@ class EnhancedLLMExtractor:
         self.ollama_model = ollama_model
         self.output_base = self.staging_path.parent / "outputs"
         self.output_base.mkdir(exist_ok=True)
+        self.relevance_index = None  # DocumentRelevanceIndex over the current document list
+        self.skipped_documents = {}  # variable -> [{'document_id', 'reason'}]
 
     def create_enhanced_prompt(self, variable: str, document_text: str,
                               structured_context: Dict) -> str:
@@ -358,6 +363,7 @@ class EnhancedLLMExtractor:
                 'name': variable,
                 'structured_context': self._get_variable_context(variable, structured_context),
                 'documents': self._select_documents_for_variable(variable, selected_documents),
+                'skipped_documents': self.skipped_documents.get(variable, []),
                 'validation_rules': self._get_validation_rules(variable)
             }
             config['variables'].append(variable_config)
@@ -461,9 +467,27 @@ class EnhancedLLMExtractor:
             relevant = all_documents[
                 all_documents['document_type'].isin(preferred_types)
             ]
-            return relevant['document_id'].tolist()[:10]  # Limit to 10 docs
+            limit = 10  # Limit to 10 docs
+        else:
+            relevant = all_documents
+            limit = 5  # Default fallback
+
+        # Most relevant to the variable first (document order on equal scores)
+        spec = relevance_spec(variable)
+        if spec is not None:
+            if self.relevance_index is None or self.relevance_index.documents is not all_documents:
+                self.relevance_index = DocumentRelevanceIndex(all_documents)
+            spec.update(top_k=limit, min_score=None)
+            selected, skipped = self.relevance_index.select(
+                spec, candidates=all_documents.index.get_indexer(relevant.index)
+            )
+            self.skipped_documents[variable] = [
+                {'document_id': all_documents.iloc[position].get('document_id'), 'reason': reason}
+                for position, reason in skipped.items()
+            ]
+            relevant = all_documents.iloc[selected]
 
-        return all_documents['document_id'].tolist()[:5]  # Default fallback
+        return relevant['document_id'].tolist()[:limit]
 
     def _get_validation_rules(self, variable: str) -> Dict:
         """Get validation rules for a variable"""
@@ -13,6 +13,10 @@ import logging
 from datetime import datetime, timedelta
 import subprocess
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from staging_store import get_staging_store
+from structured_query_index import QueryIndex
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -229,221 +233,187 @@ Provide your extraction as a structured response:
 class StructuredDataQueryEngine:
     """
     Query engine that LLM can use to access structured data
+
+    Each staging source is loaded once per patient and indexed (dates sorted
+    for range/proximity lookups, lower-cased names for drug lookups); repeated
+    identical queries are answered from an LRU (see structured_query_index).
     """
 
+    SURGERY_KEYWORDS = ['resection', 'craniotomy', 'biopsy', 'excision']
+    TUMOR_KEYWORDS = ['astrocytoma', 'glioma', 'brain', 'neoplasm']
+    PROCEDURE_DATE_COLUMNS = ['proc_performed_period_start', 'proc_performed_date_time', 'procedure_date']
+    MEDICATION_START_COLUMNS = ['medication_start_date', 'mr_authoredon', 'cp_period_start']
+    IMAGING_DATE_COLUMNS = ['imaging_date', 'img_performed_period_start', 'study_date']
+    ENCOUNTER_DATE_COLUMNS = ['enc_period_start', 'encounter_date', 'admission_date']
+
     def __init__(self, staging_path: Path):
         self.staging_path = Path(staging_path)
-        self._cache = {}  # Cache query results for efficiency
+        self.staging_store = get_staging_store(self.staging_path)
+        self.index = QueryIndex(self.staging_store)
 
     def query_surgery_dates(self, patient_id: str) -> List[Dict]:
         """Query all surgery dates for a patient"""
+        return self.index.memoized(self._surgery_dates, patient_id)
 
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        procedures_file = patient_path / "procedures.csv"
+    def query_diagnosis(self, patient_id: str) -> Dict:
+        """Query diagnosis information"""
+        return self.index.memoized(self._diagnosis, patient_id)
 
-        if not procedures_file.exists():
-            return []
+    def query_medications(self, patient_id: str, drug_name: str) -> List[Dict]:
+        """Query medication records for a specific drug"""
+        return self.index.memoized(self._medications, patient_id, drug_name)
+
+    def query_molecular_tests(self, patient_id: str) -> List[Dict]:
+        """Query molecular test results"""
+        return self.index.memoized(self._molecular_tests, patient_id)
+
+    def query_imaging_on_date(self, patient_id: str, target_date: str, tolerance_days: int = 7) -> List[Dict]:
+        """Query imaging studies near a specific date"""
+        return self.index.memoized(self._imaging_on_date, patient_id, target_date, tolerance_days)
+
+    def query_problem_list(self, patient_id: str) -> List[Dict]:
+        """Query active problems"""
+        return self.index.memoized(self._problem_list, patient_id)
+
+    def query_encounters_range(self, patient_id: str, start_date: str, end_date: str) -> List[Dict]:
+        """Query encounters within a date range"""
+        return self.index.memoized(self._encounters_range, patient_id, start_date, end_date)
 
-        procedures_df = pd.read_csv(procedures_file)
+    def _surgery_dates(self, patient_id: str) -> List[Dict]:
+        patient = self.index.patient(patient_id)
+        procedures = patient.table('procedures')
+        if procedures is None:
+            return []
 
-        # Find surgeries
-        surgery_keywords = ['resection', 'craniotomy', 'biopsy', 'excision']
+        # Find surgeries among the distinct procedure texts, then keep rows with a date
+        dates, found = procedures.first_present(self.PROCEDURE_DATE_COLUMNS)
+        names = patient.names('procedures', 'proc_code_text')
         surgeries = []
 
-        for idx, row in procedures_df.iterrows():
-            proc_text = str(row.get('proc_code_text', '')).lower()
-            if any(keyword in proc_text for keyword in surgery_keywords):
-                # Get date
-                date_col = None
-                for col in ['proc_performed_period_start', 'proc_performed_date_time', 'procedure_date']:
-                    if col in procedures_df.columns and pd.notna(row.get(col)):
-                        date_col = col
-                        break
-
-                if date_col:
-                    surgeries.append({
-                        'date': str(row[date_col])[:10],
-                        'type': 'resection' if 'resection' in proc_text else 'biopsy',
-                        'description': row.get('proc_code_text', 'Unknown')
-                    })
+        for position in names.where(lambda text: any(keyword in text for keyword in self.SURGERY_KEYWORDS)):
+            if found[position]:
+                proc_text = str(procedures.get(position, 'proc_code_text', '')).lower()
+                surgeries.append({
+                    'date': str(dates[position])[:10],
+                    'type': 'resection' if 'resection' in proc_text else 'biopsy',
+                    'description': procedures.get(position, 'proc_code_text', 'Unknown')
+                })
 
         return surgeries
 
-    def query_diagnosis(self, patient_id: str) -> Dict:
-        """Query diagnosis information"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
+    def _diagnosis(self, patient_id: str) -> Dict:
+        patient = self.index.patient(patient_id)
 
         # Check problem list
-        problem_file = patient_path / "problem_list.csv"
-        if problem_file.exists():
-            problems_df = pd.read_csv(problem_file)
-
+        problems = patient.table('problem_list')
+        if problems is not None:
             # Find tumor diagnosis
-            tumor_keywords = ['astrocytoma', 'glioma', 'brain', 'neoplasm']
-            for idx, row in problems_df.iterrows():
-                diagnosis = str(row.get('pld_diagnosis_name', '')).lower()
-                if any(keyword in diagnosis for keyword in tumor_keywords):
+            for position in range(len(problems)):
+                diagnosis = str(problems.get(position, 'pld_diagnosis_name', '')).lower()
+                if any(keyword in diagnosis for keyword in self.TUMOR_KEYWORDS):
                     return {
-                        'diagnosis': row.get('pld_diagnosis_name'),
-                        'icd10': row.get('pld_icd10cm_code'),
-                        'date': str(row.get('pld_recorded_time', ''))[:10],
-                        'status': row.get('pld_status')
+                        'diagnosis': problems.get(position, 'pld_diagnosis_name'),
+                        'icd10': problems.get(position, 'pld_icd10cm_code'),
+                        'date': str(problems.get(position, 'pld_recorded_time', ''))[:10],
+                        'status': problems.get(position, 'pld_status')
                     }
 
         # Fallback to diagnoses table
-        diagnoses_file = patient_path / "diagnoses.csv"
-        if diagnoses_file.exists():
-            diagnoses_df = pd.read_csv(diagnoses_file)
-            if not diagnoses_df.empty:
-                first_diagnosis = diagnoses_df.iloc[0]
-                return {
-                    'diagnosis': first_diagnosis.get('diagnosis_name', 'Unknown'),
-                    'date': str(first_diagnosis.get('diagnosis_date', ''))[:10]
-                }
+        diagnoses = patient.table('diagnoses')
+        if diagnoses is not None and len(diagnoses):
+            return {
+                'diagnosis': diagnoses.get(0, 'diagnosis_name', 'Unknown'),
+                'date': str(diagnoses.get(0, 'diagnosis_date', ''))[:10]
+            }
 
         return {}
 
-    def query_medications(self, patient_id: str, drug_name: str) -> List[Dict]:
-        """Query medication records for a specific drug"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        meds_file = patient_path / "medications.csv"
-
-        if not meds_file.exists():
+    def _medications(self, patient_id: str, drug_name: str) -> List[Dict]:
+        patient = self.index.patient(patient_id)
+        meds = patient.table('medications')
+        if meds is None:
             return []
 
-        meds_df = pd.read_csv(meds_file)
-
-        # Search for drug
-        drug_lower = drug_name.lower()
+        starts, found = meds.first_present(self.MEDICATION_START_COLUMNS)
         matches = []
 
-        for idx, row in meds_df.iterrows():
-            med_name = str(row.get('medication_name', '')).lower()
-            if drug_lower in med_name:
-                # Get dates
-                start_date = None
-                for col in ['medication_start_date', 'mr_authoredon', 'cp_period_start']:
-                    if col in meds_df.columns and pd.notna(row.get(col)):
-                        start_date = str(row[col])[:10]
-                        break
-
-                matches.append({
-                    'medication': row.get('medication_name'),
-                    'start_date': start_date,
-                    'end_date': str(row.get('cp_period_end', ''))[:10] if 'cp_period_end' in row else None,
-                    'status': row.get('medication_status')
-                })
+        for position in patient.names('medications', 'medication_name').containing(drug_name):
+            matches.append({
+                'medication': meds.get(position, 'medication_name'),
+                'start_date': str(starts[position])[:10] if found[position] else None,
+                'end_date': str(meds.get(position, 'cp_period_end', ''))[:10] if 'cp_period_end' in meds else None,
+                'status': meds.get(position, 'medication_status')
+            })
 
         return matches
 
-    def query_molecular_tests(self, patient_id: str) -> List[Dict]:
-        """Query molecular test results"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        molecular_file = patient_path / "molecular_tests_metadata.csv"
-
-        if not molecular_file.exists():
+    def _molecular_tests(self, patient_id: str) -> List[Dict]:
+        molecular = self.index.patient(patient_id).table('molecular_tests_metadata')
+        if molecular is None:
             return []
 
-        molecular_df = pd.read_csv(molecular_file)
-        tests = []
-
-        for idx, row in molecular_df.iterrows():
-            tests.append({
-                'test_name': row.get('mt_lab_test_name', 'Unknown'),
-                'test_date': str(row.get('mt_test_date', ''))[:10],
-                'specimen_date': str(row.get('mt_specimen_collection_date', ''))[:10],
-                'result_summary': row.get('mt_result', 'No result')
-            })
-
-        return tests
-
-    def query_imaging_on_date(self, patient_id: str, target_date: str, tolerance_days: int = 7) -> List[Dict]:
-        """Query imaging studies near a specific date"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        imaging_file = patient_path / "imaging.csv"
-
-        if not imaging_file.exists():
+        return [{
+            'test_name': molecular.get(position, 'mt_lab_test_name', 'Unknown'),
+            'test_date': str(molecular.get(position, 'mt_test_date', ''))[:10],
+            'specimen_date': str(molecular.get(position, 'mt_specimen_collection_date', ''))[:10],
+            'result_summary': molecular.get(position, 'mt_result', 'No result')
+        } for position in range(len(molecular))]
+
+    def _imaging_on_date(self, patient_id: str, target_date: str, tolerance_days: int) -> List[Dict]:
+        patient = self.index.patient(patient_id)
+        imaging = patient.table('imaging')
+        if imaging is None:
             return []
 
-        imaging_df = pd.read_csv(imaging_file)
-        target = pd.to_datetime(target_date)
+        target = pd.to_datetime(target_date, utc=True)
         matches = []
 
-        for idx, row in imaging_df.iterrows():
-            # Get imaging date
-            img_date = None
-            for col in ['imaging_date', 'img_performed_period_start', 'study_date']:
-                if col in imaging_df.columns and pd.notna(row.get(col)):
-                    img_date = pd.to_datetime(row[col])
-                    break
-
-            if img_date and abs((img_date - target).days) <= tolerance_days:
-                matches.append({
-                    'date': str(img_date)[:10],
-                    'modality': row.get('img_modality', 'Unknown'),
-                    'body_part': row.get('img_body_part_examined', 'Unknown'),
-                    'days_from_target': int((img_date - target).days)
-                })
+        for position, img_date, days in patient.dates('imaging', self.IMAGING_DATE_COLUMNS).within_days(
+                target, tolerance_days):
+            matches.append({
+                'date': str(img_date)[:10],
+                'modality': imaging.get(position, 'img_modality', 'Unknown'),
+                'body_part': imaging.get(position, 'img_body_part_examined', 'Unknown'),
+                'days_from_target': days
+            })
 
         return matches
 
-    def query_problem_list(self, patient_id: str) -> List[Dict]:
-        """Query active problems"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        problem_file = patient_path / "problem_list.csv"
-
-        if not problem_file.exists():
+    def _problem_list(self, patient_id: str) -> List[Dict]:
+        problems = self.index.patient(patient_id).table('problem_list')
+        if problems is None:
             return []
 
-        problems_df = pd.read_csv(problem_file)
-
         # Filter active problems
         active_problems = []
-        for idx, row in problems_df.iterrows():
-            if str(row.get('pld_status', '')).lower() == 'active':
+        for position in range(len(problems)):
+            if str(problems.get(position, 'pld_status', '')).lower() == 'active':
                 active_problems.append({
-                    'problem': row.get('pld_diagnosis_name'),
-                    'icd10': row.get('pld_icd10cm_code'),
-                    'recorded_date': str(row.get('pld_recorded_time', ''))[:10],
-                    'category': self._categorize_problem(row.get('pld_diagnosis_name', ''))
+                    'problem': problems.get(position, 'pld_diagnosis_name'),
+                    'icd10': problems.get(position, 'pld_icd10cm_code'),
+                    'recorded_date': str(problems.get(position, 'pld_recorded_time', ''))[:10],
+                    'category': self._categorize_problem(problems.get(position, 'pld_diagnosis_name', ''))
                 })
 
         return active_problems
 
-    def query_encounters_range(self, patient_id: str, start_date: str, end_date: str) -> List[Dict]:
-        """Query encounters within a date range"""
-
-        patient_path = self.staging_path / f"patient_{patient_id}"
-        encounters_file = patient_path / "encounters.csv"
-
-        if not encounters_file.exists():
+    def _encounters_range(self, patient_id: str, start_date: str, end_date: str) -> List[Dict]:
+        patient = self.index.patient(patient_id)
+        encounters = patient.table('encounters')
+        if encounters is None:
             return []
 
-        encounters_df = pd.read_csv(encounters_file)
-        start = pd.to_datetime(start_date)
-        end = pd.to_datetime(end_date)
+        start = pd.to_datetime(start_date, utc=True)
+        end = pd.to_datetime(end_date, utc=True)
 
         matches = []
-        for idx, row in encounters_df.iterrows():
-            # Get encounter date
-            enc_date = None
-            for col in ['enc_period_start', 'encounter_date', 'admission_date']:
-                if col in encounters_df.columns and pd.notna(row.get(col)):
-                    enc_date = pd.to_datetime(row[col])
-                    break
-
-            if enc_date and start <= enc_date <= end:
-                matches.append({
-                    'date': str(enc_date)[:10],
-                    'type': row.get('enc_class_display', 'Unknown'),
-                    'reason': row.get('enc_reasoncode_display', 'Unknown'),
-                    'department': row.get('enc_service_provider_name', 'Unknown')
-                })
+        for position, enc_date in patient.dates('encounters', self.ENCOUNTER_DATE_COLUMNS).between(start, end):
+            matches.append({
+                'date': str(enc_date)[:10],
+                'type': encounters.get(position, 'enc_class_display', 'Unknown'),
+                'reason': encounters.get(position, 'enc_reasoncode_display', 'Unknown'),
+                'department': encounters.get(position, 'enc_service_provider_name', 'Unknown')
+            })
 
         return matches
 
@@ -13,6 +13,9 @@ import logging
 from datetime import datetime, timedelta
 from difflib import SequenceMatcher
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from staging_store import get_staging_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -77,6 +80,7 @@ class CrossSourceValidator:
 
     def __init__(self, staging_path: Path):
         self.staging_path = Path(staging_path)
+        self.staging_store = get_staging_store(self.staging_path)
         self.output_base = self.staging_path.parent / "outputs"
         self.output_base.mkdir(exist_ok=True)
 
@@ -151,7 +155,7 @@ class CrossSourceValidator:
         # Save validation report
         report_path = self.output_base / f"validation_report_{patient_id}.json"
         with open(report_path, 'w') as f:
-            json.dump(validation_report, f, indent=2)
+            json.dump(validation_report, f, indent=2, default=str)
 
         logger.info(f"Validation complete: {validation_report['metrics']['accuracy']:.1%} accuracy")
 
@@ -160,7 +164,6 @@ class CrossSourceValidator:
     def _load_structured_data(self, patient_id: str) -> Dict[str, pd.DataFrame]:
         """Load all structured data sources for validation"""
         structured_data = {}
-        patient_path = self.staging_path / f"patient_{patient_id}"
 
         # Define data sources to load
         data_sources = [
@@ -170,9 +173,9 @@ class CrossSourceValidator:
         ]
 
         for source in data_sources:
-            file_path = patient_path / f"{source}.csv"
-            if file_path.exists():
-                structured_data[source] = pd.read_csv(file_path)
+            df = self.staging_store.frame(patient_id, source)
+            if df is not None:
+                structured_data[source] = df
                 logger.info(f"Loaded {len(structured_data[source])} records from {source}")
             else:
                 structured_data[source] = pd.DataFrame()
@@ -7,7 +7,6 @@ This pilot actually calls Ollama and demonstrates the query capability
 
 import pandas as pd
 import json
-import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 import logging
@@ -18,7 +17,9 @@ import re
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
 
+from llm_client import get_extraction_client, get_llm_client
 from phase4_llm_with_query_capability import StructuredDataQueryEngine
 
 logging.basicConfig(
@@ -38,6 +39,7 @@ class RealAgenticOllamaPilot:
         self.binary_path = Path(binary_path)
         self.ollama_model = ollama_model
         self.query_engine = StructuredDataQueryEngine(staging_path)
+        self.ollama_client = get_extraction_client()
 
         # Track metrics
         self.ollama_calls = 0
@@ -50,33 +52,18 @@ class RealAgenticOllamaPilot:
         """
         self.ollama_calls += 1
 
-        # Build ollama command
-        cmd = [
-            'ollama', 'run', self.ollama_model,
-            '--verbose'
-        ]
-
         logger.info(f"Calling Ollama (call #{self.ollama_calls})...")
 
         try:
-            # Run ollama with prompt
-            result = subprocess.run(
-                cmd,
-                input=prompt,
-                text=True,
-                capture_output=True,
+            response = self.ollama_client.chat(
+                model=self.ollama_model,
+                messages=[{'role': 'user', 'content': prompt}],
                 timeout=60  # 60 second timeout
-            )
-
-            if result.returncode == 0:
-                response = result.stdout.strip()
-                logger.info(f"Ollama responded (length: {len(response)} chars)")
-                return response
-            else:
-                logger.error(f"Ollama error: {result.stderr}")
-                return f"Error: {result.stderr}"
+            )['message']['content'].strip()
+            logger.info(f"Ollama responded (length: {len(response)} chars)")
+            return response
 
-        except subprocess.TimeoutExpired:
+        except TimeoutError:
             logger.error("Ollama call timed out")
             return "Error: Timeout"
         except Exception as e:
@@ -384,18 +371,15 @@ def main():
 
     # Check if Ollama is available
     try:
-        result = subprocess.run(['ollama', 'list'], capture_output=True, text=True)
-        if result.returncode != 0:
-            print("ERROR: Ollama is not available. Please ensure Ollama is running.")
-            return 1
+        installed = ' '.join(m.get('name', '') for m in get_llm_client('ollama').list_models().get('models', []))
 
         # Check if model is available
-        if 'gemma2:27b' not in result.stdout:
+        if 'gemma2:27b' not in installed:
             print("WARNING: gemma2:27b not found. Checking for alternatives...")
-            if 'gemma2' in result.stdout:
+            if 'gemma2' in installed:
                 print("Using gemma2 (base model)")
                 model = 'gemma2'
-            elif 'llama' in result.stdout:
+            elif 'llama' in installed:
                 print("Using llama3.2")
                 model = 'llama3.2'
             else:
@@ -404,8 +388,8 @@ def main():
         else:
             model = 'gemma2:27b'
 
-    except FileNotFoundError:
-        print("ERROR: Ollama command not found. Please install Ollama first.")
+    except Exception as e:
+        print(f"ERROR: Ollama is not available ({e}). Please ensure Ollama is running.")
         return 1
 
     # Initialize and run pilot
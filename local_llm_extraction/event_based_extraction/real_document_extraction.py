@@ -11,7 +11,6 @@ import json
 import logging
 import pandas as pd
 import boto3
-import base64
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
@@ -21,6 +20,9 @@ import os
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from binary_document_store import BinaryDocumentStore
+from llm_client import get_extraction_client
 
 # Configure logging
 logging.basicConfig(
@@ -32,9 +34,6 @@ logger = logging.getLogger(__name__)
 # Import the query engine from phase4
 from phase4_llm_with_query_capability import StructuredDataQueryEngine
 
-# Import Ollama client
-from ollama import Client
-
 # AWS Configuration for S3 retrieval
 AWS_PROFILE = '343218191717_AWSAdministratorAccess'
 AWS_REGION = 'us-east-1'
@@ -61,6 +60,10 @@ class RealDocumentRetriever:
                 logger.warning(f"S3 not available: {e}. Will use only materialized tables.")
                 self.use_s3 = False
 
+        # Documents already in the local store are served without S3
+        self.document_store = BinaryDocumentStore(
+            s3_client=self.s3_client, s3_bucket=S3_BUCKET, s3_prefix=S3_PREFIX)
+
     def get_imaging_text(self, patient_id: str, target_date: datetime) -> Optional[str]:
         """
         Get actual imaging report text from materialized imaging.csv
@@ -91,28 +94,15 @@ class RealDocumentRetriever:
         """
         Retrieve actual document content from S3
         """
-        if not self.s3_client or not binary_id:
+        if not binary_id:
+            return None
+        if not self.s3_client and binary_id not in self.document_store:
             return None
 
         try:
-            # Format S3 key
-            if binary_id.startswith('Binary/'):
-                s3_binary_id = binary_id[7:]
-            else:
-                s3_binary_id = binary_id
-
-            s3_binary_id = s3_binary_id.replace('.', '_')
-            s3_key = f"{S3_PREFIX}{s3_binary_id}"
-
-            # Get object from S3
-            response = self.s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
-            content = response['Body'].read()
-
-            # Parse JSON and decode base64
-            binary_data = json.loads(content)
-            if 'data' in binary_data:
-                decoded = base64.b64decode(binary_data['data']).decode('utf-8', errors='ignore')
-
+            # Local document store first, S3 only on a miss
+            decoded = self.document_store.get_text(binary_id)
+            if decoded is not None:
                 # Extract text from HTML if needed
                 if '<html' in decoded.lower():
                     soup = BeautifulSoup(decoded, 'html.parser')
@@ -203,8 +193,8 @@ class ClinicalVariableExtractor:
     """
 
     def __init__(self):
-        self.ollama_client = Client(host='http://127.0.0.1:11434')
-        self.model_name = 'gemma2:27b'
+        self.ollama_client = get_extraction_client()
+        self.model_name = self.ollama_client.model
         logger.info(f"Initialized Ollama extractor with {self.model_name}")
 
     def extract_extent_of_resection(self, document_text: str) -> Dict:
@@ -228,7 +218,8 @@ Provide only the extent of resection term:"""
         try:
             response = self.ollama_client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                variable_type='single_value'
             )
             return {
                 'value': response['message']['content'].strip(),
@@ -255,7 +246,8 @@ Provide only the anatomical location:"""
         try:
             response = self.ollama_client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                variable_type='single_value'
             )
             return {
                 'value': response['message']['content'].strip(),
@@ -290,7 +282,8 @@ Provide a brief statement about residual tumor:"""
         try:
             response = self.ollama_client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                variable_type=None  # free-text statement; no stop delimiter
             )
             return {
                 'value': response['message']['content'].strip(),
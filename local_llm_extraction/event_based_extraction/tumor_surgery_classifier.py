@@ -11,6 +11,9 @@ from typing import Dict, List, Optional, Tuple
 import logging
 from datetime import datetime, timedelta
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from staging_store import get_staging_store
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -48,6 +51,7 @@ class TumorSurgeryClassifier:
 
     def __init__(self, staging_path: Path):
         self.staging_path = Path(staging_path)
+        self.staging_store = get_staging_store(self.staging_path)
 
     def classify_procedures(self, procedures_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -215,14 +219,11 @@ class TumorSurgeryClassifier:
     def process_patient(self, patient_id: str) -> Dict[str, pd.DataFrame]:
         """Process a single patient's surgical and imaging data"""
 
-        patient_path = self.staging_path / f"patient_{patient_id}"
-
         results = {}
 
         # Load procedures
-        procedures_file = patient_path / "procedures.csv"
-        if procedures_file.exists():
-            procedures_df = pd.read_csv(procedures_file)
+        procedures_df = self.staging_store.frame(patient_id, 'procedures')
+        if procedures_df is not None:
             tumor_surgeries = self.classify_procedures(procedures_df)
             results['tumor_surgeries'] = tumor_surgeries
         else:
@@ -230,9 +231,8 @@ class TumorSurgeryClassifier:
             results['tumor_surgeries'] = pd.DataFrame()
 
         # Load imaging
-        imaging_file = patient_path / "imaging.csv"
-        if imaging_file.exists():
-            imaging_df = pd.read_csv(imaging_file)
+        imaging_df = self.staging_store.frame(patient_id, 'imaging')
+        if imaging_df is not None:
 
             if not results['tumor_surgeries'].empty:
                 imaging_df = self.map_imaging_to_surgeries(results['tumor_surgeries'], imaging_df)
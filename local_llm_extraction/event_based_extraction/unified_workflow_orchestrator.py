@@ -21,6 +21,9 @@ import argparse
 
 # Import all phase modules
 sys.path.append(str(Path(__file__).parent))
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+
+from staging_store import get_staging_store
 
 from phase2_timeline_builder import ClinicalTimelineBuilder as TimelineBuilder
 from phase3_intelligent_document_selector import IntelligentDocumentSelector
@@ -55,6 +58,9 @@ class UnifiedWorkflowOrchestrator:
         self.output_base = Path(self.config['paths']['output_base'])
         self.output_base.mkdir(exist_ok=True, parents=True)
 
+        # Staging CSVs are read once and shared by every component
+        self.staging_store = get_staging_store(self.staging_base)
+
         # Initialize components
         self._initialize_components()
 
@@ -99,12 +105,12 @@ class UnifiedWorkflowOrchestrator:
         # Phase 2 components
         structured_features = {}  # Will be populated per patient
         self.timeline_builder = TimelineBuilder(self.staging_base, structured_features)
-        self.chemo_identifier = ChemotherapyIdentifier(self.staging_base)
-        self.surgery_classifier = TumorSurgeryClassifier()
+        self.chemo_identifier = ChemotherapyIdentifier()
+        self.surgery_classifier = TumorSurgeryClassifier(self.staging_base)
         self.clinical_prioritizer = ClinicalPrioritizer(self.staging_base)
         self.diagnosis_extractor = DiagnosisExtractor()
-        self.molecular_integrator = MolecularIntegrator()
-        self.problem_analyzer = ProblemListAnalyzer()
+        self.molecular_integrator = MolecularIntegrator(self.staging_base)
+        self.problem_analyzer = ProblemListAnalyzer(self.staging_base)
 
         # Phase 3-5 components
         self.document_selector = IntelligentDocumentSelector(self.staging_base, self.binary_base)
@@ -201,6 +207,9 @@ class UnifiedWorkflowOrchestrator:
             patient_results['status'] = 'failed'
             patient_results['error'] = str(e)
 
+        # Release this patient's staging frames (the columnar files stay for reruns)
+        self.staging_store.evict(patient_id)
+
         return patient_results
 
     def _execute_phase1(self, patient_id: str) -> Dict:
@@ -220,15 +229,14 @@ class UnifiedWorkflowOrchestrator:
         ]
 
         for source in required_sources:
-            file_path = patient_path / f"{source}.csv"
-            if file_path.exists():
-                df = pd.read_csv(file_path)
+            info = self.staging_store.info(patient_id, source)
+            if info is not None:
                 results['data_sources'][source] = {
                     'exists': True,
-                    'record_count': len(df),
-                    'columns': list(df.columns)[:10]  # First 10 columns
+                    'record_count': info['rows'],
+                    'columns': info['columns'][:10]  # First 10 columns
                 }
-                logger.info(f"  ✓ {source}: {len(df)} records")
+                logger.info(f"  ✓ {source}: {info['rows']} records")
             else:
                 results['data_sources'][source] = {'exists': False}
                 logger.warning(f"  ✗ {source}: Not found")
@@ -248,59 +256,83 @@ class UnifiedWorkflowOrchestrator:
             'components': {}
         }
 
+        # Integrated timeline handed to phases 3-5 (keys they look up)
+        integrated_timeline = {}
+
         # 1. Extract diagnosis information
+        diagnosis_info = self.diagnosis_extractor.extract_diagnosis_info(patient_id, self.staging_base)
         if self.config['modules']['tumor_surgery_classification']:
-            diagnosis_info = self.diagnosis_extractor.extract_diagnosis(patient_path)
             results['components']['diagnosis'] = {
                 'date': diagnosis_info.get('diagnosis_date'),
                 'age': diagnosis_info.get('age_at_diagnosis'),
-                'surgery_type': diagnosis_info.get('initial_surgery', {}).get('type')
+                'surgery_type': diagnosis_info.get('initial_surgery_type')
             }
-            logger.info(f"  Diagnosis: {diagnosis_info.get('diagnosis_date')} (age {diagnosis_info.get('age_at_diagnosis'):.1f})")
+            logger.info(f"  Diagnosis: {diagnosis_info.get('diagnosis_date')} (age {diagnosis_info.get('age_at_diagnosis')})")
+        if diagnosis_info.get('diagnosis_date') is not None:
+            integrated_timeline['diagnosis_date'] = diagnosis_info['diagnosis_date']
+            integrated_timeline['age_at_diagnosis'] = diagnosis_info.get('age_at_diagnosis')
 
         # 2. Classify tumor surgeries
         if self.config['modules']['tumor_surgery_classification']:
-            procedures_file = patient_path / 'procedures.csv'
-            if procedures_file.exists():
-                procedures_df = pd.read_csv(procedures_file)
+            procedures_df = self.staging_store.frame(patient_id, 'procedures')
+            if procedures_df is not None:
                 tumor_surgeries = self.surgery_classifier.classify_procedures(procedures_df)
                 results['components']['tumor_surgeries'] = len(tumor_surgeries)
                 logger.info(f"  Tumor surgeries: {len(tumor_surgeries)}")
 
         # 3. Identify chemotherapy
         if self.config['modules']['chemotherapy_identification']:
-            chemo_data = self.chemo_identifier.identify_chemotherapy(patient_id)
-            if chemo_data is not None:
+            medications_df = self.staging_store.frame(patient_id, 'medications')
+            if medications_df is not None:
+                chemo_data, _ = self.chemo_identifier.identify_chemotherapy(medications_df)
+                periods = self.chemo_identifier.extract_treatment_periods(chemo_data) if not chemo_data.empty else pd.DataFrame()
+                period_records = periods.to_dict('records')
                 results['components']['chemotherapy'] = {
                     'medications_identified': len(chemo_data),
-                    'treatment_periods': self.chemo_identifier.extract_treatment_periods(chemo_data)
+                    'treatment_periods': period_records
                 }
+                integrated_timeline['chemotherapy_periods'] = [
+                    {'drug': p['drug_name'], 'start_date': p['start_date'], 'end_date': p.get('end_date')}
+                    for p in period_records
+                ]
+                integrated_timeline['treatment_phases'] = [
+                    {'phase': 'chemotherapy', 'start_date': p['start_date']}
+                    for p in sorted(period_records, key=lambda p: p['start_date'])
+                ]
                 logger.info(f"  Chemotherapy: {len(chemo_data)} medications")
 
         # 4. Integrate molecular testing
         if self.config['modules']['molecular_integration']:
             molecular_file = patient_path / 'molecular_tests_metadata.csv'
             if molecular_file.exists():
-                molecular_df = pd.read_csv(molecular_file)
-                molecular_info = self.molecular_integrator._create_integrated_diagnosis(
-                    diagnosis_info,
-                    molecular_df,
-                    {}
-                )
+                molecular_info = self.molecular_integrator.extract_molecular_diagnosis(patient_id)
                 results['components']['molecular_tests'] = molecular_info.get('molecular_testing', {})
                 logger.info(f"  Molecular tests: {molecular_info.get('molecular_testing', {}).get('tests_performed', 0)}")
 
         # 5. Analyze problem list
         if self.config['modules']['problem_list_analysis']:
-            problem_file = patient_path / 'problem_list.csv'
-            if problem_file.exists():
-                problem_df = pd.read_csv(problem_file)
-                problem_analysis = self.problem_analyzer.analyze_problems(problem_df)
-                results['components']['problems'] = problem_analysis['summary']
-                logger.info(f"  Problem list: {problem_analysis['summary']['total_problems']} problems")
-
-        # Build integrated timeline
-        integrated_timeline = self.timeline_builder.build_timeline(patient_id)
+            problem_analysis = self.problem_analyzer.analyze_problem_list(patient_id)
+            if problem_analysis:
+                results['components']['problems'] = {
+                    'total_problems': problem_analysis['total_problems'],
+                    'active_problems': problem_analysis['active_problems']
+                }
+                logger.info(f"  Problem list: {problem_analysis['total_problems']} problems")
+
+        # 6. Last contact and birth date (survival endpoints)
+        endpoints = self.clinical_prioritizer.extract_survival_endpoints(patient_id)
+        if endpoints.get('last_clinical_contact') is not None:
+            integrated_timeline['last_contact'] = endpoints['last_clinical_contact']
+
+        # Build event timeline (event ages need a birth date)
+        if endpoints.get('date_of_birth'):
+            integrated_timeline['date_of_birth'] = endpoints['date_of_birth']
+            events = self.timeline_builder.build_timeline(patient_id, endpoints['date_of_birth'])
+            integrated_timeline['chronological_events'] = [
+                {'event_type': e.event_type, 'date': e.event_date, 'description': e.description}
+                for e in events
+            ]
+            results['components']['timeline'] = self.timeline_builder.get_timeline_summary()
         results['integrated_timeline'] = integrated_timeline
 
         # Save timeline
@@ -540,6 +572,7 @@ class UnifiedWorkflowOrchestrator:
 
         # Save final results
         self._save_cohort_results(cohort_results, summary_df)
+        logger.info(self.staging_store.summary())
 
         return summary_df
 
@@ -550,7 +583,13 @@ class UnifiedWorkflowOrchestrator:
             json.dump(results, f, indent=2, default=str)
 
     def _generate_cohort_summary(self, cohort_results: List[Dict]) -> pd.DataFrame:
-        """Generate summary statistics for cohort"""
+        """
+        Generate summary statistics for cohort
+
+        Reads the phase results of process_patient (diagnosis, selected documents,
+        BRIM and validation metrics); those are not in the staging tables, so this
+        is not a CohortCatalog query.
+        """
         summary_data = []
 
         for patient_result in cohort_results:
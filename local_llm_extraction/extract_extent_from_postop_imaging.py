@@ -8,18 +8,29 @@ import pandas as pd
 import json
 from datetime import datetime, timedelta
 from pathlib import Path
-from ollama import Client
 import logging
 
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from llm_client import get_extraction_client
+from document_chunking import chunk_document, merge_window_answers, select_windows
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_extent_from_postop_imaging(patient_id: str, surgery_date: str):
+# Report windows sent to the model (instead of truncating reports at 2,000 characters)
+REPORT_WINDOW_TOKENS = 500
+MAX_REPORT_WINDOWS = 3
+EXTENT_KEYWORDS = ['debulk*', 'resect*', 'residual', 'extent', 'gross total', 'subtotal', 'near total',
+                   'partial', 'biopsy', 'impression', 'enhanc*', 'postoperative', 'cavity']
+
+STAGING_DIR = '/Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/athena_extraction_validation/staging_files'
+
+def extract_extent_from_postop_imaging(patient_id: str, surgery_date: str, staging_dir: str = STAGING_DIR):
     """
     Extract extent of resection specifically from post-operative imaging
     """
 
-    staging_dir = Path('/Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/athena_extraction_validation/staging_files')
+    staging_dir = Path(staging_dir)
     imaging_path = staging_dir / f'patient_{patient_id}' / 'imaging.csv'
 
     if not imaging_path.exists():
@@ -40,17 +51,21 @@ def extract_extent_from_postop_imaging(patient_id: str, surgery_date: str):
     ]
 
     results = []
-    ollama_client = Client(host='http://127.0.0.1:11434')
+    ollama_client = get_extraction_client()
 
     # Limit to first 3 reports to avoid timeout
     for idx, row in post_op_imaging.head(3).iterrows():
         if pd.notna(row.get('result_information', '')):
 
-            # Create targeted prompt for extent extraction - reduced text for speed
-            prompt = f"""You are reviewing a post-operative MRI report to determine the extent of tumor resection.
+            # Create targeted prompt for extent extraction - one per report window mentioning the resection
+            windows = chunk_document(row['result_information'], REPORT_WINDOW_TOKENS)
+            prompts = []
+            for window in select_windows(windows, EXTENT_KEYWORDS, max_windows=MAX_REPORT_WINDOWS):
+                excerpt = f", excerpt {window['index'] + 1} of {len(windows)}" if len(windows) > 1 else ''
+                prompts.append(f"""You are reviewing a post-operative MRI report to determine the extent of tumor resection.
 
-Post-operative MRI Report (Date: {row['imaging_date'].date()}):
-{row['result_information'][:2000]}
+Post-operative MRI Report (Date: {row['imaging_date'].date()}{excerpt}):
+{window['text']}
 
 Extract the extent of resection using these EXACT terms:
 - Gross total resection (GTR) or "complete resection"
@@ -66,15 +81,18 @@ Look for key phrases like:
 - "extent of resection"
 - percentage removed
 
-Provide ONLY the extent category:"""
+Provide ONLY the extent category:""")
 
             try:
-                response = ollama_client.chat(
-                    model='gemma2:27b',
-                    messages=[{'role': 'user', 'content': prompt}]
-                )
-
-                extracted_extent = response['message']['content'].strip()
+                answers = []
+                for prompt in prompts:
+                    response = ollama_client.chat(
+                        messages=[{'role': 'user', 'content': prompt}],
+                        variable_type='single_value'
+                    )
+                    answers.append(response['message']['content'].strip())
+
+                extracted_extent = merge_window_answers(answers)
 
                 # Skip supporting text extraction to save time - just look for key terms
                 result_text = row['result_information'].lower()
@@ -18,9 +18,53 @@ Usage:
     # With local Ollama model
     python3 local_llm_extraction_pipeline_with_ollama.py <config_file> --model ollama --ollama-model llama3.1:70b
 
+    # Several variables per document prompt (one JSON answer per call)
+    python3 local_llm_extraction_pipeline_with_ollama.py <config_file> --batch-variables --context-tokens 32768
+
 Requirements:
-    - For Claude: anthropic package, ANTHROPIC_API_KEY
-    - For Ollama: ollama package, Ollama running locally
+    - For Claude: ANTHROPIC_API_KEY
+    - For Ollama: Ollama running locally (OLLAMA_HOST, default http://127.0.0.1:11434)
+
+Both backends go through the shared pooled client (src/llm_client.py): answers
+are streamed, single-value answers (see answer_type) are cut at the answer
+delimiter, and latency/token/error counters are logged at the end of the run.
+
+With LLM_CACHE_DIR set, responses are cached on disk (src/llm_response_cache.py,
+owner-only directory holding extracted patient values), so re-runs only call
+the model for prompts that changed.
+
+Calls run through the shared LLM scheduler (src/llm_scheduler.py): up to
+--max-in-flight concurrent calls per backend, one_per_patient variables first,
+failed calls retried with backoff.
+
+Each variable only goes to the documents its relevance spec matches
+(src/document_relevance_index.py: BM25 over NOTE_TITLE/NOTE_TEXT, built in
+load_input_files). Skipped (variable, document) pairs are written with their
+reason to skipped_extractions_<patient>.csv. Disable with --no-relevance-filter.
+
+Notes longer than the prompt budget (--context-tokens, or --chunk-tokens) are
+split at section headers and sentence boundaries into windows
+(src/document_chunking.py); only windows mentioning the variable's keywords are
+sent, and the per-window answers are merged.
+
+Progress is journaled per (variable, document) to
+checkpoints/extraction_journal_<patient>.jsonl (src/extraction_journal.py). A
+re-run resumes after the last completed pair without prompting; --no-resume
+starts over. Check a running extraction with:
+    python3 src/extraction_journal.py <output_dir>/checkpoints/extraction_journal_<patient>.jsonl
+
+Prompts put the document before the variable's task (src/prompt_layout.py) and
+calls are queued document by document, so consecutive calls share a prefix the
+backend can reuse: Ollama keeps the model and its KV cache loaded
+(ollama_keep_alive in the config, default 30m) and Anthropic calls mark the
+document with a cache_control breakpoint.
+
+With --early-exit, one_per_patient variables visit their documents in priority
+order (Phase 3 priority_score column if present, else document type and
+relevance score) and stop once --early-exit-agreement answers agree
+(src/evidence_accumulation.py). Documents not consulted are recorded in
+skipped_extractions_<patient>.csv, and one row per variable (consensus value,
+consulted NOTE_IDs) goes to early_exit_<patient>.csv.
 """
 
 import os
@@ -31,9 +75,24 @@ import logging
 import pickle
 import json
 import argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from llm_client import get_llm_client
+from llm_response_cache import CachedOllamaClient
+from llm_scheduler import PRIORITY_DEFAULT, get_scheduler, scope_priority
+from document_relevance_index import DocumentRelevanceIndex, relevance_spec
+from document_chunking import chunk_document, merge_window_answers, select_windows
+from extraction_journal import ExtractionJournal
+from evidence_accumulation import DEFAULT_AGREEMENT, DEFAULT_MIN_SHARE, EvidenceAccumulator, document_priority_order
+from prompt_layout import (DEFAULT_OLLAMA_KEEP_ALIVE, batch_extraction_task, document_prefix,
+                           extraction_task)
+
+sys.path.append(str(Path(__file__).resolve().parent / 'event_based_extraction'))
 
 # Configure logging
 logging.basicConfig(
@@ -42,11 +101,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Batched extraction sizing (rough estimate: ~4 characters per token)
+CHARS_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 300
+BATCH_ANSWER_TOKENS = 256
+DEFAULT_CONTEXT_TOKENS = {'ollama': 8192, 'claude': 200000}
+DEFAULT_MAX_BATCH_VARIABLES = 20
+
+# BRIM variable types whose answer is one value
+SINGLE_VALUE_TYPES = ('boolean', 'integer', 'float', 'date')
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count for prompt budgeting"""
+    return len(str(text)) // CHARS_PER_TOKEN + 1
+
+
+def parse_batch_response(response: str, variable_names: List[str]) -> Dict[str, str]:
+    """
+    Parse a batched extraction answer (JSON object keyed by variable name)
+
+    Returns:
+        Dict of variable_name -> extracted value for the variables that were
+        answered; missing, null or unparseable answers are left out
+    """
+    text = response.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        if text.startswith('json'):
+            text = text[4:]
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return {}
+    try:
+        answer = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+
+    values = {}
+    for name in variable_names:
+        value = answer.get(name)
+        if value is None:
+            continue
+        values[name] = value.strip() if isinstance(value, str) else json.dumps(value)
+    return values
+
+
+def answer_type(variable) -> Optional[str]:
+    """
+    llm_client variable type of a variable's extraction calls
+
+    'single_value' (the answer is cut at the first blank line) for a variable
+    that is not many_per_note and has option_definitions or a boolean, integer,
+    float or date variable_type; otherwise its scope (the answer runs to the end).
+    """
+    scope = variable.get('scope')
+    options = variable.get('option_definitions')
+    single = (isinstance(options, str) and options.strip()) or variable.get('variable_type') in SINGLE_VALUE_TYPES
+    if single and scope != 'many_per_note':
+        return 'single_value'
+    return scope
+
 
 class LocalLLMExtractionPipeline:
     """Mimics BRIM extraction using Claude API or Ollama locally"""
 
-    def __init__(self, config_file: str, use_ollama: bool = False, ollama_model: str = "llama3.1:70b"):
+    def __init__(self, config_file: str, use_ollama: bool = False, ollama_model: str = "llama3.1:70b",
+                 batch_variables: bool = False, context_tokens: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, relevance_filter: Optional[bool] = None,
+                 chunk_tokens: Optional[int] = None, resume: Optional[bool] = None,
+                 early_exit: Optional[bool] = None, early_exit_agreement: Optional[int] = None):
         """Initialize pipeline with configuration"""
         with open(config_file, 'r') as f:
             self.config = yaml.safe_load(f)
@@ -75,42 +201,57 @@ class LocalLLMExtractionPipeline:
         # Checkpoint settings
         self.checkpoint_dir = self.output_dir / "checkpoints"
         self.checkpoint_dir.mkdir(exist_ok=True)
-        self.checkpoint_file = self.checkpoint_dir / f"extraction_checkpoint_{self.patient_fhir_id}.pkl"
+        self.checkpoint_file = self.checkpoint_dir / f"extraction_checkpoint_{self.patient_fhir_id}.pkl"  # legacy
+        self.journal = ExtractionJournal(self.checkpoint_dir / f"extraction_journal_{self.patient_fhir_id}.jsonl")
+        self.resume = self.config.get('resume', True) if resume is None else resume
         self.completed_variables = set()  # Track which variables are done
+        self.completed_pairs = set()  # (variable_name, NOTE_ID) pairs done in a previous run
 
         # Initialize LLM client (Claude or Ollama)
         self.use_ollama = use_ollama
         self.ollama_model = ollama_model
 
+        # Batched mode: several variables per document prompt, sized to the model's context
+        self.batch_variables = batch_variables or self.config.get('batch_variables', False)
+        self.context_tokens = (context_tokens or self.config.get('context_tokens')
+                               or DEFAULT_CONTEXT_TOKENS['ollama' if use_ollama else 'claude'])
+        self.max_batch_variables = self.config.get('max_batch_variables', DEFAULT_MAX_BATCH_VARIABLES)
+
+        # Long notes are split into windows of at most chunk_tokens (default: whatever fits the context)
+        self.chunk_tokens = chunk_tokens or self.config.get('chunk_tokens')
+        self.chunk_stats = {'notes_chunked': 0, 'windows': 0, 'windows_sent': 0}
+
+        # Relevance pre-filter: variables skip documents their relevance spec does not match
+        self.relevance_filter = (self.config.get('relevance_filter', True) if relevance_filter is None
+                                 else relevance_filter)
+        self.relevance_specs = self.config.get('relevance_specs') or {}
+        self.relevance_index = None
+        self.skipped_extractions = []  # (variable, document) pairs not sent to the LLM, with reason
+
+        # Early exit: one_per_patient variables stop once enough answers agree
+        self.early_exit = self.config.get('early_exit', False) if early_exit is None else early_exit
+        self.early_exit_agreement = (early_exit_agreement or self.config.get('early_exit_agreement')
+                                     or DEFAULT_AGREEMENT)
+        self.early_exit_min_share = self.config.get('early_exit_min_share', DEFAULT_MIN_SHARE)
+        self.early_exit_results = []  # one row per early-exit variable: consensus and consulted documents
+
+        # Shared pooled client of the backend (raises if ANTHROPIC_API_KEY is missing for Claude)
+        self.backend = 'ollama' if use_ollama else 'anthropic'
+        self.llm_client = CachedOllamaClient(get_llm_client(self.backend))
         if use_ollama:
-            try:
-                import ollama
-                self.ollama_client = ollama
-                self.model = ollama_model
-                logger.info("Using Ollama for local inference")
-            except ImportError:
-                raise ImportError(
-                    "ollama package not found. Install with: pip install ollama\n"
-                    "Also make sure Ollama is running: ollama serve"
-                )
+            self.model = ollama_model
+            # Keep the model (and the KV cache of the shared document prefix) loaded between calls
+            self.ollama_keep_alive = self.config.get('ollama_keep_alive', DEFAULT_OLLAMA_KEEP_ALIVE)
+            logger.info("Using Ollama for local inference")
         else:
-            try:
-                import anthropic
-                api_key = os.environ.get('ANTHROPIC_API_KEY')
-                if not api_key:
-                    raise ValueError(
-                        "ANTHROPIC_API_KEY environment variable not set.\n"
-                        "Set it with: export ANTHROPIC_API_KEY='your-api-key'\n"
-                        "Or use --model ollama for free local inference"
-                    )
-                self.client = anthropic.Anthropic(api_key=api_key)
-                self.model = "claude-sonnet-4-20250514"
-                logger.info("Using Claude API (Anthropic)")
-            except ImportError:
-                raise ImportError(
-                    "anthropic package not found. Install with: pip install anthropic\n"
-                    "Or use --model ollama for free local inference"
-                )
+            self.model = self.llm_client.model
+            logger.info("Using Claude API (Anthropic)")
+
+        # All LLM calls go through the shared scheduler (concurrency limit, priority, retries)
+        self.scheduler = get_scheduler()
+        max_in_flight = max_in_flight or self.config.get('max_in_flight')
+        if max_in_flight:
+            self.scheduler.configure_backend(self.backend, max_in_flight)
 
         logger.info("="*80)
         logger.info("LOCAL LLM EXTRACTION PIPELINE (BRIM Mimic)")
@@ -119,51 +260,70 @@ class LocalLLMExtractionPipeline:
         logger.info(f"Person ID: {self.person_id}")
         logger.info(f"Model Provider: {'Ollama (Local)' if use_ollama else 'Claude API (Cloud)'}")
         logger.info(f"Model: {self.model}")
+        logger.info(f"Max concurrent LLM calls: {self.scheduler.max_in_flight.get(self.backend, 1)}")
+        logger.info(f"Document relevance filter: {'enabled' if self.relevance_filter else 'disabled'}")
+        if self.chunk_tokens:
+            logger.info(f"Long notes split into windows of up to {self.chunk_tokens} tokens")
+        if self.early_exit:
+            logger.info(f"Early exit: one_per_patient variables stop at {self.early_exit_agreement} agreeing answers")
+        if self.batch_variables:
+            logger.info(f"Batched extraction: up to {self.max_batch_variables} variables per prompt, "
+                        f"{self.context_tokens} token context")
         logger.info("="*80 + "\n")
 
+    def record_result(self, row: Dict):
+        """Store one (variable, document) result and append it to the journal"""
+        self.variable_results.append(row)
+        self.journal.append_result(row)
+
     def save_checkpoint(self, variable_name: str):
-        """Save current extraction progress to checkpoint file"""
-        checkpoint_data = {
-            'variable_results': self.variable_results,
-            'completed_variables': self.completed_variables,
-            'last_variable': variable_name,
-            'timestamp': datetime.now().isoformat()
-        }
-        with open(self.checkpoint_file, 'wb') as f:
-            pickle.dump(checkpoint_data, f)
+        """Mark a variable as completed in the journal (its results are already journaled)"""
+        self.journal.mark_variable_complete(variable_name)
         logger.info(f"  ✓ Checkpoint saved after completing {variable_name}")
 
     def load_checkpoint(self):
-        """Load checkpoint if it exists"""
-        if self.checkpoint_file.exists():
-            logger.info(f"Found checkpoint file: {self.checkpoint_file}")
+        """Resume from the extraction journal if it exists (no prompt; resume=False starts over)"""
+        if not self.resume:
+            if self.journal.exists() or self.checkpoint_file.exists():
+                logger.info("Discarding previous checkpoint (resume disabled)")
+            self.journal.reset()
+            if self.checkpoint_file.exists():
+                self.checkpoint_file.unlink()
+            return False
+
+        if self.checkpoint_file.exists() and not self.journal.exists():
+            # Checkpoint from an older version: move it into the journal
             with open(self.checkpoint_file, 'rb') as f:
                 checkpoint_data = pickle.load(f)
+            for row in checkpoint_data['variable_results']:
+                self.journal.append_result(row)
+            for variable_name in checkpoint_data['completed_variables']:
+                self.journal.mark_variable_complete(variable_name)
+            self.checkpoint_file.unlink()
+            logger.info(f"Converted pickle checkpoint to journal: {self.journal.path}")
 
-            self.variable_results = checkpoint_data['variable_results']
-            self.completed_variables = checkpoint_data['completed_variables']
-
-            logger.info(f"  Loaded {len(self.variable_results)} extraction results")
-            logger.info(f"  Completed variables: {sorted(self.completed_variables)}")
-            logger.info(f"  Last checkpoint: {checkpoint_data['timestamp']}")
-
-            # Ask user if they want to resume
-            response = input("\nDo you want to resume from this checkpoint? (yes/no): ").lower()
-            if response in ['yes', 'y']:
-                logger.info("  Resuming from checkpoint...")
-                return True
-            else:
-                logger.info("  Starting fresh extraction...")
-                self.variable_results = []
-                self.completed_variables = set()
-                return False
-        return False
+        if not self.journal.exists():
+            return False
+
+        logger.info(f"Found checkpoint journal: {self.journal.path}")
+        self.variable_results, self.completed_pairs, self.completed_variables = self.journal.load()
+        logger.info(f"  Loaded {len(self.variable_results)} extraction results")
+        logger.info(f"  Completed variables: {sorted(self.completed_variables)}")
+        logger.info("  Resuming from checkpoint...")
+        return True
 
     def cleanup_checkpoint(self):
-        """Remove checkpoint file after successful completion"""
-        if self.checkpoint_file.exists():
-            self.checkpoint_file.unlink()
-            logger.info("  ✓ Checkpoint file removed after successful completion")
+        """Remove checkpoint journal after successful completion"""
+        if self.journal.exists():
+            self.journal.reset()
+            logger.info("  ✓ Checkpoint journal removed after successful completion")
+
+    def sort_variable_results(self):
+        """Order variable_results as a single uninterrupted run would: variables file order, then document order"""
+        variable_order = {name: i for i, name in enumerate(self.variables_df['variable_name'])}
+        note_order = {str(note_id): i for i, note_id in enumerate(self.project_df['NOTE_ID'])}
+        self.variable_results.sort(key=lambda row: (variable_order.get(row['variable_name'], -1),
+                                                    note_order.get(str(row['NOTE_ID']), -1)))
 
     def load_input_files(self):
         """Load the 3 BRIM input CSV files"""
@@ -182,6 +342,13 @@ class LocalLLMExtractionPipeline:
 
         logger.info(f"  Loaded project.csv: {len(self.project_df)} documents")
 
+        # Relevance index over the documents (one per patient, shared by all variables)
+        if self.relevance_filter:
+            self.project_df = self.project_df.reset_index(drop=True)
+            self.relevance_index = DocumentRelevanceIndex(self.project_df, text_columns=['NOTE_TEXT'],
+                                                          title_columns=['NOTE_TITLE'], id_column='NOTE_ID')
+            logger.info(f"  Built relevance index: {len(self.relevance_index.vocabulary)} terms")
+
         # Variables file (extraction instructions)
         variables_file = self.output_dir / f"variables_{self.patient_fhir_id}.csv"
         if not variables_file.exists():
@@ -202,77 +369,262 @@ class LocalLLMExtractionPipeline:
         self.decisions_df = pd.read_csv(decisions_file)
         logger.info(f"  Loaded decisions.csv: {len(self.decisions_df)} decisions\n")
 
-    def call_llm(self, prompt: str, max_tokens: int = 1024) -> str:
+    def variable_relevance_spec(self, variable_name: str) -> Optional[Dict]:
+        """Relevance spec (keywords, top_k, min_score) for a variable, or None"""
+        variable_row = None
+        if self.variables_df is not None:
+            rows = self.variables_df[self.variables_df['variable_name'] == variable_name]
+            if len(rows):
+                variable_row = rows.iloc[0]
+        return relevance_spec(variable_name, variable_row, self.relevance_specs)
+
+    def select_documents(self, variable_row) -> pd.DataFrame:
+        """
+        Documents to extract a variable from (relevance pre-filter)
+
+        Pairs that are skipped are recorded in self.skipped_extractions with their reason.
+
+        Returns:
+            Subset of project_df, in file order
+        """
+        variable_name = variable_row['variable_name']
+        spec = self.variable_relevance_spec(variable_name)
+        if self.relevance_index is None or spec is None:
+            return self.project_df
+
+        selected, skipped = self.relevance_index.select(spec)
+        for position, reason in sorted(skipped.items()):
+            doc_row = self.project_df.iloc[position]
+            self.skipped_extractions.append({
+                'PERSON_ID': self.person_id,
+                'NOTE_ID': doc_row['NOTE_ID'],
+                'NOTE_TITLE': doc_row['NOTE_TITLE'],
+                'variable_name': variable_name,
+                'skip_reason': reason
+            })
+        return self.project_df.iloc[selected]
+
+    def _call_backend(self, prompt: str, max_tokens: Optional[int] = None, json_output: bool = False,
+                      cache_prefix: Optional[str] = None, variable_type: Optional[str] = None):
+        """
+        Single raw LLM client call (run by the scheduler; raises on failure)
+
+        Args:
+            max_tokens: Generation budget (default: the variable type's, see llm_client)
+            cache_prefix: Leading part of the prompt shared with other calls (the
+                          document); marked as an Anthropic prompt-cache breakpoint
+            variable_type: answer_type() of the variable, 'batch' or 'decision'; sets
+                           max tokens and the answer delimiter (if any) the stream stops at
+
+        Returns:
+            Ollama-style response dict (both backends)
+        """
+        options = {"temperature": 0.0}
+        if self.use_ollama and self.batch_variables:
+            options["num_ctx"] = self.context_tokens
+        return self.llm_client.chat(
+            model=self.model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            options=options,
+            variable_type=variable_type,
+            max_tokens=max_tokens,
+            cache_prefix=cache_prefix,
+            **({"keep_alive": self.ollama_keep_alive} if self.use_ollama else {}),
+            **({"format": "json"} if json_output else {})
+        )
+
+    def submit_llm(self, prompt: str, max_tokens: Optional[int] = None, json_output: bool = False,
+                   priority: int = PRIORITY_DEFAULT, cache_prefix: Optional[str] = None,
+                   variable_type: Optional[str] = None) -> Future:
+        """
+        Queue an LLM call on the shared scheduler without waiting for it
+
+        Returns:
+            Future of the raw response; pass it to llm_result()
+        """
+        return self.scheduler.submit(self._call_backend, prompt, max_tokens, json_output, cache_prefix,
+                                     variable_type, backend=self.backend, priority=priority)
+
+    def llm_result(self, future: Future) -> str:
+        """
+        Response text of a submitted call
+
+        Returns:
+            Response text, or "ERROR" if the call failed after retries
+        """
+        try:
+            return future.result()['message']['content'].strip()
+        except Exception as e:
+            logger.error(f"{'Ollama' if self.use_ollama else 'Claude API'} error: {e}")
+            return "ERROR"
+
+    def call_llm(self, prompt: str, max_tokens: Optional[int] = None, json_output: bool = False,
+                 priority: int = PRIORITY_DEFAULT, cache_prefix: Optional[str] = None,
+                 variable_type: Optional[str] = None) -> str:
         """
         Call LLM (Claude or Ollama) with given prompt
 
+        Args:
+            prompt: Prompt text
+            max_tokens: Maximum tokens to generate (default: the variable type's)
+            json_output: Constrain Ollama output to JSON (batched extraction)
+            priority: Scheduler priority (lower runs first)
+            cache_prefix: Leading part of the prompt shared with other calls (see _call_backend)
+            variable_type: answer_type() of the variable, 'batch' or 'decision' (see _call_backend)
+
         Returns:
             Response text
         """
-        if self.use_ollama:
-            # Call Ollama
-            try:
-                response = self.ollama_client.chat(
-                    model=self.model,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ],
-                    options={
-                        "temperature": 0.0,
-                        "num_predict": max_tokens
-                    }
-                )
-                return response['message']['content'].strip()
-            except Exception as e:
-                logger.error(f"Ollama error: {e}")
-                return "ERROR"
-        else:
-            # Call Claude API
-            try:
-                message = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=max_tokens,
-                    temperature=0,
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                return message.content[0].text.strip()
-            except Exception as e:
-                logger.error(f"Claude API error: {e}")
-                return "ERROR"
+        return self.llm_result(self.submit_llm(prompt, max_tokens, json_output, priority, cache_prefix,
+                                               variable_type))
+
+    def build_extraction_prompt(self, instruction: str, note_id: str, note_text: str, note_title: str) -> str:
+        """
+        Prompt for extracting a single variable from a single document
+
+        The document comes before the task, so every variable asked of a document
+        shares document_prefix() and the backend can reuse its cached prefix.
+        """
+        return document_prefix(note_id, note_title, note_text) + extraction_task(instruction)
+
+    def window_budget(self, instruction: str) -> int:
+        """Tokens of note text that fit in one extraction prompt with this instruction"""
+        budget = self.context_tokens - PROMPT_OVERHEAD_TOKENS - estimate_tokens(instruction) - BATCH_ANSWER_TOKENS
+        if self.chunk_tokens:
+            budget = min(budget, self.chunk_tokens)
+        return max(budget, 256)
+
+    def submit_extraction(self, variable_name: str, instruction: str, note_id: str, note_text: str,
+                          note_title: str, priority: int = PRIORITY_DEFAULT,
+                          variable_type: Optional[str] = None) -> List[Future]:
+        """
+        Queue the LLM call(s) extracting a variable from a document
+
+        A note within the prompt budget is one call. A longer note is split into
+        windows (section headers, sentence boundaries) and one call is queued per
+        window that mentions the variable's relevance keywords.
+
+        Returns:
+            One future per call; combine the answers with merge_window_answers
+        """
+        budget = self.window_budget(instruction)
+        if estimate_tokens(note_text) <= budget:
+            prompt = self.build_extraction_prompt(instruction, note_id, note_text, note_title)
+            return [self.submit_llm(prompt, priority=priority, variable_type=variable_type,
+                                    cache_prefix=document_prefix(note_id, note_title, note_text))]
+
+        windows = chunk_document(note_text, budget)
+        spec = self.variable_relevance_spec(variable_name)
+        selected = select_windows(windows, spec['keywords'] if spec else None)
+        self.chunk_stats['notes_chunked'] += 1
+        self.chunk_stats['windows'] += len(windows)
+        self.chunk_stats['windows_sent'] += len(selected)
+
+        futures = []
+        for window in selected:
+            section = f", section {window['section']}" if window['section'] else ''
+            excerpt = f"[Excerpt {window['index'] + 1} of {len(windows)}{section}]\n{window['text']}"
+            prompt = self.build_extraction_prompt(instruction, note_id, excerpt, note_title)
+            futures.append(self.submit_llm(prompt, priority=priority, variable_type=variable_type,
+                                           cache_prefix=document_prefix(note_id, note_title, excerpt)))
+        return futures
 
     def extract_variable_from_document(self, variable_name: str, instruction: str,
-                                      note_id: str, note_text: str, note_title: str) -> str:
+                                      note_id: str, note_text: str, note_title: str,
+                                      variable_type: Optional[str] = None) -> str:
         """
         Extract a single variable from a single document using LLM
 
+        Args:
+            variable_type: answer_type() of the variable (sets max tokens and the answer delimiter)
+
         Returns:
             Extracted value as string
         """
-        # Build extraction prompt
-        prompt = f"""You are a medical data extraction assistant. Your task is to extract specific information from clinical documents.
+        futures = self.submit_extraction(variable_name, instruction, note_id, note_text, note_title,
+                                         variable_type=variable_type)
+        return merge_window_answers([self.llm_result(future) for future in futures])
 
-DOCUMENT INFORMATION:
-- NOTE_ID: {note_id}
-- NOTE_TITLE: {note_title}
+    def submit_variable_batch(self, variables: List[Dict], note_id: str, note_text: str, note_title: str,
+                              priority: int = PRIORITY_DEFAULT) -> Future:
+        """
+        Queue one LLM call extracting several variables from a single document
 
-EXTRACTION TASK:
-{instruction}
+        The model answers with a JSON object keyed by variable name (see batch_answers).
 
-DOCUMENT TEXT:
-{note_text}
+        Args:
+            variables: Variable rows with 'variable_name' and 'instruction'
 
-INSTRUCTIONS:
-1. Read the document carefully
-2. Extract ONLY the requested information following the exact format specified
-3. If the information is not found or not applicable, return the default value specified in the instruction
-4. Return ONLY the extracted value, no explanation or preamble
+        Returns:
+            Future of the raw response; pass it to batch_answers()
+        """
+        prefix = document_prefix(note_id, note_title, note_text)
+        prompt = prefix + batch_extraction_task(variables)
+        return self.submit_llm(prompt, max_tokens=BATCH_ANSWER_TOKENS * len(variables), json_output=True,
+                               priority=priority, cache_prefix=prefix, variable_type='batch')
 
-EXTRACTED VALUE:"""
+    def batch_answers(self, variables: List[Dict], future: Future, note_id: str) -> Tuple[Dict[str, str], List[Dict]]:
+        """
+        Values of a submitted batch call
 
-        result = self.call_llm(prompt, max_tokens=1024)
-        return result
+        Returns:
+            Dict of variable_name -> extracted value as string, and the variables the
+            answer left out (or could not be parsed for), to extract individually
+        """
+        variable_names = [variable['variable_name'] for variable in variables]
+        response = self.llm_result(future)
+        if response == "ERROR":
+            return {name: response for name in variable_names}, []
+
+        values = parse_batch_response(response, variable_names)
+        missing = [variable for variable in variables if variable['variable_name'] not in values]
+        for variable in missing:
+            logger.warning(f"  No batched answer for {variable['variable_name']} in {note_id}, "
+                           f"extracting individually")
+        return values, missing
+
+    def group_compatible_variables(self, variables: List[Dict]) -> List[List[Dict]]:
+        """
+        Group variables that can share a prompt: same scope, at most max_batch_variables each
+        (split into evenly sized groups)
+        """
+        by_scope = {}
+        for variable in variables:
+            scope = variable.get('scope', 'many_per_note')
+            by_scope.setdefault('many_per_note' if pd.isna(scope) else scope, []).append(variable)
+
+        groups = []
+        for scope_variables in by_scope.values():
+            n_groups = -(-len(scope_variables) // self.max_batch_variables)
+            size = -(-len(scope_variables) // n_groups)
+            for start in range(0, len(scope_variables), size):
+                groups.append(scope_variables[start:start + size])
+        return groups
+
+    def plan_variable_batches(self, variables: List[Dict], note_text: str) -> List[List[Dict]]:
+        """
+        Split a variable group into batches whose prompt, note and answers fit context_tokens
+
+        A note too long to share the context (or longer than chunk_tokens) yields
+        single-variable batches, which are windowed by extract_variable_from_document.
+        """
+        if self.chunk_tokens and estimate_tokens(note_text) > self.chunk_tokens:
+            return [[variable] for variable in variables]
+        available = self.context_tokens - estimate_tokens(note_text) - PROMPT_OVERHEAD_TOKENS
+
+        batches, current, used = [], [], 0
+        for variable in variables:
+            cost = estimate_tokens(variable['instruction']) + BATCH_ANSWER_TOKENS
+            if current and used + cost > available:
+                batches.append(current)
+                current, used = [], 0
+            current.append(variable)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
 
     def extract_variables(self):
         """Extract all variables from all documents"""
@@ -280,66 +632,402 @@ EXTRACTED VALUE:"""
         logger.info("STEP 1: VARIABLE EXTRACTION")
         logger.info("="*80 + "\n")
 
-        total_extractions = len(self.variables_df) * len(self.project_df)
+        self.skipped_extractions = []
+        documents = {variable_row['variable_name']: self.select_documents(variable_row)
+                     for _, variable_row in self.variables_df.iterrows()}
+
+        total_extractions = sum(len(docs) for docs in documents.values())
         logger.info(f"Total extractions to perform: {total_extractions}")
-        logger.info(f"  ({len(self.variables_df)} variables × {len(self.project_df)} documents)\n")
+        logger.info(f"  ({len(self.variables_df)} variables × {len(self.project_df)} documents, "
+                    f"{len(self.skipped_extractions)} pairs skipped by relevance filter)\n")
 
-        extraction_count = 0
+        if self.early_exit:
+            self.extract_variables_early_exit(documents)
+
+        if self.batch_variables:
+            self.extract_variables_batched(total_extractions, documents)
+            return
 
-        # For each variable
+        extraction_count = 0
+        pending = []
         for var_idx, variable_row in self.variables_df.iterrows():
             variable_name = variable_row['variable_name']
-            instruction = variable_row['instruction']
-            scope = variable_row.get('scope', 'many_per_note')
 
             # Skip if variable was already completed in a previous run
             if variable_name in self.completed_variables:
                 logger.info(f"Variable {var_idx+1}/{len(self.variables_df)}: {variable_name} - SKIPPING (already completed)")
                 # Count the extractions we're skipping
-                extraction_count += len(self.project_df)
+                extraction_count += len(documents[variable_name])
+                continue
+            pending.append((var_idx, variable_row))
+
+        # Calls run in document lanes (see order_pairs): each of up to max_in_flight lanes works
+        # through one document's variables one call at a time, so every call finds the document
+        # prefix in the cache of the server slot that just served the lane. Results are recorded
+        # as they complete and a variable is checkpointed once all its documents are done
+        pairs = []
+        remaining = {}
+        for var_idx, variable_row in pending:
+            variable_name = variable_row['variable_name']
+            scope = variable_row.get('scope', 'many_per_note')
+            logger.info(f"Variable {var_idx+1}/{len(self.variables_df)}: {variable_name} (scope: {scope}, "
+                        f"{len(documents[variable_name])}/{len(self.project_df)} documents)")
+
+            remaining[variable_name] = 0
+            for doc_idx, doc_row in documents[variable_name].iterrows():
+                # Resume: pairs journaled by an interrupted run are already in variable_results
+                if (variable_name, str(doc_row['NOTE_ID'])) in self.completed_pairs:
+                    extraction_count += 1
+                    continue
+                pairs.append((var_idx, variable_row, doc_idx, doc_row))
+                remaining[variable_name] += 1
+            if not remaining[variable_name]:
+                self._complete_variable(variable_name, len(documents[variable_name]))
+
+        chains = deque()
+        for pair in self.order_pairs(pairs):
+            key = (scope_priority(pair[1].get('scope', 'many_per_note')), pair[2])
+            if not chains or chains[-1][0] != key:
+                chains.append((key, deque()))
+            chains[-1][1].append(pair)
+        chains = deque(chain for _, chain in chains)
+
+        width = max(1, self.scheduler.max_in_flight.get(self.backend, 1))
+        lanes = []  # [remaining pairs of the lane's document, (variable_name, doc_row, futures) in flight]
+        while chains or lanes:
+            while len(lanes) < width:
+                if chains:
+                    chain = chains.popleft()
+                else:
+                    # Fewer documents than lanes: split the longest lane rather than idle
+                    longest = max(lanes, key=lambda lane: len(lane[0]), default=None)
+                    if longest is None or len(longest[0]) < 2:
+                        break
+                    rest = list(longest[0])
+                    longest[0], chain = deque(rest[:len(rest) // 2]), deque(rest[len(rest) // 2:])
+                lanes.append([chain, self._submit_pair(chain.popleft())])
+
+            wait([future for _, call in lanes for future in call[2] if not future.done()],
+                 return_when=FIRST_COMPLETED)
+            for lane in lanes:
+                if all(future.done() for future in lane[1][2]):
+                    extraction_count = self._record_extraction(*lane[1], remaining, documents,
+                                                               extraction_count, total_extractions)
+                    lane[1] = self._submit_pair(lane[0].popleft()) if lane[0] else None
+            lanes = [lane for lane in lanes if lane[1] is not None]
+
+        # Same row order as the variables file (one_per_patient variables ran first)
+        self.sort_variable_results()
+
+        if self.chunk_stats['notes_chunked']:
+            logger.info(f"Long notes: {self.chunk_stats['notes_chunked']} split into {self.chunk_stats['windows']} "
+                        f"windows, {self.chunk_stats['windows_sent']} sent to the LLM")
+        logger.info(f"✓ Variable extraction completed: {extraction_count} total extractions\n")
+
+    def rank_documents(self, variable_row, documents: pd.DataFrame) -> pd.DataFrame:
+        """
+        A variable's documents in early-exit visiting order
+
+        Phase 3 priority_score column if the project file has one, otherwise document
+        type priority (IntelligentDocumentSelector) of NOTE_TITLE, then relevance score.
+        """
+        # Imported here: phase3 configures logging at import, which must not pre-empt ours
+        from phase3_intelligent_document_selector import IntelligentDocumentSelector
+
+        scores = None
+        spec = self.variable_relevance_spec(variable_row['variable_name'])
+        if self.relevance_index is not None and spec is not None:
+            scores = self.relevance_index.scores(spec['keywords'])[list(documents.index)]
+        order = document_priority_order(documents, type_priority=IntelligentDocumentSelector.document_type_priority,
+                                        scores=scores)
+        return documents.iloc[order]
+
+    def extract_variables_early_exit(self, documents: Dict[str, pd.DataFrame]):
+        """
+        Extract one_per_patient variables until their answers agree
+
+        Each variable asks its documents in rank_documents order, at most
+        early_exit_agreement at a time, and stops once an EvidenceAccumulator is
+        satisfied. Answers are consumed strictly in rank order, so the consulted
+        documents do not depend on call timing. Calls still queued when a variable
+        stops are cancelled; documents not consulted go to skipped_extractions.
+
+        Args:
+            documents: Selected documents per variable; early-exit variables are
+                narrowed to the documents consulted
+        """
+        variables = [variable_row for _, variable_row in self.variables_df.iterrows()
+                     if variable_row.get('scope') == 'one_per_patient'
+                     and variable_row['variable_name'] not in self.completed_variables]
+        if not variables:
+            return
+        logger.info(f"Early exit: {len(variables)} one_per_patient variables, "
+                    f"stopping at {self.early_exit_agreement} agreeing answers")
+
+        # Resume: answers journaled by an interrupted run count as consulted without a call
+        journaled = {(row['variable_name'], str(row['NOTE_ID'])): row['extracted_value']
+                     for row in self.variable_results}
+        active = [{'row': variable_row,
+                   'docs': [doc_row for _, doc_row in self.rank_documents(
+                       variable_row, documents[variable_row['variable_name']]).iterrows()],
+                   'next': 0, 'submitted': {},  # rank -> futures, or the journaled answer
+                   'evidence': EvidenceAccumulator(self.early_exit_agreement, self.early_exit_min_share)}
+                  for variable_row in variables]
+
+        width = max(1, self.scheduler.max_in_flight.get(self.backend, 1))
+        while active:
+            # Round-robin over variables, each at most early_exit_agreement documents ahead
+            in_flight = sum(isinstance(entry, list) for state in active for entry in state['submitted'].values())
+            queued = True
+            while queued and in_flight < width:
+                queued = False
+                for state in active:
+                    if in_flight >= width:
+                        break
+                    if state['next'] >= len(state['docs']) or len(state['submitted']) >= self.early_exit_agreement:
+                        continue
+                    rank, doc_row = state['next'], state['docs'][state['next']]
+                    state['next'] += 1
+                    queued = True
+                    key = (state['row']['variable_name'], str(doc_row['NOTE_ID']))
+                    if key in journaled:
+                        state['submitted'][rank] = journaled[key]
+                        continue
+                    state['submitted'][rank] = self._submit_pair((None, state['row'], None, doc_row))[2]
+                    in_flight += 1
+
+            wait([future for state in active for entry in state['submitted'].values() if isinstance(entry, list)
+                  for future in entry if not future.done()], return_when=FIRST_COMPLETED)
+            for state in active:
+                evidence = state['evidence']
+                while not evidence.done and len(evidence.consulted) in state['submitted']:
+                    rank = len(evidence.consulted)
+                    entry, doc_row = state['submitted'][rank], state['docs'][rank]
+                    if isinstance(entry, list):
+                        if not all(future.done() for future in entry):
+                            break
+                        extracted_value = merge_window_answers([self.llm_result(future) for future in entry])
+                        self.record_result({
+                            'PERSON_ID': self.person_id,
+                            'NOTE_ID': doc_row['NOTE_ID'],
+                            'NOTE_TITLE': doc_row['NOTE_TITLE'],
+                            'variable_name': state['row']['variable_name'],
+                            'extracted_value': extracted_value,
+                            'extraction_timestamp': datetime.now().isoformat()
+                        })
+                    else:
+                        extracted_value = entry
+                    del state['submitted'][rank]
+                    evidence.add(doc_row['NOTE_ID'], extracted_value)
+                if evidence.done or len(evidence.consulted) == len(state['docs']):
+                    self._finish_early_exit(state, documents)
+            active = [state for state in active if 'finished' not in state]
+
+    def _finish_early_exit(self, state: Dict, documents: Dict[str, pd.DataFrame]):
+        """Cancel a stopped variable's queued calls, record what was (not) consulted, checkpoint it"""
+        variable_name = state['row']['variable_name']
+        evidence = state['evidence']
+        for entry in state['submitted'].values():
+            if isinstance(entry, list):
+                for future in entry:
+                    future.cancel()
+        consulted = len(evidence.consulted)
+        summary = evidence.summary()
+        for doc_row in state['docs'][consulted:]:
+            self.skipped_extractions.append({
+                'PERSON_ID': self.person_id,
+                'NOTE_ID': doc_row['NOTE_ID'],
+                'NOTE_TITLE': doc_row['NOTE_TITLE'],
+                'variable_name': variable_name,
+                'skip_reason': f"early exit: {summary['agreeing_answers']} agreeing answers "
+                               f"in the first {consulted} documents"
+            })
+        self.early_exit_results.append({
+            'PERSON_ID': self.person_id,
+            'variable_name': variable_name,
+            **summary,
+            'documents_available': len(state['docs']),
+            'consulted_note_ids': '|'.join(str(row['NOTE_ID']) for row in evidence.consulted)
+        })
+        logger.info(f"  {variable_name}: {summary['consensus_value']!r} after {consulted}/{len(state['docs'])} "
+                    f"documents{' (early exit)' if summary['stopped_early'] else ''}")
+        documents[variable_name] = documents[variable_name].loc[[row.name for row in state['docs'][:consulted]]]
+        state['finished'] = True
+        self._complete_variable(variable_name, consulted)
+
+    def order_pairs(self, pairs: List) -> List:
+        """
+        Order in which (variable, document) calls are queued
+
+        one_per_patient variables first (scheduler priority), then document by
+        document with the variables of a document in file order, so consecutive
+        prompts share the document prefix (see prompt_layout).
+
+        Args:
+            pairs: (var_idx, variable_row, doc_idx, doc_row) tuples
+
+        Returns:
+            The pairs in submission order
+        """
+        return sorted(pairs, key=lambda pair: (scope_priority(pair[1].get('scope', 'many_per_note')),
+                                               pair[2], pair[0]))
+
+    def _submit_pair(self, pair):
+        """Queue the call(s) for one (var_idx, variable_row, doc_idx, doc_row) pair"""
+        var_idx, variable_row, doc_idx, doc_row = pair
+        variable_name = variable_row['variable_name']
+        scope = variable_row.get('scope', 'many_per_note')
+        futures = self.submit_extraction(variable_name, variable_row['instruction'], doc_row['NOTE_ID'],
+                                         doc_row['NOTE_TEXT'], doc_row['NOTE_TITLE'],
+                                         priority=scope_priority(scope), variable_type=answer_type(variable_row))
+        return variable_name, doc_row, futures
+
+    def _record_extraction(self, variable_name: str, doc_row, futures: List[Future], remaining: Dict[str, int],
+                           documents: Dict[str, pd.DataFrame], extraction_count: int,
+                           total_extractions: int) -> int:
+        """Wait for one (variable, document) call, store the row; checkpoint the variable when it is done"""
+        extracted_value = merge_window_answers([self.llm_result(future) for future in futures])
+
+        extraction_count += 1
+
+        # Store result
+        self.record_result({
+            'PERSON_ID': self.person_id,
+            'NOTE_ID': doc_row['NOTE_ID'],
+            'NOTE_TITLE': doc_row['NOTE_TITLE'],
+            'variable_name': variable_name,
+            'extracted_value': extracted_value,
+            'extraction_timestamp': datetime.now().isoformat()
+        })
+
+        # Log progress every 10 extractions
+        if extraction_count % 10 == 0:
+            logger.info(f"  Progress: {extraction_count}/{total_extractions} extractions completed")
+
+        remaining[variable_name] -= 1
+        if not remaining[variable_name]:
+            self._complete_variable(variable_name, len(documents[variable_name]))
+        return extraction_count
+
+    def _complete_variable(self, variable_name: str, n_documents: int):
+        """Mark a variable as completed and save checkpoint"""
+        logger.info(f"  Completed {variable_name} across {n_documents} documents")
+        self.completed_variables.add(variable_name)
+        self.save_checkpoint(variable_name)
+        logger.info("")  # Empty line for readability
+
+    def extract_variables_batched(self, total_extractions: int, documents: Dict[str, pd.DataFrame]):
+        """
+        Extract all variables with one LLM call per (variable batch, document)
+
+        Produces the same variable_results rows (in the same order), checkpoints and
+        resume behavior as the per-variable loop in extract_variables. Calls go through
+        the scheduler like the per-variable loop, so up to max_in_flight run at once.
+
+        Args:
+            total_extractions: Number of (variable, document) pairs to extract
+            documents: Selected documents per variable (see select_documents)
+        """
+        pending = []
+        extraction_count = 0
+        for var_idx, variable_row in self.variables_df.iterrows():
+            if variable_row['variable_name'] in self.completed_variables:
+                logger.info(f"Variable {var_idx+1}/{len(self.variables_df)}: {variable_row['variable_name']} - SKIPPING (already completed)")
+                extraction_count += len(documents[variable_row['variable_name']])
                 continue
+            pending.append(variable_row)
 
-            logger.info(f"Variable {var_idx+1}/{len(self.variables_df)}: {variable_name} (scope: {scope})")
+        groups = self.group_compatible_variables(pending)
+        logger.info(f"Batched extraction: {len(pending)} variables in {len(groups)} groups\n")
 
-            # For each document
+        llm_calls = 0
+        for group_idx, group in enumerate(groups, start=1):
+            variable_names = [variable['variable_name'] for variable in group]
+            scope = group[0].get('scope', 'many_per_note')
+            logger.info(f"Variable group {group_idx}/{len(groups)}: {', '.join(variable_names)} "
+                        f"(scope: {scope})")
+
+            selected = {name: set(documents[name].index) for name in variable_names}
+
+            # Queue every (batch, document) call of the group up front, in document order; the
+            # scheduler runs up to max_in_flight of them at once
+            calls = []
             for doc_idx, doc_row in self.project_df.iterrows():
                 note_id = doc_row['NOTE_ID']
                 note_text = doc_row['NOTE_TEXT']
                 note_title = doc_row['NOTE_TITLE']
-
-                # Extract variable from document
-                extracted_value = self.extract_variable_from_document(
-                    variable_name=variable_name,
-                    instruction=instruction,
-                    note_id=note_id,
-                    note_text=note_text,
-                    note_title=note_title
+                relevant = [variable for variable in group if doc_idx in selected[variable['variable_name']]]
+                # Resume: pairs journaled by an interrupted run are already in variable_results
+                resumed = [variable for variable in relevant
+                           if (variable['variable_name'], str(note_id)) in self.completed_pairs]
+                extraction_count += len(resumed)
+                relevant = [variable for variable in relevant if variable not in resumed]
+                if not relevant:
+                    continue
+
+                for batch in self.plan_variable_batches(relevant, note_text):
+                    if len(batch) == 1:
+                        futures = self.submit_extraction(batch[0]['variable_name'], batch[0]['instruction'],
+                                                         note_id, note_text, note_title,
+                                                         priority=scope_priority(scope),
+                                                         variable_type=answer_type(batch[0]))
+                    else:
+                        futures = [self.submit_variable_batch(batch, note_id, note_text, note_title,
+                                                              priority=scope_priority(scope))]
+                    llm_calls += len(futures)
+                    calls.append((doc_row, batch, futures))
+
+            # Record the answers in submission order. Variables a batch answer left out are
+            # queued individually and recorded once every batch answer is in
+            fallbacks = []
+            for call_idx, (doc_row, batch, futures) in enumerate(calls, start=1):
+                if len(batch) == 1:
+                    values = {batch[0]['variable_name']:
+                              merge_window_answers([self.llm_result(future) for future in futures])}
+                else:
+                    values, missing = self.batch_answers(batch, futures[0], doc_row['NOTE_ID'])
+                    for variable in missing:
+                        fallback = self.submit_extraction(variable['variable_name'], variable['instruction'],
+                                                          doc_row['NOTE_ID'], doc_row['NOTE_TEXT'],
+                                                          doc_row['NOTE_TITLE'], priority=scope_priority(scope),
+                                                          variable_type=answer_type(variable))
+                        llm_calls += len(fallback)
+                        fallbacks.append((doc_row, variable['variable_name'], fallback))
+                extraction_count += self._record_batch_values(doc_row, values)
+                if call_idx % 10 == 0:
+                    logger.info(f"  Progress: {extraction_count}/{total_extractions} extractions completed "
+                                f"({llm_calls} LLM calls)")
+            for doc_row, name, fallback in fallbacks:
+                extraction_count += self._record_batch_values(
+                    doc_row, {name: merge_window_answers([self.llm_result(future) for future in fallback])}
                 )
 
-                extraction_count += 1
-
-                # Store result
-                self.variable_results.append({
-                    'PERSON_ID': self.person_id,
-                    'NOTE_ID': note_id,
-                    'NOTE_TITLE': note_title,
-                    'variable_name': variable_name,
-                    'extracted_value': extracted_value,
-                    'extraction_timestamp': datetime.now().isoformat()
-                })
-
-                # Log progress every 10 extractions
-                if extraction_count % 10 == 0:
-                    logger.info(f"  Progress: {extraction_count}/{total_extractions} extractions completed")
+            logger.info(f"  Completed {len(group)} variables across "
+                        f"{len(set().union(*(selected[name] for name in variable_names)))} documents")
+            for name in variable_names:
+                self.completed_variables.add(name)
+                self.save_checkpoint(name)
+            logger.info("")  # Empty line for readability
 
-            logger.info(f"  Completed {variable_name} across {len(self.project_df)} documents")
+        # Same row order as the per-variable loop (groups follow scope, not file order)
+        self.sort_variable_results()
 
-            # Mark variable as completed and save checkpoint
-            self.completed_variables.add(variable_name)
-            self.save_checkpoint(variable_name)
-            logger.info("")  # Empty line for readability
+        logger.info(f"✓ Variable extraction completed: {extraction_count} total extractions "
+                    f"in {llm_calls} LLM calls\n")
 
-        logger.info(f"✓ Variable extraction completed: {extraction_count} total extractions\n")
+    def _record_batch_values(self, doc_row, values: Dict[str, str]) -> int:
+        """Store the rows of one document's batched answers; returns the number of rows"""
+        timestamp = datetime.now().isoformat()
+        for name, extracted_value in values.items():
+            self.record_result({
+                'PERSON_ID': self.person_id,
+                'NOTE_ID': doc_row['NOTE_ID'],
+                'NOTE_TITLE': doc_row['NOTE_TITLE'],
+                'variable_name': name,
+                'extracted_value': extracted_value,
+                'extraction_timestamp': timestamp
+            })
+        return len(values)
 
     def adjudicate_decision(self, decision_name: str, instruction: str,
                            relevant_variables: Dict[str, List[str]]) -> str:
@@ -378,7 +1066,7 @@ INSTRUCTIONS:
 
 ADJUDICATED VALUE:"""
 
-        result = self.call_llm(prompt, max_tokens=2048)
+        result = self.call_llm(prompt, variable_type='decision')
         return result
 
     def adjudicate_decisions(self):
@@ -456,6 +1144,20 @@ ADJUDICATED VALUE:"""
         logger.info(f"  Saved decision adjudication results: {dec_output_file}")
         logger.info(f"    ({len(dec_results_df)} rows)")
 
+        # Save (variable, document) pairs skipped by the relevance filter
+        skipped_output_file = self.output_dir / f"skipped_extractions_{self.patient_fhir_id}.csv"
+        pd.DataFrame(self.skipped_extractions, columns=['PERSON_ID', 'NOTE_ID', 'NOTE_TITLE', 'variable_name',
+                                                        'skip_reason']).to_csv(skipped_output_file, index=False)
+        logger.info(f"  Saved skipped extractions: {skipped_output_file}")
+        logger.info(f"    ({len(self.skipped_extractions)} rows)")
+
+        # Save consensus and consulted documents of early-exit variables
+        if self.early_exit:
+            early_exit_file = self.output_dir / f"early_exit_{self.patient_fhir_id}.csv"
+            pd.DataFrame(self.early_exit_results).to_csv(early_exit_file, index=False)
+            logger.info(f"  Saved early exit evidence: {early_exit_file}")
+            logger.info(f"    ({len(self.early_exit_results)} rows)")
+
         # Create summary pivot table (wide format - one row per person)
         logger.info("\n  Creating summary pivot table...")
         summary_data = {'PERSON_ID': self.person_id}
@@ -479,6 +1181,7 @@ ADJUDICATED VALUE:"""
         try:
             # Step 0: Check for checkpoint
             checkpoint_loaded = self.load_checkpoint()
+            self.journal.start_run(patient_fhir_id=self.patient_fhir_id, resumed=checkpoint_loaded)
 
             # Step 1: Load input files
             self.load_input_files()
@@ -493,6 +1196,7 @@ ADJUDICATED VALUE:"""
             var_file, dec_file, summary_file = self.save_results()
 
             # Step 5: Cleanup checkpoint after successful completion
+            self.journal.close()
             self.cleanup_checkpoint()
 
             # Summary
@@ -503,6 +1207,9 @@ ADJUDICATED VALUE:"""
             logger.info("✓ EXTRACTION PIPELINE COMPLETED")
             logger.info("="*80)
             logger.info(f"Total execution time: {duration:.1f} seconds ({duration/60:.1f} minutes)")
+            logger.info(self.llm_client.cache.summary())
+            logger.info(self.scheduler.summary())
+            logger.info(self.llm_client.summary())
             logger.info(f"\nOutput files:")
             logger.info(f"  1. Variable extractions: {var_file.name}")
             logger.info(f"  2. Decision adjudications: {dec_file.name}")
@@ -512,6 +1219,7 @@ ADJUDICATED VALUE:"""
             return 0
 
         except Exception as e:
+            self.journal.close()
             logger.error(f"\n❌ Pipeline failed: {e}")
             import traceback
             traceback.print_exc()
@@ -556,6 +1264,51 @@ Available Ollama Models (comparable to Amazon Nova Pro):
         default='llama3.1:70b',
         help='Ollama model name (only used with --model ollama). Default: llama3.1:70b'
     )
+    parser.add_argument(
+        '--batch-variables',
+        action='store_true',
+        help='Extract several variables per document prompt (JSON answer) instead of one call per variable'
+    )
+    parser.add_argument(
+        '--context-tokens',
+        type=int,
+        default=None,
+        help='Model context size used to size variable batches. Default: 8192 (ollama), 200000 (claude)'
+    )
+    parser.add_argument(
+        '--chunk-tokens',
+        type=int,
+        default=None,
+        help='Split notes longer than this many tokens into windows (bounds prompt size). '
+             'Default: whatever fits --context-tokens'
+    )
+    parser.add_argument(
+        '--no-resume',
+        action='store_true',
+        help='Discard any checkpoint journal from an interrupted run and start over'
+    )
+    parser.add_argument(
+        '--no-relevance-filter',
+        action='store_true',
+        help='Send every variable to every document (disable the relevance pre-filter)'
+    )
+    parser.add_argument(
+        '--early-exit',
+        action='store_true',
+        help='Stop extracting a one_per_patient variable once enough documents agree (highest priority first)'
+    )
+    parser.add_argument(
+        '--early-exit-agreement',
+        type=int,
+        default=None,
+        help=f'Agreeing answers needed to stop with --early-exit. Default: {DEFAULT_AGREEMENT}'
+    )
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=None,
+        help='Concurrent LLM calls (match OLLAMA_NUM_PARALLEL for a local server). Default: 4 (ollama), 8 (claude)'
+    )
 
     args = parser.parse_args()
 
@@ -575,9 +1328,8 @@ Available Ollama Models (comparable to Amazon Nova Pro):
     # Check if Ollama is running if using Ollama
     if args.model == 'ollama':
         try:
-            import ollama
             # Test if Ollama is accessible
-            ollama.list()
+            get_llm_client('ollama').list_models()
             print(f"✓ Ollama is running. Using model: {args.ollama_model}\n")
         except Exception as e:
             print("Error: Ollama is not running or not accessible")
@@ -593,7 +1345,15 @@ Available Ollama Models (comparable to Amazon Nova Pro):
     pipeline = LocalLLMExtractionPipeline(
         args.config_file,
         use_ollama=use_ollama,
-        ollama_model=args.ollama_model
+        ollama_model=args.ollama_model,
+        batch_variables=args.batch_variables,
+        context_tokens=args.context_tokens,
+        max_in_flight=args.max_in_flight,
+        relevance_filter=False if args.no_relevance_filter else None,
+        chunk_tokens=args.chunk_tokens,
+        resume=False if args.no_resume else None,
+        early_exit=True if args.early_exit else None,
+        early_exit_agreement=args.early_exit_agreement
     )
     exit_code = pipeline.run()
     sys.exit(exit_code)
@@ -17,8 +17,10 @@ import os
 
 # Import our extraction modules
 sys.path.append(str(Path(__file__).parent))
-from event_based_extraction.enhanced_extraction_with_fallback import EnhancedEventExtractor
+import _src_path  # noqa: F401 - puts the repository's src/ on sys.path
+from event_based_extraction.enhanced_extraction_with_fallback import STAGING_DIR, EnhancedEventExtractor
 from extract_extent_from_postop_imaging import extract_extent_from_postop_imaging
+from llm_scheduler import get_scheduler
 
 # Configure logging
 logging.basicConfig(
@@ -36,16 +38,18 @@ class ProductionExtractionPipeline:
     Production-ready extraction pipeline for RADIANT PCA patients
     """
 
-    def __init__(self, patient_list_path: str, output_dir: str = None):
+    def __init__(self, patient_list_path: str, output_dir: str = None, staging_dir: str = None):
         """
         Initialize pipeline
 
         Args:
             patient_list_path: Path to CSV with patient IDs
             output_dir: Output directory for results
+            staging_dir: Athena staging files (patient_<id>/procedures.csv, ...)
         """
         self.patient_list = self._load_patient_list(patient_list_path)
-        self.extractor = EnhancedEventExtractor()
+        self.staging_dir = Path(staging_dir or STAGING_DIR)
+        self.extractor = EnhancedEventExtractor(self.staging_dir)
 
         # Set up output directory
         if output_dir:
@@ -154,7 +158,7 @@ class ProductionExtractionPipeline:
     def _get_patient_events(self, patient_id: str) -> List[Dict]:
         """Get surgical events for patient"""
         try:
-            staging_dir = Path(f'/Users/resnick/Documents/GitHub/RADIANT_PCA/BRIM_Analytics/athena_extraction_validation/staging_files/patient_{patient_id}')
+            staging_dir = self.staging_dir / f'patient_{patient_id}'
             procedures_file = staging_dir / 'procedures.csv'
 
             if not procedures_file.exists():
@@ -215,12 +219,14 @@ class ProductionExtractionPipeline:
 
             if 'extent_of_tumor_resection' in primary_results:
                 logger.info("Validating extent of resection with post-op imaging")
-                postop_extent = extract_extent_from_postop_imaging(patient_id, event_date)
+                postop_extent = extract_extent_from_postop_imaging(patient_id, event_date, self.staging_dir)
 
                 if postop_extent:
                     validation_performed = True
                     original_value = primary_results['extent_of_tumor_resection'].get('value')
-                    postop_value = postop_extent.get('consensus_extent')
+                    # Most frequent extent across the post-op reports (earliest report on a tie)
+                    extents = [report['extracted_extent'] for report in postop_extent]
+                    postop_value = max(extents, key=extents.count)
 
                     if original_value != postop_value:
                         discrepancy_found = True
@@ -238,7 +244,7 @@ class ProductionExtractionPipeline:
                             'source': 'post_operative_imaging',
                             'original_value': original_value,
                             'override_reason': 'Post-op MRI is gold standard for extent',
-                            'supporting_evidence': postop_extent.get('all_extractions', [])
+                            'supporting_evidence': postop_extent
                         }
 
             return {
@@ -294,6 +300,9 @@ class ProductionExtractionPipeline:
         """
         Process all patients in parallel
 
+        Patient workers share one LLM scheduler, so concurrent Ollama calls stay at
+        the scheduler's limit (LLM_MAX_IN_FLIGHT_OLLAMA) however many workers run.
+
         Args:
             max_workers: Maximum number of parallel workers
 
@@ -323,6 +332,8 @@ class ProductionExtractionPipeline:
                         'error': str(e)
                     })
 
+        logger.info(get_scheduler().summary())
+
         # Generate summary report
         summary = self.generate_summary_report(results)
 
@@ -481,6 +492,11 @@ def main():
         help='Output directory for results',
         default=None
     )
+    parser.add_argument(
+        '--staging-dir',
+        help='Athena staging files directory (default: the RADIANT PCA staging_files)',
+        default=None
+    )
     parser.add_argument(
         '--workers',
         type=int,
@@ -498,7 +514,8 @@ def main():
     # Initialize pipeline
     pipeline = ProductionExtractionPipeline(
         patient_list_path=args.patient_list,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        staging_dir=args.staging_dir
     )
 
     # Run extraction
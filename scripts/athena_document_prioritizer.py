@@ -10,13 +10,17 @@ Usage:
 import boto3
 import pandas as pd
 import json
-import time
+import sys
+from pathlib import Path
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 from datetime import datetime
 import argparse
 import logging
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+from athena_query_engine import AthenaQueryEngine as SharedQueryEngine
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -68,18 +72,17 @@ class AthenaQueryEngine:
         self.database = database  # v2 for condition, procedure, medication, observation
         self.document_database = document_database  # v1 for document_reference
         self.s3_output_location = s3_output_location
+        self.engine = SharedQueryEngine(
+            self.athena_client,
+            database=database,
+            output_location=s3_output_location
+        )
     
     def execute_query(self, query: str, wait: bool = True) -> str:
         """Execute Athena query and return query execution ID"""
         logger.info(f"Executing Athena query:\n{query[:200]}...")
         
-        response = self.athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': self.database},
-            ResultConfiguration={'OutputLocation': self.s3_output_location}
-        )
-        
-        query_execution_id = response['QueryExecutionId']
+        query_execution_id = self.engine.start(query)
         logger.info(f"Query execution ID: {query_execution_id}")
         
         if wait:
@@ -88,44 +91,13 @@ class AthenaQueryEngine:
         return query_execution_id
     
     def _wait_for_query(self, query_execution_id: str, max_wait: int = 60):
-        """Wait for query to complete"""
-        start_time = time.time()
-        
-        while True:
-            if time.time() - start_time > max_wait:
-                raise TimeoutError(f"Query {query_execution_id} exceeded {max_wait}s timeout")
-            
-            response = self.athena_client.get_query_execution(
-                QueryExecutionId=query_execution_id
-            )
-            
-            status = response['QueryExecution']['Status']['State']
-            
-            if status == 'SUCCEEDED':
-                logger.info(f"Query {query_execution_id} succeeded")
-                return
-            elif status in ['FAILED', 'CANCELLED']:
-                reason = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                raise RuntimeError(f"Query {query_execution_id} {status}: {reason}")
-            
-            time.sleep(2)
+        """Wait for query to complete (exponential backoff, raises on failure/timeout)"""
+        self.engine.wait(query_execution_id, timeout=max_wait)
+        logger.info(f"Query {query_execution_id} succeeded")
     
     def get_query_results(self, query_execution_id: str) -> pd.DataFrame:
-        """Retrieve query results as DataFrame"""
-        results = self.athena_client.get_query_results(
-            QueryExecutionId=query_execution_id,
-            MaxResults=1000
-        )
-        
-        # Parse column headers
-        columns = [col['Label'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-        
-        # Parse data rows (skip header row)
-        rows = []
-        for row in results['ResultSet']['Rows'][1:]:
-            rows.append([field.get('VarCharValue', None) for field in row['Data']])
-        
-        df = pd.DataFrame(rows, columns=columns)
+        """Retrieve all result pages as DataFrame"""
+        df = self.engine.fetch_dataframe(query_execution_id, typed=False)
         logger.info(f"Retrieved {len(df)} rows from query {query_execution_id}")
         
         return df
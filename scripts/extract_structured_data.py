@@ -24,7 +24,7 @@ Usage:
 import argparse
 import json
 import logging
-import time
+import sys
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -32,6 +32,10 @@ from typing import Dict, List, Optional
 import boto3
 import pandas as pd
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+from athena_query_engine import AthenaQueryEngine
+from athena_result_cache import QueryResultCache
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -65,49 +69,20 @@ class StructuredDataExtractor:
         self.v2_database = v2_database
         self.v1_database = v1_database
         self.s3_output_location = s3_output_location
+        # Result cache is opt-in via ATHENA_CACHE=1 (see src/athena_result_cache.py)
+        self.engine = AthenaQueryEngine(
+            self.athena_client,
+            output_location=s3_output_location,
+            cache=QueryResultCache.from_config({})
+        )
         
         logger.info(f"Initialized with v2_db={v2_database}, v1_db={v1_database}")
     
     def query_and_fetch(self, query: str, database: str) -> pd.DataFrame:
-        """Execute Athena query and return results as DataFrame"""
+        """Execute Athena query and return all result pages as DataFrame"""
         logger.info(f"Executing query on {database}:\n{query[:200]}...")
         
-        response = self.athena_client.start_query_execution(
-            QueryString=query,
-            QueryExecutionContext={'Database': database},
-            ResultConfiguration={'OutputLocation': self.s3_output_location}
-        )
-        
-        query_execution_id = response['QueryExecutionId']
-        
-        # Wait for query to complete
-        while True:
-            response = self.athena_client.get_query_execution(
-                QueryExecutionId=query_execution_id
-            )
-            status = response['QueryExecution']['Status']['State']
-            
-            if status == 'SUCCEEDED':
-                break
-            elif status in ['FAILED', 'CANCELLED']:
-                reason = response['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                raise RuntimeError(f"Query {status}: {reason}")
-            
-            time.sleep(2)
-        
-        # Fetch results
-        results = self.athena_client.get_query_results(
-            QueryExecutionId=query_execution_id,
-            MaxResults=1000
-        )
-        
-        # Parse into DataFrame
-        columns = [col['Label'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
-        rows = []
-        for row in results['ResultSet']['Rows'][1:]:  # Skip header
-            rows.append([field.get('VarCharValue', None) for field in row['Data']])
-        
-        df = pd.DataFrame(rows, columns=columns)
+        df = self.engine.query(query, database=database, typed=False)
         logger.info(f"Query returned {len(df)} rows")
         
         return df
@@ -17,14 +17,17 @@ Usage:
 import os
 import json
 import csv
+import sys
 import boto3
-import base64
 import argparse
 from datetime import datetime, timezone
-from bs4 import BeautifulSoup
 from pathlib import Path
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+from binary_document_store import BinaryDocumentStore
+from ndjson_patient_index import NDJSONPatientIndex
+from text_normalization import normalize_many, normalize_text
 
 # Load environment
 load_dotenv()
@@ -50,6 +53,16 @@ class BRIMCSVGenerator:
         self.session = boto3.Session(profile_name=self.aws_profile)
         self.s3_client = self.session.client('s3', region_name='us-east-1')
         
+        # Local Binary document store (with BINARY_STORE_DIR set, S3 is read once per document across runs)
+        self.document_store = BinaryDocumentStore(
+            s3_client=self.s3_client,
+            s3_bucket=self.s3_bucket,
+            s3_prefix='prd/source/Binary/'
+        )
+        
+        # subject.reference -> NDJSON byte-offset index (replaces per-file S3 Select scans)
+        self.ndjson_index = NDJSONPatientIndex(self.s3_client, self.s3_bucket)
+        
         # Load FHIR Bundle
         print(f"📂 Loading FHIR Bundle from {bundle_path}")
         with open(bundle_path, 'r') as f:
@@ -79,39 +92,29 @@ class BRIMCSVGenerator:
         self.clinical_notes = []
     
     def extract_clinical_notes(self):
-        """Extract clinical notes from S3 using S3 Select on NDJSON files."""
+        """Extract clinical notes from S3 DocumentReference NDJSON files via the patient index."""
         print(f"\n📥 Extracting clinical notes from S3...")
         
-        # Query DocumentReference NDJSON files using S3 Select
         doc_ref_prefix = f"{self.s3_prefix}DocumentReference/"
         
         try:
-            # List ALL NDJSON files in DocumentReference folder using pagination
-            print(f"🔍 Listing all DocumentReference NDJSON files...")
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            files = []
+            # Bring the patient -> (file, byte offset) index up to date (only new/changed files are read)
+            print("🔍 Updating DocumentReference patient index...")
+            counts = self.ndjson_index.build(doc_ref_prefix)
             
-            for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=doc_ref_prefix):
-                if 'Contents' in page:
-                    page_files = [obj['Key'] for obj in page['Contents'] if obj['Key'].endswith('.ndjson')]
-                    files.extend(page_files)
-            
-            if not files:
+            if counts['files'] == 0:
                 print(f"⚠️  No DocumentReference files found at {doc_ref_prefix}")
                 return []
             
-            print(f"✅ Found {len(files)} DocumentReference NDJSON files")
+            print(f"✅ {counts['files']} DocumentReference NDJSON files: {counts['indexed']} indexed, "
+                  f"{counts['unchanged']} unchanged, {counts['removed']} removed")
+            if counts['failed']:
+                print(f"⚠️  {counts['failed']} files could not be indexed (see log)")
             
-            # Query each file for patient's documents
-            document_refs = []
-            print(f"   Querying all {len(files)} files for patient documents...")
-            for i, file_key in enumerate(files, 1):
-                if i % 100 == 0 or i == 1:  # Progress update every 100 files
-                    print(f"   Progress: {i}/{len(files)} files queried...")
-                docs = self._query_s3_select(file_key)
-                document_refs.extend(docs)
-                if len(document_refs) > 0 and i % 100 == 0:
-                    print(f"   Found {len(document_refs)} DocumentReferences so far...")
+            # Ranged GETs on only the files holding this patient's records
+            locations = self.ndjson_index.lookup(self.patient_id, doc_ref_prefix)
+            print(f"   Reading patient records from {len(locations)} files...")
+            document_refs = self.ndjson_index.fetch_records(self.patient_id, doc_ref_prefix)
             
             print(f"✅ Found {len(document_refs)} DocumentReference resources")
             
@@ -167,9 +170,18 @@ class BRIMCSVGenerator:
         
         print(f"   Total documents to extract: {len(all_docs)}")
         
+        # Download everything not yet in the local store concurrently
+        counts = self.document_store.prefetch(
+            doc.get('s3_url', '').split('Binary/')[-1]
+            for doc in all_docs if 'Binary/' in (doc.get('s3_url') or '')
+        )
+        print(f"   Prefetched {counts['fetched']} Binary documents "
+              f"({counts['already_stored']} already in local store, {counts['failed']} failed)")
+        
         # Track success/failure
         success_count = 0
         failure_count = 0
+        notes_before = len(self.clinical_notes)
         
         for i, doc in enumerate(all_docs, 1):
             try:
@@ -194,10 +206,7 @@ class BRIMCSVGenerator:
                         print(f"      ⚠️  Failed to fetch Binary content")
                     continue
                 
-                # Sanitize HTML
-                text_content = self._sanitize_html(text_content)
-                
-                # Create note entry
+                # Create note entry (HTML/RTF sanitized below, all notes at once)
                 note = {
                     'note_id': doc.get('document_id', binary_id),
                     'note_date': doc.get('document_date', ''),
@@ -209,50 +218,23 @@ class BRIMCSVGenerator:
                 success_count += 1
                 
                 if i <= 10:
-                    print(f"      ✅ Successfully extracted (Type: {note['note_type']}, {len(text_content)} chars)")
+                    print(f"      ✅ Successfully extracted (Type: {note['note_type']}, {len(text_content)} raw chars)")
                 
             except Exception as e:
                 failure_count += 1
                 if i <= 10:
                     print(f"      ⚠️  Error: {e}")
         
+        # Sanitize HTML/RTF across a process pool
+        new_notes = self.clinical_notes[notes_before:]
+        for note, text in zip(new_notes, normalize_many(note['note_text'] for note in new_notes)):
+            note['note_text'] = text
+        
         print(f"\n✅ Successfully extracted {success_count} prioritized documents")
         if failure_count > 0:
             print(f"⚠️  Failed to extract {failure_count} documents")
         print(f"📊 Total clinical notes in memory: {len(self.clinical_notes)}")
-    
-    def _query_s3_select(self, file_key):
-        """Use S3 Select to query NDJSON file for patient documents."""
-        sql = f"""
-        SELECT *
-        FROM S3Object[*] s
-        WHERE s.subject.reference LIKE '%{self.patient_id}%'
-        """
-        
-        try:
-            response = self.s3_client.select_object_content(
-                Bucket=self.s3_bucket,
-                Key=file_key,
-                ExpressionType='SQL',
-                Expression=sql,
-                InputSerialization={'JSON': {'Type': 'LINES'}},
-                OutputSerialization={'JSON': {'RecordDelimiter': '\n'}}
-            )
-            
-            # Parse streaming response
-            records = []
-            for event in response['Payload']:
-                if 'Records' in event:
-                    payload = event['Records']['Payload'].decode('utf-8')
-                    for line in payload.strip().split('\n'):
-                        if line:
-                            records.append(json.loads(line))
-            
-            return records
-            
-        except Exception as e:
-            # Silent failure for individual file queries
-            return []
+        print(f"💾 {self.document_store.summary()}")
     
     def _process_document_reference(self, doc_ref):
         """Process DocumentReference to extract note content."""
@@ -296,7 +278,7 @@ class BRIMCSVGenerator:
             return None
     
     def _fetch_binary_content(self, binary_id):
-        """Fetch Binary resource content from S3 source/Binary/ folder.
+        """Fetch Binary resource content from the local document store (S3 source/Binary/ on a miss).
         
         Binary files are stored in prd/source/Binary/ with the Binary ID as the filename.
         NOTE: Due to S3 naming bug, periods (.) in Binary IDs are replaced with underscores (_) in filenames.
@@ -315,41 +297,16 @@ class BRIMCSVGenerator:
             if debug:
                 print(f"         Fetching Binary ID: {binary_id}")
             
-            # IMPORTANT: Replace periods with underscores due to S3 naming bug
-            s3_filename = binary_id.replace('.', '_')
-            s3_key = f"prd/source/Binary/{s3_filename}"
-            
-            if debug:
-                print(f"         S3 Key: {s3_key}")
-            
-            # Fetch from S3 using boto3
-            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=s3_key)
-            binary_data = response['Body'].read()
+            # Local store first; S3 key is prd/source/Binary/<id with periods -> underscores>
+            decoded = self.document_store.get_text(binary_id)
             
             if debug:
-                print(f"         Downloaded {len(binary_data)} bytes")
-            
-            # Try to decode as JSON first (FHIR Binary resource format)
-            try:
-                binary_resource = json.loads(binary_data.decode('utf-8'))
-                # Extract base64 data field
-                data = binary_resource.get('data', '')
-                if data:
-                    decoded = base64.b64decode(data).decode('utf-8', errors='ignore')
-                    if debug:
-                        print(f"         Decoded {len(decoded)} characters from base64")
-                    return decoded
-            except json.JSONDecodeError:
-                # If not JSON, try direct decoding (plain text or HTML)
-                try:
-                    decoded = binary_data.decode('utf-8', errors='ignore')
-                    if debug:
-                        print(f"         Decoded {len(decoded)} characters directly")
-                    return decoded
-                except:
-                    return None
+                if decoded is None:
+                    print("         Binary resource has no data")
+                else:
+                    print(f"         Decoded {len(decoded)} characters")
             
-            return None
+            return decoded
             
         except Exception as e:
             if debug:
@@ -357,20 +314,8 @@ class BRIMCSVGenerator:
             return None
     
     def _sanitize_html(self, text):
-        """Remove HTML tags and clean up text."""
-        if not text:
-            return ""
-        
-        # Parse HTML
-        soup = BeautifulSoup(text, 'html.parser')
-        
-        # Extract text
-        clean_text = soup.get_text()
-        
-        # Clean up whitespace
-        clean_text = '\n'.join(line.strip() for line in clean_text.split('\n') if line.strip())
-        
-        return clean_text
+        """Remove HTML tags (or RTF markup) and clean up text."""
+        return normalize_text(text)
     
     def create_structured_findings_documents(self):
         """Create synthetic 'documents' from structured data findings.
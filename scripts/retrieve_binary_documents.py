@@ -18,14 +18,15 @@ Excludes:
 
 import pandas as pd
 import boto3
-import base64
-import re
-from bs4 import BeautifulSoup
+from botocore.config import Config
 from datetime import datetime
-import json
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+from binary_document_store import BinaryDocumentStore
+from text_normalization import normalize_many, normalize_text
+
 # Configuration
 AWS_PROFILE = '343218191717_AWSAdministratorAccess'
 AWS_REGION = 'us-east-1'
@@ -47,7 +48,18 @@ SURVEILLANCE_END = '2025-05-22'
 def setup_aws_session():
     """Initialize AWS session with profile."""
     session = boto3.Session(profile_name=AWS_PROFILE, region_name=AWS_REGION)
-    return session.client('s3')
+    return session.client('s3', config=Config(max_pool_connections=32))
+
+
+_DOCUMENT_STORES = {}
+
+
+def get_document_store(s3_client):
+    """Local Binary document store for an S3 client (one per client)."""
+    if id(s3_client) not in _DOCUMENT_STORES:
+        _DOCUMENT_STORES[id(s3_client)] = BinaryDocumentStore(
+            s3_client=s3_client, s3_bucket=S3_BUCKET, s3_prefix=S3_PREFIX)
+    return _DOCUMENT_STORES[id(s3_client)]
 
 
 def load_annotated_files(csv_path):
@@ -204,7 +216,7 @@ def filter_event_based_imaging(df):
 
 def retrieve_binary_content(s3_client, binary_id):
     """
-    Retrieve Binary content from S3.
+    Retrieve Binary content from the local document store (S3 on a miss).
     
     Args:
         s3_client: Boto3 S3 client
@@ -213,32 +225,9 @@ def retrieve_binary_content(s3_client, binary_id):
     Returns:
         str: Decoded content or None if error
     """
-    # Remove "Binary/" prefix if present
-    if binary_id.startswith('Binary/'):
-        s3_binary_id = binary_id[7:]  # Remove "Binary/" prefix
-    else:
-        s3_binary_id = binary_id
-    
-    # Simple period-to-underscore conversion (matching query_accessible_binaries.py)
-    s3_binary_id = s3_binary_id.replace('.', '_')
-    
-    s3_key = f"{S3_PREFIX}{s3_binary_id}"
-    
     try:
-        # Get object from S3
-        response = s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
-        content = response['Body'].read()
-        
-        # Parse JSON
-        binary_data = json.loads(content)
-        
-        # Decode base64 content from 'data' field (not 'content')
-        if 'data' in binary_data:
-            decoded = base64.b64decode(binary_data['data']).decode('utf-8', errors='ignore')
-            return decoded
-        else:
-            return None
-            
+        # Local document store first; S3 (prefix/underscore key mapping) only on a miss
+        return get_document_store(s3_client).get_text(binary_id)
     except Exception as e:
         print(f"  ✗ Error retrieving {binary_id}: {str(e)}")
         return None
@@ -254,30 +243,12 @@ def extract_text_from_html(html_content):
     Returns:
         str: Extracted plain text
     """
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # Get text
-        text = soup.get_text()
-        
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        return text
-    except Exception as e:
-        print(f"  ✗ Error extracting HTML text: {str(e)}")
-        return html_content  # Return raw content if parsing fails
+    return normalize_text(html_content)
 
 
 def extract_text_from_rtf(rtf_content):
     """
-    Extract plain text from RTF content (basic extraction).
+    Extract plain text from RTF content (control words and destination groups parsed).
     
     Args:
         rtf_content: RTF string
@@ -285,11 +256,7 @@ def extract_text_from_rtf(rtf_content):
     Returns:
         str: Extracted plain text
     """
-    # Basic RTF stripping - remove control words
-    text = re.sub(r'\\[a-z]+\d*\s?', '', rtf_content)
-    text = re.sub(r'[{}]', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    return normalize_text(rtf_content)
 
 
 def download_and_extract_documents(s3_client, selected_docs):
@@ -305,6 +272,11 @@ def download_and_extract_documents(s3_client, selected_docs):
     """
     print("\n[7/7] Downloading and extracting Binary content from S3...")
     
+    store = get_document_store(s3_client)
+    counts = store.prefetch(selected_docs['binary_id'])
+    print(f"  ✓ Prefetched {counts['fetched']} documents "
+          f"({counts['already_stored']} already in local store, {counts['failed']} failed)")
+    
     results = []
     total = len(selected_docs)
     errors = 0
@@ -320,26 +292,23 @@ def download_and_extract_documents(s3_client, selected_docs):
             errors += 1
             continue
         
-        # Extract text based on content type
-        if 'text/html' in str(row['content_type']):
-            note_text = extract_text_from_html(content)
-        elif 'text/rtf' in str(row['content_type']):
-            note_text = extract_text_from_rtf(content)
-        else:
-            note_text = content  # Use raw content for other types
-        
-        # Store result
+        # Store result (text extracted below, all documents at once)
         results.append({
             'NOTE_ID': row['document_reference_id'],
             'SUBJECT_ID': PATIENT_ID,
             'NOTE_DATETIME': row['document_date'],
-            'NOTE_TEXT': note_text,
+            'NOTE_TEXT': content,
             'DOCUMENT_TYPE': row['document_type']
         })
     
+    # Extract text from HTML/RTF (format detected from content) across a process pool
+    for result, note_text in zip(results, normalize_many(r['NOTE_TEXT'] for r in results)):
+        result['NOTE_TEXT'] = note_text
+    
     print(f"\n  ✓ Successfully retrieved {len(results)} documents")
     if errors > 0:
         print(f"  ⚠ Failed to retrieve {errors} documents")
+    print(f"  {store.summary()}")
     
     return pd.DataFrame(results)
 
@@ -0,0 +1,809 @@
+"""
+Athena Query Engine
+===================
+
+Shared Athena execution layer for the extraction scripts.
+
+Replaces the per-script ``start_query_execution`` + ``time.sleep(2)`` loops with:
+- NextToken pagination (no silent truncation at 1000 rows)
+- Exponential-backoff polling instead of fixed sleeps
+- Typed DataFrames built from the result set column metadata
+- Many queries in flight at once via ``query_many``
+- Bulk result download straight from S3 (``fetch_mode='s3_csv'`` or ``'unload'``)
+- Optional on-disk result cache (see athena_result_cache.py)
+
+Fetch modes:
+- ``api``: GetQueryResults JSON pages (default, works everywhere)
+- ``s3_csv``: one streaming GET of the query's CSV OutputLocation, parsed by pandas
+- ``unload``: wraps the query in ``UNLOAD ... WITH (format = 'PARQUET')`` and reads
+  the Parquet files (requires pyarrow; best for very large result sets). The
+  files are deleted once read. UNLOAD writes its files in parallel, so rows
+  come back in no particular order: queries with an ORDER BY use ``s3_csv``
+  instead
+"""
+
+import io
+import logging
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import boto3
+import pandas as pd
+
+from athena_result_cache import QueryResultCache
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+# Athena column types -> pandas conversions (anything else stays as string)
+INTEGER_TYPES = {'tinyint', 'smallint', 'integer', 'int', 'bigint'}
+FLOAT_TYPES = {'float', 'real', 'double', 'decimal'}
+BOOLEAN_TYPES = {'boolean'}
+DATE_TYPES = {'date'}
+TIMESTAMP_TYPES = {'timestamp', 'timestamp with time zone'}
+
+# BatchGetQueryExecution accepts at most 50 IDs per call
+BATCH_STATUS_LIMIT = 50
+
+FETCH_MODES = ('api', 's3_csv', 'unload')
+
+# DeleteObjects accepts at most 1000 keys per call
+DELETE_OBJECTS_LIMIT = 1000
+
+# Any ORDER BY (window functions included) keeps a query off UNLOAD
+ORDER_BY = re.compile(r'\border\s+by\b', re.IGNORECASE)
+
+
+class AthenaQueryError(RuntimeError):
+    """Raised when an Athena query ends in FAILED or CANCELLED state."""
+
+
+class AthenaQueryEngine:
+    """
+    Execute Athena queries and return complete, typed results.
+
+    The engine wraps a single boto3 Athena client, which is thread-safe, so one
+    instance can be shared by every extractor in a run.
+    """
+
+    def __init__(
+        self,
+        athena_client=None,
+        database: Optional[str] = None,
+        output_location: Optional[str] = None,
+        work_group: Optional[str] = None,
+        aws_profile: Optional[str] = None,
+        region_name: str = 'us-east-1',
+        poll_initial: float = 0.2,
+        poll_max: float = 5.0,
+        poll_multiplier: float = 1.5,
+        timeout: float = 600.0,
+        max_concurrency: int = 20,
+        fetch_workers: int = 8,
+        page_size: int = 1000,
+        s3_client=None,
+        fetch_mode: str = 'api',
+        unload_location: Optional[str] = None,
+        cache: Optional[QueryResultCache] = None
+    ):
+        """
+        Initialize query engine.
+
+        Args:
+            athena_client: Existing boto3 Athena client (created from aws_profile if omitted)
+            database: Default database for queries
+            output_location: Default S3 output location for query results
+            work_group: Optional Athena work group
+            aws_profile: AWS profile used when no client is supplied
+            region_name: AWS region used when no client is supplied
+            poll_initial: First polling interval in seconds
+            poll_max: Upper bound on the polling interval in seconds
+            poll_multiplier: Backoff factor applied after each unfinished poll
+            timeout: Per-query timeout in seconds
+            max_concurrency: Maximum number of queries in flight in query_many
+            fetch_workers: Threads used to download result pages in query_many
+            page_size: GetQueryResults page size (Athena maximum is 1000)
+            s3_client: boto3 S3 client for the s3_csv/unload fetch modes (created lazily if omitted)
+            fetch_mode: Default result fetch mode ('api', 's3_csv' or 'unload')
+            unload_location: S3 prefix for UNLOAD output (defaults to <output_location>/unload/)
+            cache: Result cache consulted by query() and query_many() (None = always query)
+        """
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"fetch_mode must be one of {FETCH_MODES}, got '{fetch_mode}'")
+
+        self._session_kwargs = {'region_name': region_name}
+        if aws_profile:
+            self._session_kwargs['profile_name'] = aws_profile
+
+        if athena_client is None:
+            athena_client = boto3.Session(**self._session_kwargs).client('athena')
+
+        self.athena = athena_client
+        self._s3 = s3_client
+        self.fetch_mode = fetch_mode
+        self.unload_location = unload_location
+        self.cache = cache if cache is not None and cache.enabled else None
+        self.database = database
+        self.output_location = output_location
+        self.work_group = work_group
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_multiplier = poll_multiplier
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.fetch_workers = fetch_workers
+        self.page_size = min(page_size, 1000)
+
+    @classmethod
+    def from_patient_config(cls, patient_config: Dict[str, Any], **kwargs) -> 'AthenaQueryEngine':
+        """
+        Build an engine from a patient_config.json dictionary.
+
+        Args:
+            patient_config: Config with aws_profile, database, s3_output (region,
+                athena_fetch_mode and athena_cache* keys optional)
+            **kwargs: Overrides passed through to the constructor
+
+        Returns:
+            Configured AthenaQueryEngine
+        """
+        options = {
+            'aws_profile': patient_config.get('aws_profile'),
+            'database': patient_config.get('database'),
+            'output_location': patient_config.get('s3_output'),
+            'region_name': patient_config.get('region', 'us-east-1'),
+            'fetch_mode': patient_config.get('athena_fetch_mode', 'api'),
+            'cache': QueryResultCache.from_config(patient_config),
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    @property
+    def s3(self):
+        """S3 client used by the bulk fetch modes."""
+        if self._s3 is None:
+            self._s3 = boto3.Session(**self._session_kwargs).client('s3')
+        return self._s3
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+
+    def start(self, query: str, database: Optional[str] = None) -> str:
+        """
+        Submit a query without waiting for it.
+
+        Args:
+            query: SQL query string
+            database: Database override (defaults to engine database)
+
+        Returns:
+            Query execution ID
+        """
+        params = {'QueryString': query}
+
+        database = database or self.database
+        if database:
+            params['QueryExecutionContext'] = {'Database': database}
+        if self.output_location:
+            params['ResultConfiguration'] = {'OutputLocation': self.output_location}
+        if self.work_group:
+            params['WorkGroup'] = self.work_group
+
+        response = self.athena.start_query_execution(**params)
+        return response['QueryExecutionId']
+
+    def wait(self, query_execution_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Poll a query with exponential backoff until it finishes.
+
+        Args:
+            query_execution_id: Query execution ID
+            timeout: Timeout override in seconds
+
+        Returns:
+            The QueryExecution description of the succeeded query
+
+        Raises:
+            AthenaQueryError: If the query fails or is cancelled
+            TimeoutError: If the query does not finish in time
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout
+        delay = self.poll_initial
+
+        while True:
+            execution = self.athena.get_query_execution(
+                QueryExecutionId=query_execution_id
+            )['QueryExecution']
+            state = execution['Status']['State']
+
+            if state in TERMINAL_STATES:
+                self._raise_for_state(query_execution_id, execution)
+                return execution
+
+            if time.monotonic() + delay > deadline:
+                self.athena.stop_query_execution(QueryExecutionId=query_execution_id)
+                raise TimeoutError(f"Query {query_execution_id} exceeded {timeout:.0f}s timeout")
+
+            time.sleep(delay)
+            delay = min(delay * self.poll_multiplier, self.poll_max)
+
+    def _raise_for_state(self, query_execution_id: str, execution: Dict[str, Any]) -> None:
+        """Raise AthenaQueryError for a FAILED/CANCELLED execution."""
+        status = execution['Status']
+        if status['State'] != 'SUCCEEDED':
+            reason = status.get('StateChangeReason', 'Unknown')
+            raise AthenaQueryError(f"Query {query_execution_id} {status['State']}: {reason}")
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+
+    def iter_result_pages(self, query_execution_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every GetQueryResults page, following NextToken to the end.
+
+        Args:
+            query_execution_id: Query execution ID of a succeeded query
+
+        Yields:
+            Raw GetQueryResults responses
+        """
+        params = {'QueryExecutionId': query_execution_id, 'MaxResults': self.page_size}
+
+        while True:
+            page = self.athena.get_query_results(**params)
+            yield page
+
+            next_token = page.get('NextToken')
+            if not next_token:
+                break
+            params['NextToken'] = next_token
+
+    def fetch_result_set(self, query_execution_id: str) -> Dict[str, Any]:
+        """
+        Fetch all pages merged into a single GetQueryResults-shaped response.
+
+        Useful for callers that already parse ``ResultSet.Rows`` themselves.
+
+        Args:
+            query_execution_id: Query execution ID of a succeeded query
+
+        Returns:
+            Dict with 'ResultSet' containing all rows (header row first)
+        """
+        merged = None
+        for page in self.iter_result_pages(query_execution_id):
+            if merged is None:
+                merged = {'ResultSet': {
+                    'Rows': list(page['ResultSet']['Rows']),
+                    'ResultSetMetadata': page['ResultSet']['ResultSetMetadata'],
+                }}
+            else:
+                merged['ResultSet']['Rows'].extend(page['ResultSet']['Rows'])
+        return merged
+
+    def fetch_dataframe(
+        self,
+        query_execution_id: str,
+        typed: bool = True,
+        na_value: Optional[str] = None,
+        fetch_mode: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Fetch the complete result of a succeeded query as a DataFrame.
+
+        Args:
+            query_execution_id: Query execution ID of a succeeded query
+            typed: Convert columns using the Athena column types
+            na_value: Value for NULL cells when typed is False
+            fetch_mode: 'api' or 's3_csv' (defaults to the engine fetch mode;
+                'unload' falls back to 'api' since the query has already run)
+
+        Returns:
+            DataFrame with one row per result row
+        """
+        fetch_mode = fetch_mode or self.fetch_mode
+        if fetch_mode == 's3_csv':
+            return self.fetch_dataframe_from_s3(query_execution_id, typed=typed, na_value=na_value)
+        return self._fetch_api_dataframe(query_execution_id, typed=typed, na_value=na_value)
+
+    def _fetch_api_dataframe(
+        self,
+        query_execution_id: str,
+        typed: bool = True,
+        na_value: Optional[str] = None
+    ) -> pd.DataFrame:
+        """Parse every GetQueryResults page into a DataFrame."""
+        columns: List[str] = []
+        column_types: List[str] = []
+        rows: List[List[Optional[str]]] = []
+
+        for page_number, page in enumerate(self.iter_result_pages(query_execution_id)):
+            page_rows = page['ResultSet']['Rows']
+
+            if page_number == 0:
+                column_info = page['ResultSet']['ResultSetMetadata']['ColumnInfo']
+                columns = [col['Name'] for col in column_info]
+                column_types = [col.get('Type', 'varchar').lower() for col in column_info]
+
+                # SELECT results repeat the column names as the first row
+                if page_rows and [d.get('VarCharValue') for d in page_rows[0]['Data']] == columns:
+                    page_rows = page_rows[1:]
+
+            width = len(columns)
+            for row in page_rows:
+                values = [d.get('VarCharValue', na_value) for d in row['Data']]
+                if len(values) < width:
+                    values.extend([na_value] * (width - len(values)))
+                rows.append(values)
+
+        df = pd.DataFrame(rows, columns=columns, dtype=object)
+
+        if typed:
+            df = apply_athena_types(df, column_types)
+
+        logger.debug(f"Query {query_execution_id} returned {len(df)} rows")
+        return df
+
+    def fetch_dataframe_from_s3(
+        self,
+        query_execution_id: str,
+        typed: bool = True,
+        na_value: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Read the query's CSV result object from its S3 OutputLocation in one GET.
+
+        Athena writes every SELECT result as a fully quoted CSV; streaming it
+        through pandas' C parser avoids walking ResultSet.Rows JSON row by row.
+        Non-CSV outputs (DDL statements) fall back to GetQueryResults.
+
+        Args:
+            query_execution_id: Query execution ID of a succeeded query
+            typed: Convert columns using the Athena column types
+            na_value: Value for empty cells when typed is False
+
+        Returns:
+            DataFrame with one row per result row
+        """
+        execution = self.athena.get_query_execution(
+            QueryExecutionId=query_execution_id
+        )['QueryExecution']
+        output_location = execution.get('ResultConfiguration', {}).get('OutputLocation', '')
+
+        if not output_location.endswith('.csv'):
+            return self._fetch_api_dataframe(query_execution_id, typed=typed, na_value=na_value)
+
+        bucket, key = split_s3_uri(output_location)
+        body = self.s3.get_object(Bucket=bucket, Key=key)['Body']
+
+        # Read everything as text first so typing follows the Athena schema, not pandas' guesses
+        df = pd.read_csv(body, dtype=str, keep_default_na=False, na_values=[''])
+
+        if typed:
+            metadata = self.athena.get_query_results(
+                QueryExecutionId=query_execution_id, MaxResults=1
+            )['ResultSet']['ResultSetMetadata']
+            column_types = [col.get('Type', 'varchar').lower() for col in metadata['ColumnInfo']]
+            return apply_athena_types(df, column_types)
+
+        return df.astype(object).where(df.notna(), na_value)
+
+    def query(
+        self,
+        query: str,
+        database: Optional[str] = None,
+        typed: bool = True,
+        na_value: Optional[str] = None,
+        fetch_mode: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Execute a query, wait for it and return all rows.
+
+        Args:
+            query: SQL query string
+            database: Database override
+            typed: Convert columns using the Athena column types
+            na_value: Value for NULL cells when typed is False
+            fetch_mode: 'api', 's3_csv' or 'unload' (defaults to the engine fetch mode)
+
+        Returns:
+            DataFrame with the complete result set
+        """
+        fetch_mode = fetch_mode or self.fetch_mode
+
+        if self.cache is not None:
+            cached = self.cache.get(query, database or self.database, typed, na_value)
+            if cached is not None:
+                return cached
+
+        fetch_mode = unordered_fetch_mode(query, fetch_mode)
+        if fetch_mode == 'unload':
+            query_execution_id, prefix = self.start_unload(query, database)
+            try:
+                self.wait(query_execution_id)
+            except Exception:
+                self.delete_unload_output(prefix)
+                raise
+            df = self.fetch_unload_dataframe(prefix, typed=typed, na_value=na_value)
+        else:
+            query_execution_id = self.start(query, database)
+            self.wait(query_execution_id)
+            df = self.fetch_dataframe(query_execution_id, typed=typed, na_value=na_value, fetch_mode=fetch_mode)
+
+        if self.cache is not None:
+            self.cache.put(query, database or self.database, df, typed, na_value)
+        return df
+
+    def start_unload(self, query: str, database: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Submit ``query`` wrapped in an UNLOAD to Parquet under a fresh S3 prefix.
+
+        Args:
+            query: SELECT statement to unload (without ORDER BY; UNLOAD output is unordered)
+            database: Database override
+
+        Returns:
+            Tuple of (query execution ID, S3 prefix holding the Parquet files)
+        """
+        if ORDER_BY.search(query):
+            raise ValueError("UNLOAD does not keep the ORDER BY of a query; use fetch_mode 'api' or 's3_csv'")
+        base = self.unload_location or f"{(self.output_location or '').rstrip('/')}/unload"
+        if not base.startswith('s3://'):
+            raise ValueError("UNLOAD needs unload_location or output_location to be an s3:// URI")
+
+        prefix = f"{base.rstrip('/')}/{uuid.uuid4().hex}/"
+        statement = f"UNLOAD ({query.strip().rstrip(';')}) TO '{prefix}' WITH (format = 'PARQUET')"
+        return self.start(statement, database), prefix
+
+    def fetch_unload_dataframe(
+        self,
+        prefix: str,
+        typed: bool = True,
+        na_value: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Read the Parquet files written by an UNLOAD, then delete them.
+
+        Args:
+            prefix: S3 prefix returned by start_unload
+            typed: Keep Parquet column types (False renders every value as the
+                text the api fetch mode returns)
+            na_value: Value for NULL cells when typed is False
+
+        Returns:
+            DataFrame with the unloaded rows
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("fetch_mode='unload' requires pyarrow (pip install pyarrow)") from e
+
+        bucket, key_prefix = split_s3_uri(prefix)
+        tables = []
+        try:
+            paginator = self.s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=key_prefix):
+                for obj in page.get('Contents', []):
+                    if obj['Size'] == 0:
+                        continue
+                    data = self.s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+                    tables.append(pq.read_table(io.BytesIO(data)))
+        finally:
+            self.delete_unload_output(prefix)
+
+        if not tables:
+            return pd.DataFrame()
+
+        # Nullable pandas dtypes keep integer/boolean columns with NULLs from turning into floats
+        nullable_types = {
+            pa.int8(): pd.Int64Dtype(), pa.int16(): pd.Int64Dtype(),
+            pa.int32(): pd.Int64Dtype(), pa.int64(): pd.Int64Dtype(),
+            pa.bool_(): pd.BooleanDtype(),
+        }
+        df = pa.concat_tables(tables).to_pandas(types_mapper=nullable_types.get)
+
+        if not typed:
+            for column in df.columns:
+                df[column] = athena_text(df[column]).where(df[column].notna(), na_value)
+
+        return df
+
+    def delete_unload_output(self, prefix: str) -> None:
+        """
+        Delete every object under an UNLOAD prefix (failures are logged, not raised).
+
+        Args:
+            prefix: S3 prefix returned by start_unload
+        """
+        bucket, key_prefix = split_s3_uri(prefix)
+        try:
+            paginator = self.s3.get_paginator('list_objects_v2')
+            keys = [obj['Key'] for page in paginator.paginate(Bucket=bucket, Prefix=key_prefix)
+                    for obj in page.get('Contents', [])]
+            for i in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+                self.s3.delete_objects(Bucket=bucket, Delete={
+                    'Objects': [{'Key': key} for key in keys[i:i + DELETE_OBJECTS_LIMIT]], 'Quiet': True
+                })
+        except Exception as e:
+            logger.warning(f"Could not delete UNLOAD output {prefix}: {e}")
+
+    def query_many(
+        self,
+        queries: Dict[str, str],
+        database: Optional[str] = None,
+        typed: bool = True,
+        na_value: Optional[str] = None,
+        raise_on_error: bool = True,
+        fetch_mode: Optional[str] = None,
+        errors: Optional[Dict[str, Exception]] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Run many queries concurrently and return their results by key.
+
+        Up to ``max_concurrency`` queries are kept in flight; their states are
+        polled together with BatchGetQueryExecution and finished results are
+        downloaded on a thread pool while the rest keep running, so the batch
+        takes roughly as long as its slowest query.
+
+        Args:
+            queries: Mapping of result key -> SQL query
+            database: Database override applied to every query
+            typed: Convert columns using the Athena column types
+            na_value: Value for NULL cells when typed is False
+            raise_on_error: Raise on the first failed query (or result download)
+                instead of returning an empty DataFrame for it
+            fetch_mode: 'api', 's3_csv' or 'unload' (defaults to the engine fetch mode)
+            errors: Filled with result key -> exception for every failed query
+                when raise_on_error is False (their empty DataFrames are
+                otherwise indistinguishable from empty results)
+
+        Returns:
+            Mapping of result key -> DataFrame
+        """
+        fetch_mode = fetch_mode or self.fetch_mode
+        cached: Dict[str, pd.DataFrame] = {}
+        if self.cache is not None:
+            for key, sql in queries.items():
+                df = self.cache.get(sql, database or self.database, typed, na_value)
+                if df is not None:
+                    cached[key] = df
+
+        pending = [(key, sql) for key, sql in queries.items() if key not in cached]
+        in_flight: Dict[str, str] = {}
+        unload_prefixes: Dict[str, str] = {}
+        started_at: Dict[str, float] = {}
+        failures: Dict[str, Exception] = {}
+        futures = {}
+        delay = self.poll_initial
+
+        def stop_in_flight():
+            for query_execution_id in in_flight:
+                self.athena.stop_query_execution(QueryExecutionId=query_execution_id)
+                if query_execution_id in unload_prefixes:
+                    self.delete_unload_output(unload_prefixes[query_execution_id])
+
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as pool:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_concurrency:
+                    key, sql = pending.pop(0)
+                    try:
+                        if unordered_fetch_mode(sql, fetch_mode) == 'unload':
+                            query_execution_id, prefix = self.start_unload(sql, database)
+                            unload_prefixes[query_execution_id] = prefix
+                        else:
+                            query_execution_id = self.start(sql, database)
+                    except Exception:
+                        stop_in_flight()
+                        raise
+                    in_flight[query_execution_id] = key
+                    started_at[query_execution_id] = time.monotonic()
+
+                finished = 0
+                for execution in self._batch_get_executions(list(in_flight)):
+                    query_execution_id = execution['QueryExecutionId']
+                    key = in_flight[query_execution_id]
+
+                    if execution['Status']['State'] in TERMINAL_STATES:
+                        del in_flight[query_execution_id]
+                        finished += 1
+                        try:
+                            self._raise_for_state(query_execution_id, execution)
+                        except AthenaQueryError as e:
+                            failures[key] = e
+                            if query_execution_id in unload_prefixes:
+                                self.delete_unload_output(unload_prefixes[query_execution_id])
+                            continue
+                        if query_execution_id in unload_prefixes:
+                            futures[key] = pool.submit(
+                                self.fetch_unload_dataframe,
+                                unload_prefixes[query_execution_id], typed, na_value
+                            )
+                        else:
+                            futures[key] = pool.submit(
+                                self.fetch_dataframe, query_execution_id, typed, na_value,
+                                's3_csv' if fetch_mode == 'unload' else fetch_mode
+                            )
+                    elif time.monotonic() - started_at[query_execution_id] > self.timeout:
+                        del in_flight[query_execution_id]
+                        finished += 1
+                        self.athena.stop_query_execution(QueryExecutionId=query_execution_id)
+                        if query_execution_id in unload_prefixes:
+                            self.delete_unload_output(unload_prefixes[query_execution_id])
+                        failures[key] = TimeoutError(
+                            f"Query {query_execution_id} exceeded {self.timeout:.0f}s timeout"
+                        )
+
+                if failures and raise_on_error:
+                    stop_in_flight()
+                    key, error = next(iter(failures.items()))
+                    raise AthenaQueryError(f"{key}: {error}") from error
+
+                if in_flight and not finished:
+                    time.sleep(delay)
+                    delay = min(delay * self.poll_multiplier, self.poll_max)
+                else:
+                    delay = self.poll_initial
+
+            results = {}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    failures[key] = e
+
+        if failures and raise_on_error:
+            key, error = next(iter(failures.items()))
+            raise AthenaQueryError(f"{key}: {error}") from error
+
+        if self.cache is not None:
+            for key, df in results.items():
+                self.cache.put(queries[key], database or self.database, df, typed, na_value)
+        results.update(cached)
+
+        if errors is not None:
+            errors.update(failures)
+        for key, error in failures.items():
+            logger.error(f"Query '{key}' failed: {error}")
+            results[key] = pd.DataFrame()
+
+        # Preserve the caller's ordering
+        return {key: results[key] for key in queries}
+
+    def _batch_get_executions(self, query_execution_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch QueryExecution descriptions in chunks of 50."""
+        executions = []
+        for i in range(0, len(query_execution_ids), BATCH_STATUS_LIMIT):
+            response = self.athena.batch_get_query_execution(
+                QueryExecutionIds=query_execution_ids[i:i + BATCH_STATUS_LIMIT]
+            )
+            executions.extend(response.get('QueryExecutions', []))
+        return executions
+
+
+class QueryBatch:
+    """
+    Results of independent queries prefetched together with ``query_many``.
+
+    Extraction scripts build their SQL up front, run it as one batch and then
+    take each result by its SQL text where they would have called ``query()``.
+    """
+
+    def __init__(self, engine: 'AthenaQueryEngine', queries: Dict[str, str], **kwargs):
+        """
+        Run the batch.
+
+        Args:
+            engine: AthenaQueryEngine (or a stand-in with the same query_many)
+            queries: Mapping of result key -> SQL query
+            **kwargs: database, typed, na_value, fetch_mode for query_many
+        """
+        errors: Dict[str, Exception] = {}
+        results = engine.query_many(queries, raise_on_error=False, errors=errors, **kwargs)
+        self._results = {sql: errors.get(key, results[key]) for key, sql in queries.items()}
+
+    def take(self, query: str) -> Optional[pd.DataFrame]:
+        """
+        Hand out (and forget) a prefetched result.
+
+        Returns:
+            The query's DataFrame, or None if the query was not in the batch
+
+        Raises:
+            The query's own exception if it failed
+        """
+        result = self._results.pop(query, None)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def apply_athena_types(df: pd.DataFrame, column_types: List[str]) -> pd.DataFrame:
+    """
+    Convert string columns to pandas dtypes based on Athena column types.
+
+    Args:
+        df: DataFrame of raw VarCharValue strings
+        column_types: Athena type name for each column, in order
+
+    Returns:
+        DataFrame with numeric, boolean and datetime columns converted
+    """
+    for column, athena_type in zip(df.columns, column_types):
+        # 'decimal(10,2)' -> 'decimal', 'timestamp(3)' -> 'timestamp'
+        base_type = athena_type.split('(')[0].strip()
+
+        if base_type in INTEGER_TYPES:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('Int64')
+        elif base_type in FLOAT_TYPES:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        elif base_type in BOOLEAN_TYPES:
+            df[column] = df[column].map({'true': True, 'false': False}).astype('boolean')
+        elif base_type in DATE_TYPES:
+            df[column] = pd.to_datetime(df[column], format='%Y-%m-%d', errors='coerce')
+        elif base_type in TIMESTAMP_TYPES:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+
+    return df
+
+
+def unordered_fetch_mode(query: str, fetch_mode: str) -> str:
+    """
+    Fetch mode to run ``query`` with: 's3_csv' instead of 'unload' when it has an ORDER BY.
+
+    Args:
+        query: SQL query string
+        fetch_mode: Requested fetch mode
+
+    Returns:
+        Fetch mode that keeps the query's row order
+    """
+    if fetch_mode == 'unload' and ORDER_BY.search(query):
+        logger.debug("Query has an ORDER BY; fetching it with s3_csv instead of unload")
+        return 's3_csv'
+    return fetch_mode
+
+
+def athena_text(values: pd.Series) -> pd.Series:
+    """
+    Render a typed column as the text GetQueryResults returns for it.
+
+    Timestamps get Athena's millisecond precision ('2024-01-05 10:20:30.000')
+    and booleans are lower case; other values use their string form.
+
+    Args:
+        values: Column read from Parquet
+
+    Returns:
+        Object column of strings (NULLs left as missing values)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        text = values.dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+    elif pd.api.types.is_bool_dtype(values):
+        text = values.astype('string').str.lower()
+    else:
+        text = values.astype('string')
+    return text.astype(object)
+
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    """
+    Split an s3://bucket/key URI into (bucket, key).
+
+    Args:
+        uri: S3 URI
+
+    Returns:
+        Tuple of bucket name and key (key may be empty)
+    """
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {uri}")
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
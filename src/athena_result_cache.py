@@ -0,0 +1,353 @@
+"""
+Athena Result Cache
+===================
+
+Content-addressed on-disk cache for Athena query results.
+
+Entries are keyed on the normalized SQL text (comments and whitespace outside
+string literals removed), the database, a data-snapshot tag and the result
+shape options (typed/na_value), and stored as Parquet next to a small JSON
+sidecar. Re-running identical SQL against the same snapshot reads the Parquet
+file instead of scanning Athena again.
+
+- TTL: entries older than ``ttl_seconds`` are treated as misses and removed
+- LRU: when the cache exceeds ``max_bytes`` the least recently read entries go first
+- Counters: ``hits``, ``misses``, ``stores``, ``evictions`` (see ``summary()``)
+- ``refresh=True`` skips reads but still stores, so the next run is warm again
+
+Configuration (patient_config.json keys / environment variables):
+- ``athena_cache`` (bool) or ``ATHENA_CACHE=1``: enable for the extraction scripts
+- ``athena_cache_dir`` / ``ATHENA_CACHE_DIR``: cache directory
+- ``athena_snapshot_tag`` / ``ATHENA_SNAPSHOT_TAG``: data snapshot (change it when the data is reloaded)
+- ``athena_cache_ttl_hours``: entry lifetime
+- Validation scripts (``add_cache_arguments``): off unless ``--cache`` is given
+  together with ``--snapshot-tag``, so a re-run after the tables are refreshed
+  never reads results of the previous load
+
+Requires pyarrow for Parquet; without it the cache disables itself with a warning.
+
+Cached results are unencrypted patient data (PHI): the cache directory is
+created, or restricted, to mode 0700 (owner only).
+"""
+
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'brim_athena_results'
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# String literals, line comments, whitespace runs, everything else
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|--[^\n]*|\s+|[^'\s-]+|-")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize SQL text for cache keys.
+
+    Comments are dropped and whitespace outside string literals is collapsed,
+    so re-indented or re-commented queries share an entry. Literals are kept
+    verbatim (a different patient ID is a different query).
+
+    Args:
+        sql: SQL query string
+
+    Returns:
+        Normalized SQL
+    """
+    parts = []
+    for token in _SQL_TOKEN.findall(sql):
+        if token.startswith('--'):
+            continue
+        if token.isspace():
+            if parts and parts[-1] != ' ':
+                parts.append(' ')
+            continue
+        parts.append(token)
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+class QueryResultCache:
+    """
+    Parquet-backed Athena result cache with TTL and size-bounded LRU eviction.
+
+    Safe to share between threads (one engine used by several extractors).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        snapshot_tag: str = '',
+        ttl_seconds: Optional[float] = DEFAULT_TTL_SECONDS,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        refresh: bool = False,
+        enabled: bool = True
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            cache_dir: Directory for cache entries (created if missing)
+            snapshot_tag: Data snapshot identifier folded into every key
+            ttl_seconds: Entry lifetime (None = never expire)
+            max_bytes: Total size bound before LRU eviction (None = unbounded)
+            refresh: Ignore existing entries but store fresh results
+            enabled: False turns every call into a no-op miss
+        """
+        self.cache_dir = Path(cache_dir or os.environ.get('ATHENA_CACHE_DIR', DEFAULT_CACHE_DIR))
+        self.snapshot_tag = snapshot_tag
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        # pandas reads and writes the Parquet files through pyarrow
+        if self.enabled and importlib.util.find_spec('pyarrow') is None:
+            logger.warning("Athena result cache disabled: pyarrow is not installed (pip install pyarrow)")
+            self.enabled = False
+
+        if self.enabled:
+            # Patient data: owner-only access
+            self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            os.chmod(self.cache_dir, 0o700)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], **kwargs) -> 'QueryResultCache':
+        """
+        Build a cache from patient_config.json keys (falling back to environment variables).
+
+        Args:
+            config: Config with optional athena_cache* keys
+            **kwargs: Overrides passed through to the constructor
+
+        Returns:
+            QueryResultCache (disabled unless athena_cache / ATHENA_CACHE is set)
+        """
+        ttl_hours = config.get('athena_cache_ttl_hours')
+        options = {
+            'enabled': bool(config.get('athena_cache', os.environ.get('ATHENA_CACHE', '') not in ('', '0'))),
+            'cache_dir': config.get('athena_cache_dir'),
+            'snapshot_tag': config.get('athena_snapshot_tag', os.environ.get('ATHENA_SNAPSHOT_TAG', '')),
+            'ttl_seconds': ttl_hours * 3600 if ttl_hours is not None else DEFAULT_TTL_SECONDS,
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    @classmethod
+    def from_args(cls, args) -> 'QueryResultCache':
+        """Build a cache from the options added by add_cache_arguments (disabled without --cache)."""
+        enabled = args.cache and not args.no_cache
+        if enabled and not args.snapshot_tag:
+            raise SystemExit("--cache needs --snapshot-tag (or ATHENA_SNAPSHOT_TAG) naming the data load, "
+                             "so results of an earlier load are never reused")
+        return cls(
+            cache_dir=args.cache_dir,
+            snapshot_tag=args.snapshot_tag,
+            ttl_seconds=args.cache_ttl_hours * 3600 if args.cache_ttl_hours else None,
+            refresh=args.refresh,
+            enabled=enabled,
+        )
+
+    # ------------------------------------------------------------------
+    # Keys and paths
+    # ------------------------------------------------------------------
+
+    def key(self, query: str, database: Optional[str], typed: bool = True, na_value: Optional[str] = None) -> str:
+        """Content address for a query result."""
+        payload = json.dumps({
+            'sql': normalize_sql(query),
+            'database': database or '',
+            'snapshot': self.snapshot_tag,
+            'typed': typed,
+            'na_value': na_value,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str):
+        return self.cache_dir / f'{key}.parquet', self.cache_dir / f'{key}.json'
+
+    # ------------------------------------------------------------------
+    # Get / put
+    # ------------------------------------------------------------------
+
+    def get(
+        self,
+        query: str,
+        database: Optional[str],
+        typed: bool = True,
+        na_value: Optional[str] = None
+    ) -> Optional[pd.DataFrame]:
+        """
+        Look up a cached result.
+
+        Returns:
+            The cached DataFrame, or None on a miss (disabled, refresh, absent or expired)
+        """
+        if not self.enabled:
+            return None
+        if self.refresh:
+            self._count('misses')
+            return None
+
+        data_path, meta_path = self._paths(self.key(query, database, typed, na_value))
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if self.ttl_seconds is not None and time.time() - meta['created_at'] > self.ttl_seconds:
+                self._remove(data_path, meta_path)
+                self._count('misses')
+                return None
+
+            df = pd.read_parquet(data_path)
+            os.utime(data_path)  # mtime = last access, for LRU
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self._count('misses')
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {data_path.name}: {e}")
+            self._remove(data_path, meta_path)
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        if not typed:
+            df = df.astype(object).where(df.notna(), na_value)
+        return df
+
+    def put(
+        self,
+        query: str,
+        database: Optional[str],
+        df: pd.DataFrame,
+        typed: bool = True,
+        na_value: Optional[str] = None
+    ):
+        """Store a result (atomically) and evict old entries if over the size bound."""
+        if not self.enabled:
+            return
+
+        data_path, meta_path = self._paths(self.key(query, database, typed, na_value))
+        tmp_suffix = f'.{uuid.uuid4().hex}.tmp'
+        tmp_data = data_path.with_name(data_path.name + tmp_suffix)
+        tmp_meta = meta_path.with_name(meta_path.name + tmp_suffix)
+
+        try:
+            df.to_parquet(tmp_data, index=False)
+            with open(tmp_meta, 'w') as f:
+                json.dump({
+                    'created_at': time.time(),
+                    'database': database,
+                    'snapshot_tag': self.snapshot_tag,
+                    'rows': len(df),
+                    'sql': normalize_sql(query)[:2000],
+                }, f)
+            os.replace(tmp_data, data_path)
+            os.replace(tmp_meta, meta_path)
+        except Exception as e:
+            logger.warning(f"Could not cache query result: {e}")
+            self._remove(tmp_data, tmp_meta)
+            return
+
+        self._count('stores')
+        if self.max_bytes is not None:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently read entries until under max_bytes."""
+        entries = []
+        now = time.time()
+        for data_path in self.cache_dir.glob('*.parquet'):
+            meta_path = data_path.with_suffix('.json')
+            try:
+                stat = data_path.stat()
+            except FileNotFoundError:
+                continue
+            if self.ttl_seconds is not None and now - stat.st_mtime > self.ttl_seconds:
+                # Not read within a TTL, so certainly expired
+                self._remove(data_path, meta_path)
+                self._count('evictions')
+                continue
+            entries.append((stat.st_mtime, stat.st_size, data_path, meta_path))
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, data_path, meta_path in sorted(entries):
+            if self.max_bytes is None or total <= self.max_bytes:
+                break
+            self._remove(data_path, meta_path)
+            self._count('evictions')
+            total -= size
+
+    def clear(self):
+        """Remove every cache entry."""
+        for path in list(self.cache_dir.glob('*.parquet')) + list(self.cache_dir.glob('*.json')):
+            self._remove(path)
+
+    # ------------------------------------------------------------------
+    # Bookkeeping
+    # ------------------------------------------------------------------
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _remove(*paths: Path):
+        for path in paths:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/store/eviction counters."""
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+
+    def summary(self) -> str:
+        """One-line counter summary for end-of-run logs."""
+        if not self.enabled:
+            return "Athena result cache: disabled"
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        return (f"Athena result cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate), "
+                f"{self.stores} stored, {self.evictions} evicted [{self.cache_dir}]")
+
+
+def add_cache_arguments(parser):
+    """
+    Add the standard cache options to an argparse parser.
+
+    --cache, --no-cache, --refresh, --snapshot-tag, --cache-dir, --cache-ttl-hours
+    """
+    group = parser.add_argument_group('Athena result cache')
+    group.add_argument('--cache', action='store_true',
+                       help='Read and write the local result cache (requires --snapshot-tag)')
+    group.add_argument('--no-cache', action='store_true',
+                       help='Always query Athena; do not read or write the local result cache (the default)')
+    group.add_argument('--refresh', action='store_true',
+                       help='Re-run every query and overwrite its cached result')
+    group.add_argument('--snapshot-tag', default=os.environ.get('ATHENA_SNAPSHOT_TAG', ''),
+                       help='Data snapshot tag, required with --cache; change it after the FHIR tables are reloaded')
+    group.add_argument('--cache-dir', type=Path, default=None,
+                       help=f'Cache directory (default: $ATHENA_CACHE_DIR or {DEFAULT_CACHE_DIR})')
+    group.add_argument('--cache-ttl-hours', type=float, default=DEFAULT_TTL_SECONDS / 3600,
+                       help='Entry lifetime in hours (0 = never expire)')
+    return group
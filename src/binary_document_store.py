@@ -0,0 +1,499 @@
+"""
+Binary Document Store
+=====================
+
+Persistent local store for FHIR Binary documents pulled from S3.
+
+Every retrieval script used to GET ``prd/source/Binary/<id>`` and base64-decode
+it on each run. The store keeps the decoded document bytes on local disk so a
+document is read from S3 once:
+
+- Keyed by Binary ID; blobs are content-addressed (SHA-256 of the decoded
+  bytes), so the same attachment under several Binary IDs is stored once
+- Blobs are zstd-compressed (zlib when the ``zstandard`` package is missing)
+- A SQLite index file maps Binary ID -> content hash, content type and last access
+- ``prefetch()`` downloads a list of Binary IDs concurrently
+- The least recently read blobs are evicted once the store passes ``max_bytes``
+- Counters: ``hits``, ``s3_reads``, ``stores``, ``deduplicated``, ``evictions``
+
+The decoded documents are clinical notes (PHI) and the store does not encrypt
+them, so nothing is persisted unless a directory is configured (``store_dir``
+or ``BINARY_STORE_DIR``); without one every call reads S3. The directory is
+created, or restricted, to mode 0700 (owner only); put it on an encrypted
+volume and delete it when a project ends.
+
+Usage:
+    store = BinaryDocumentStore(s3_client=s3_client, store_dir=project_dir / 'binary_store')
+    store.prefetch(binary_ids)
+    text = store.get_text('Binary/fABC.123')
+
+Configuration (environment variables):
+- ``BINARY_STORE_DIR``: store directory (default: none, every call reads S3)
+- ``BINARY_STORE=0``: disable persistence even when a directory is configured
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+DEFAULT_S3_BUCKET = 'radiant-prd-343218191717-us-east-1-prd-ehr-pipeline'
+DEFAULT_S3_PREFIX = 'prd/source/Binary/'
+
+_ZSTD_WARNED = False
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    binary_id    TEXT PRIMARY KEY,
+    content_hash TEXT,
+    content_type TEXT,
+    raw_bytes    INTEGER,
+    stored_at    REAL,
+    last_access  REAL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash TEXT PRIMARY KEY,
+    codec        TEXT,
+    stored_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS documents_hash ON documents (content_hash);
+"""
+
+
+class BinaryDocumentNotFound(KeyError):
+    """Raised when a Binary ID is not in S3 (and not in the local store)."""
+
+
+def normalize_binary_id(binary_id: str) -> str:
+    """
+    Map a FHIR Binary reference to its S3 object name.
+
+    Strips the ``Binary/`` prefix and replaces periods with underscores
+    (S3 naming bug in the Binary export).
+
+    Args:
+        binary_id: ``Binary/xxx`` or bare Binary ID
+
+    Returns:
+        S3 object name under the Binary prefix
+    """
+    binary_id = str(binary_id).strip()
+    if binary_id.startswith('Binary/'):
+        binary_id = binary_id[7:]
+    return binary_id.replace('.', '_')
+
+
+def decode_binary_resource(body: bytes):
+    """
+    Decode a FHIR Binary resource as stored in S3.
+
+    Args:
+        body: S3 object body
+
+    Returns:
+        (content bytes or None when the resource has no data, content type)
+    """
+    try:
+        resource = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # Not a FHIR Binary wrapper: the object is the document itself
+        return body, None
+    if not isinstance(resource, dict):
+        return body, None
+    data = resource.get('data')
+    if not data:
+        return None, resource.get('contentType')
+    return base64.b64decode(data), resource.get('contentType')
+
+
+class BinaryDocumentStore:
+    """
+    Local, size-bounded, content-addressed cache of decoded Binary documents.
+
+    Safe to share between threads (prefetch workers and readers).
+    """
+
+    def __init__(
+        self,
+        s3_client=None,
+        store_dir: Optional[Path] = None,
+        s3_bucket: str = DEFAULT_S3_BUCKET,
+        s3_prefix: str = DEFAULT_S3_PREFIX,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        max_workers: int = 16,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize store.
+
+        Args:
+            s3_client: Boto3 S3 client used on a miss
+            store_dir: Directory for the index and blobs (created with mode 0700 if missing;
+                       default BINARY_STORE_DIR, and without either nothing is stored)
+            s3_bucket: Bucket holding the Binary objects
+            s3_prefix: Key prefix of the Binary objects
+            max_bytes: Compressed size bound before LRU eviction (None = unbounded)
+            max_workers: Concurrent S3 reads in prefetch()
+            enabled: False reads S3 on every call and stores nothing
+                     (default: on when a store directory is configured, unless BINARY_STORE=0)
+        """
+        self.s3_client = s3_client
+        store_dir = store_dir or os.environ.get('BINARY_STORE_DIR')
+        self.store_dir = Path(store_dir) if store_dir else None
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.enabled = os.environ.get('BINARY_STORE', '1') != '0' if enabled is None else enabled
+        self.enabled = self.enabled and self.store_dir is not None
+        self.codec = 'zst' if ZSTD_AVAILABLE else 'zz'
+
+        self.hits = 0
+        self.s3_reads = 0
+        self.stores = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._db = None
+
+        if self.enabled:
+            global _ZSTD_WARNED
+            if not ZSTD_AVAILABLE and not _ZSTD_WARNED:
+                logger.warning("zstandard not installed; Binary store blobs use zlib (pip install zstandard)")
+                _ZSTD_WARNED = True
+            # Patient documents: owner-only access
+            self.store_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            os.chmod(self.store_dir, 0o700)
+            (self.store_dir / 'blobs').mkdir(exist_ok=True)
+            self._db = sqlite3.connect(str(self.store_dir / 'index.sqlite'), check_same_thread=False,
+                                       isolation_level=None, timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get_bytes(self, binary_id: str) -> Optional[bytes]:
+        """
+        Decoded document bytes for a Binary ID, reading S3 only on a miss.
+
+        Args:
+            binary_id: ``Binary/xxx`` or bare Binary ID
+
+        Returns:
+            Document bytes, or None if the Binary resource has no data
+
+        Raises:
+            BinaryDocumentNotFound: the object does not exist in S3
+            Exception: other S3 errors are passed through
+        """
+        key = normalize_binary_id(binary_id)
+        found, content = self._read_local(key)
+        if found:
+            return content
+
+        content, content_type = self._fetch(key)
+        self._write_local(key, content, content_type)
+        return content
+
+    def get_text(self, binary_id: str) -> Optional[str]:
+        """
+        Decoded document text (UTF-8, undecodable bytes dropped).
+
+        Args:
+            binary_id: ``Binary/xxx`` or bare Binary ID
+
+        Returns:
+            Document text, or None if the Binary resource has no data
+        """
+        content = self.get_bytes(binary_id)
+        if content is None:
+            return None
+        return content.decode('utf-8', errors='ignore')
+
+    def content_type(self, binary_id: str) -> Optional[str]:
+        """Content type recorded for a stored Binary ID (None if unknown or not stored)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._db.execute('SELECT content_type FROM documents WHERE binary_id = ?',
+                                   (normalize_binary_id(binary_id),)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, binary_id: str) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM documents WHERE binary_id = ?',
+                                   (normalize_binary_id(binary_id),)).fetchone()
+        return row is not None
+
+    def prefetch(self, binary_ids: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        Download every Binary ID that is not stored yet, concurrently.
+
+        Args:
+            binary_ids: Binary IDs (``Binary/`` prefix optional; blanks/NaN skipped)
+            max_workers: Concurrent S3 reads (default: self.max_workers)
+
+        Returns:
+            Counts: requested, already_stored, fetched, failed
+        """
+        keys = []
+        seen = set()
+        for binary_id in binary_ids:
+            if not isinstance(binary_id, str) or not binary_id.strip():
+                continue
+            key = normalize_binary_id(binary_id)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+
+        missing = [key for key in keys if key not in self] if self.enabled else []
+        counts = {'requested': len(keys), 'already_stored': len(keys) - len(missing), 'fetched': 0, 'failed': 0}
+        if not missing:
+            return counts
+
+        logger.info(f"Prefetching {len(missing)} Binary documents ({counts['already_stored']} already stored)")
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            futures = {pool.submit(self.get_bytes, key): key for key in missing}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    counts['fetched'] += 1
+                except Exception as e:
+                    counts['failed'] += 1
+                    logger.debug(f"Prefetch failed for {futures[future]}: {e}")
+        return counts
+
+    # ------------------------------------------------------------------
+    # S3 and local storage
+    # ------------------------------------------------------------------
+
+    def _fetch(self, key: str):
+        if self.s3_client is None:
+            raise BinaryDocumentNotFound(f"{key} is not stored locally and no S3 client was given")
+        try:
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=f"{self.s3_prefix}{key}")
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in ('NoSuchKey', '404'):
+                raise BinaryDocumentNotFound(f"s3://{self.s3_bucket}/{self.s3_prefix}{key}") from e
+            raise
+        body = response['Body'].read()
+        self._count('s3_reads')
+        return decode_binary_resource(body)
+
+    def _blob_path(self, content_hash: str, codec: str) -> Path:
+        return self.store_dir / 'blobs' / content_hash[:2] / f'{content_hash}.{codec}'
+
+    def _read_local(self, key: str):
+        """(found, content) from the local store."""
+        if not self.enabled:
+            return False, None
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT d.content_hash, b.codec FROM documents d '
+                'LEFT JOIN blobs b ON b.content_hash = d.content_hash WHERE d.binary_id = ?',
+                (key,)).fetchone()
+        if row is None:
+            return False, None
+
+        content_hash, codec = row
+        content = None
+        if content_hash is not None:
+            try:
+                content = self._decompress(self._blob_path(content_hash, codec).read_bytes(), codec)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable Binary store blob for {key}: {e}")
+                with self._lock:
+                    self._db.execute('DELETE FROM documents WHERE binary_id = ?', (key,))
+                return False, None
+
+        with self._lock:
+            self._db.execute('UPDATE documents SET last_access = ? WHERE binary_id = ?', (time.time(), key))
+        self._count('hits')
+        return True, content
+
+    def _write_local(self, key: str, content: Optional[bytes], content_type: Optional[str]):
+        if not self.enabled:
+            return
+
+        now = time.time()
+        content_hash = hashlib.sha256(content).hexdigest() if content is not None else None
+        new_blob = False
+        if content_hash is not None:
+            with self._lock:
+                exists = self._db.execute('SELECT 1 FROM blobs WHERE content_hash = ?',
+                                          (content_hash,)).fetchone()
+            if exists:
+                self._count('deduplicated')
+            else:
+                path = self._blob_path(content_hash, self.codec)
+                path.parent.mkdir(exist_ok=True)
+                compressed = self._compress(content)
+                tmp = path.with_name(f'{path.name}.{uuid.uuid4().hex}.tmp')
+                try:
+                    tmp.write_bytes(compressed)
+                    os.replace(tmp, path)
+                except Exception as e:
+                    logger.warning(f"Could not store Binary {key}: {e}")
+                    tmp.unlink(missing_ok=True)
+                    return
+                with self._lock:
+                    self._db.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)',
+                                     (content_hash, self.codec, len(compressed)))
+                new_blob = True
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, content_hash, content_type,
+                              len(content) if content is not None else 0, now, now))
+        self._count('stores')
+        if new_blob and self.max_bytes is not None:
+            self.evict()
+
+    def _compress(self, content: bytes) -> bytes:
+        if self.codec == 'zst':
+            return zstandard.ZstdCompressor(level=6).compress(content)
+        return zlib.compress(content, 6)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == 'zst':
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError('blob is zstd-compressed but zstandard is not installed')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    # ------------------------------------------------------------------
+    # Eviction and bookkeeping
+    # ------------------------------------------------------------------
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Drop the least recently read blobs (and their index rows) until under max_bytes."""
+        if not self.enabled:
+            return
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return
+
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(stored_bytes), 0) FROM blobs').fetchone()[0]
+            if total <= max_bytes:
+                return
+            candidates = self._db.execute(
+                'SELECT b.content_hash, b.codec, b.stored_bytes FROM blobs b '
+                'JOIN documents d ON d.content_hash = b.content_hash '
+                'GROUP BY b.content_hash ORDER BY MAX(d.last_access)').fetchall()
+            for content_hash, codec, stored_bytes in candidates:
+                if total <= max_bytes:
+                    break
+                self._db.execute('DELETE FROM documents WHERE content_hash = ?', (content_hash,))
+                self._db.execute('DELETE FROM blobs WHERE content_hash = ?', (content_hash,))
+                self._blob_path(content_hash, codec).unlink(missing_ok=True)
+                total -= stored_bytes
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every stored document."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for content_hash, codec in self._db.execute('SELECT content_hash, codec FROM blobs').fetchall():
+                self._blob_path(content_hash, codec).unlink(missing_ok=True)
+            self._db.execute('DELETE FROM documents')
+            self._db.execute('DELETE FROM blobs')
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus stored document/blob totals."""
+        stats = {'hits': self.hits, 's3_reads': self.s3_reads, 'stores': self.stores,
+                 'deduplicated': self.deduplicated, 'evictions': self.evictions}
+        if self.enabled:
+            with self._lock:
+                documents = self._db.execute('SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0) FROM documents').fetchone()
+                blobs = self._db.execute('SELECT COUNT(*), COALESCE(SUM(stored_bytes), 0) FROM blobs').fetchone()
+            stats.update({'documents': documents[0], 'raw_bytes': documents[1],
+                          'blobs': blobs[0], 'stored_bytes': blobs[1]})
+        return stats
+
+    def summary(self) -> str:
+        """One-line counter summary for end-of-run logs."""
+        if not self.enabled:
+            return f"Binary document store: disabled ({self.s3_reads} S3 reads)"
+        stats = self.stats()
+        return (f"Binary document store: {self.hits} local hits, {self.s3_reads} S3 reads, "
+                f"{self.deduplicated} deduplicated, {self.evictions} evicted; "
+                f"{stats['documents']} documents in {stats['stored_bytes'] / 1024 ** 2:.1f} MB "
+                f"({stats['raw_bytes'] / 1024 ** 2:.1f} MB raw) [{self.store_dir}]")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def main():
+    """Prefetch the Binary IDs listed in a CSV into the local store."""
+    import argparse
+
+    import boto3
+    import pandas as pd
+    from botocore.config import Config
+
+    parser = argparse.ArgumentParser(description='Prefetch Binary documents into the local document store')
+    parser.add_argument('csv', help='CSV with a Binary ID column (e.g. accessible_binary_files.csv)')
+    parser.add_argument('--column', default='binary_id')
+    parser.add_argument('--profile', default=os.environ.get('AWS_PROFILE'))
+    parser.add_argument('--bucket', default=DEFAULT_S3_BUCKET)
+    parser.add_argument('--prefix', default=DEFAULT_S3_PREFIX)
+    parser.add_argument('--store-dir', type=Path, default=os.environ.get('BINARY_STORE_DIR'),
+                        help='Store directory (default BINARY_STORE_DIR)')
+    parser.add_argument('--max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3)
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+    if not args.store_dir:
+        parser.error('set --store-dir or BINARY_STORE_DIR')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    session = boto3.Session(profile_name=args.profile)
+    s3_client = session.client('s3', region_name='us-east-1',
+                               config=Config(max_pool_connections=args.workers))
+    store = BinaryDocumentStore(s3_client=s3_client, store_dir=args.store_dir, s3_bucket=args.bucket,
+                                s3_prefix=args.prefix, max_bytes=int(args.max_gb * 1024 ** 3),
+                                max_workers=args.workers)
+
+    binary_ids = pd.read_csv(args.csv, usecols=[args.column])[args.column]
+    counts = store.prefetch(binary_ids)
+    print(f"Requested {counts['requested']}, already stored {counts['already_stored']}, "
+          f"fetched {counts['fetched']}, failed {counts['failed']}")
+    print(store.summary())
+    return 0 if counts['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -8,9 +8,11 @@ Generate BRIM-compatible CSV files from FHIR data.
 import pandas as pd
 import csv
 from typing import Dict, List, Any, Optional
-from bs4 import BeautifulSoup
 from datetime import datetime
 
+from temporal_context import TemporalContextIndex
+from text_normalization import normalize_many, normalize_text
+
 
 class BRIMCSVGenerator:
     """
@@ -34,7 +36,7 @@ class BRIMCSVGenerator:
     @staticmethod
     def sanitize_html(content: str) -> str:
         """
-        Remove HTML, JavaScript, CSS from clinical notes.
+        Remove HTML, JavaScript, CSS (or RTF markup) from clinical notes.
         
         CRITICAL: Must be done before BRIM processing!
         
@@ -45,20 +47,7 @@ class BRIMCSVGenerator:
             Clean text only
         """
         
-        if not content:
-            return ''
-        
-        soup = BeautifulSoup(content, 'html.parser')
-        
-        # Remove script, style, meta, link elements
-        for element in soup(['script', 'style', 'meta', 'link', 'head']):
-            element.decompose()
-        
-        # Get text and normalize whitespace
-        text = soup.get_text(separator=' ', strip=True)
-        text = ' '.join(text.split())
-        
-        return text
+        return normalize_text(content)
     
     def generate_project_csv(
         self, 
@@ -82,9 +71,10 @@ class BRIMCSVGenerator:
         
         rows = []
         
-        for i, note in enumerate(clinical_notes):
-            # Extract Binary content if available
-            note_text = ''
+        # Extract Binary content if available, then sanitize all notes at once (process pool)
+        contents = []
+        for note in clinical_notes:
+            content = None
             if fhir_extractor and 'binary_url' in note and note['binary_url']:
                 # Extract Binary ID from URL
                 import re
@@ -92,8 +82,12 @@ class BRIMCSVGenerator:
                 if match:
                     binary_id = match.group(1)
                     content = fhir_extractor.extract_binary_content(binary_id)
-                    if content:
-                        note_text = self.sanitize_html(content)
+            contents.append(content)
+        sanitized = normalize_many(contents)
+        
+        kept = []
+        for i, note in enumerate(clinical_notes):
+            note_text = sanitized[i]
             
             # Fallback to description if no Binary content
             if not note_text and 'description' in note:
@@ -103,26 +97,22 @@ class BRIMCSVGenerator:
             if not note_text:
                 continue
             
-            # Generate HINT columns from FHIR context
-            document_date = pd.to_datetime(note['document_date'])
-            
-            surgery_number = fhir_extractor.assign_surgery_number(
-                document_date,
-                self.fhir_context['surgeries']
-            ) if fhir_extractor else 'other'
-            
-            diagnosis = fhir_extractor.get_relevant_diagnosis(
-                document_date,
-                self.fhir_context['diagnoses']
-            ) if fhir_extractor else ''
-            
-            who_grade = fhir_extractor.extract_who_grade(diagnosis) if fhir_extractor else ''
-            
-            active_meds = fhir_extractor.get_active_medications(
-                document_date,
-                self.fhir_context['medications']
-            ) if fhir_extractor else []
-            
+            kept.append((i, note, note_text, pd.to_datetime(note['document_date'])))
+        
+        # Generate HINT columns from FHIR context for all notes in one pass
+        if fhir_extractor:
+            hints = TemporalContextIndex(self.fhir_context).hint_columns(
+                [document_date for _, _, _, document_date in kept]
+            ).to_dict('records')
+        else:
+            hints = [{
+                'HINT_SURGERY_NUMBER': 'other',
+                'HINT_DIAGNOSIS': '',
+                'HINT_WHO_GRADE': '',
+                'HINT_MEDICATIONS': '',
+            }] * len(kept)
+        
+        for (i, note, note_text, document_date), hint in zip(kept, hints):
             row = {
                 'NOTE_ID': f"DOC_{i+1:04d}",
                 'PERSON_ID': patient_research_id,
@@ -130,10 +120,7 @@ class BRIMCSVGenerator:
                 'NOTE_TEXT': note_text,
                 'NOTE_TITLE': note.get('document_type', 'Unknown'),
                 # HINT columns from FHIR
-                'HINT_SURGERY_NUMBER': surgery_number,
-                'HINT_DIAGNOSIS': diagnosis,
-                'HINT_WHO_GRADE': who_grade,
-                'HINT_MEDICATIONS': '; '.join(active_meds) if active_meds else '',
+                **hint,
             }
             
             rows.append(row)
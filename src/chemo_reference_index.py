@@ -0,0 +1,355 @@
+"""
+Chemotherapy Reference Index
+============================
+
+The RADIANT unified drug reference (``drugs.csv``, ``drug_alias.csv``,
+``rxnorm_code_map.csv``) compiled once into lookup tables, plus the vectorized
+pieces the chemotherapy matchers are built from.
+
+ComprehensiveChemotherapyIdentifier and the filter_chemotherapy_from_medications
+scripts ran five strategies, each an ``iterrows()`` over the medications that
+re-parsed ``rx_norm_codes`` per row and scanned ``drugs_df`` per code; the
+product-to-ingredient map was rebuilt with ``rxnorm_map_df.iterrows()`` on
+every call. Now:
+
+- ``ChemoReferenceIndex`` holds code -> ingredient dicts and merge-ready
+  tables for the non-supportive-care chemotherapy drugs, and the
+  normalized alias -> drug_id lookup
+- ``load_reference_index()`` compiles the index once per process; with
+  ``CHEMO_INDEX_DIR`` set, the lookup tables are also saved there as JSON,
+  checked against a SHA-256 of the reference files (a changed file is
+  compiled again), and the merge tables rebuilt from them on load
+- ``explode_rxnorm_codes()`` parses every row's ``rx_norm_codes`` in one pass
+  (one row per code, in row and code order), ready to merge with the index
+- Names are matched with ``text_matching.AliasAutomaton``: each distinct
+  medication name is scanned once for every pattern
+
+Matches come out in the same order, with the same values, as the row loops
+they replace.
+
+Usage:
+    reference = load_reference_index(drugs_csv, alias_csv, rxnorm_map_csv)
+    codes = explode_rxnorm_codes(medications_df['rx_norm_codes'])
+    hits = reference.ingredient_matches(codes)
+
+Configuration (environment variables):
+- ``CHEMO_INDEX_DIR``: compiled index cache (default: none, compiled from the
+  CSVs in every process); created, or restricted, to mode 0700 (owner only)
+- ``CHEMO_INDEX=0``: compile from the CSVs every time even when a directory is configured
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = '2'
+CHEMO_APPROVAL_STATUSES = ['FDA_approved', 'investigational']
+
+_LOADED_INDEXES: Dict[tuple, 'ChemoReferenceIndex'] = {}
+_LOADED_INDEXES_LOCK = threading.Lock()
+
+
+def normalize_text(text):
+    """
+    Normalize text for matching: lowercase, remove spaces/punctuation
+    Matches the normalization in drug_alias.csv normalized_key
+    """
+    if pd.isna(text) or text == '':
+        return ''
+    return re.sub(r'[^a-z0-9]', '', str(text).lower())
+
+
+def column_values(df: pd.DataFrame, column: str, default: Any = None) -> List[Any]:
+    """``row.get(column, default)`` for every row, as ``iterrows()`` handed the values out."""
+    if column not in df.columns:
+        return [default] * len(df)
+    return df[column].tolist()
+
+
+def explode_rxnorm_codes(values: pd.Series) -> pd.DataFrame:
+    """
+    Semicolon-separated RxNorm code lists, one row per code.
+
+    Same rules as parse_rxnorm_codes(): null or '' -> no codes; each piece is
+    stripped and kept if it is all digits.
+
+    Returns:
+        Frame with ``position`` (row position in ``values``) and ``code``
+        (digit text), in row order then code order
+    """
+    text = pd.Series(values.tolist(), dtype=object)
+    present = text.notna() & ~(text == '')
+    pieces = text[present].astype(str).str.split(';').explode().str.strip()
+    pieces = pieces[pieces.str.len().gt(0) & pieces.str.isdigit().astype(bool)]
+    return pd.DataFrame({'position': pieces.index.to_numpy(dtype=np.int64),
+                         'code': pieces.to_numpy(dtype=object)})
+
+
+def group_codes(codes: pd.DataFrame, column: str = 'code') -> Dict[int, List[Any]]:
+    """
+    Row position -> ``column`` values of that row's codes, in code order.
+
+    ``codes`` must be in row order, as explode_rxnorm_codes() and the
+    ``*_matches()`` joins leave it.
+    """
+    positions = codes['position'].to_numpy()
+    values = codes[column].tolist()
+    starts = np.flatnonzero(np.diff(positions)) + 1
+    bounds = zip(np.r_[0, starts].tolist(), np.r_[starts, len(values)].tolist())
+    return {int(positions[start]): values[start:end] for start, end in bounds if end > start}
+
+
+class ChemoReferenceIndex:
+    """Lookup tables compiled from the RADIANT unified drug reference frames."""
+
+    def __init__(
+        self,
+        drugs_df: Optional[pd.DataFrame] = None,
+        drug_alias_df: Optional[pd.DataFrame] = None,
+        rxnorm_map_df: Optional[pd.DataFrame] = None
+    ):
+        """
+        Compile index.
+
+        Args:
+            drugs_df: drugs.csv (None if unavailable)
+            drug_alias_df: drug_alias.csv
+            rxnorm_map_df: rxnorm_code_map.csv (product -> ingredient)
+        """
+        self.has_drugs = drugs_df is not None
+        self.has_aliases = drug_alias_df is not None
+        self.has_rxnorm_map = rxnorm_map_df is not None
+        self.counts: Dict[str, Any] = {}
+
+        # Non-supportive-care chemotherapy ingredients
+        self.valid_ingredients = set()
+        self.ingredient_names: Dict[int, Any] = {}
+        self.chemo_drug_ids = set()
+        if drugs_df is not None:
+            chemo_drugs = drugs_df[
+                (drugs_df['approval_status'].isin(CHEMO_APPROVAL_STATUSES)) &
+                (drugs_df['is_supportive_care'] == False)
+            ]
+            self.valid_ingredients = set(chemo_drugs['rxnorm_in'].dropna().astype(int))
+            # First drug whose rxnorm_in equals the code exactly (a fractional rxnorm_in names nothing)
+            for value, name in zip(chemo_drugs['rxnorm_in'].tolist(), chemo_drugs['preferred_name'].tolist()):
+                if pd.notna(value) and value == int(value):
+                    self.ingredient_names.setdefault(int(value), name)
+            self.chemo_drug_ids = set(chemo_drugs['drug_id'])
+            self.counts.update({
+                'drugs': len(drugs_df),
+                'fda_approved': (drugs_df['approval_status'] == 'FDA_approved').sum(),
+                'investigational': (drugs_df['approval_status'] == 'investigational').sum(),
+                'supportive_care': drugs_df['is_supportive_care'].sum(),
+            })
+
+        # Product code -> chemotherapy ingredient (later rows win, as the dict build did)
+        self.product_to_ingredient: Dict[int, int] = {}
+        if rxnorm_map_df is not None:
+            mapped = rxnorm_map_df[rxnorm_map_df['ingredient_rxcui'].notna() & rxnorm_map_df['code_cui'].notna()]
+            for product, ingredient in zip(mapped['code_cui'].tolist(), mapped['ingredient_rxcui'].tolist()):
+                if int(ingredient) in self.valid_ingredients:
+                    self.product_to_ingredient[int(product)] = int(ingredient)
+            self.counts['rxnorm_mappings'] = len(rxnorm_map_df)
+
+        # Normalized alias -> drug_id of the chemotherapy drugs (later rows win)
+        self.alias_lookup: Dict[Any, Any] = {}
+        if drug_alias_df is not None:
+            chemo_aliases = drug_alias_df[drug_alias_df['drug_id'].isin(self.chemo_drug_ids)]
+            for key, alias, drug_id in zip(chemo_aliases['normalized_key'].tolist(),
+                                           chemo_aliases.iloc[:, 1].tolist(),
+                                           chemo_aliases['drug_id'].tolist()):
+                normalized = key if pd.notna(key) else normalize_text(alias)
+                if normalized:
+                    self.alias_lookup[normalized] = drug_id
+            self.counts['aliases'] = len(drug_alias_df)
+
+        self._build_tables()
+
+    def _build_tables(self):
+        """Merge tables, keyed by code text (as exploded) and by integer RxCUI."""
+        ingredients = sorted(self.valid_ingredients)
+        self.ingredient_table = pd.DataFrame({
+            'code': pd.Series([str(code) for code in ingredients], dtype=object),
+            'rxcui': pd.Series(ingredients, dtype=np.int64),
+            'drug_name': pd.Series([self.ingredient_names.get(code) for code in ingredients], dtype=object),
+            'named': pd.Series([code in self.ingredient_names for code in ingredients], dtype=bool),
+        })
+        self.product_table = pd.DataFrame({
+            'code': pd.Series([str(code) for code in self.product_to_ingredient], dtype=object),
+            'rxcui': pd.Series(list(self.product_to_ingredient), dtype=np.int64),
+            'ingredient': pd.Series(list(self.product_to_ingredient.values()), dtype=np.int64),
+        })
+        self._keys: Dict[tuple, pd.Index] = {}
+
+    def _join(self, codes: pd.DataFrame, name: str, on: str) -> pd.DataFrame:
+        """Inner hash join of ``codes`` with a table on its unique key column, in ``codes`` order."""
+        table = getattr(self, name)
+        keys = self._keys.get((name, on))
+        if keys is None:
+            # The Index keeps its hash table, so the reference side is hashed once
+            keys = self._keys[(name, on)] = pd.Index(table[on])
+        rows = keys.get_indexer(codes[on])
+        hit = rows >= 0
+        hits = codes[hit].reset_index(drop=True)
+        for column in table.columns:
+            if column not in hits.columns:
+                hits[column] = table[column].to_numpy()[rows[hit]]
+        return hits
+
+    def ingredient_matches(self, codes: pd.DataFrame, on: str = 'code') -> pd.DataFrame:
+        """
+        Exploded codes that are chemotherapy ingredients, in row then code order.
+
+        Args:
+            codes: explode_rxnorm_codes() frame (plus an ``rxcui`` column to join on integers)
+            on: 'code' (digit text) or 'rxcui' (integer)
+        """
+        return self._join(codes, 'ingredient_table', on)
+
+    def product_matches(self, codes: pd.DataFrame, on: str = 'code') -> pd.DataFrame:
+        """Exploded codes that are products of chemotherapy ingredients (``ingredient`` column)."""
+        return self._join(codes, 'product_table', on)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_keys'] = {}  # rebuilt on first use
+        return state
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Lookup tables as JSON-ready data (the merge tables are rebuilt by from_dict())."""
+        return {
+            'has_drugs': self.has_drugs,
+            'has_aliases': self.has_aliases,
+            'has_rxnorm_map': self.has_rxnorm_map,
+            'counts': {name: _plain(value) for name, value in self.counts.items()},
+            'valid_ingredients': sorted(self.valid_ingredients),
+            'ingredient_names': [[code, _plain(name)] for code, name in self.ingredient_names.items()],
+            'chemo_drug_ids': [_plain(drug_id) for drug_id in sorted(self.chemo_drug_ids, key=str)],
+            'product_to_ingredient': [[product, ingredient]
+                                      for product, ingredient in self.product_to_ingredient.items()],
+            'alias_lookup': [[_plain(alias), _plain(drug_id)] for alias, drug_id in self.alias_lookup.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChemoReferenceIndex':
+        """Index from to_dict() output."""
+        index = cls.__new__(cls)
+        index.has_drugs = data['has_drugs']
+        index.has_aliases = data['has_aliases']
+        index.has_rxnorm_map = data['has_rxnorm_map']
+        index.counts = dict(data['counts'])
+        index.valid_ingredients = set(data['valid_ingredients'])
+        index.ingredient_names = {int(code): name for code, name in data['ingredient_names']}
+        index.chemo_drug_ids = set(data['chemo_drug_ids'])
+        index.product_to_ingredient = {int(product): int(ingredient)
+                                       for product, ingredient in data['product_to_ingredient']}
+        index.alias_lookup = {alias: drug_id for alias, drug_id in data['alias_lookup']}
+        index._build_tables()
+        return index
+
+    def summary(self) -> str:
+        return (f"Chemotherapy reference index: {len(self.valid_ingredients)} ingredient codes, "
+                f"{len(self.product_to_ingredient)} product codes, {len(self.alias_lookup)} aliases")
+
+
+def _plain(value: Any) -> Any:
+    """numpy scalars as Python values (JSON-serializable)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _fingerprint(path: Optional[Path]):
+    if path is None or not Path(path).exists():
+        return None
+    stat = Path(path).stat()
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _source_hash(paths: List[Optional[Path]]) -> str:
+    """SHA-256 over the reference files' contents (missing files included as such)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if path is None or not path.exists():
+            digest.update(b'\0missing\0')
+            continue
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 ** 2), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_reference_index(
+    drugs_file: Optional[Path],
+    alias_file: Optional[Path],
+    rxnorm_file: Optional[Path],
+    cache_dir: Optional[Path] = None
+) -> ChemoReferenceIndex:
+    """
+    Compiled index of the reference files (missing files are skipped).
+
+    Compiled once per process. With a cache directory, the lookup tables are
+    saved as JSON and reused across processes while the files' contents are
+    unchanged.
+
+    Args:
+        drugs_file: drugs.csv
+        alias_file: drug_alias.csv
+        rxnorm_file: rxnorm_code_map.csv
+        cache_dir: Compiled index cache (created with mode 0700 if missing;
+                   default CHEMO_INDEX_DIR, and without either nothing is written)
+    """
+    paths = [Path(p).resolve() if p is not None else None for p in (drugs_file, alias_file, rxnorm_file)]
+    fingerprints = tuple(_fingerprint(p) for p in paths)
+    key = (tuple(str(p) for p in paths), fingerprints)
+
+    with _LOADED_INDEXES_LOCK:
+        index = _LOADED_INDEXES.get(key)
+    if index is not None:
+        return index
+
+    cache_dir = cache_dir or os.environ.get('CHEMO_INDEX_DIR')
+    use_cache = bool(cache_dir) and os.environ.get('CHEMO_INDEX', '1') != '0' and any(fingerprints)
+    if use_cache:
+        cache_dir = Path(cache_dir)
+        cache_file = cache_dir / f"{hashlib.sha1(repr(key[0]).encode()).hexdigest()[:16]}.json"
+        source_hash = _source_hash(paths)
+
+    if use_cache and cache_file.exists():
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('format') == FORMAT_VERSION and cached.get('source_hash') == source_hash:
+                index = ChemoReferenceIndex.from_dict(cached['index'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not read compiled chemotherapy index {cache_file}: {e}")
+
+    if index is None:
+        frames = [pd.read_csv(p) if fp is not None else None for p, fp in zip(paths, fingerprints)]
+        index = ChemoReferenceIndex(*frames)
+        if use_cache:
+            try:
+                # Owner-only, like the other on-disk caches
+                cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+                os.chmod(cache_dir, 0o700)
+                tmp = cache_file.with_suffix(f'.{uuid.uuid4().hex}.tmp')
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'format': FORMAT_VERSION, 'source_hash': source_hash, 'index': index.to_dict()}, f)
+                os.replace(tmp, cache_file)
+            except OSError as e:
+                logger.warning(f"Could not write compiled chemotherapy index {cache_file}: {e}")
+
+    with _LOADED_INDEXES_LOCK:
+        _LOADED_INDEXES[key] = index
+    return index
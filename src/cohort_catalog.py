@@ -0,0 +1,440 @@
+"""
+Cohort Catalog
+==============
+
+Cohort-wide SQL over every patient's staging CSVs, in one embedded SQLite
+database.
+
+Cohort questions ("patients with more than one tumor surgery and a post-op
+MRI within 72 hours", "chemotherapy exposure by agent") used to be answered by
+looping over ``staging_files/patient_*/`` and reading each patient's CSVs into
+pandas, once per question. The catalog loads them once:
+
+- One table per staging source (``procedures``, ``imaging``, ``medications``,
+  ...) holding every patient's rows, with a leading ``patient_id`` column
+  (indexed) taken from the folder name; the table's columns are the union of
+  the patients' CSV columns
+- Each (source, patient) is a partition recorded with the CSV's size and mtime
+  in ``_partitions``: ``refresh()`` reloads only new or changed CSVs and drops
+  partitions whose CSV is gone
+- Date columns the staging store would type (see staging_store.type_date_columns)
+  are stored as UTC ``YYYY-MM-DD HH:MM:SS`` text, so ``julianday()``,
+  ``date()`` and string comparisons work across patients
+- ``register_terms()`` adds small vocabulary tables (TEMP, not persisted) for
+  joins against free-text columns
+- ``patients`` view: every patient with at least one partition
+
+DuckDB is not a dependency of this repository; SQLite ships with Python and
+needs nothing installed.
+
+Usage:
+    catalog = CohortCatalog(staging_dir)
+    catalog.refresh()
+    df = catalog.query("SELECT patient_id, COUNT(*) AS n FROM imaging GROUP BY patient_id")
+    catalog.tumor_surgeries_with_postop_mri(surgery_terms, exclude_terms, hours=72)
+    catalog.exposure_by_agent({'carboplatin': ['carboplatin', 'paraplatin'], ...})
+
+The catalog holds every patient's staging rows (PHI), unencrypted, so it is
+kept in memory (and loaded again by each process) unless a database file is
+configured. A configured file is created, or restricted, to mode 0600 (owner
+only); put it on an encrypted volume and delete it when a project ends.
+
+Configuration (environment variables):
+- ``COHORT_CATALOG_DB``: database file (default: none, the catalog is in memory)
+
+Command line:
+    python src/cohort_catalog.py refresh /path/to/staging_files --db /secure/cohort.sqlite
+    python src/cohort_catalog.py sql /path/to/staging_files "SELECT COUNT(*) FROM patients"
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+from staging_store import csv_fingerprint, type_date_columns, utc_text
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = '1'
+
+PROCEDURE_DATE_COLUMNS = ['proc_performed_period_start', 'proc_performed_date_time', 'procedure_date']
+PROCEDURE_TEXT_COLUMNS = ['proc_code_text', 'proc_description']
+IMAGING_DATE_COLUMNS = ['imaging_date', 'img_performed_period_start', 'study_date']
+IMAGING_MODALITY_COLUMNS = ['imaging_modality', 'img_modality', 'di_modality']
+MEDICATION_START_COLUMNS = ['medication_start_date', 'mr_authoredon', 'cp_period_start']
+
+
+def quote(identifier: str) -> str:
+    """SQL-quoted identifier."""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def sql_values(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame with SQLite-ready values: typed dates as UTC text, nulls as None."""
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.DatetimeTZDtype):
+            df[column] = utc_text(df[column], 's')
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+class CohortCatalog:
+    """
+    SQLite catalog of one staging directory's patient CSVs.
+
+    Safe to share between threads (one connection behind a lock).
+    """
+
+    def __init__(self, staging_dir: Path, db_path: Optional[Path] = None):
+        """
+        Initialize catalog.
+
+        Args:
+            staging_dir: Directory holding ``patient_<id>/`` folders of CSVs
+            db_path: SQLite file (created with mode 0600 if missing; default COHORT_CATALOG_DB,
+                     and without either the catalog is kept in memory)
+        """
+        self.staging_dir = Path(staging_dir)
+        db_path = db_path or os.environ.get('COHORT_CATALOG_DB') or ':memory:'
+        self.db_path = db_path if str(db_path) == ':memory:' else Path(db_path)
+        if self.db_path != ':memory:':
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Patient data: owner-only access (SQLite gives the -wal/-shm files the same mode)
+            os.close(os.open(self.db_path, os.O_CREAT | os.O_WRONLY, 0o600))
+            os.chmod(self.db_path, 0o600)
+
+        self.loaded = 0
+        self.unchanged = 0
+        self.removed = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        # Partitions are rebuilt from the CSVs, so a crash can only lose work, not data
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _catalog (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM _catalog WHERE key = 'format'").fetchone()
+            if row and row[0] != FORMAT_VERSION:
+                for (table,) in self._conn.execute("SELECT DISTINCT source FROM _partitions").fetchall():
+                    self._conn.execute(f"DROP TABLE IF EXISTS {quote(table)}")
+                self._conn.execute("DROP TABLE IF EXISTS _partitions")
+            self._conn.execute("INSERT OR REPLACE INTO _catalog VALUES ('format', ?)", (FORMAT_VERSION,))
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS _partitions (source TEXT, patient_id TEXT, size INTEGER, "
+                "mtime_ns INTEGER, rows INTEGER, PRIMARY KEY (source, patient_id))")
+            self._conn.execute("CREATE VIEW IF NOT EXISTS patients AS "
+                               "SELECT DISTINCT patient_id FROM _partitions ORDER BY patient_id")
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def discover_patients(self) -> List[str]:
+        """Patient IDs with a staging folder (ID kept as-is, dots included)."""
+        return sorted(path.name[len('patient_'):] for path in self.staging_dir.glob('patient_*') if path.is_dir())
+
+    def refresh(self, patients: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Load new or changed staging CSVs; drop partitions whose CSV is gone.
+
+        Args:
+            patients: Limit to these patients (default: every staging folder;
+                      partitions of patients without a folder are dropped)
+
+        Returns:
+            Counts of partitions loaded, unchanged and removed by this call
+        """
+        start = time.perf_counter()
+        counts = {'loaded': 0, 'unchanged': 0, 'removed': 0}
+        all_patients = patients is None
+        patients = self.discover_patients() if all_patients else list(patients)
+
+        with self._lock:
+            known = {(source, patient_id): (size, mtime_ns) for source, patient_id, size, mtime_ns in
+                     self._conn.execute("SELECT source, patient_id, size, mtime_ns FROM _partitions")}
+            seen = set()
+            for patient_id in patients:
+                for path in sorted((self.staging_dir / f"patient_{patient_id}").glob('*.csv')):
+                    key = (path.stem, patient_id)
+                    seen.add(key)
+                    fingerprint = csv_fingerprint(path)
+                    if known.get(key) == (fingerprint['size'], fingerprint['mtime_ns']):
+                        counts['unchanged'] += 1
+                        continue
+                    self._load_partition(path.stem, patient_id, path, fingerprint)
+                    counts['loaded'] += 1
+
+            scope = set(patients)
+            for source, patient_id in known:
+                if (source, patient_id) not in seen and (all_patients or patient_id in scope):
+                    with self._conn:
+                        self._drop_partition(source, patient_id)
+                    counts['removed'] += 1
+
+        self.loaded += counts['loaded']
+        self.unchanged += counts['unchanged']
+        self.removed += counts['removed']
+        logger.info(f"Cohort catalog refreshed in {time.perf_counter() - start:.1f}s: {counts['loaded']} loaded, "
+                    f"{counts['unchanged']} unchanged, {counts['removed']} removed")
+        return counts
+
+    def _load_partition(self, source: str, patient_id: str, path: Path, fingerprint: Dict[str, Any]):
+        try:
+            df = pd.read_csv(path, low_memory=False)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame()
+        type_date_columns(df)
+        if 'patient_id' in df.columns:
+            # The folder name is the catalog's patient_id; keep the CSV's own column alongside
+            df = df.rename(columns={'patient_id': 'staging_patient_id'})
+        df = sql_values(df)
+
+        with self._conn:
+            self._ensure_table(source, df.columns)
+            self._drop_partition(source, patient_id)
+            if len(df):
+                columns = ['patient_id'] + list(df.columns)
+                placeholders = ', '.join('?' * len(columns))
+                self._conn.executemany(
+                    f"INSERT INTO {quote(source)} ({', '.join(quote(c) for c in columns)}) VALUES ({placeholders})",
+                    ([patient_id] + row for row in df.values.tolist()))
+            self._conn.execute("INSERT INTO _partitions VALUES (?, ?, ?, ?, ?)",
+                               (source, patient_id, fingerprint['size'], fingerprint['mtime_ns'], len(df)))
+
+    def _ensure_table(self, source: str, columns: Sequence[str]):
+        existing = self.columns(source)
+        if not existing:
+            self._conn.execute(f"CREATE TABLE {quote(source)} (patient_id TEXT)")
+            self._conn.execute(f"CREATE INDEX {quote('ix_' + source + '_patient')} ON {quote(source)} (patient_id)")
+            existing = ['patient_id']
+        known = {column.lower() for column in existing}
+        for column in columns:
+            if column.lower() not in known:
+                self._conn.execute(f"ALTER TABLE {quote(source)} ADD COLUMN {quote(column)}")
+                known.add(column.lower())
+
+    def _drop_partition(self, source: str, patient_id: str):
+        if self.columns(source):
+            self._conn.execute(f"DELETE FROM {quote(source)} WHERE patient_id = ?", (patient_id,))
+        self._conn.execute("DELETE FROM _partitions WHERE source = ? AND patient_id = ?", (source, patient_id))
+
+    def register_terms(self, name: str, terms: Dict[str, Iterable[str]]):
+        """
+        (Re)create TEMP table ``name(category, term)`` of lower-cased terms.
+
+        Args:
+            name: Table name
+            terms: category -> terms, e.g. {'carboplatin': ['carboplatin', 'paraplatin']}
+        """
+        rows = sorted({(category, str(term).lower()) for category, values in terms.items() for term in values})
+        with self._lock, self._conn:
+            self._conn.execute(f"DROP TABLE IF EXISTS temp.{quote(name)}")
+            self._conn.execute(f"CREATE TEMP TABLE {quote(name)} (category TEXT, term TEXT)")
+            self._conn.executemany(f"INSERT INTO temp.{quote(name)} VALUES (?, ?)", rows)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def query(self, sql: str, params: Optional[Any] = None) -> pd.DataFrame:
+        """Run a SELECT over the catalog."""
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def tables(self) -> List[str]:
+        """Staging sources loaded for at least one patient."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT source FROM _partitions ORDER BY source")]
+
+    def patients(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT patient_id FROM patients")]
+
+    def columns(self, table: str) -> List[str]:
+        with self._lock:
+            return [row[1] for row in self._conn.execute(f"PRAGMA main.table_info({quote(table)})")]
+
+    def coalesce(self, table: str, columns: Sequence[str], prefix: str = '') -> str:
+        """SQL for the first non-null of ``columns`` that the table has ('NULL' if none)."""
+        existing = {column.lower() for column in self.columns(table)}
+        present = [f"{prefix}{quote(c)}" for c in columns if c.lower() in existing]
+        if not present:
+            return 'NULL'
+        return present[0] if len(present) == 1 else f"COALESCE({', '.join(present)})"
+
+    def tumor_surgeries_with_postop_mri(
+        self,
+        surgery_terms: Iterable[str],
+        exclude_terms: Iterable[str] = (),
+        min_surgeries: int = 2,
+        hours: float = 72
+    ) -> pd.DataFrame:
+        """
+        Patients with at least ``min_surgeries`` tumor surgery days and an MRI
+        within ``hours`` after one of them.
+
+        A procedure is a tumor surgery when its code text or description
+        contains one of ``surgery_terms`` and none of ``exclude_terms``
+        (TumorSurgeryClassifier's rule); surgeries on the same calendar day
+        count once. MRI: modality starting with 'MR'.
+
+        Returns:
+            One row per patient: tumor_surgery_days, surgery_days_with_postop_mri,
+            first_surgery, last_surgery
+        """
+        if not {'procedures', 'imaging'} <= set(self.tables()):
+            return pd.DataFrame(columns=['patient_id', 'tumor_surgery_days', 'surgery_days_with_postop_mri',
+                                         'first_surgery', 'last_surgery'])
+        self.register_terms('surgery_terms', {'include': surgery_terms, 'exclude': exclude_terms})
+        proc_date = self.coalesce('procedures', PROCEDURE_DATE_COLUMNS, 'p.')
+        img_date = self.coalesce('imaging', IMAGING_DATE_COLUMNS, 'i.')
+        imaging_columns = {c.lower() for c in self.columns('imaging')}
+        modality = [f"upper(i.{quote(c)}) LIKE 'MR%'" for c in IMAGING_MODALITY_COLUMNS if c in imaging_columns]
+        procedure_columns = {c.lower() for c in self.columns('procedures')}
+        text = " || ' ' || ".join(f"lower(coalesce(p.{quote(c)}, ''))"
+                                  for c in PROCEDURE_TEXT_COLUMNS if c in procedure_columns) or "''"
+        # Surgery and imaging times are compared as julianday(), so mixed UTC offsets line up
+
+        sql = f"""
+            WITH surgeries AS (
+                SELECT DISTINCT p.patient_id, {proc_date} AS surgery_time
+                FROM procedures p
+                WHERE {proc_date} IS NOT NULL
+                  AND EXISTS (SELECT 1 FROM surgery_terms t WHERE t.category = 'include' AND instr({text}, t.term))
+                  AND NOT EXISTS (SELECT 1 FROM surgery_terms t WHERE t.category = 'exclude' AND instr({text}, t.term))
+            ),
+            mri AS (
+                SELECT i.patient_id, julianday({img_date}) AS imaging_day
+                FROM imaging i
+                WHERE {' OR '.join(modality) or '0'} AND {img_date} IS NOT NULL
+            ),
+            surgery_days AS (
+                SELECT s.patient_id, date(s.surgery_time) AS surgery_day, MIN(s.surgery_time) AS surgery_time,
+                       MAX(EXISTS (SELECT 1 FROM mri m WHERE m.patient_id = s.patient_id
+                                   AND m.imaging_day > julianday(s.surgery_time)
+                                   AND m.imaging_day <= julianday(s.surgery_time) + :hours / 24.0)) AS postop_mri
+                FROM surgeries s
+                GROUP BY s.patient_id, date(s.surgery_time)
+            )
+            SELECT patient_id, COUNT(*) AS tumor_surgery_days, SUM(postop_mri) AS surgery_days_with_postop_mri,
+                   MIN(surgery_time) AS first_surgery, MAX(surgery_time) AS last_surgery
+            FROM surgery_days
+            GROUP BY patient_id
+            HAVING COUNT(*) >= :min_surgeries AND SUM(postop_mri) > 0
+            ORDER BY patient_id
+        """
+        return self.query(sql, {'hours': float(hours), 'min_surgeries': int(min_surgeries)})
+
+    def exposure_by_agent(self, agent_aliases: Dict[str, Iterable[str]]) -> pd.DataFrame:
+        """
+        Medication exposure per agent across the cohort.
+
+        A medication record counts for an agent when its lower-cased name
+        contains one of the agent's aliases (each record once per agent).
+
+        Returns:
+            One row per agent with records: patients, medication_records,
+            first_start, last_start
+        """
+        if 'medications' not in self.tables():
+            return pd.DataFrame(columns=['agent', 'patients', 'medication_records', 'first_start', 'last_start'])
+        self.register_terms('agent_aliases', agent_aliases)
+        start = self.coalesce('medications', MEDICATION_START_COLUMNS, 'm.')
+
+        sql = f"""
+            WITH names AS (
+                SELECT DISTINCT lower(medication_name) AS name FROM medications WHERE medication_name IS NOT NULL
+            ),
+            agent_names AS (
+                SELECT DISTINCT n.name, a.category AS agent
+                FROM names n JOIN agent_aliases a ON instr(n.name, a.term)
+            )
+            SELECT an.agent, COUNT(DISTINCT m.patient_id) AS patients, COUNT(*) AS medication_records,
+                   MIN({start}) AS first_start, MAX({start}) AS last_start
+            FROM medications m JOIN agent_names an ON lower(m.medication_name) = an.name
+            GROUP BY an.agent
+            ORDER BY patients DESC, medication_records DESC, an.agent
+        """
+        return self.query(sql)
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            partitions, rows = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM _partitions").fetchone()
+        return {
+            'patients': len(self.patients()),
+            'tables': len(self.tables()),
+            'partitions': partitions,
+            'rows': rows,
+            'loaded': self.loaded,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"Cohort catalog: {s['patients']} patients, {s['tables']} tables, {s['rows']:,} rows "
+                f"[{self.db_path}]")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQL over every patient\'s staging CSVs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh = sub.add_parser('refresh', help='Load new or changed staging CSVs into the catalog')
+    refresh.add_argument('staging_dir')
+    sql = sub.add_parser('sql', help='Run a query (refreshes the catalog first)')
+    sql.add_argument('staging_dir')
+    sql.add_argument('query', help='SELECT over tables named after the staging sources, plus patient_id')
+    sql.add_argument('--output', help='Write the result to this CSV instead of printing it')
+    sql.add_argument('--no-refresh', action='store_true', help='Query the catalog as it is')
+    tables = sub.add_parser('tables', help='List tables and their columns')
+    tables.add_argument('staging_dir')
+    for command in (refresh, sql, tables):
+        command.add_argument('--db', help='Catalog database file (default COHORT_CATALOG_DB)')
+    args = parser.parse_args()
+    if args.command != 'sql' and not (args.db or os.environ.get('COHORT_CATALOG_DB')):
+        parser.error(f"{args.command} needs --db or COHORT_CATALOG_DB (the catalog is otherwise in memory)")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    catalog = CohortCatalog(Path(args.staging_dir), db_path=args.db)
+    if args.command == 'refresh':
+        catalog.refresh()
+        print(catalog.summary())
+    elif args.command == 'tables':
+        for table in catalog.tables():
+            print(f"{table}: {', '.join(catalog.columns(table))}")
+    else:
+        if not args.no_refresh:
+            catalog.refresh()
+        result = catalog.query(args.query)
+        if args.output:
+            result.to_csv(args.output, index=False)
+            print(f"{len(result)} rows written to {args.output}")
+        else:
+            with pd.option_context('display.max_rows', 200, 'display.width', 200):
+                print(result.to_string(index=False))
+    catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Document Chunking
+=================
+
+Token-budgeted windows over long clinical notes, so every LLM call has a
+bounded prompt (and bounded latency and memory) however long the note is.
+
+Notes used to be sent whole (too long for the context of a local model on a
+32GB machine) or cut off at a fixed length (``[:2000]``), which silently drops
+findings further down. ``chunk_document`` splits a note at section headers
+(``IMPRESSION:``, ``Findings:``, ...) and sentence boundaries into contiguous
+windows of at most ``max_tokens``:
+
+- Windows prefer to end at a section header once they are half full
+- Otherwise consecutive windows share ``overlap_sentences`` sentences, so a
+  finding that straddles a boundary is seen whole at least once
+- A sentence longer than the budget is split at whitespace
+
+``select_windows`` keeps the windows that mention a variable's keywords
+(same keyword syntax as document_relevance_index: ``prefix*`` allowed) and
+``merge_window_answers`` combines the per-window answers: "not found" style
+answers are dropped, distinct findings are joined with ``'; '``.
+
+Usage:
+    windows = chunk_document(note_text, max_tokens=2000)
+    for window in select_windows(windows, ['resect*', 'residual']):
+        answers.append(call_llm(prompt_for(window['text'])))
+    value = merge_window_answers(answers)
+"""
+
+import re
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from document_relevance_index import tokenize
+
+CHARS_PER_TOKEN = 4
+
+SECTION_HEADERS = (
+    'addendum', 'assessment', 'assessment and plan', 'brief history', 'chief complaint', 'clinical history',
+    'clinical information', 'comparison', 'complications', 'conclusion', 'diagnosis', 'discussion',
+    'final diagnosis', 'findings', 'gross description', 'history', 'history of present illness', 'hospital course',
+    'impression', 'indication', 'indications', 'interval history', 'medications', 'microscopic description',
+    'molecular results', 'operative findings', 'physical exam', 'plan', 'postoperative diagnosis',
+    'preoperative diagnosis', 'procedure', 'procedures', 'reason for exam', 'recommendations', 'result',
+    'results', 'summary', 'technique',
+)
+
+# All-caps headers anywhere ("IMPRESSION:"), known mixed-case headers at line start ("Findings:")
+_SECTION_HEADER = re.compile(
+    r'(?:(?<=\s)|^)[A-Z][A-Z0-9 /&(),-]{2,50}:'
+    r'|(?im:^[ \t]*(?:' + '|'.join(re.escape(h) for h in sorted(SECTION_HEADERS, key=len, reverse=True)) + r')[ \t]*:)'
+)
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n+')
+
+NOT_FOUND_ANSWERS = {
+    '', 'unavailable', 'not available', 'not found', 'not documented', 'not mentioned', 'not stated',
+    'not specified', 'not applicable', 'n/a', 'na', 'none', 'unknown', 'no information',
+}
+
+
+def estimate_tokens(text: Any) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(str(text)) // CHARS_PER_TOKEN + 1
+
+
+def _sentence_spans(text: str) -> List[List[int]]:
+    """[start, end, section_start] of each sentence; section headers always start a sentence."""
+    header_starts = sorted(m.start() + len(m.group()) - len(m.group().lstrip())
+                           for m in _SECTION_HEADER.finditer(text))
+    breaks = set(header_starts)
+    for match in _SENTENCE_END.finditer(text):
+        breaks.add(match.end())
+    breaks = sorted(b for b in breaks if 0 < b < len(text))
+
+    spans = []
+    start = 0
+    for end in breaks + [len(text)]:
+        piece = text[start:end]
+        if piece.strip():
+            lead = len(piece) - len(piece.lstrip())
+            section = header_starts[bisect_right(header_starts, start + lead) - 1] \
+                if header_starts and header_starts[0] <= start + lead else -1
+            spans.append([start + lead, start + len(piece.rstrip()), section])
+        start = end
+    return spans
+
+
+def _split_long(spans: List[List[int]], text: str, max_chars: int) -> List[List[int]]:
+    """Split sentences longer than max_chars at whitespace."""
+    result = []
+    for start, end, section in spans:
+        while end - start > max_chars:
+            cut = text.rfind(' ', start + 1, start + max_chars)
+            cut = cut if cut > start else start + max_chars
+            result.append([start, cut, section])
+            start = cut + 1 if text[cut:cut + 1] == ' ' else cut
+        if end > start:
+            result.append([start, end, section])
+    return result
+
+
+def chunk_document(text: Any, max_tokens: int, overlap_sentences: int = 1) -> List[Dict[str, Any]]:
+    """
+    Split a note into contiguous windows of at most max_tokens.
+
+    Args:
+        text: Note text
+        max_tokens: Token budget per window
+        overlap_sentences: Sentences repeated at the start of the next window
+
+    Returns:
+        Windows in document order: dicts with ``index``, ``section`` (header the
+        window starts in, or ''), ``text``, ``start`` / ``end`` character offsets
+        and ``tokens``. A note within the budget is a single window.
+    """
+    text = '' if text is None else str(text)
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return [{'index': 0, 'section': '', 'text': text, 'start': 0, 'end': len(text),
+                 'tokens': estimate_tokens(text)}]
+
+    spans = _split_long(_sentence_spans(text), text, max_chars)
+    windows = []
+    i = 0
+    while i < len(spans):
+        j = i + 1
+        while j < len(spans) and spans[j][1] - spans[i][0] <= max_chars:
+            j += 1
+        overlap = overlap_sentences
+        if j < len(spans):
+            # End at the last section header in the second half of the window, if any
+            for k in range(j - 1, i, -1):
+                if spans[k][2] == spans[k][0] and spans[k][0] - spans[i][0] >= max_chars // 2:
+                    j, overlap = k, 0
+                    break
+
+        start, end = spans[i][0], spans[j - 1][1]
+        section = spans[i][2]
+        windows.append({
+            'index': len(windows),
+            'section': text[section:text.find(':', section)].strip() if section >= 0 else '',
+            'text': text[start:end],
+            'start': start,
+            'end': end,
+            'tokens': estimate_tokens(text[start:end]),
+        })
+        i = max(j - overlap, i + 1) if j < len(spans) else j
+    return windows
+
+
+def window_matches(text: str, keywords: Iterable[str]) -> int:
+    """Number of keywords (words, phrases or ``prefix*``) that occur in a text."""
+    tokens = set(tokenize(text))
+    hits = 0
+    for keyword in keywords:
+        keyword = keyword.strip().lower()
+        if keyword.endswith('*'):
+            prefix = keyword[:-1]
+            hits += any(token.startswith(prefix) for token in tokens)
+        else:
+            words = tokenize(keyword)
+            hits += bool(words) and all(word in tokens for word in words)
+    return hits
+
+
+def select_windows(windows: Sequence[Dict[str, Any]], keywords: Optional[Iterable[str]],
+                   max_windows: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Windows worth sending to the LLM for a variable.
+
+    Args:
+        windows: Output of chunk_document
+        keywords: Variable keywords; None or empty keeps every window
+        max_windows: Keep at most this many (most keyword hits first)
+
+    Returns:
+        Matching windows in document order; the first window if none match
+    """
+    keywords = list(keywords or [])
+    if not keywords or len(windows) <= 1:
+        selected = list(windows)
+    else:
+        hits = {window['index']: window_matches(window['text'], keywords) for window in windows}
+        selected = [window for window in windows if hits[window['index']]] or list(windows[:1])
+        if max_windows is not None and len(selected) > max_windows:
+            keep = {w['index'] for w in sorted(selected, key=lambda w: -hits[w['index']])[:max_windows]}
+            selected = [window for window in selected if window['index'] in keep]
+    if max_windows is not None:
+        selected = selected[:max_windows]
+    return selected
+
+
+def merge_window_answers(answers: Sequence[str], error_value: str = 'ERROR') -> str:
+    """
+    Combine per-window answers into one value.
+
+    "Not found" style answers and failed calls are dropped; distinct remaining
+    answers are joined with '; ' in window order. If no window found anything,
+    the first answer is returned (keeping the instruction's default value).
+    """
+    if len(answers) == 1:
+        return answers[0]
+    found, seen = [], set()
+    for answer in answers:
+        value = str(answer).strip()
+        key = value.lower().rstrip('.')
+        if value == error_value or key in NOT_FOUND_ANSWERS or key in seen:
+            continue
+        seen.add(key)
+        found.append(value)
+    if found:
+        return '; '.join(found)
+    return next((a for a in answers if a != error_value), answers[0] if answers else '')
+
+
+def relevant_snippet(text: Any, keywords: Iterable[str], max_chars: int = 500, default_chars: int = 200) -> str:
+    """
+    Sentence-bounded snippet around the first keyword found (keywords tried in order).
+
+    The sentence containing the keyword is extended with neighbouring sentences
+    while the snippet stays within max_chars; a single longer sentence is cut
+    around the keyword. Without a keyword match, the leading sentences up to
+    default_chars are returned.
+    """
+    text = '' if text is None else str(text)
+    text_lower = text.lower()
+    position = -1
+    for keyword in keywords:
+        position = text_lower.find(keyword.lower())
+        if position >= 0:
+            break
+
+    spans = _sentence_spans(text)
+    if not spans:
+        return text[:default_chars]
+    if position < 0:
+        end = 0
+        while end < len(spans) and spans[end][1] - spans[0][0] <= default_chars:
+            end += 1
+        return text[spans[0][0]:spans[max(end, 1) - 1][1]][:default_chars]
+
+    index = max(0, bisect_right([span[0] for span in spans], position) - 1)
+    first = last = index
+    if spans[index][1] - spans[index][0] > max_chars:
+        start = max(spans[index][0], position - max_chars // 2)
+        return text[start:start + max_chars]
+    grew = True
+    while grew:
+        grew = False
+        if last + 1 < len(spans) and spans[last + 1][1] - spans[first][0] <= max_chars:
+            last += 1
+            grew = True
+        if first > 0 and spans[last][1] - spans[first - 1][0] <= max_chars:
+            first -= 1
+            grew = True
+    return text[spans[first][0]:spans[last][1]]
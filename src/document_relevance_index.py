@@ -0,0 +1,288 @@
+"""
+Document Relevance Index
+========================
+
+Per-patient BM25 keyword index over note titles and text, used to send each
+variable only to the documents that can plausibly answer it.
+
+Extraction used to run every variable against every document, so questions
+like ``extent_of_tumor_resection`` were asked of medication reconciliations
+and ``chemotherapy_agents`` of MRI reports. ``DocumentRelevanceIndex`` builds
+an inverted index once per patient and scores documents against a variable's
+declarative relevance spec:
+
+- ``keywords``: terms or phrases (phrases are scored as their words); a
+  trailing ``*`` matches any word with that prefix (``resect*``)
+- ``min_score``: documents must score above this BM25 value (default 0, i.e.
+  at least one keyword); ``None`` ranks without a threshold
+- ``top_k``: keep at most this many of the best-scoring documents
+
+Variables without a spec (demographics, free-form variables) keep every
+document. Documents whose ID marks them as structured summaries
+(``STRUCTURED_*``, ``FHIR_BUNDLE``) are always kept. Every skipped
+(variable, document) pair gets an explicit reason.
+
+Specs come from, in order: ``relevance_keywords`` / ``relevance_top_k`` /
+``relevance_min_score`` columns in variables.csv, a ``relevance_specs``
+mapping in the pipeline config, then ``RELEVANCE_SPECS`` below.
+
+Usage:
+    index = DocumentRelevanceIndex(project_df)
+    spec = relevance_spec('chemotherapy_agents')
+    selected, skipped = index.select(spec)   # row positions, {position: reason}
+"""
+
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 3  # title words count this many times
+
+DEFAULT_TEXT_COLUMNS = ('NOTE_TEXT', 'document_text', 'dr_description', 'dr_type_text', 'description')
+DEFAULT_TITLE_COLUMNS = ('NOTE_TITLE', 'dc_content_title', 'document_type', 'title')
+DEFAULT_ID_COLUMNS = ('NOTE_ID', 'document_id', 'dc_binary_id')
+PINNED_ID_PREFIXES = ('STRUCTURED_', 'FHIR_BUNDLE')
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+_SURGERY = ['surgery', 'surgical', 'operative', 'resect*', 'craniotomy', 'craniectomy', 'debulk*',
+            'excision', 'procedure', 'gross total', 'subtotal', 'gtr', 'str', 'neurosurgery']
+_IMAGING = ['mri', 'mr', 'ct', 'imaging', 'radiology', 'enhanc*', 'lesion', 'mass', 'contrast', 'flair',
+            'impression', 'findings']
+_PATHOLOGY = ['pathology', 'histolog*', 'diagnosis', 'astrocytoma', 'glioma', 'ependymoma',
+              'medulloblastoma', 'tumor', 'neoplasm', 'grade', 'biopsy', 'specimen']
+_MOLECULAR = ['molecular', 'genomic', 'mutation', 'fusion', 'braf', 'kiaa1549', 'idh*', 'mgmt',
+              'methylation', 'h3', 'k27m', 'sequencing', 'panel', 'variant']
+_CHEMOTHERAPY = ['chemotherapy', 'chemo', 'oncology', 'vinblastine', 'vincristine', 'carboplatin',
+                 'temozolomide', 'bevacizumab', 'selumetinib', 'dabrafenib', 'trametinib', 'lomustine',
+                 'cycle', 'regimen', 'infusion', 'protocol']
+_RADIATION = ['radiation', 'radiotherapy', 'proton', 'gy', 'cgy', 'fraction*', 'xrt', 'imrt']
+_PROGRESSION = ['progress*', 'recurren*', 'relapse', 'stable', 'increas*', 'decreas*', 'interval',
+                'response', 'residual', 'growth']
+_METASTASIS = ['metasta*', 'leptomeningeal', 'dissemina*', 'drop', 'spine', 'spinal', 'csf', 'cytology',
+               'seeding']
+_LOCATION = ['location', 'cerebell*', 'posterior', 'fossa', 'frontal', 'temporal', 'parietal',
+             'occipital', 'brainstem', 'pons', 'thalam*', 'ventricle', 'suprasellar', 'optic', 'hemisphere']
+_SYMPTOMS = ['symptom*', 'headache', 'nausea', 'vomiting', 'ataxia', 'seizure*', 'vision', 'weakness',
+             'complain*', 'presents', 'history']
+_HYDROCEPHALUS = ['hydrocephalus', 'shunt', 'vps', 'ventriculostomy', 'etv', 'evd', 'ventricul*']
+_MEDICATIONS = ['medication*', 'dose', 'mg', 'tablet', 'daily', 'prescri*', 'dexamethasone', 'levetiracetam']
+_STATUS = ['status', 'follow', 'visit', 'clinic', 'alive', 'deceased', 'expired', 'death', 'exam']
+
+RELEVANCE_SPECS: Dict[str, Dict[str, Any]] = {
+    # BRIM variables (variables.csv)
+    'surgery_number': {'keywords': _SURGERY},
+    'surgery_date': {'keywords': _SURGERY},
+    'surgery_type': {'keywords': _SURGERY},
+    'surgery_extent': {'keywords': _SURGERY + _IMAGING},
+    'surgery_location': {'keywords': _SURGERY + _LOCATION},
+    'surgery_diagnosis': {'keywords': _SURGERY + _PATHOLOGY},
+    'extent_of_tumor_resection': {'keywords': _SURGERY + _IMAGING},
+    'primary_diagnosis': {'keywords': _PATHOLOGY},
+    'diagnosis_date': {'keywords': _PATHOLOGY + _SURGERY},
+    'who_grade': {'keywords': _PATHOLOGY},
+    'tumor_location': {'keywords': _LOCATION + _IMAGING + _SURGERY},
+    'idh_mutation': {'keywords': _MOLECULAR + _PATHOLOGY},
+    'mgmt_methylation': {'keywords': _MOLECULAR + _PATHOLOGY},
+    'braf_status': {'keywords': _MOLECULAR + _PATHOLOGY},
+    'molecular_testing_performed': {'keywords': _MOLECULAR},
+    'chemotherapy_received': {'keywords': _CHEMOTHERAPY},
+    'chemotherapy_agent': {'keywords': _CHEMOTHERAPY},
+    'chemotherapy_agents': {'keywords': _CHEMOTHERAPY},
+    'radiation_received': {'keywords': _RADIATION},
+    'tumor_progression': {'keywords': _PROGRESSION + _IMAGING},
+    'imaging_findings': {'keywords': _IMAGING},
+    'treatment_response': {'keywords': _PROGRESSION + _IMAGING + _CHEMOTHERAPY},
+    'symptoms_present': {'keywords': _SYMPTOMS},
+    'hydrocephalus_treatment': {'keywords': _HYDROCEPHALUS},
+    'concomitant_medications': {'keywords': _MEDICATIONS},
+    'metastasis_present': {'keywords': _METASTASIS + _IMAGING},
+    'metastasis_locations': {'keywords': _METASTASIS + _IMAGING},
+    'clinical_status': {'keywords': _STATUS + _PROGRESSION},
+
+    # Event-based workflow variables (CompleteVariableWorkflow, EnhancedLLMExtractor)
+    'extent_of_resection': {'keywords': _SURGERY + _IMAGING},
+    'progression_recurrence_indicator': {'keywords': _PROGRESSION + _IMAGING},
+    'metastasis': {'keywords': _METASTASIS + _IMAGING},
+    'surgery': {'keywords': _SURGERY},
+    'tumor_histology': {'keywords': _PATHOLOGY + _MOLECULAR},
+    'chemotherapy_response': {'keywords': _CHEMOTHERAPY + _PROGRESSION + _IMAGING},
+    'progression_status': {'keywords': _PROGRESSION + _IMAGING},
+    'molecular_testing': {'keywords': _MOLECULAR},
+    'survival_status': {'keywords': _STATUS},
+}
+
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase alphanumeric words of a text ('' for missing values)."""
+    if _is_missing(text):
+        return []
+    return _TOKEN.findall(str(text).lower())
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value)) or value == ''
+
+
+def _split_keywords(value: Any) -> List[str]:
+    """Keywords from a spec value: a list, or a ';' / '|' / ',' separated string."""
+    if isinstance(value, str):
+        return [k.strip() for k in re.split(r'[;|,]', value) if k.strip()]
+    return [str(k) for k in value or []]
+
+
+def relevance_spec(variable_name: str, variable_row: Optional[Mapping[str, Any]] = None,
+                   config_specs: Optional[Mapping[str, Mapping[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Relevance spec for a variable, or None if every document should be used.
+
+    Args:
+        variable_name: Variable name
+        variable_row: Row of variables.csv (``relevance_keywords``, ``relevance_top_k``,
+            ``relevance_min_score`` columns override the other sources)
+        config_specs: ``relevance_specs`` mapping from the pipeline config
+
+    Returns:
+        Dict with ``keywords`` (list), ``top_k`` and ``min_score``
+    """
+    spec = dict(RELEVANCE_SPECS.get(variable_name, {}))
+    if config_specs and variable_name in config_specs:
+        spec.update(config_specs[variable_name] or {})
+    if variable_row is not None:
+        for key in ('keywords', 'top_k', 'min_score'):
+            value = variable_row.get(f'relevance_{key}')
+            if not _is_missing(value):
+                spec[key] = value
+
+    keywords = _split_keywords(spec.get('keywords'))
+    if not keywords:
+        return None
+    top_k = spec.get('top_k')
+    min_score = spec.get('min_score', 0.0)
+    return {
+        'keywords': keywords,
+        'top_k': None if _is_missing(top_k) else int(top_k),
+        'min_score': None if min_score is None else float(min_score),
+    }
+
+
+class DocumentRelevanceIndex:
+    """
+    BM25 inverted index over one patient's documents (rows of a DataFrame).
+    """
+
+    def __init__(self, documents: pd.DataFrame, text_columns: Optional[Sequence[str]] = None,
+                 title_columns: Optional[Sequence[str]] = None, id_column: Optional[str] = None):
+        """
+        Args:
+            documents: One row per document
+            text_columns: Body text columns (default: those of DEFAULT_TEXT_COLUMNS present)
+            title_columns: Title columns, weighted TITLE_WEIGHT times (default: DEFAULT_TITLE_COLUMNS present)
+            id_column: Document ID column (default: first of DEFAULT_ID_COLUMNS present)
+        """
+        self.documents = documents
+        columns = set(documents.columns)
+        self.text_columns = [c for c in (text_columns or DEFAULT_TEXT_COLUMNS) if c in columns]
+        self.title_columns = [c for c in (title_columns or DEFAULT_TITLE_COLUMNS) if c in columns]
+        self.id_column = id_column or next((c for c in DEFAULT_ID_COLUMNS if c in columns), None)
+        self.size = len(documents)
+
+        postings = defaultdict(lambda: ([], []))
+        self.lengths = np.zeros(self.size, dtype=np.float64)
+        text_values = [documents[c].tolist() for c in self.text_columns]
+        title_values = [documents[c].tolist() for c in self.title_columns]
+        for position in range(self.size):
+            counts = Counter()
+            for values in text_values:
+                counts.update(tokenize(values[position]))
+            for values in title_values:
+                for term in tokenize(values[position]):
+                    counts[term] += TITLE_WEIGHT
+            self.lengths[position] = sum(counts.values())
+            for term, tf in counts.items():
+                entry = postings[term]
+                entry[0].append(position)
+                entry[1].append(tf)
+
+        self.postings = {term: (np.asarray(positions, dtype=np.int64), np.asarray(tfs, dtype=np.float64))
+                         for term, (positions, tfs) in postings.items()}
+        self.vocabulary = sorted(self.postings)
+        self.average_length = float(self.lengths.mean()) if self.size and self.lengths.any() else 1.0
+
+        ids = documents[self.id_column].astype(str).tolist() if self.id_column else [''] * self.size
+        self.pinned = np.array([i.startswith(PINNED_ID_PREFIXES) for i in ids], dtype=bool)
+
+    @property
+    def searchable(self) -> bool:
+        """False when the documents have no text or title columns to index."""
+        return bool(self.text_columns or self.title_columns)
+
+    def expand_terms(self, keywords: Iterable[str]) -> List[str]:
+        """Index terms for keywords: words of each phrase, ``prefix*`` expanded over the vocabulary."""
+        terms = set()
+        for keyword in keywords:
+            keyword = keyword.strip().lower()
+            if keyword.endswith('*'):
+                prefix = keyword[:-1]
+                start = bisect_left(self.vocabulary, prefix)
+                while start < len(self.vocabulary) and self.vocabulary[start].startswith(prefix):
+                    terms.add(self.vocabulary[start])
+                    start += 1
+            else:
+                terms.update(t for t in tokenize(keyword) if t in self.postings)
+        return sorted(terms)
+
+    def scores(self, keywords: Iterable[str]) -> np.ndarray:
+        """BM25 score of every document for a keyword query (each distinct term counted once)."""
+        scores = np.zeros(self.size, dtype=np.float64)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / self.average_length)
+        for term in self.expand_terms(keywords):
+            positions, tfs = self.postings[term]
+            idf = math.log(1 + (self.size - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[positions])
+        return scores
+
+    def select(self, spec: Optional[Mapping[str, Any]],
+               candidates: Optional[Sequence[int]] = None) -> Tuple[List[int], Dict[int, str]]:
+        """
+        Documents to send to the LLM for a relevance spec.
+
+        Args:
+            spec: Relevance spec (see ``relevance_spec``); None keeps every candidate
+            candidates: Row positions to choose from, in order of preference for equal
+                scores (default: all documents)
+
+        Returns:
+            (selected row positions in input order, {skipped row position: reason})
+        """
+        candidates = list(range(self.size)) if candidates is None else list(candidates)
+        if not spec or not spec.get('keywords') or not self.searchable:
+            return candidates, {}
+
+        scores = self.scores(spec['keywords'])
+        min_score = spec.get('min_score', 0.0)
+        skipped = {}
+        eligible = []
+        for position in candidates:
+            if self.pinned[position]:
+                continue
+            if min_score is not None and scores[position] <= min_score:
+                skipped[position] = ('no relevance keyword in title or text' if scores[position] == 0 else
+                                     f'relevance score {scores[position]:.2f} <= min_score {min_score:g}')
+            else:
+                eligible.append(position)
+
+        top_k = spec.get('top_k')
+        if top_k is not None and len(eligible) > top_k:
+            ranked = sorted(eligible, key=lambda p: -scores[p])  # ties keep candidate order
+            for rank, position in enumerate(ranked[top_k:], start=top_k + 1):
+                skipped[position] = f'ranked {rank} of {len(ranked)} by relevance score (top_k={top_k})'
+
+        return [p for p in candidates if p not in skipped], skipped
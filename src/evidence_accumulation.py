@@ -0,0 +1,148 @@
+"""
+Evidence Accumulation
+=====================
+
+Early exit for variables with a single answer per patient.
+
+``one_per_patient`` variables (date of birth, gender, primary diagnosis) were
+extracted from every selected document and only collapsed to one value at
+adjudication, so a 300-note patient cost 300 calls per variable for an answer
+the first few good documents already agree on. Evidence accumulation visits a
+variable's documents in priority order and stops once the answers agree:
+
+- ``document_priority_order()`` ranks documents by a Phase 3 ``priority_score``
+  column when the project file has one (IntelligentDocumentSelector export),
+  otherwise by document type priority, then relevance score, then file order
+- ``EvidenceAccumulator`` takes answers in rank order; uninformative answers
+  (``Unavailable``, ``N/A``, ...) are consulted but never count as evidence
+- It is ``done`` once the leading answer has ``agreement`` informative answers
+  and at least ``min_share`` of all informative answers
+- ``consulted`` lists every document asked, in order, with its answer
+
+Usage:
+    order = document_priority_order(documents, type_priority=type_priority, scores=bm25_scores)
+    accumulator = EvidenceAccumulator(agreement=3)
+    for position in order:
+        if accumulator.add(note_id, answer):
+            break
+    accumulator.value, accumulator.consulted
+"""
+
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+DEFAULT_AGREEMENT = 3
+DEFAULT_MIN_SHARE = 0.75
+
+# Answers that say the document does not have the information (compared after normalize_answer)
+UNINFORMATIVE_ANSWERS = {
+    '', 'unavailable', 'n/a', 'na', 'unknown', 'not found', 'not mentioned', 'not documented',
+    'not available', 'not applicable', 'not specified', 'not stated', 'no information', 'error',
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_answer(answer: Any) -> str:
+    """Comparison key for an answer: case, surrounding quotes/punctuation and spacing ignored."""
+    if answer is None or (isinstance(answer, float) and pd.isna(answer)):
+        return ''
+    text = _WHITESPACE.sub(' ', str(answer)).strip().strip('"\'`').rstrip('.').strip()
+    return text.casefold()
+
+
+def is_informative(answer: Any) -> bool:
+    """False for empty answers and the default values extraction prompts fall back to."""
+    return normalize_answer(answer) not in UNINFORMATIVE_ANSWERS
+
+
+def document_priority_order(documents: pd.DataFrame, priority_column: str = 'priority_score',
+                            type_priority: Optional[Callable[[Any], int]] = None,
+                            title_column: str = 'NOTE_TITLE',
+                            scores: Optional[Sequence[float]] = None) -> List[int]:
+    """
+    Row positions of documents, best evidence first.
+
+    Args:
+        documents: One row per document
+        priority_column: Phase 3 score column (higher first); used alone when present
+        type_priority: Document type priority of a title (lower first), e.g.
+            IntelligentDocumentSelector.document_type_priority
+        title_column: Column passed to type_priority
+        scores: Relevance score per row position (higher first)
+
+    Returns:
+        Row positions; ties keep file order
+    """
+    positions = range(len(documents))
+    if priority_column in documents.columns:
+        priority = pd.to_numeric(documents[priority_column], errors='coerce').fillna(float('-inf')).tolist()
+        return sorted(positions, key=lambda p: -priority[p])
+
+    titles = documents[title_column].tolist() if title_column in documents.columns else [None] * len(documents)
+    type_rank = [type_priority(title) for title in titles] if type_priority else [0] * len(documents)
+    relevance = list(scores) if scores is not None else [0.0] * len(documents)
+    return sorted(positions, key=lambda p: (type_rank[p], -relevance[p]))
+
+
+class EvidenceAccumulator:
+    """Answers for one variable in priority order, until enough of them agree."""
+
+    def __init__(self, agreement: int = DEFAULT_AGREEMENT, min_share: float = DEFAULT_MIN_SHARE):
+        """
+        Args:
+            agreement: Informative answers the leading value needs before stopping
+            min_share: Fraction of informative answers the leading value needs
+        """
+        self.agreement = max(1, int(agreement))
+        self.min_share = min_share
+        self.counts = Counter()
+        self.first_seen = {}  # normalized answer -> answer as first returned
+        self.consulted: List[Dict[str, Any]] = []
+
+    def add(self, note_id: Any, answer: Any) -> bool:
+        """Record the answer of the next document; True once the evidence is sufficient."""
+        self.consulted.append({'NOTE_ID': note_id, 'extracted_value': answer})
+        if is_informative(answer):
+            key = normalize_answer(answer)
+            self.counts[key] += 1
+            self.first_seen.setdefault(key, answer)
+        return self.done
+
+    @property
+    def informative(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def leader(self) -> Optional[str]:
+        """Normalized answer with the most support (earliest seen on a tie)."""
+        if not self.counts:
+            return None
+        return max(self.first_seen, key=lambda key: self.counts[key])
+
+    @property
+    def done(self) -> bool:
+        leader = self.leader
+        if leader is None:
+            return False
+        support = self.counts[leader]
+        return support >= self.agreement and support >= self.min_share * self.informative
+
+    @property
+    def value(self) -> Optional[str]:
+        """Leading answer as the model first returned it (None without informative answers)."""
+        leader = self.leader
+        return None if leader is None else self.first_seen[leader]
+
+    def summary(self) -> Dict[str, Any]:
+        leader = self.leader
+        return {
+            'consensus_value': self.value,
+            'agreeing_answers': self.counts[leader] if leader is not None else 0,
+            'informative_answers': self.informative,
+            'documents_consulted': len(self.consulted),
+            'stopped_early': self.done,
+        }
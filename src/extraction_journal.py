@@ -0,0 +1,196 @@
+"""
+Extraction Journal
+==================
+
+Append-only, document-granular checkpoint for extraction runs.
+
+The pipeline used to pickle its whole ``variable_results`` list after every
+variable (O(n^2) bytes over a run), could only resume at variable granularity
+and asked ``input()`` before resuming, so unattended batch runs hung.
+``ExtractionJournal`` is a JSON Lines write-ahead log instead:
+
+- One line per completed (variable, note) result, appended as it is recorded;
+  ``variable_complete`` lines mark finished variables
+- Lines are flushed immediately and fsynced in batches (every ``fsync_every``
+  records or ``fsync_seconds``, and whenever a variable completes)
+- ``load()`` rebuilds results, completed pairs and completed variables; a
+  torn last line from a crash is ignored, a repeated pair keeps its last value
+- Safe to read while a run is in progress: readers only see whole lines, so
+  dashboards can poll ``read_journal()`` / ``journal_progress()`` without
+  pausing the pipeline
+
+Usage:
+    journal = ExtractionJournal(checkpoint_dir / f"extraction_journal_{patient}.jsonl")
+    results, completed_pairs, completed_variables = journal.load()
+    journal.append_result(row)                  # row has variable_name and NOTE_ID
+    journal.mark_variable_complete('surgery_date')
+    journal.close()
+
+Progress from the command line (while a run is going):
+    python src/extraction_journal.py <journal.jsonl>
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+DEFAULT_FSYNC_EVERY = 50
+DEFAULT_FSYNC_SECONDS = 5.0
+
+
+def read_journal(path) -> Iterator[Dict[str, Any]]:
+    """Records of a journal file, skipping a torn (unterminated or unparseable) last line."""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # being written right now, or torn by a crash
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def journal_progress(path) -> Dict[str, Any]:
+    """Counts for a journal file: results, completed variables, last result."""
+    results, variables, last = {}, set(), None
+    for record in read_journal(path):
+        if record.get('type') == 'result':
+            results[(record.get('variable_name'), record.get('NOTE_ID'))] = True
+            last = record
+        elif record.get('type') == 'variable_complete':
+            variables.add(record['variable_name'])
+    return {
+        'results': len(results),
+        'variables_completed': len(variables),
+        'last_variable': last.get('variable_name') if last else None,
+        'last_note': last.get('NOTE_ID') if last else None,
+        'last_timestamp': last.get('extraction_timestamp') if last else None,
+    }
+
+
+class ExtractionJournal:
+    """JSON Lines write-ahead journal of (variable, note) extraction results."""
+
+    def __init__(self, path, fsync_every: int = DEFAULT_FSYNC_EVERY, fsync_seconds: float = DEFAULT_FSYNC_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.records_written = 0
+
+    def exists(self) -> bool:
+        return self.path.exists() and self.path.stat().st_size > 0
+
+    def load(self) -> Tuple[List[Dict[str, Any]], Set[Tuple[str, str]], Set[str]]:
+        """
+        Replay the journal.
+
+        Returns:
+            (result rows in journal order, completed (variable_name, NOTE_ID) pairs,
+            completed variable names)
+        """
+        results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        completed_variables = set()
+        for record in read_journal(self.path):
+            kind = record.pop('type', None)
+            if kind == 'result':
+                key = (record['variable_name'], str(record['NOTE_ID']))
+                results.pop(key, None)
+                results[key] = record
+            elif kind == 'variable_complete':
+                completed_variables.add(record['variable_name'])
+        return list(results.values()), set(results), completed_variables
+
+    def _open(self):
+        if self._file is None:
+            # A crash can leave a torn last line; start appending on a fresh line
+            if self.exists():
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b'\n'
+                if torn:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write('\n')
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _write(self, record: Dict[str, Any], sync: bool = False):
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            self.records_written += 1
+            self._unsynced += 1
+            if sync or self._unsynced >= self.fsync_every or \
+                    time.monotonic() - self._last_sync >= self.fsync_seconds:
+                os.fsync(f.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def start_run(self, **metadata):
+        """Record the start (or resumption) of a run."""
+        self._write({'type': 'run_start', 'timestamp': datetime.now().isoformat(), **metadata}, sync=True)
+
+    def append_result(self, row: Dict[str, Any]):
+        """Record one completed (variable, note) result."""
+        self._write({'type': 'result', **row})
+
+    def mark_variable_complete(self, variable_name: str):
+        """Record that every document of a variable is done (fsyncs)."""
+        self._write({'type': 'variable_complete', 'variable_name': variable_name,
+                     'timestamp': datetime.now().isoformat()}, sync=True)
+
+    def sync(self):
+        """fsync pending records."""
+        with self._lock:
+            if self._file is not None and self._unsynced:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def reset(self):
+        """Discard the journal (start over)."""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python src/extraction_journal.py <journal.jsonl>")
+        return 1
+    progress = journal_progress(sys.argv[1])
+    print(f"Results: {progress['results']}  Variables completed: {progress['variables_completed']}")
+    if progress['last_variable']:
+        print(f"Last: {progress['last_variable']} / {progress['last_note']} at {progress['last_timestamp']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,722 @@
+"""
+LLM Client
+==========
+
+One LLM backend interface shared by every extractor.
+
+Extractors each built their own ``Client(host='http://127.0.0.1:11434')`` with
+the host, model and options hard-coded, opened a new connection per call and
+waited for the complete response. ``LLMClient`` replaces those clients:
+
+- Backends: Ollama (``/api/chat``) and Anthropic (``/v1/messages``) over one
+  pooled ``requests.Session`` per server, so keep-alive connections of calls
+  that run to completion are reused across calls, threads and components
+  (``LLM_TRANSPORT=sdk`` calls the ``ollama`` / ``anthropic`` packages instead,
+  without streaming)
+- Streaming: the answer is read token by token. Calls that opt in stop early:
+  at the first answer delimiter (``stop``, or ``variable_type='single_value'``:
+  a blank line after a single extracted value) or once a JSON answer is
+  complete. Stopping early closes the connection instead of returning it to
+  the pool; that is what makes the server stop generating
+- Per-call timeouts: connecting, between streamed tokens, and a deadline for
+  the whole call (so a call the scheduler gave up on frees its worker thread)
+- ``max_tokens`` per variable type (``VARIABLE_TYPE_LIMITS``; 1024 unless a type says otherwise)
+- Prometheus-style metrics per backend and model: request, error, early stop
+  and token counters, latency and time-to-first-token histograms;
+  ``metrics_text()`` renders the text exposition format
+
+``chat()`` takes the ``ollama.Client.chat()`` arguments and returns an Ollama
+response dict for both backends, so ``CachedOllamaClient`` and
+``ScheduledOllamaClient`` wrap it unchanged. ``get_extraction_client()``
+returns that stack around the shared client.
+
+Usage:
+    llm = get_extraction_client()  # cached, scheduled, pooled
+    response = llm.chat(messages=[{'role': 'user', 'content': prompt}], variable_type='many_per_note')
+    response['message']['content']
+
+    client = get_llm_client('anthropic')  # unscheduled, for callers that schedule themselves
+    print(metrics_text())
+
+Configuration (environment variables):
+- ``OLLAMA_HOST`` (default http://127.0.0.1:11434), ``LLM_OLLAMA_MODEL`` (default gemma2:27b)
+- ``ANTHROPIC_API_KEY``, ``ANTHROPIC_BASE_URL``, ``LLM_ANTHROPIC_MODEL``
+- ``LLM_TRANSPORT``: ``http`` (default) or ``sdk``
+- ``LLM_STREAM=0``: wait for complete responses (answers are still cut at the delimiter)
+- ``LLM_CONNECT_TIMEOUT`` (default 10s), ``LLM_READ_TIMEOUT`` seconds between
+  tokens (default 300s), ``LLM_TIMEOUT`` whole call (default 600s, as the scheduler)
+- ``LLM_POOL_SIZE``: pooled connections per server (default 16)
+- ``LLM_MAX_TOKENS_<TYPE>``: e.g. ``LLM_MAX_TOKENS_SINGLE_VALUE=256``
+- ``LLM_METRICS_PORT``: serve the metrics on ``/metrics`` at this port
+- ``LLM_METRICS_HOST``: interface the metrics server binds to (default 127.0.0.1,
+  local only; e.g. 0.0.0.0 for a Prometheus scraper on another host)
+
+local_llm_extraction/local_llm_extraction_pipeline.py (the Claude-only
+pipeline) still builds its own ``anthropic.Anthropic`` client and does not go
+through ``LLMClient``; local_llm_extraction_pipeline_with_ollama.py replaces it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from document_chunking import estimate_tokens
+from llm_response_cache import CachedOllamaClient
+from llm_scheduler import PRIORITY_DEFAULT, ScheduledOllamaClient
+from prompt_layout import anthropic_messages
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_HOST = 'http://127.0.0.1:11434'
+DEFAULT_OLLAMA_MODEL = 'gemma2:27b'
+DEFAULT_ANTHROPIC_URL = 'https://api.anthropic.com'
+DEFAULT_ANTHROPIC_MODEL = 'claude-sonnet-4-20250514'
+ANTHROPIC_VERSION = '2023-06-01'
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_POOL_SIZE = 16
+DEFAULT_METRICS_HOST = '127.0.0.1'
+DEFAULT_OPTIONS = {'temperature': 0.0}
+
+DEFAULT_MAX_TOKENS = 1024
+
+# A single extracted value ends at the first blank line; what follows is commentary
+ANSWER_DELIMITERS = ('\n\n',)
+
+# Generation budget and answer delimiters per variable type (variable scope or kind of call).
+# Only 'single_value' answers (an option, number, date or yes/no) stop at the delimiter: a scope
+# says nothing about the answer's length, and many_per_note answers may span paragraphs.
+# Batched (JSON) answers stop once the object is complete; decisions and untyped calls run to the end.
+VARIABLE_TYPE_LIMITS = {
+    'one_per_patient': {'max_tokens': DEFAULT_MAX_TOKENS, 'stop': ()},
+    'one_per_note': {'max_tokens': DEFAULT_MAX_TOKENS, 'stop': ()},
+    'many_per_note': {'max_tokens': DEFAULT_MAX_TOKENS, 'stop': ()},
+    'single_value': {'max_tokens': DEFAULT_MAX_TOKENS, 'stop': ANSWER_DELIMITERS},
+    'batch': {'max_tokens': 2048, 'stop': ()},
+    'decision': {'max_tokens': 2048, 'stop': ()},
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_CLIENTS: Dict[str, 'LLMClient'] = {}
+_SESSIONS: Dict[str, requests.Session] = {}
+_SHARED_LOCK = threading.Lock()
+_METRICS_SERVER = None
+
+
+def variable_type_limits(variable_type: Optional[str]) -> Dict[str, Any]:
+    """max_tokens and stop delimiters of a variable type (``LLM_MAX_TOKENS_<TYPE>`` overrides max_tokens)."""
+    if not isinstance(variable_type, str):  # e.g. a missing scope read as NaN
+        variable_type = None
+    limits = dict(VARIABLE_TYPE_LIMITS.get(variable_type) or {'max_tokens': DEFAULT_MAX_TOKENS, 'stop': ()})
+    if variable_type:
+        env = os.environ.get(f'LLM_MAX_TOKENS_{variable_type.upper()}')
+        if env:
+            limits['max_tokens'] = int(env)
+    return limits
+
+
+def find_delimiter(text: str, stop: Sequence[str], start: int = 0) -> int:
+    """
+    Position of the first stop delimiter after the answer has started, or -1.
+
+    Leading whitespace is not an answer, so a delimiter before the first
+    non-blank character does not end it.
+    """
+    begin = len(text) - len(text.lstrip())
+    if begin == len(text):
+        return -1
+    positions = [position for position in (text.find(delimiter, max(begin, start - len(delimiter) + 1))
+                                           for delimiter in stop) if position >= 0]
+    return min(positions) if positions else -1
+
+
+class JSONEnd:
+    """Incremental scanner: end of the first complete top-level JSON object or array in a stream."""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.consumed = 0
+        self.end = -1
+
+    def feed(self, piece: str) -> int:
+        """Scan the next piece; returns the end offset (exclusive) once the value is complete, else -1."""
+        for char in piece:
+            if self.end >= 0:
+                break
+            self.consumed += 1
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth:
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]' and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    self.end = self.consumed
+        return self.end
+
+
+class LLMMetrics:
+    """Thread-safe Prometheus-style counters and histograms (text exposition via text())."""
+
+    HELP = {
+        'llm_requests_total': ('counter', 'LLM calls started'),
+        'llm_errors_total': ('counter', 'LLM calls that failed, by error kind'),
+        'llm_early_stops_total': ('counter', 'LLM calls stopped at an answer delimiter or complete JSON answer'),
+        'llm_prompt_tokens_total': ('counter', 'Prompt tokens reported (or estimated) per call'),
+        'llm_completion_tokens_total': ('counter', 'Generated tokens consumed per call'),
+        'llm_request_duration_seconds': ('histogram', 'LLM call latency'),
+        'llm_time_to_first_token_seconds': ('histogram', 'Time until the first answer token arrived'),
+    }
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = defaultdict(float)
+        self._histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+
+    @staticmethod
+    def _labels(labels: Dict[str, Any]) -> Tuple:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, self._labels(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a histogram sample: [bucket counts..., count, sum]."""
+        with self._lock:
+            series = self._histograms.setdefault((name, self._labels(labels)), [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def value(self, name: str, **labels) -> float:
+        """Counter total (or histogram sample count) over all series matching the given labels."""
+        wanted = set(self._labels(labels))
+        with self._lock:
+            total = sum(count for (metric, series), count in self._counters.items()
+                        if metric == name and wanted <= set(series))
+            total += sum(values[-2] for (metric, series), values in self._histograms.items()
+                         if metric == name and wanted <= set(series))
+        return total
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def text(self) -> str:
+        """Prometheus text exposition format."""
+        def render(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        lines = []
+        for name, (kind, description) in self.HELP.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            if kind == 'counter':
+                for (metric, labels), count in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{render(labels)} {count:g}')
+                continue
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f'{name}_bucket{render(labels, [("le", f"{bound:g}")])} {count}')
+                lines.append(f'{name}_bucket{render(labels, [("le", "+Inf")])} {values[-2]}')
+                lines.append(f'{name}_count{render(labels)} {values[-2]}')
+                lines.append(f'{name}_sum{render(labels)} {values[-1]:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = LLMMetrics()
+
+
+def metrics_text() -> str:
+    """Process-wide LLM client metrics in the Prometheus text format."""
+    return METRICS.text()
+
+
+def start_metrics_server(port: int, metrics: Optional[LLMMetrics] = None,
+                         host: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Serve metrics on http://<host>:<port>/metrics from a daemon thread.
+
+    host defaults to LLM_METRICS_HOST, else 127.0.0.1 (reachable from this machine only).
+    """
+    metrics = metrics or METRICS
+    host = host or os.environ.get('LLM_METRICS_HOST', DEFAULT_METRICS_HOST)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            data = metrics.text().encode('utf-8') if self.path == '/metrics' else b'not found\n'
+            self.send_response(200 if self.path == '/metrics' else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='llm-metrics', daemon=True).start()
+    logger.info(f"Serving LLM metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def pooled_session(base_url: str, pool_size: Optional[int] = None) -> requests.Session:
+    """Process-wide keep-alive session for one server (shared by every client of that URL)."""
+    with _SHARED_LOCK:
+        if base_url not in _SESSIONS:
+            size = pool_size or int(os.environ.get('LLM_POOL_SIZE', DEFAULT_POOL_SIZE))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _SESSIONS[base_url] = session
+        return _SESSIONS[base_url]
+
+
+class OllamaBackend:
+    """Ollama ``/api/chat`` over the pooled session."""
+
+    provider = 'ollama'
+
+    def __init__(self, host: Optional[str] = None, pool_size: Optional[int] = None):
+        self.host = (host or os.environ.get('OLLAMA_HOST') or DEFAULT_OLLAMA_HOST).rstrip('/')
+        if '://' not in self.host:
+            self.host = f'http://{self.host}'
+        self.session = pooled_session(self.host, pool_size)
+
+    def generate(self, request: Dict[str, Any], usage: Dict[str, Any], stream: bool,
+                 timeout: Tuple[float, float]) -> Iterator[str]:
+        """Yield answer text as it arrives; fills usage (prompt/completion tokens, stop reason)."""
+        body = {'model': request['model'], 'messages': request['messages'], 'stream': stream,
+                'options': {**request['options'], 'num_predict': request['max_tokens']}}
+        if request.get('format') is not None:
+            body['format'] = request['format']
+        if request.get('keep_alive') is not None:
+            body['keep_alive'] = request['keep_alive']
+
+        response = self.session.post(f'{self.host}/api/chat', json=body, stream=stream, timeout=timeout)
+        try:
+            response.raise_for_status()
+            chunks = (json.loads(line) for line in response.iter_lines() if line) if stream else [response.json()]
+            for chunk in chunks:
+                if chunk.get('error'):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                content = (chunk.get('message') or {}).get('content', '')
+                if chunk.get('done'):
+                    usage['prompt_tokens'] = chunk.get('prompt_eval_count', usage['prompt_tokens'])
+                    usage['completion_tokens'] = chunk.get('eval_count', usage['completion_tokens'] + bool(content))
+                    usage['stop_reason'] = chunk.get('done_reason', 'stop')
+                elif content:
+                    usage['completion_tokens'] += 1  # one token per streamed chunk
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+    def list_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        response = self.session.get(f'{self.host}/api/tags',
+                                    timeout=(timeout or DEFAULT_CONNECT_TIMEOUT, timeout or 30.0))
+        response.raise_for_status()
+        return response.json()
+
+
+class AnthropicBackend:
+    """Anthropic Messages API (server-sent events when streaming) over the pooled session."""
+
+    provider = 'anthropic'
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 pool_size: Optional[int] = None):
+        self.api_key = api_key or os.environ.get('ANTHROPIC_API_KEY')
+        if not self.api_key:
+            raise ValueError(
+                "ANTHROPIC_API_KEY environment variable not set.\n"
+                "Set it with: export ANTHROPIC_API_KEY='your-api-key'\n"
+                "Or use --model ollama for free local inference"
+            )
+        self.base_url = (base_url or os.environ.get('ANTHROPIC_BASE_URL') or DEFAULT_ANTHROPIC_URL).rstrip('/')
+        self.session = pooled_session(self.base_url, pool_size)
+
+    @staticmethod
+    def body(request: Dict[str, Any]) -> Dict[str, Any]:
+        """Messages API request for an Ollama-style request (system messages -> system)."""
+        system = '\n\n'.join(m['content'] for m in request['messages'] if m['role'] == 'system')
+        messages = [m for m in request['messages'] if m['role'] != 'system']
+        if len(messages) == 1 and isinstance(messages[0]['content'], str):
+            messages = anthropic_messages(messages[0]['content'], request.get('cache_prefix'))
+        body = {'model': request['model'], 'max_tokens': request['max_tokens'], 'messages': messages}
+        if system:
+            body['system'] = system
+        if 'temperature' in request['options']:
+            body['temperature'] = request['options']['temperature']
+        return body
+
+    def generate(self, request: Dict[str, Any], usage: Dict[str, Any], stream: bool,
+                 timeout: Tuple[float, float]) -> Iterator[str]:
+        body = {**self.body(request), 'stream': stream}
+        headers = {'x-api-key': self.api_key, 'anthropic-version': ANTHROPIC_VERSION}
+        response = self.session.post(f'{self.base_url}/v1/messages', json=body, headers=headers, stream=stream,
+                                     timeout=timeout)
+        try:
+            response.raise_for_status()
+            if not stream:
+                message = response.json()
+                self._usage(usage, message.get('usage') or {})
+                usage['completion_tokens'] = int((message.get('usage') or {}).get('output_tokens') or 0)
+                usage['stop_reason'] = message.get('stop_reason')
+                yield ''.join(block.get('text', '') for block in message.get('content', []))
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                event = json.loads(line[5:])
+                kind = event.get('type')
+                if kind == 'content_block_delta':
+                    text = (event.get('delta') or {}).get('text', '')
+                    if text:
+                        usage['completion_tokens'] += 1  # exact count arrives with message_delta
+                        yield text
+                elif kind == 'message_start':
+                    self._usage(usage, (event.get('message') or {}).get('usage') or {})
+                elif kind == 'message_delta':
+                    usage['completion_tokens'] = (event.get('usage') or {}).get('output_tokens',
+                                                                                usage['completion_tokens'])
+                    usage['stop_reason'] = (event.get('delta') or {}).get('stop_reason')
+                elif kind == 'error':
+                    raise RuntimeError(f"Anthropic error: {event.get('error')}")
+        finally:
+            response.close()
+
+    @staticmethod
+    def _usage(usage: Dict[str, Any], reported: Dict[str, Any]):
+        """Prompt tokens of a usage block, cached and cache-write tokens included."""
+        usage['prompt_tokens'] = sum(int(reported.get(name) or 0) for name in
+                                     ('input_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens'))
+
+
+class SDKBackend:
+    """
+    The ``ollama`` or ``anthropic`` package as transport (no streaming or connection pooling).
+
+    The package is looked up on every call, so a replaced ``sys.modules`` entry takes effect.
+    """
+
+    def __init__(self, provider: str, host: Optional[str] = None, api_key: Optional[str] = None):
+        self.provider = provider
+        self.host = host or os.environ.get('OLLAMA_HOST') or DEFAULT_OLLAMA_HOST
+        self.api_key = api_key or os.environ.get('ANTHROPIC_API_KEY')
+        self._module = None
+        self._client = None
+        self._sdk()
+
+    def _sdk(self):
+        try:
+            if self.provider == 'ollama':
+                import ollama as module
+            else:
+                import anthropic as module
+        except ImportError:
+            raise ImportError(
+                f"{self.provider} package not found. Install with: pip install {self.provider}\n"
+                "Or set LLM_TRANSPORT=http to call the server directly"
+            )
+        if module is not self._module:
+            self._module = module
+            if self.provider == 'ollama':
+                self._client = module.Client(host=self.host) if hasattr(module, 'Client') else module
+            else:
+                self._client = module.Anthropic(api_key=self.api_key)
+        return self._client
+
+    def generate(self, request: Dict[str, Any], usage: Dict[str, Any], stream: bool,
+                 timeout: Tuple[float, float]) -> Iterator[str]:
+        client = self._sdk()
+        if self.provider == 'anthropic':
+            message = client.messages.create(**AnthropicBackend.body(request))
+            reported = getattr(message, 'usage', None)
+            if reported is not None:
+                AnthropicBackend._usage(usage, {name: getattr(reported, name, 0) for name in
+                                                ('input_tokens', 'cache_read_input_tokens',
+                                                 'cache_creation_input_tokens')})
+                usage['completion_tokens'] = int(getattr(reported, 'output_tokens', 0) or 0)
+            usage['stop_reason'] = getattr(message, 'stop_reason', None)
+            yield ''.join(getattr(block, 'text', '') for block in message.content)
+            return
+
+        call = {'model': request['model'], 'messages': request['messages'],
+                'options': {**request['options'], 'num_predict': request['max_tokens']}}
+        if request.get('format') is not None:
+            call['format'] = request['format']
+        if request.get('keep_alive') is not None:
+            call['keep_alive'] = request['keep_alive']
+        response = client.chat(**call)
+        get = response.get if isinstance(response, dict) else lambda name, default=None: getattr(response, name,
+                                                                                                 default)
+        usage['prompt_tokens'] = get('prompt_eval_count') or 0
+        usage['completion_tokens'] = get('eval_count') or 0
+        usage['stop_reason'] = get('done_reason', 'stop')
+        message = get('message')
+        yield message['content'] if isinstance(message, dict) else message.content
+
+    def list_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Installed models in the ``/api/tags`` shape (``{'models': [{'name': ...}, ...]}``)."""
+        if self.provider != 'ollama':
+            raise NotImplementedError("Listing models is only supported for Ollama")
+        response = self._sdk().list()  # a dict from older packages, a ListResponse from newer ones
+        models = response.get('models', []) if isinstance(response, dict) else getattr(response, 'models', [])
+        listed = []
+        for model in models:
+            get = model.get if isinstance(model, dict) else lambda name, default=None: getattr(model, name,
+                                                                                               default)
+            listed.append({'name': get('name') or get('model') or '', 'size': get('size')})
+        return {'models': listed}
+
+
+class LLMClient:
+    """
+    Blocking chat calls against one backend, with streaming early stop and metrics.
+
+    Thread-safe; one instance per backend is shared process-wide (get_llm_client()).
+    """
+
+    # ScheduledOllamaClient passes its per-call timeout on, so timed-out calls stop here too
+    accepts_timeout = True
+
+    def __init__(self, backend, model: Optional[str] = None, options: Optional[Dict[str, Any]] = None,
+                 stream: Optional[bool] = None, connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None, timeout: Optional[float] = None,
+                 metrics: Optional[LLMMetrics] = None):
+        """
+        Args:
+            backend: OllamaBackend, AnthropicBackend or SDKBackend
+            model: Default model (env LLM_OLLAMA_MODEL / LLM_ANTHROPIC_MODEL)
+            options: Default Ollama options (temperature is also sent to Anthropic)
+            stream: Stream responses (env LLM_STREAM, default on)
+            connect_timeout: Seconds to connect (env LLM_CONNECT_TIMEOUT)
+            read_timeout: Seconds to wait for the next token (env LLM_READ_TIMEOUT)
+            timeout: Default deadline in seconds for a whole call (env LLM_TIMEOUT)
+            metrics: Metrics registry (default: the process-wide METRICS)
+        """
+        self.backend = backend
+        self.provider = backend.provider
+        default_model = (os.environ.get('LLM_OLLAMA_MODEL', DEFAULT_OLLAMA_MODEL) if self.provider == 'ollama'
+                         else os.environ.get('LLM_ANTHROPIC_MODEL', DEFAULT_ANTHROPIC_MODEL))
+        self.model = model or default_model
+        self.options = dict(DEFAULT_OPTIONS if options is None else options)
+        self.stream = stream if stream is not None else os.environ.get('LLM_STREAM', '1') != '0'
+        self.connect_timeout = connect_timeout or float(os.environ.get('LLM_CONNECT_TIMEOUT',
+                                                                       DEFAULT_CONNECT_TIMEOUT))
+        self.read_timeout = read_timeout or float(os.environ.get('LLM_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+        self.timeout = timeout or float(os.environ.get('LLM_TIMEOUT', DEFAULT_TIMEOUT))
+        self.metrics = metrics or METRICS
+
+    def chat(self, messages: List[Dict[str, Any]], model: Optional[str] = None,
+             options: Optional[Dict[str, Any]] = None, format: Optional[str] = None,
+             variable_type: Optional[str] = None, max_tokens: Optional[int] = None,
+             stop: Optional[Sequence[str]] = None, keep_alive: Optional[Any] = None,
+             cache_prefix: Optional[str] = None, timeout: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+        """
+        One chat call; raises on failure.
+
+        Args:
+            messages: Ollama-style messages
+            model: Model (default: the client's)
+            options: Ollama options merged over the client defaults
+            format: 'json' constrains Ollama output to JSON; the call stops once the object is complete
+            variable_type: Key of VARIABLE_TYPE_LIMITS choosing max_tokens and stop delimiters
+            max_tokens: Generation budget (overrides the variable type's)
+            stop: Answer delimiters (overrides the variable type's); the answer is cut before the first
+            keep_alive: Ollama keep_alive
+            cache_prefix: Leading part of the prompt to mark as an Anthropic prompt-cache breakpoint
+            timeout: Deadline in seconds for the whole call
+
+        Returns:
+            Ollama response dict: message.content, prompt_eval_count, eval_count, done_reason
+            ('delimiter' when stopped early) and stopped_early
+        """
+        if kwargs.pop('stream', False):
+            raise ValueError("LLMClient.chat() consumes the stream itself; stream=True is not supported")
+        limits = variable_type_limits(variable_type)
+        request = {
+            'model': model or self.model,
+            'messages': messages,
+            'options': {**self.options, **(options or {})},
+            'max_tokens': max_tokens or (options or {}).get('num_predict') or limits['max_tokens'],
+            'format': format,
+            'keep_alive': keep_alive,
+            'cache_prefix': cache_prefix,
+        }
+        request['options'].pop('num_predict', None)
+        stop = tuple(limits['stop'] if stop is None else stop)
+        json_end = JSONEnd() if format == 'json' or variable_type == 'batch' else None
+        deadline = time.monotonic() + (timeout or self.timeout)
+        labels = {'backend': self.provider, 'model': request['model']}
+
+        usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'stop_reason': None}
+        text = ''
+        stopped_early = False
+        first_token = None
+        start = time.monotonic()
+        self.metrics.inc('llm_requests_total', **labels)
+        pieces = self.backend.generate(request, usage, self.stream, (self.connect_timeout, self.read_timeout))
+        try:
+            for piece in pieces:
+                if first_token is None:
+                    first_token = time.monotonic()
+                searched = len(text)
+                text += piece
+                cut = find_delimiter(text, stop, searched) if stop else -1
+                if json_end is not None and cut < 0:
+                    cut = json_end.feed(piece)
+                if cut >= 0:
+                    # Generation was still running unless the final chunk has been read
+                    stopped_early = usage['stop_reason'] is None
+                    text = text[:cut]
+                    break
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"LLM call exceeded {timeout or self.timeout:.0f}s ({self.provider})")
+        except Exception as e:
+            self.metrics.inc('llm_errors_total', error=self._error_kind(e), **labels)
+            raise
+        finally:
+            pieces.close()  # closes the response; an unfinished stream drops its connection (not pooled)
+            elapsed = time.monotonic() - start
+            self.metrics.observe('llm_request_duration_seconds', elapsed, **labels)
+            if first_token is not None:
+                self.metrics.observe('llm_time_to_first_token_seconds', first_token - start, **labels)
+
+        if not usage['prompt_tokens']:
+            usage['prompt_tokens'] = estimate_tokens(''.join(str(m.get('content', '')) for m in messages))
+        self.metrics.inc('llm_prompt_tokens_total', usage['prompt_tokens'], **labels)
+        self.metrics.inc('llm_completion_tokens_total', usage['completion_tokens'], **labels)
+        if stopped_early:
+            self.metrics.inc('llm_early_stops_total', **labels)
+        return {
+            'model': request['model'],
+            'message': {'role': 'assistant', 'content': text},
+            'done': True,
+            'done_reason': 'delimiter' if stopped_early else (usage['stop_reason'] or 'stop'),
+            'total_duration': int(elapsed * 1e9),
+            'prompt_eval_count': usage['prompt_tokens'],
+            'eval_count': usage['completion_tokens'],
+            'stopped_early': stopped_early,
+        }
+
+    @staticmethod
+    def _error_kind(error: Exception) -> str:
+        if isinstance(error, (TimeoutError, requests.Timeout)):
+            return 'timeout'
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return f'http_{error.response.status_code}'
+        if isinstance(error, requests.ConnectionError):
+            return 'connection'
+        return type(error).__name__
+
+    def list_models(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Models available on the server (Ollama ``/api/tags`` shape); raises if it is unreachable."""
+        return self.backend.list_models(timeout=timeout)
+
+    def summary(self) -> str:
+        """One-line counter summary for end-of-run logs."""
+        labels = {'backend': self.provider}
+        requests_total = self.metrics.value('llm_requests_total', **labels)
+        return (f"LLM client [{self.provider}]: {requests_total:.0f} calls, "
+                f"{self.metrics.value('llm_errors_total', **labels):.0f} errors, "
+                f"{self.metrics.value('llm_early_stops_total', **labels):.0f} stopped early; "
+                f"{self.metrics.value('llm_prompt_tokens_total', **labels):,.0f} prompt / "
+                f"{self.metrics.value('llm_completion_tokens_total', **labels):,.0f} completion tokens")
+
+
+def create_backend(provider: str, transport: Optional[str] = None):
+    """Backend for 'ollama' or 'anthropic' over the configured transport (env LLM_TRANSPORT)."""
+    if provider not in ('ollama', 'anthropic'):
+        raise ValueError(f"Unknown LLM provider: {provider}")
+    transport = transport or os.environ.get('LLM_TRANSPORT', 'http')
+    if transport == 'sdk':
+        return SDKBackend(provider)
+    if transport != 'http':
+        raise ValueError(f"Unknown LLM transport: {transport} (use 'http' or 'sdk')")
+    return OllamaBackend() if provider == 'ollama' else AnthropicBackend()
+
+
+def backend_available(provider: str = 'ollama', probe: bool = False, timeout: float = 2.0) -> bool:
+    """
+    Whether a client for the provider can be created.
+
+    False when the sdk transport's package is missing or Anthropic has no API key.
+    With ``probe``, an Ollama server must also answer ``/api/tags`` within
+    ``timeout`` seconds (one request; use it once at startup, not per call).
+    """
+    try:
+        backend = create_backend(provider)
+    except (ImportError, ValueError):
+        return False
+    if probe and provider == 'ollama':
+        try:
+            backend.list_models(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Ollama server not reachable at {getattr(backend, 'host', '?')}: {e}")
+            return False
+    return True
+
+
+def get_llm_client(provider: str = 'ollama') -> LLMClient:
+    """Process-wide client for a provider (created on first use from the environment)."""
+    global _METRICS_SERVER
+    with _SHARED_LOCK:
+        client = _CLIENTS.get(provider)
+    if client is None:
+        client = LLMClient(create_backend(provider))
+        with _SHARED_LOCK:
+            client = _CLIENTS.setdefault(provider, client)
+            if _METRICS_SERVER is None and os.environ.get('LLM_METRICS_PORT'):
+                _METRICS_SERVER = start_metrics_server(int(os.environ['LLM_METRICS_PORT']))
+    return client
+
+
+def get_extraction_client(provider: str = 'ollama', priority: int = PRIORITY_DEFAULT) -> CachedOllamaClient:
+    """Shared client behind the response cache and the shared scheduler (blocking ``chat()``)."""
+    return CachedOllamaClient(ScheduledOllamaClient(get_llm_client(provider), backend=provider,
+                                                    priority=priority))
+
+
+def reset_llm_clients():
+    """Forget the shared clients and sessions (e.g. after changing OLLAMA_HOST)."""
+    with _SHARED_LOCK:
+        _CLIENTS.clear()
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
@@ -0,0 +1,418 @@
+"""
+LLM Response Cache
+==================
+
+Persistent cache of LLM responses shared by every extraction pipeline.
+
+Extractors call ``ollama`` (``Client.chat``) or ``anthropic``
+(``messages.create``) directly, so re-running a patient after a crash or after
+editing one variable's instruction recomputed every call. The cached clients
+below wrap those clients and answer repeated calls from a local SQLite file:
+
+- Key: SHA-256 of (provider, model, options/parameters, normalized messages);
+  line endings and trailing whitespace are normalized, anything else that
+  changes the prompt (or model, temperature, num_ctx, max_tokens, ...) is a
+  new key, so only prompts that actually changed are recomputed
+- Only successful responses are stored; errors and streaming calls pass through
+- Only deterministic (temperature 0) calls are cached: a call with a nonzero
+  temperature, or none (Ollama and Anthropic then sample), passes through, so
+  a sampled answer is never replayed
+- The least recently used entries are evicted once the cache passes ``max_bytes``
+- Counters: ``hits``, ``misses``, ``stores``, ``evictions`` (``hit_rate`` in stats())
+
+Usage:
+    from llm_response_cache import CachedOllamaClient, CachedAnthropicClient
+
+    ollama_client = CachedOllamaClient(Client(host='http://127.0.0.1:11434'))
+    response = ollama_client.chat(model=..., messages=[...], options={'temperature': 0})
+
+    client = CachedAnthropicClient(anthropic.Anthropic(api_key=...))
+    message = client.messages.create(model=..., max_tokens=..., temperature=0, messages=[...])
+
+Configuration (environment variables):
+- ``LLM_CACHE_DIR``: cache directory (default: none, every call goes to the model)
+- ``LLM_CACHE=0``: disable even when a directory is configured
+- ``LLM_CACHE_REFRESH=1``: ignore cached entries and overwrite them with fresh responses
+
+Cached responses are values extracted from patient notes (PHI) and the cache
+does not encrypt them, so nothing is stored unless a directory is configured
+(``cache_dir`` or ``LLM_CACHE_DIR``). The directory is created, or restricted,
+to mode 0700 (owner only); clear it when a project ends.
+
+Inspect or clear from the command line:
+    python src/llm_response_cache.py stats --cache-dir DIR
+    python src/llm_response_cache.py clear --cache-dir DIR
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Call parameters that do not change the response
+_UNKEYED_PARAMETERS = {'stream', 'keep_alive', 'timeout', 'cache_prefix', 'extra_headers', 'extra_query', 'metadata'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key   TEXT PRIMARY KEY,
+    provider    TEXT,
+    model       TEXT,
+    content     TEXT,
+    stored_at   REAL,
+    last_access REAL,
+    hits        INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access);
+"""
+
+_SHARED_CACHE = None
+_SHARED_CACHE_LOCK = threading.Lock()
+
+
+def normalize_prompt(text: Any) -> str:
+    """Prompt text with CRLF line endings and trailing whitespace normalized."""
+    lines = str(text).replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip()
+
+
+def is_deterministic(temperature: Any) -> bool:
+    """True for a temperature of 0 (None means the backend's sampling default)."""
+    try:
+        return temperature is not None and float(temperature) == 0.0
+    except (TypeError, ValueError):
+        return False
+
+
+def _normalize_messages(messages: Any) -> Any:
+    if isinstance(messages, str):
+        return normalize_prompt(messages)
+    if isinstance(messages, dict):
+        return {key: _normalize_messages(value) for key, value in messages.items() if key != 'cache_control'}
+    if isinstance(messages, (list, tuple)):
+        if messages and all(isinstance(block, dict) and block.get('type') == 'text' for block in messages):
+            # Text content blocks (split at prompt-cache breakpoints) key like the joined text
+            return normalize_prompt(''.join(str(block.get('text', '')) for block in messages))
+        return [_normalize_messages(value) for value in messages]
+    return messages
+
+
+def cache_key(provider: str, model: str, messages: Any, **parameters) -> str:
+    """
+    Cache key for one LLM call.
+
+    Args:
+        provider: 'ollama' or 'anthropic'
+        model: Model name
+        messages: Chat messages (or a prompt string)
+        **parameters: Options that change the response (options, format, system,
+                      max_tokens, temperature, ...); unkeyed ones are ignored
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    keyed = {name: _normalize_messages(value) for name, value in parameters.items()
+             if name not in _UNKEYED_PARAMETERS and value is not None}
+    payload = json.dumps([provider, model, _normalize_messages(messages), keyed],
+                         sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Size-bounded SQLite cache of LLM response texts.
+
+    Safe to share between threads and between pipelines in one process.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+        enabled: Optional[bool] = None,
+        refresh: Optional[bool] = None
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            cache_dir: Directory for responses.sqlite (created with mode 0700 if missing;
+                       default LLM_CACHE_DIR, and without either nothing is stored)
+            max_bytes: Stored response size bound before LRU eviction (None = unbounded)
+            enabled: False calls the model every time and stores nothing
+                     (default: on when a cache directory is configured, unless LLM_CACHE=0)
+            refresh: True skips lookups but still stores fresh responses
+                     (default: LLM_CACHE_REFRESH=1)
+        """
+        cache_dir = cache_dir or os.environ.get('LLM_CACHE_DIR')
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.enabled = os.environ.get('LLM_CACHE', '1') != '0' if enabled is None else enabled
+        self.enabled = self.enabled and self.cache_dir is not None
+        self.refresh = os.environ.get('LLM_CACHE_REFRESH', '0') == '1' if refresh is None else refresh
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._db = None
+        self._stores_since_evict = 0
+
+        if self.enabled:
+            # Patient data: owner-only access
+            self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            os.chmod(self.cache_dir, 0o700)
+            self._db = sqlite3.connect(str(self.cache_dir / 'responses.sqlite'), check_same_thread=False,
+                                       isolation_level=None, timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response text for a key (None on a miss)."""
+        if not self.enabled or self.refresh:
+            self._count('misses')
+            return None
+        with self._lock:
+            row = self._db.execute('SELECT content FROM responses WHERE cache_key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE responses SET last_access = ?, hits = hits + 1 WHERE cache_key = ?',
+                             (time.time(), key))
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, provider: str, model: str, content: str):
+        """Store a response text."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses (cache_key, provider, model, content, '
+                             'stored_at, last_access, hits) VALUES (?, ?, ?, ?, ?, ?, 0)',
+                             (key, provider, model, content, now, now))
+            self.stores += 1
+            self._stores_since_evict += 1
+            # Size check every 100 stores keeps writes cheap
+            if self.max_bytes is not None and self._stores_since_evict >= 100:
+                self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """Drop the least recently used responses until under max_bytes."""
+        if not self.enabled:
+            return
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return
+
+        with self._lock:
+            self._stores_since_evict = 0
+            total = self._db.execute('SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) '
+                                     'FROM responses').fetchone()[0]
+            if total <= max_bytes:
+                return
+            candidates = self._db.execute('SELECT cache_key, LENGTH(CAST(content AS BLOB)) FROM responses '
+                                          'ORDER BY last_access').fetchall()
+            for key, size in candidates:
+                if total <= max_bytes:
+                    break
+                self._db.execute('DELETE FROM responses WHERE cache_key = ?', (key,))
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every cached response."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, hit rate and stored totals."""
+        lookups = self.hits + self.misses
+        stats = {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions,
+                 'hit_rate': self.hits / lookups if lookups else 0.0}
+        if self.enabled:
+            with self._lock:
+                responses = self._db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0), '
+                                             'COALESCE(SUM(hits), 0) FROM responses').fetchone()
+            stats.update({'responses': responses[0], 'stored_bytes': responses[1],
+                          'lifetime_hits': responses[2]})
+        return stats
+
+    def summary(self) -> str:
+        """One-line counter summary for end-of-run logs."""
+        if not self.enabled:
+            return "LLM response cache: disabled"
+        stats = self.stats()
+        return (f"LLM response cache: {self.hits} hits, {self.misses} misses "
+                f"({stats['hit_rate']:.0%} hit rate), {self.evictions} evicted; "
+                f"{stats['responses']} responses in {stats['stored_bytes'] / 1024 ** 2:.1f} MB [{self.cache_dir}]")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Process-wide cache shared by every cached client created without an explicit cache."""
+    global _SHARED_CACHE
+    with _SHARED_CACHE_LOCK:
+        if _SHARED_CACHE is None:
+            _SHARED_CACHE = LLMResponseCache()
+        return _SHARED_CACHE
+
+
+class CachedOllamaClient:
+    """
+    Drop-in wrapper for ``ollama.Client`` (or the ``ollama`` module) with a response cache.
+
+    ``chat()`` returns the client's response on a miss and an equivalent dict
+    (``response['message']['content']``) on a hit. Other attributes pass through.
+    Also wraps ``llm_client.LLMClient``, whose ``provider`` (ollama or anthropic) keys its entries
+    and whose default ``options`` give the temperature when a call sets none.
+    """
+
+    provider = 'ollama'
+
+    def __init__(self, client, cache: Optional[LLMResponseCache] = None):
+        self.client = client
+        self.cache = cache or get_response_cache()
+        provider = getattr(client, 'provider', None)
+        if isinstance(provider, str):
+            self.provider = provider
+
+    def chat(self, model: Optional[str] = None, messages: Optional[List[Dict]] = None,
+             options: Optional[Dict] = None, format: Optional[Any] = None, stream: bool = False, **kwargs):
+        model = model or getattr(self.client, 'model', None)  # LLMClient has a default model
+        if stream or not is_deterministic(self._temperature(options, kwargs)):
+            return self.client.chat(model=model, messages=messages, options=options, format=format,
+                                    stream=stream, **kwargs)
+
+        key = cache_key(self.provider, model, messages, options=options, format=format, **kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            return {'model': model, 'message': {'role': 'assistant', 'content': content},
+                    'done': True, 'cached': True}
+
+        call = {'model': model, 'messages': messages, **kwargs}
+        if options is not None:
+            call['options'] = options
+        if format is not None:
+            call['format'] = format
+        response = self.client.chat(**call)
+        self.cache.put(key, self.provider, model, response['message']['content'])
+        return response
+
+    def _temperature(self, options: Optional[Dict], kwargs: Dict) -> Any:
+        for source in (options, kwargs, getattr(self.client, 'options', None)):
+            if isinstance(source, dict) and source.get('temperature') is not None:
+                return source['temperature']
+        return None
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class _CachedTextBlock:
+    type = 'text'
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _CachedMessage:
+    """Subset of ``anthropic.types.Message`` read by the extractors (``content[0].text``)."""
+
+    role = 'assistant'
+    stop_reason = 'end_turn'
+    cached = True
+
+    def __init__(self, model: str, text: str):
+        self.model = model
+        self.content = [_CachedTextBlock(text)]
+
+
+class _CachedMessages:
+    provider = 'anthropic'
+
+    def __init__(self, messages, cache: LLMResponseCache):
+        self._messages = messages
+        self.cache = cache
+
+    def create(self, **kwargs):
+        if kwargs.get('stream') or not is_deterministic(kwargs.get('temperature')):
+            return self._messages.create(**kwargs)
+
+        model = kwargs.get('model')
+        parameters = {name: value for name, value in kwargs.items() if name not in ('model', 'messages')}
+        key = cache_key(self.provider, model, kwargs.get('messages'), **parameters)
+        content = self.cache.get(key)
+        if content is not None:
+            return _CachedMessage(model, content)
+
+        message = self._messages.create(**kwargs)
+        text = ''.join(getattr(block, 'text', '') for block in message.content)
+        self.cache.put(key, self.provider, model, text)
+        return message
+
+    def __getattr__(self, name):
+        return getattr(self._messages, name)
+
+
+class CachedAnthropicClient:
+    """
+    Drop-in wrapper for ``anthropic.Anthropic`` with a response cache on ``messages.create``.
+
+    Cache hits return a message whose ``content[0].text`` is the cached text.
+    """
+
+    def __init__(self, client, cache: Optional[LLMResponseCache] = None):
+        self.client = client
+        self.cache = cache or get_response_cache()
+        self.messages = _CachedMessages(client.messages, self.cache)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def main():
+    """Show stats for, or clear, the LLM response cache."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect or clear the LLM response cache')
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--cache-dir', type=Path, default=os.environ.get('LLM_CACHE_DIR'),
+                        help='Cache directory (default LLM_CACHE_DIR)')
+    args = parser.parse_args()
+    if not args.cache_dir:
+        parser.error('set --cache-dir or LLM_CACHE_DIR')
+
+    cache = LLMResponseCache(cache_dir=args.cache_dir, enabled=True)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cleared LLM response cache [{cache.cache_dir}]")
+    else:
+        stats = cache.stats()
+        print(f"{stats['responses']} responses, {stats['stored_bytes'] / 1024 ** 2:.1f} MB, "
+              f"{stats['lifetime_hits']} hits served [{cache.cache_dir}]")
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,408 @@
+"""
+LLM Request Scheduler
+=====================
+
+Shared scheduler for LLM calls with per-backend concurrency limits.
+
+Extractors used to call Ollama/Claude synchronously, one prompt at a time, and
+``ProductionExtractionPipeline`` ran several patients in an uncoordinated
+thread pool, so a single Ollama server was either swamped or idle. Every
+extractor now submits its calls to one process-wide ``LLMScheduler``:
+
+- Per-backend ``max_in_flight`` (e.g. match ``OLLAMA_NUM_PARALLEL``)
+- Priority queue per backend (lower number first, e.g. one_per_patient
+  variables before many_per_note), FIFO within a priority
+- Bounded queues: ``submit()`` blocks once ``max_queue`` calls are waiting
+  (backpressure on the producers)
+- Retries with exponential backoff and full jitter; per-call timeouts
+- Metrics per backend: queue depth (current/max), in flight, latency
+  percentiles, prompt/completion tokens and tokens per second
+
+The scheduler runs an asyncio event loop on a background thread. Blocking
+client calls run in a worker thread pool. A call that times out is retried
+(or failed), but its worker thread cannot be interrupted; give the underlying
+client a timeout too.
+
+Usage:
+    scheduler = get_scheduler()
+    future = scheduler.submit(client.chat, model=..., messages=[...],
+                              backend='ollama', priority=PRIORITY_ONE_PER_PATIENT)
+    response = future.result()
+
+    response = scheduler.call(client.chat, ..., backend='ollama')      # blocking
+    response = await scheduler.submit_async(client.chat, ..., backend='ollama')
+
+    ollama_client = ScheduledOllamaClient(Client(host=...))  # drop-in, blocking chat()
+
+Configuration (environment variables):
+- ``LLM_MAX_IN_FLIGHT_OLLAMA`` (default 4), ``LLM_MAX_IN_FLIGHT_ANTHROPIC`` (default 8)
+- ``LLM_TIMEOUT`` seconds per call (default 600), ``LLM_RETRIES`` (default 2)
+- ``LLM_MAX_QUEUE`` waiting calls per backend before submit() blocks (default 512)
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = {'ollama': 4, 'anthropic': 8}
+DEFAULT_TIMEOUT = 600.0
+DEFAULT_RETRIES = 2
+DEFAULT_MAX_QUEUE = 512
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 30.0
+
+PRIORITY_ONE_PER_PATIENT = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_BACKGROUND = 9
+
+_LATENCY_WINDOW = 10000
+
+_SHARED_SCHEDULER = None
+_SHARED_SCHEDULER_LOCK = threading.Lock()
+
+
+def scope_priority(scope: Any) -> int:
+    """Scheduler priority for a variable scope (one_per_patient first)."""
+    return PRIORITY_ONE_PER_PATIENT if scope == 'one_per_patient' else PRIORITY_DEFAULT
+
+
+def response_token_counts(response: Any) -> Tuple[int, int]:
+    """
+    (prompt tokens, completion tokens) reported by an Ollama or Anthropic response.
+
+    Returns (0, 0) when the response carries no usage information.
+    """
+    try:
+        if isinstance(response, dict) or hasattr(response, 'prompt_eval_count'):
+            get = response.get if isinstance(response, dict) else lambda name: getattr(response, name, None)
+            return int(get('prompt_eval_count') or 0), int(get('eval_count') or 0)
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            return int(getattr(usage, 'input_tokens', 0) or 0), int(getattr(usage, 'output_tokens', 0) or 0)
+    except (TypeError, ValueError):
+        pass
+    return 0, 0
+
+
+class _Request:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'timeout', 'retries', 'submitted')
+
+    def __init__(self, fn, args, kwargs, timeout, retries):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.timeout = timeout
+        self.retries = retries
+        self.submitted = time.monotonic()
+
+
+class _Backend:
+    """Queue, concurrency limit and counters for one backend (created on the loop thread)."""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.queue = asyncio.PriorityQueue(maxsize=max_queue)
+        self.slots = asyncio.Condition()
+        self.in_flight = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.max_queue_depth = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.queue_waits = deque(maxlen=_LATENCY_WINDOW)
+        self.first_submit = None
+        self.last_complete = None
+
+
+class LLMScheduler:
+    """
+    Priority-ordered, concurrency-limited executor for blocking LLM client calls.
+
+    Thread-safe: submit() and call() may be used from any thread except the
+    scheduler's own loop thread.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[Dict[str, int]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX
+    ):
+        """
+        Initialize scheduler and start its event loop thread.
+
+        Args:
+            max_in_flight: Concurrent calls per backend name (unlisted backends use 1
+                           unless configured later; env LLM_MAX_IN_FLIGHT_<NAME>)
+            timeout: Default seconds per call attempt (env LLM_TIMEOUT)
+            retries: Default retries after a failed or timed-out attempt (env LLM_RETRIES)
+            max_queue: Waiting calls per backend before submit() blocks (env LLM_MAX_QUEUE)
+            backoff_base: First retry delay bound in seconds (doubles per attempt)
+            backoff_max: Largest retry delay bound in seconds
+        """
+        self.max_in_flight = dict(DEFAULT_MAX_IN_FLIGHT)
+        for name in list(self.max_in_flight):
+            env = os.environ.get(f'LLM_MAX_IN_FLIGHT_{name.upper()}')
+            if env:
+                self.max_in_flight[name] = int(env)
+        self.max_in_flight.update(max_in_flight or {})
+        self.timeout = timeout if timeout is not None else float(os.environ.get('LLM_TIMEOUT', DEFAULT_TIMEOUT))
+        self.retries = retries if retries is not None else int(os.environ.get('LLM_RETRIES', DEFAULT_RETRIES))
+        self.max_queue = max_queue if max_queue is not None else int(os.environ.get('LLM_MAX_QUEUE',
+                                                                                   DEFAULT_MAX_QUEUE))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._backends: Dict[str, _Backend] = {}
+        self._sequence = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=128, thread_name_prefix='llm-call')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-scheduler', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+
+    def configure_backend(self, backend: str, max_in_flight: int):
+        """Set the concurrency limit of a backend (takes effect for the next dispatch)."""
+        self.max_in_flight[backend] = max_in_flight
+        if backend in self._backends:
+            async def resize():
+                state = self._backends[backend]
+                async with state.slots:
+                    state.max_in_flight = max_in_flight
+                    state.slots.notify_all()
+            asyncio.run_coroutine_threadsafe(resize(), self._loop).result()
+
+    def submit(self, fn: Callable, *args, backend: str = 'ollama', priority: int = PRIORITY_DEFAULT,
+               timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs) -> Future:
+        """
+        Queue a blocking call fn(*args, **kwargs); blocks while the backend queue is full.
+
+        Args:
+            fn: Client call (e.g. client.chat); exceptions trigger retries
+            backend: Backend name the concurrency limit applies to
+            priority: Lower runs first
+            timeout: Seconds per attempt (default: scheduler timeout)
+            retries: Retries after a failure (default: scheduler retries)
+
+        Returns:
+            concurrent.futures.Future with the call's return value (or last exception)
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("LLMScheduler.submit() cannot be called from the scheduler loop; "
+                               "use submit_async()")
+        request = _Request(fn, args, kwargs,
+                           self.timeout if timeout is None else timeout,
+                           self.retries if retries is None else retries)
+        asyncio.run_coroutine_threadsafe(self._enqueue(backend, priority, request), self._loop).result()
+        return request.future
+
+    def call(self, fn: Callable, *args, backend: str = 'ollama', priority: int = PRIORITY_DEFAULT,
+             timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs) -> Any:
+        """Submit a call and wait for its result (raises the call's last exception)."""
+        return self.submit(fn, *args, backend=backend, priority=priority, timeout=timeout,
+                           retries=retries, **kwargs).result()
+
+    async def submit_async(self, fn: Callable, *args, backend: str = 'ollama', priority: int = PRIORITY_DEFAULT,
+                           timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs) -> Any:
+        """Awaitable form of call() for asyncio code (any event loop)."""
+        request = _Request(fn, args, kwargs,
+                           self.timeout if timeout is None else timeout,
+                           self.retries if retries is None else retries)
+        enqueued = asyncio.run_coroutine_threadsafe(self._enqueue(backend, priority, request), self._loop)
+        await asyncio.wrap_future(enqueued)
+        return await asyncio.wrap_future(request.future)
+
+    # ------------------------------------------------------------------
+    # Loop thread
+    # ------------------------------------------------------------------
+
+    def _backend(self, name: str) -> _Backend:
+        if name not in self._backends:
+            self._backends[name] = _Backend(name, self.max_in_flight.get(name, 1), self.max_queue)
+            self._loop.create_task(self._dispatch(self._backends[name]))
+        return self._backends[name]
+
+    async def _enqueue(self, backend: str, priority: int, request: _Request):
+        state = self._backend(backend)
+        state.submitted += 1
+        if state.first_submit is None:
+            state.first_submit = time.monotonic()
+        await state.queue.put((priority, next(self._sequence), request))
+        state.max_queue_depth = max(state.max_queue_depth, state.queue.qsize())
+
+    async def _dispatch(self, state: _Backend):
+        while True:
+            # Take a slot first so the highest-priority request waiting at that moment runs
+            async with state.slots:
+                await state.slots.wait_for(lambda: state.in_flight < state.max_in_flight)
+                state.in_flight += 1
+            _, _, request = await state.queue.get()
+            if not request.future.set_running_or_notify_cancel():
+                await self._release(state)
+                continue
+            self._loop.create_task(self._run(state, request))
+
+    async def _release(self, state: _Backend):
+        async with state.slots:
+            state.in_flight -= 1
+            state.slots.notify_all()
+
+    async def _run(self, state: _Backend, request: _Request):
+        state.queue_waits.append(time.monotonic() - request.submitted)
+        try:
+            for attempt in range(request.retries + 1):
+                start = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(
+                        self._loop.run_in_executor(
+                            self._executor, functools.partial(request.fn, *request.args, **request.kwargs)),
+                        request.timeout)
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        state.timeouts += 1
+                        e = TimeoutError(f"LLM call timed out after {request.timeout:.0f}s ({state.name})")
+                    if attempt >= request.retries:
+                        state.failed += 1
+                        request.future.set_exception(e)
+                        return
+                    state.retries += 1
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    logger.warning(f"LLM call failed on {state.name} ({e}); retry {attempt + 1}/{request.retries} "
+                                   f"in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                state.latencies.append(time.monotonic() - start)
+                prompt_tokens, completion_tokens = response_token_counts(result)
+                state.prompt_tokens += prompt_tokens
+                state.completion_tokens += completion_tokens
+                state.completed += 1
+                state.last_complete = time.monotonic()
+                request.future.set_result(result)
+                return
+        finally:
+            await self._release(state)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per-backend counters, queue depth, latency percentiles and token rates."""
+        async def snapshot():
+            return {name: self._backend_metrics(state) for name, state in self._backends.items()}
+        return asyncio.run_coroutine_threadsafe(snapshot(), self._loop).result()
+
+    @staticmethod
+    def _backend_metrics(state: _Backend) -> Dict[str, Any]:
+        latencies = sorted(state.latencies)
+
+        def percentile(values, q):
+            return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+        elapsed = (state.last_complete - state.first_submit) if state.last_complete and state.first_submit else 0.0
+        busy = sum(latencies)
+        return {
+            'max_in_flight': state.max_in_flight,
+            'in_flight': state.in_flight,
+            'queue_depth': state.queue.qsize(),
+            'max_queue_depth': state.max_queue_depth,
+            'submitted': state.submitted,
+            'completed': state.completed,
+            'failed': state.failed,
+            'retries': state.retries,
+            'timeouts': state.timeouts,
+            'latency_p50': percentile(latencies, 0.50),
+            'latency_p95': percentile(latencies, 0.95),
+            'queue_wait_p95': percentile(sorted(state.queue_waits), 0.95),
+            'prompt_tokens': state.prompt_tokens,
+            'completion_tokens': state.completion_tokens,
+            # Generation speed per call, and overall throughput since the first submit
+            'tokens_per_second': state.completion_tokens / busy if busy else 0.0,
+            'throughput_tokens_per_second': state.completion_tokens / elapsed if elapsed else 0.0,
+        }
+
+    def summary(self) -> str:
+        """One line per backend for end-of-run logs."""
+        lines = []
+        for name, m in self.metrics().items():
+            lines.append(
+                f"LLM scheduler [{name}]: {m['completed']} completed, {m['failed']} failed, "
+                f"{m['retries']} retries ({m['timeouts']} timeouts); max {m['max_in_flight']} in flight, "
+                f"peak queue {m['max_queue_depth']}; latency p50 {m['latency_p50']:.2f}s "
+                f"p95 {m['latency_p95']:.2f}s; {m['throughput_tokens_per_second']:.1f} tokens/s")
+        return '\n'.join(lines) or "LLM scheduler: no calls"
+
+    def shutdown(self):
+        """Stop the loop thread (queued calls are abandoned)."""
+        async def cancel_tasks():
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler shared by every extractor."""
+    global _SHARED_SCHEDULER
+    with _SHARED_SCHEDULER_LOCK:
+        if _SHARED_SCHEDULER is None:
+            _SHARED_SCHEDULER = LLMScheduler()
+        return _SHARED_SCHEDULER
+
+
+class ScheduledOllamaClient:
+    """
+    Drop-in wrapper for ``ollama.Client`` whose ``chat()`` runs through the scheduler.
+
+    ``chat()`` blocks like the client's own, but waits for a backend slot and is
+    retried on failure. Pass ``priority=`` to chat() to override the client default
+    and ``timeout=`` to override the scheduler's per-attempt timeout (also passed to
+    clients with ``accepts_timeout``, e.g. ``llm_client.LLMClient``, so they stop
+    too). Other attributes pass through.
+    """
+
+    def __init__(self, client, scheduler: Optional[LLMScheduler] = None, backend: str = 'ollama',
+                 priority: int = PRIORITY_DEFAULT):
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        self.backend = backend
+        self.priority = priority
+
+    def chat(self, *args, priority: Optional[int] = None, timeout: Optional[float] = None, **kwargs):
+        if kwargs.get('stream'):
+            return self.client.chat(*args, **kwargs)
+        chat = self.client.chat
+        if timeout is not None and getattr(self.client, 'accepts_timeout', False):
+            chat = functools.partial(chat, timeout=timeout)
+        return self.scheduler.call(chat, *args, backend=self.backend, timeout=timeout,
+                                   priority=self.priority if priority is None else priority, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
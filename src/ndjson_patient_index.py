@@ -0,0 +1,411 @@
+"""
+NDJSON Patient Index
+====================
+
+Byte-offset index from FHIR ``subject.reference`` to the NDJSON records that
+hold it, for resource exports such as ``<prefix>DocumentReference/*.ndjson``.
+
+Finding one patient's records used to cost one S3 Select call per NDJSON file
+(thousands of files, each scanned in full). The index is built by streaming
+each file once and recording ``subject.reference -> (file, byte offset, length)``
+in a SQLite file. A patient lookup then does ranged GETs on only the files that
+hold that patient's records, with adjacent records coalesced into one request.
+
+- Incremental: ``build()`` lists the prefix and only streams files that are
+  new or whose ETag/size changed; files gone from S3 are dropped
+- Ranged GETs use ``If-Match`` on the indexed ETag; a file rewritten since it
+  was indexed is re-indexed and read again rather than returning wrong bytes
+
+Usage:
+    index = NDJSONPatientIndex(s3_client, bucket)
+    index.build('prd/source/DocumentReference/')
+    doc_refs = index.fetch_records('e4BwD8ZYDBccepXcJ.Ilo3w3', 'prd/source/DocumentReference/')
+
+The index lists patient FHIR IDs, so the index file is created, or
+restricted, to mode 0600 (owner only).
+
+Configuration (environment variables):
+- ``NDJSON_INDEX_DIR``: index directory (default ~/.cache/brim_ndjson_index)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path.home() / '.cache' / 'brim_ndjson_index'
+STREAM_CHUNK_BYTES = 8 * 1024 ** 2
+# Records closer than this are fetched with one ranged GET
+COALESCE_GAP_BYTES = 256 * 1024
+
+# Fast path for the top-level subject reference; lines it does not match are parsed as JSON
+_SUBJECT_REFERENCE = re.compile(rb'"subject"\s*:\s*\{[^{}]*?"reference"\s*:\s*"([^"\\]*)"')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id    INTEGER PRIMARY KEY,
+    file_key   TEXT UNIQUE,
+    etag       TEXT,
+    size       INTEGER,
+    records    INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS records (
+    subject TEXT,
+    file_id INTEGER,
+    offset  INTEGER,
+    length  INTEGER
+);
+CREATE INDEX IF NOT EXISTS records_subject ON records (subject);
+CREATE INDEX IF NOT EXISTS records_file ON records (file_id);
+"""
+
+
+class IndexedFileChanged(Exception):
+    """Raised when an indexed NDJSON file no longer matches its indexed ETag."""
+
+
+def iter_ndjson_lines(body, chunk_size: int = STREAM_CHUNK_BYTES) -> Iterator[Tuple[int, bytes]]:
+    """
+    Stream an NDJSON body as (byte offset, line) pairs without loading it whole.
+
+    Args:
+        body: botocore StreamingBody (or any object with iter_chunks)
+        chunk_size: Bytes per read
+
+    Yields:
+        (offset of the line's first byte, line bytes without the newline)
+    """
+    offset = 0
+    pending = b''
+    for chunk in body.iter_chunks(chunk_size):
+        data = pending + chunk if pending else chunk
+        start = 0
+        while True:
+            newline = data.find(b'\n', start)
+            if newline < 0:
+                break
+            yield offset + start, data[start:newline]
+            start = newline + 1
+        offset += start
+        pending = data[start:]
+    if pending:
+        yield offset, pending
+
+
+def subject_reference(line: bytes) -> Optional[str]:
+    """``subject.reference`` of one NDJSON record (None if absent or unparseable)."""
+    match = _SUBJECT_REFERENCE.search(line)
+    if match:
+        return match.group(1).decode('utf-8')
+    try:
+        resource = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    subject = resource.get('subject') if isinstance(resource, dict) else None
+    if isinstance(subject, dict):
+        return subject.get('reference')
+    return None
+
+
+def coalesce_ranges(records: List[Tuple[int, int]], gap: int = COALESCE_GAP_BYTES) -> List[Tuple[int, int]]:
+    """
+    Merge (offset, length) records into as few byte ranges as possible.
+
+    Args:
+        records: (offset, length) pairs within one file
+        gap: Largest gap between records still fetched in one request
+
+    Returns:
+        (start, end) ranges, end exclusive
+    """
+    ranges = []
+    for offset, length in sorted(records):
+        end = offset + length
+        if ranges and offset - ranges[-1][1] <= gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return [tuple(r) for r in ranges]
+
+
+class NDJSONPatientIndex:
+    """
+    On-disk subject.reference -> NDJSON byte-range index for one S3 bucket.
+
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        index_path: Optional[Path] = None,
+        max_workers: int = 16
+    ):
+        """
+        Initialize index.
+
+        Args:
+            s3_client: Boto3 S3 client
+            bucket: Bucket holding the NDJSON exports
+            index_path: SQLite index file (default: one file per bucket under NDJSON_INDEX_DIR)
+            max_workers: Concurrent file streams in build() and ranged GETs in fetch_records()
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.max_workers = max_workers
+        if index_path is None:
+            index_dir = Path(os.environ.get('NDJSON_INDEX_DIR', DEFAULT_INDEX_DIR))
+            index_path = index_dir / f"{bucket}_{hashlib.sha256(bucket.encode()).hexdigest()[:8]}.sqlite"
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        # Patient identifiers: owner-only access (SQLite gives the -wal/-shm files the same mode)
+        os.close(os.open(self.index_path, os.O_CREAT | os.O_WRONLY, 0o600))
+        os.chmod(self.index_path, 0o600)
+
+        self.range_requests = 0
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.index_path), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    def list_files(self, prefix: str) -> Dict[str, Tuple[str, int]]:
+        """NDJSON files under a prefix: {key: (etag, size)}."""
+        files = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.ndjson'):
+                    files[obj['Key']] = (obj['ETag'], obj['Size'])
+        return files
+
+    def build(self, prefix: str, max_workers: Optional[int] = None) -> Dict[str, int]:
+        """
+        Bring the index up to date with the NDJSON files under a prefix.
+
+        Args:
+            prefix: S3 prefix, e.g. ``prd/source/DocumentReference/``
+            max_workers: Concurrent file streams (default: self.max_workers)
+
+        Returns:
+            Counts: files, unchanged, indexed, removed, failed, records
+        """
+        current = self.list_files(prefix)
+        with self._lock:
+            indexed = {key: (etag, size) for key, etag, size in self._db.execute(
+                'SELECT file_key, etag, size FROM files WHERE file_key >= ? AND file_key < ?',
+                (prefix, prefix + '\uffff'))}
+
+        removed = [key for key in indexed if key not in current]
+        stale = [key for key, meta in current.items() if indexed.get(key) != meta]
+        counts = {'files': len(current), 'unchanged': len(current) - len(stale), 'indexed': 0,
+                  'removed': len(removed), 'failed': 0, 'records': 0}
+
+        with self._lock:
+            for key in removed:
+                self._drop_file(key)
+            self._db.commit()
+
+        if stale:
+            logger.info(f"Indexing {len(stale)} NDJSON files under {prefix} ({counts['unchanged']} unchanged)")
+            with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+                futures = {pool.submit(self.index_file, key, *current[key]): key for key in stale}
+                for future in as_completed(futures):
+                    try:
+                        counts['records'] += future.result()
+                        counts['indexed'] += 1
+                    except Exception as e:
+                        counts['failed'] += 1
+                        logger.warning(f"Could not index {futures[future]}: {e}")
+        return counts
+
+    def index_file(self, file_key: str, etag: Optional[str] = None, size: Optional[int] = None) -> int:
+        """
+        Stream one NDJSON file and replace its entries in the index.
+
+        Returns:
+            Number of records with a subject reference
+        """
+        kwargs = {'IfMatch': etag} if etag else {}
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=file_key, **kwargs)
+        etag = response.get('ETag', etag)
+        size = response.get('ContentLength', size)
+
+        rows = []
+        for offset, line in iter_ndjson_lines(response['Body']):
+            if not line.strip():
+                continue
+            subject = subject_reference(line)
+            if subject:
+                rows.append((subject, offset, len(line)))
+
+        with self._lock:
+            self._drop_file(file_key)
+            cursor = self._db.execute(
+                'INSERT INTO files (file_key, etag, size, records, indexed_at) VALUES (?, ?, ?, ?, ?)',
+                (file_key, etag, size, len(rows), time.time()))
+            file_id = cursor.lastrowid
+            self._db.executemany('INSERT INTO records VALUES (?, ?, ?, ?)',
+                                 [(subject, file_id, offset, length) for subject, offset, length in rows])
+            self._db.commit()
+        return len(rows)
+
+    def _drop_file(self, file_key: str):
+        row = self._db.execute('SELECT file_id FROM files WHERE file_key = ?', (file_key,)).fetchone()
+        if row:
+            self._db.execute('DELETE FROM records WHERE file_id = ?', row)
+            self._db.execute('DELETE FROM files WHERE file_id = ?', row)
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def subject_keys(patient_id: str) -> List[str]:
+        """Reference forms a patient's records may carry."""
+        patient_id = patient_id[len('Patient/'):] if patient_id.startswith('Patient/') else patient_id
+        return [f'Patient/{patient_id}', patient_id]
+
+    def lookup(self, patient_id: str, prefix: str = '') -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Byte ranges of a patient's records.
+
+        Args:
+            patient_id: FHIR Patient ID (``Patient/`` prefix optional)
+            prefix: Restrict to files under this prefix
+
+        Returns:
+            {file_key: [(offset, length), ...]} in file order
+        """
+        subjects = self.subject_keys(patient_id)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT f.file_key, r.offset, r.length FROM records r JOIN files f ON f.file_id = r.file_id "
+                f"WHERE r.subject IN ({','.join('?' * len(subjects))}) AND f.file_key >= ? AND f.file_key < ? "
+                f"ORDER BY f.file_key, r.offset",
+                (*subjects, prefix, prefix + '\uffff')).fetchall()
+        locations = {}
+        for file_key, offset, length in rows:
+            locations.setdefault(file_key, []).append((offset, length))
+        return locations
+
+    def fetch_records(self, patient_id: str, prefix: str = '', max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        A patient's records, read with ranged GETs on only the files that hold them.
+
+        Args:
+            patient_id: FHIR Patient ID (``Patient/`` prefix optional)
+            prefix: Restrict to files under this prefix
+            max_workers: Concurrent ranged GETs (default: self.max_workers)
+
+        Returns:
+            Parsed resources in file/offset order
+        """
+        locations = self.lookup(patient_id, prefix)
+        if not locations:
+            return []
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            futures = {pool.submit(self._fetch_file_records, file_key, records): file_key
+                       for file_key, records in locations.items()}
+            for future in as_completed(futures):
+                file_key = futures[future]
+                try:
+                    results[file_key] = future.result()
+                except IndexedFileChanged:
+                    # Rewritten since indexing: re-index this file and read it again
+                    logger.info(f"{file_key} changed since it was indexed; re-indexing")
+                    self.index_file(file_key)
+                    records = self.lookup(patient_id, file_key).get(file_key, [])
+                    results[file_key] = self._fetch_file_records(file_key, records) if records else []
+
+        return [record for file_key in sorted(results) for record in results[file_key]]
+
+    def _fetch_file_records(self, file_key: str, records: List[Tuple[int, int]]) -> List[Dict]:
+        with self._lock:
+            row = self._db.execute('SELECT etag FROM files WHERE file_key = ?', (file_key,)).fetchone()
+        kwargs = {'IfMatch': row[0]} if row and row[0] else {}
+
+        parsed = []
+        records = sorted(records)
+        for start, end in coalesce_ranges(records):
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket, Key=file_key,
+                                                     Range=f'bytes={start}-{end - 1}', **kwargs)
+            except Exception as e:
+                code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+                if code in ('PreconditionFailed', '412'):
+                    raise IndexedFileChanged(file_key) from e
+                raise
+            with self._lock:
+                self.range_requests += 1
+            data = response['Body'].read()
+            for offset, length in records:
+                if start <= offset and offset + length <= end:
+                    parsed.append(json.loads(data[offset - start:offset - start + length]))
+        return parsed
+
+    def stats(self) -> Dict[str, int]:
+        """Indexed file/record/subject counts."""
+        with self._lock:
+            files, records = self._db.execute('SELECT COUNT(*), COALESCE(SUM(records), 0) FROM files').fetchone()
+            subjects = self._db.execute('SELECT COUNT(DISTINCT subject) FROM records').fetchone()[0]
+        return {'files': files, 'records': records, 'subjects': subjects}
+
+    def close(self):
+        self._db.close()
+
+
+def main():
+    """Build or query the index from the command line."""
+    import argparse
+
+    import boto3
+    from botocore.config import Config
+
+    parser = argparse.ArgumentParser(description='Build or query the patient -> NDJSON byte-offset index')
+    parser.add_argument('command', choices=['build', 'lookup'])
+    parser.add_argument('--bucket', default=os.environ.get('S3_NDJSON_BUCKET'))
+    parser.add_argument('--prefix', default=f"{os.environ.get('S3_NDJSON_PREFIX', '')}DocumentReference/")
+    parser.add_argument('--patient-id', default=os.environ.get('PILOT_PATIENT_ID'))
+    parser.add_argument('--profile', default=os.environ.get('AWS_PROFILE'))
+    parser.add_argument('--index-path', type=Path, default=None)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    session = boto3.Session(profile_name=args.profile)
+    s3_client = session.client('s3', region_name='us-east-1', config=Config(max_pool_connections=args.workers))
+    index = NDJSONPatientIndex(s3_client, args.bucket, index_path=args.index_path, max_workers=args.workers)
+
+    if args.command == 'build':
+        counts = index.build(args.prefix)
+        print(f"{counts['files']} files: {counts['indexed']} indexed ({counts['records']} records), "
+              f"{counts['unchanged']} unchanged, {counts['removed']} removed, {counts['failed']} failed")
+        print(f"Index: {index.stats()} [{index.index_path}]")
+        return 0 if counts['failed'] == 0 else 1
+
+    locations = index.lookup(args.patient_id, args.prefix)
+    for file_key, records in locations.items():
+        print(f"{file_key}: {len(records)} records")
+    print(f"{sum(len(r) for r in locations.values())} records in {len(locations)} files")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
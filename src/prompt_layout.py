@@ -0,0 +1,98 @@
+"""
+Prompt Layout
+=============
+
+Prefix-stable prompt assembly for extraction calls, so backends can reuse the
+work they already did for a document.
+
+Extraction prompts used to put the variable-specific ``EXTRACTION TASK``
+before the ``DOCUMENT TEXT``, so no two prompts for the same document shared
+more than a one-line prefix. Both local and hosted backends only reuse
+*prefixes*:
+
+- Ollama (llama.cpp) keeps each parallel slot's KV cache and only evaluates
+  the tokens after the longest prefix shared with the slot's previous prompt,
+  as long as the model stays loaded (``keep_alive``)
+- Anthropic prompt caching bills a cached prefix (up to a ``cache_control``
+  breakpoint) at a fraction of the input price and skips its prefill
+
+Prompts are therefore assembled as **system text -> document -> task**:
+``document_prefix()`` is identical for every variable asked of a document, and
+the pipeline submits calls grouped by document so consecutive calls hit a warm
+prefix. ``anthropic_messages()`` marks the end of that prefix with
+``cache_control``.
+
+Usage:
+    prefix = document_prefix(note_id, note_title, note_text)
+    prompt = prefix + extraction_task(instruction)
+    messages = anthropic_messages(prompt, cache_prefix=prefix)
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+SYSTEM_TEXT = ("You are a medical data extraction assistant. "
+               "Your task is to extract specific information from clinical documents.")
+
+# How long Ollama keeps the model (and its KV cache) loaded between calls
+DEFAULT_OLLAMA_KEEP_ALIVE = '30m'
+
+
+def document_prefix(note_id: Any, note_title: Any, note_text: Any) -> str:
+    """System text and document: the part of the prompt shared by every variable of a document."""
+    return f"""{SYSTEM_TEXT}
+
+DOCUMENT INFORMATION:
+- NOTE_ID: {note_id}
+- NOTE_TITLE: {note_title}
+
+DOCUMENT TEXT:
+{note_text}
+
+"""
+
+
+def extraction_task(instruction: str) -> str:
+    """Variable-specific part of a single-variable extraction prompt."""
+    return f"""EXTRACTION TASK:
+{instruction}
+
+INSTRUCTIONS:
+1. Read the document carefully
+2. Extract ONLY the requested information following the exact format specified
+3. If the information is not found or not applicable, return the default value specified in the instruction
+4. Return ONLY the extracted value, no explanation or preamble
+
+EXTRACTED VALUE:"""
+
+
+def batch_extraction_task(variables: Sequence[Dict[str, Any]]) -> str:
+    """Variable-specific part of a batched (JSON answer) extraction prompt."""
+    variable_names = [variable['variable_name'] for variable in variables]
+    tasks = "\n\n".join(f"### {variable['variable_name']}\n{variable['instruction']}" for variable in variables)
+    return f"""EXTRACTION TASKS:
+{tasks}
+
+INSTRUCTIONS:
+1. Read the document carefully
+2. For each task, extract ONLY the requested information following the exact format specified
+3. If the information is not found or not applicable, use the default value specified in that task's instruction
+4. Return ONLY a JSON object with exactly these keys: {', '.join(json.dumps(name) for name in variable_names)}
+5. Each value is the extracted value as a string, no explanation or preamble
+
+JSON OBJECT:"""
+
+
+def anthropic_messages(prompt: str, cache_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Messages for ``anthropic.messages.create`` with a prompt-cache breakpoint after cache_prefix.
+
+    Without a prefix (or if the prompt does not start with it) the prompt is sent as plain text.
+    """
+    if not cache_prefix or not prompt.startswith(cache_prefix) or len(prompt) == len(cache_prefix):
+        return [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": [
+        {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": prompt[len(cache_prefix):]},
+    ]}]
+
@@ -0,0 +1,455 @@
+"""
+Staging Store
+=============
+
+Columnar, parse-once store for the per-patient Athena staging CSVs.
+
+Every event-based component (Phase 1 harvester, timeline builder, surgery
+classifier, survival endpoints, cross-source validator, query engine, the
+orchestrator itself) called ``pd.read_csv`` on the same
+``staging_files/patient_<id>/<source>.csv`` files and re-parsed their date
+columns with ``pd.to_datetime(..., utc=True)``, so one orchestrator run read
+each file half a dozen times and held as many copies of it. The store reads
+each CSV once:
+
+- The CSV is converted to an Arrow IPC file (``<source>.arrow``) carrying the
+  CSV's size and mtime in its schema metadata; a changed CSV is converted again
+- Date-like columns (``*date*``, ``*_time``, ``*datetime*``, ``*period_start``,
+  ``*period_end``) are stored as tz-aware UTC timestamps when that loses
+  nothing: every value parses and keeps its calendar date (columns with other
+  UTC offsets or unparseable values stay text)
+- Arrow files are memory-mapped; each source is loaded into one shared frame
+  per process, and callers get a view of it, never a copy: callers may add or
+  replace columns, while in-place edits of shared values raise ValueError
+  (the shared arrays are read-only; with pandas >= 3, or ``copy_on_write``
+  enabled, pandas copies on write instead), so no caller's edits reach another
+- ``frame(..., dates=[...])`` additionally guarantees the listed columns are
+  parsed (``errors='coerce', utc=True``), once per process
+- ``info()`` answers row counts and column names from the Arrow schema
+  without loading the frame
+- Frames of the least recently used patients are dropped from memory once
+  more than ``max_patients`` are loaded
+- Counters: ``conversions``, ``loads``, ``hits``, ``csv_reads``
+
+Without ``pyarrow``, or without a configured store directory, the store still
+parses each CSV once per process and shares the frame; nothing is written to
+disk.
+
+The Arrow files are copies of patient data (PHI), unencrypted, so nothing is
+persisted unless a directory is configured (``store_dir`` or
+``STAGING_STORE_DIR``). The directory is created, or restricted, to mode 0700
+(owner only); put it on an encrypted volume and delete it when a project ends.
+
+Usage:
+    store = get_staging_store(staging_dir)
+    procedures = store.frame(patient_id, 'procedures', dates=['proc_performed_date_time'])
+    if procedures is not None:
+        ...
+    store.info(patient_id, 'imaging')  # {'rows': 42, 'columns': [...]}
+
+Configuration (environment variables):
+- ``STAGING_STORE_DIR``: Arrow cache directory (default: none, frames are kept in memory only)
+- ``STAGING_STORE_PATIENTS``: patients kept in memory (default 4)
+- ``STAGING_STORE=0``: disable (every call reads the CSV, as before)
+
+Convert a staging directory ahead of a run:
+    python src/staging_store.py convert /path/to/staging_files
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+import warnings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PATIENTS = 4
+FORMAT_VERSION = '1'
+
+# Column names that hold dates in the Athena staging exports
+DATE_COLUMN_PATTERN = re.compile(r'date|_time$|datetime|period_start$|period_end$', re.IGNORECASE)
+
+_METADATA_KEY = b'brim_staging_store'
+
+_SHARED_STORES: Dict[str, 'StagingStore'] = {}
+_SHARED_STORES_LOCK = threading.Lock()
+
+
+def copy_on_write_enabled() -> bool:
+    """True when pandas copies shared column data on first write (default from pandas 3)."""
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except (KeyError, pd.errors.OptionError):
+        return False
+
+
+def _freeze(df: pd.DataFrame) -> pd.DataFrame:
+    """Mark the frame's column arrays read-only, so views of it cannot write into them."""
+    for values in df._mgr.arrays:
+        for array in (values, getattr(values, '_ndarray', None),
+                      getattr(values, '_data', None), getattr(values, '_mask', None)):
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+    return df
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """The parse every staging reader applies to a date column."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(values, errors='coerce', utc=True)
+
+
+def utc_text(values: pd.Series, unit: str = 's') -> np.ndarray:
+    """
+    ``dt.strftime`` of tz-aware timestamps in UTC, vectorized: ``'%Y-%m-%d'``
+    for unit 'D', ``'%Y-%m-%d %H:%M:%S'`` for unit 's'; NaT -> None.
+    """
+    naive = values.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(f'datetime64[{unit}]')
+    text = np.datetime_as_string(naive, unit=unit)
+    if unit != 'D':
+        text = np.char.replace(text, 'T', ' ')
+    text = text.astype(object)
+    text[np.asarray(values.isna())] = None
+    return text
+
+
+def type_date_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Parse date-like text columns in place where the timestamps keep every value.
+
+    A column is converted when all non-empty values parse and the UTC timestamp
+    has the calendar date the text starts with, so ``str(value)[:10]`` and
+    ``parse_dates(value)`` give what they gave on the text.
+
+    Returns:
+        Names of the converted columns
+    """
+    converted = []
+    for col in df.columns:
+        if not DATE_COLUMN_PATTERN.search(str(col)) or pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        text = df[col]
+        present = text.notna()
+        if not present.any():
+            continue
+        parsed = parse_dates(text)
+        if parsed.notna().sum() != present.sum():
+            continue
+        if not (utc_text(parsed[present], 'D') == text[present].astype(str).str[:10].to_numpy(dtype=object)).all():
+            continue
+        df[col] = parsed
+        converted.append(col)
+    return converted
+
+
+def csv_fingerprint(path: Path) -> Dict[str, Any]:
+    stat = path.stat()
+    return {'format': FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class StagingStore:
+    """
+    Parse-once, shared frames of one staging directory's patient CSVs.
+
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        staging_dir: Path,
+        store_dir: Optional[Path] = None,
+        max_patients: Optional[int] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Initialize store.
+
+        Args:
+            staging_dir: Directory holding ``patient_<id>/`` folders of CSVs
+            store_dir: Arrow cache directory (created with mode 0700 if missing; default
+                       STAGING_STORE_DIR, and without either nothing is written to disk)
+            max_patients: Patients whose frames stay in memory (LRU)
+            enabled: False reads the CSV on every call and caches nothing
+                     (default: on unless STAGING_STORE=0)
+        """
+        self.staging_dir = Path(staging_dir)
+        store_dir = store_dir or os.environ.get('STAGING_STORE_DIR')
+        self.store_dir = Path(store_dir) if store_dir else None
+        self.max_patients = max(1, int(max_patients or os.environ.get('STAGING_STORE_PATIENTS', DEFAULT_MAX_PATIENTS)))
+        self.enabled = os.environ.get('STAGING_STORE', '1') != '0' if enabled is None else enabled
+        self.persistent = self.enabled and PYARROW_AVAILABLE and self.store_dir is not None
+        if self.persistent:
+            # Patient data: owner-only access
+            self.store_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            os.chmod(self.store_dir, 0o700)
+        self.copy_on_write = copy_on_write_enabled()
+
+        self.conversions = 0
+        self.loads = 0
+        self.hits = 0
+        self.csv_reads = 0
+        self._frames: 'OrderedDict[str, Dict[str, pd.DataFrame]]' = OrderedDict()
+        self._patient_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+
+    def patient_dir(self, patient_id: str) -> Path:
+        """Staging folder of a patient (ID kept as-is, dots included)."""
+        return self.staging_dir / f"patient_{patient_id}"
+
+    def csv_path(self, patient_id: str, source: str) -> Path:
+        return self.patient_dir(patient_id) / f"{source}.csv"
+
+    def arrow_path(self, patient_id: str, source: str) -> Path:
+        folder = hashlib.sha1(str(self.patient_dir(patient_id).resolve()).encode()).hexdigest()[:16]
+        return self.store_dir / folder / f"{source}.arrow"
+
+    def has(self, patient_id: str, source: str) -> bool:
+        return self.csv_path(patient_id, source).exists()
+
+    def sources(self, patient_id: str) -> List[str]:
+        """Staging sources (CSV stems) available for a patient."""
+        return sorted(path.stem for path in self.patient_dir(patient_id).glob('*.csv'))
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def frame(self, patient_id: str, source: str, dates: Optional[Iterable[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        One staging source of a patient.
+
+        Args:
+            patient_id: Patient FHIR ID
+            source: CSV stem, e.g. ``procedures``
+            dates: Columns to return parsed as UTC timestamps (unparseable -> NaT);
+                   missing columns are ignored
+
+        Returns:
+            A view of the shared frame, or None if the CSV does not exist. Adding
+            or replacing columns is fine; edit values in place on a ``copy()``
+        """
+        if not self.has(patient_id, source):
+            return None
+        if not self.enabled:
+            self.csv_reads += 1
+            df = pd.read_csv(self.csv_path(patient_id, source))
+            for col in dates or ():
+                if col in df.columns:
+                    df[col] = parse_dates(df[col])
+            return df
+
+        with self._patient_lock(patient_id):
+            frames = self._patient_frames(patient_id)
+            df = frames.get(source)
+            if df is None:
+                df = self._share(self._load(patient_id, source))
+            else:
+                self.hits += 1
+            parse = [col for col in dates or () if col in df.columns
+                     and not isinstance(df[col].dtype, pd.DatetimeTZDtype)]
+            if parse:
+                # The shared frame gains the parsed columns; earlier views keep theirs
+                df = df.copy(deep=False)
+                for col in parse:
+                    df[col] = parse_dates(df[col])
+                df = self._share(df)
+            frames[source] = df
+        return df.copy(deep=False)
+
+    def info(self, patient_id: str, source: str) -> Optional[Dict[str, Any]]:
+        """Row count and column names of a source, from the Arrow schema when it is not loaded."""
+        if not self.has(patient_id, source):
+            return None
+        if self.persistent:
+            with self._patient_lock(patient_id):
+                df = self._frames.get(patient_id, {}).get(source)
+                path = None if df is not None else self._convert(patient_id, source)[0]
+            if path is not None:
+                with pa.memory_map(str(path)) as mapped:
+                    reader = pa.ipc.open_file(mapped)
+                    rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+                    return {'rows': rows, 'columns': list(reader.schema.names)}
+        df = self.frame(patient_id, source)
+        return {'rows': len(df), 'columns': list(df.columns)}
+
+    def evict(self, patient_id: Optional[str] = None):
+        """Drop in-memory frames of one patient (all patients by default); Arrow files stay."""
+        with self._lock:
+            if patient_id is None:
+                self._frames.clear()
+            else:
+                self._frames.pop(patient_id, None)
+
+    def convert(self, patient_id: str) -> int:
+        """Convert every CSV of a patient that is not converted yet; returns the number converted."""
+        before = self.conversions
+        if self.persistent:
+            for source in self.sources(patient_id):
+                with self._patient_lock(patient_id):
+                    self._convert(patient_id, source)
+        return self.conversions - before
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _share(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Frame ready to hand out as views: read-only unless pandas copies on write itself."""
+        return df if self.copy_on_write else _freeze(df)
+
+    def _patient_lock(self, patient_id: str) -> threading.Lock:
+        with self._lock:
+            return self._patient_locks.setdefault(patient_id, threading.Lock())
+
+    def _patient_frames(self, patient_id: str) -> Dict[str, pd.DataFrame]:
+        with self._lock:
+            frames = self._frames.pop(patient_id, None)
+            if frames is None:
+                frames = {}
+            self._frames[patient_id] = frames  # most recently used last
+            while len(self._frames) > self.max_patients:
+                self._frames.popitem(last=False)
+            return frames
+
+    def _read_csv(self, patient_id: str, source: str) -> pd.DataFrame:
+        self.csv_reads += 1
+        df = pd.read_csv(self.csv_path(patient_id, source))
+        type_date_columns(df)
+        return df
+
+    def _load(self, patient_id: str, source: str) -> pd.DataFrame:
+        """Frame from the Arrow file (converting the CSV first if needed), else from the CSV."""
+        if not self.persistent:
+            return self._read_csv(patient_id, source)
+        path, df = self._convert(patient_id, source)
+        if path is None:
+            return df
+        self.loads += 1
+        df = pa.ipc.open_file(pa.memory_map(str(path))).read_all().to_pandas()
+        for col in df.columns:
+            if df[col].dtype == object and df[col].isna().any():
+                df[col] = df[col].where(df[col].notna(), np.nan)  # Arrow nulls come back as None
+        return df
+
+    def _convert(self, patient_id: str, source: str):
+        """
+        Bring the Arrow file of a source up to date with its CSV.
+
+        Returns:
+            (Arrow path, None), or (None, frame read from the CSV) when Arrow cannot hold it
+        """
+        path = self.arrow_path(patient_id, source)
+        fingerprint = csv_fingerprint(self.csv_path(patient_id, source))
+        if path.exists():
+            try:
+                with pa.memory_map(str(path)) as mapped:
+                    metadata = pa.ipc.open_file(mapped).schema.metadata or {}
+                if json.loads(metadata.get(_METADATA_KEY, b'{}')) == fingerprint:
+                    return path, None
+            except (pa.ArrowInvalid, OSError, ValueError):
+                pass
+
+        df = self._read_csv(patient_id, source)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.debug(f"Staging store: {source} of {patient_id} kept in memory only ({e})")
+            return None, df
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               _METADATA_KEY: json.dumps(fingerprint).encode()})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        with pa.OSFile(str(tmp), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+        self.conversions += 1
+        return path, None
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = sum(len(frames) for frames in self._frames.values())
+            patients = len(self._frames)
+        return {
+            'conversions': self.conversions,
+            'loads': self.loads,
+            'hits': self.hits,
+            'csv_reads': self.csv_reads,
+            'patients_in_memory': patients,
+            'frames_in_memory': loaded,
+            'persistent': self.persistent,
+        }
+
+    def summary(self) -> str:
+        mode = f"Arrow [{self.store_dir}]" if self.persistent else 'in-memory only'
+        return (f"Staging store: {self.hits} shared hits, {self.loads} Arrow loads, "
+                f"{self.conversions} conversions, {self.csv_reads} CSV reads ({mode})")
+
+
+def get_staging_store(staging_dir: Path) -> StagingStore:
+    """Process-wide store of a staging directory, shared by every component reading it."""
+    key = str(Path(staging_dir).resolve())
+    with _SHARED_STORES_LOCK:
+        store = _SHARED_STORES.get(key)
+        if store is None:
+            store = _SHARED_STORES[key] = StagingStore(Path(staging_dir))
+        return store
+
+
+def reset_staging_stores():
+    """Forget the shared stores (their Arrow files stay); the next get_staging_store() starts fresh."""
+    with _SHARED_STORES_LOCK:
+        _SHARED_STORES.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert staging CSVs to the columnar staging store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert', help='Convert every patient folder of a staging directory')
+    convert.add_argument('staging_dir')
+    convert.add_argument('--store-dir', default=os.environ.get('STAGING_STORE_DIR'),
+                         help='Arrow cache directory (default STAGING_STORE_DIR)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if not PYARROW_AVAILABLE:
+        parser.error('pyarrow is not installed (pip install pyarrow)')
+    if not args.store_dir:
+        parser.error('set --store-dir or STAGING_STORE_DIR')
+    store = StagingStore(Path(args.staging_dir), store_dir=args.store_dir)
+    patients = sorted(path.name[len('patient_'):] for path in store.staging_dir.glob('patient_*') if path.is_dir())
+    for patient_id in patients:
+        store.convert(patient_id)
+    print(f"Converted {store.conversions} staging files of {len(patients)} patients into {store.store_dir}")
+
+
+if __name__ == '__main__':
+    main()
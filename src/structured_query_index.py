@@ -0,0 +1,318 @@
+"""
+Structured Query Index
+======================
+
+Per-patient, load-once indexes behind the Phase 4 structured data query
+engine (``StructuredDataQueryEngine``).
+
+The engine answers the tool calls the LLM makes during extraction
+(QUERY_SURGERY_DATES, QUERY_MEDICATIONS, QUERY_IMAGING_ON_DATE,
+QUERY_ENCOUNTERS_RANGE, ...). Each call used to fetch the staging frame and
+walk it with ``iterrows()``, so every query cost a full scan of the source and
+the same query asked from several documents cost it again. This module keeps,
+per patient:
+
+- ``SourceTable``: each staging source loaded once from the staging store, as
+  the row values ``iterrows()`` handed out (same objects, same types)
+- ``DateIndex``: the first present date of each row among candidate columns,
+  parsed once to UTC and sorted, so range and ``+/- N days`` lookups are two
+  binary searches
+- ``NameIndex``: row positions grouped by lower-cased value of a name column,
+  so a substring lookup (``'carboplatin' in name``) tests each distinct name
+  once instead of every row
+- Answers memoized in an LRU keyed by query and arguments; callers get copies
+
+Results come back in file order, exactly as the row scans produced them.
+
+Usage:
+    index = QueryIndex(get_staging_store(staging_dir))
+    patient = index.patient(patient_id)
+    medications = patient.table('medications')
+    positions = patient.names('medications', 'medication_name').containing('carboplatin')
+    answer = index.memoized(compute, patient_id, 'carboplatin')
+
+Configuration (environment variables):
+- ``QUERY_CACHE_SIZE``: memoized answers kept (default 1024, 0 disables)
+- ``QUERY_INDEX_PATIENTS``: patients whose indexes stay in memory (default 4)
+"""
+
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_PATIENTS = 4
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+def parse_timestamps(values: np.ndarray) -> pd.Series:
+    """
+    Parse values to UTC timestamps the way ``pd.to_datetime(value, utc=True)``
+    parses each one on its own; unparseable values raise, as they did per row.
+    """
+    values = pd.Series(values, dtype=object)
+    try:
+        return pd.to_datetime(values, utc=True, format='mixed')
+    except (TypeError, ValueError):
+        # pandas < 2 has no format='mixed'; parse element by element
+        return pd.Series([pd.to_datetime(value, utc=True) for value in values], dtype=object)
+
+
+def copy_result(result: Any) -> Any:
+    """Copy of a memoized answer (a dict or a list of dicts) the caller may modify."""
+    if isinstance(result, dict):
+        return dict(result)
+    if isinstance(result, list):
+        return [dict(item) if isinstance(item, dict) else item for item in result]
+    return result
+
+
+class SourceTable:
+    """One staging source, loaded once, read by row position and column name."""
+
+    def __init__(self, frame: pd.DataFrame):
+        self.columns = list(frame.columns)
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+        # Same upcasting as iterrows(): object rows unless every column is numeric
+        self.values = frame.values
+        self._first_present: Dict[Tuple[str, ...], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._positions
+
+    def get(self, position: int, column: str, default: Any = None) -> Any:
+        """``row.get(column, default)`` of the row at ``position``."""
+        j = self._positions.get(column)
+        return default if j is None else self.values[position, j]
+
+    def column(self, column: str) -> Optional[np.ndarray]:
+        j = self._positions.get(column)
+        return None if j is None else self.values[:, j]
+
+    def first_present(self, columns: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per row, the value of the first of ``columns`` that exists and is not null.
+
+        Returns:
+            (values, found): object array of the chosen values and a mask of
+            the rows where one was found
+        """
+        key = tuple(columns)
+        cached = self._first_present.get(key)
+        if cached is not None:
+            return cached
+        chosen = np.full(len(self), None, dtype=object)
+        found = np.zeros(len(self), dtype=bool)
+        for column in columns:
+            values = self.column(column)
+            if values is None:
+                continue
+            mask = ~found & np.asarray(pd.notna(values), dtype=bool)
+            chosen[mask] = values[mask]
+            found |= mask
+        self._first_present[key] = (chosen, found)
+        return chosen, found
+
+
+class DateIndex:
+    """Rows sorted by their date (first present of the candidate columns, parsed to UTC)."""
+
+    def __init__(self, table: SourceTable, columns: Sequence[str]):
+        chosen, found = table.first_present(columns)
+        positions = np.flatnonzero(found)
+        stamps = parse_timestamps(chosen[positions])
+        valid = np.asarray(stamps.notna(), dtype=bool)
+        positions = positions[valid]
+        stamps = list(stamps[valid])
+        ns = np.array([stamp.value for stamp in stamps], dtype=np.int64)
+
+        order = np.argsort(ns, kind='stable')
+        self.ns = ns[order]
+        self.positions = positions[order]
+        self.stamps = [stamps[i] for i in order]
+
+    def __len__(self) -> int:
+        return len(self.ns)
+
+    def _hits(self, lo: int, hi: int) -> List[int]:
+        """Sorted-order slice [lo, hi) reordered by row position (file order)."""
+        return (np.argsort(self.positions[lo:hi], kind='stable') + lo).tolist()
+
+    def between(self, start: pd.Timestamp, end: pd.Timestamp) -> Iterator[Tuple[int, pd.Timestamp]]:
+        """(position, date) of rows with start <= date <= end, in file order."""
+        lo = int(np.searchsorted(self.ns, start.value, side='left'))
+        hi = int(np.searchsorted(self.ns, end.value, side='right'))
+        for i in self._hits(lo, hi):
+            yield int(self.positions[i]), self.stamps[i]
+
+    def within_days(self, target: pd.Timestamp, tolerance_days: float) -> Iterator[Tuple[int, pd.Timestamp, int]]:
+        """
+        (position, date, days) of rows with ``abs((date - target).days) <= tolerance_days``,
+        in file order. ``Timedelta.days`` floors, so the window is
+        [target - N days, target + N + 1 days).
+        """
+        tolerance = math.floor(tolerance_days)
+        lo = int(np.searchsorted(self.ns, target.value - tolerance * NS_PER_DAY, side='left'))
+        hi = int(np.searchsorted(self.ns, target.value + (tolerance + 1) * NS_PER_DAY, side='left'))
+        for i in self._hits(lo, hi):
+            yield int(self.positions[i]), self.stamps[i], int((self.ns[i] - target.value) // NS_PER_DAY)
+
+
+class NameIndex:
+    """Row positions grouped by ``str(value).lower()`` of one column ('' where it is missing)."""
+
+    def __init__(self, table: SourceTable, column: str):
+        values = table.column(column)
+        groups: Dict[str, List[int]] = {}
+        if values is None:
+            groups[''] = list(range(len(table)))
+        else:
+            for position, value in enumerate(values):
+                groups.setdefault(str(value).lower(), []).append(position)
+        self.groups = {name: np.array(positions, dtype=np.int64) for name, positions in groups.items()}
+
+    def where(self, predicate: Callable[[str], bool]) -> np.ndarray:
+        """Positions (file order) of rows whose lower-cased name satisfies ``predicate``."""
+        hits = [positions for name, positions in self.groups.items() if predicate(name)]
+        if not hits:
+            return np.array([], dtype=np.int64)
+        return np.sort(np.concatenate(hits))
+
+    def containing(self, term: str) -> np.ndarray:
+        """Positions (file order) of rows whose lower-cased name contains ``term``."""
+        term = term.lower()
+        return self.where(lambda name: term in name)
+
+
+class PatientQueryIndex:
+    """A patient's staging sources and their indexes, each built on first use."""
+
+    def __init__(self, store, patient_id: str):
+        self.store = store
+        self.patient_id = patient_id
+        self._tables: Dict[str, Optional[SourceTable]] = {}
+        self._indexes: Dict[Tuple, Any] = {}
+        self._lock = threading.RLock()
+        self.builds = 0
+
+    def table(self, source: str) -> Optional[SourceTable]:
+        """The staging source, or None if the patient has no such CSV."""
+        with self._lock:
+            if source not in self._tables:
+                frame = self.store.frame(self.patient_id, source)
+                self._tables[source] = None if frame is None else SourceTable(frame)
+                self.builds += 1
+            return self._tables[source]
+
+    def dates(self, source: str, columns: Sequence[str]) -> Optional[DateIndex]:
+        return self._index(DateIndex, source, tuple(columns))
+
+    def names(self, source: str, column: str) -> Optional[NameIndex]:
+        return self._index(NameIndex, source, column)
+
+    def _index(self, kind, source: str, spec):
+        key = (kind.__name__, source, spec)
+        with self._lock:
+            if key not in self._indexes:
+                table = self.table(source)
+                # Build errors (unparseable dates) propagate and are retried next time, as the scans raised
+                self._indexes[key] = None if table is None else kind(table, spec)
+                self.builds += 1
+            return self._indexes[key]
+
+
+class QueryIndex:
+    """
+    Patient indexes over one staging store, plus the LRU of memoized answers.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, store, cache_size: Optional[int] = None, max_patients: Optional[int] = None):
+        """
+        Initialize index.
+
+        Args:
+            store: staging_store.StagingStore the sources are read from
+            cache_size: Memoized answers kept (default QUERY_CACHE_SIZE or 1024; 0 disables)
+            max_patients: Patients whose indexes stay in memory (LRU)
+        """
+        self.store = store
+        self.cache_size = int(os.environ.get('QUERY_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+                              if cache_size is None else cache_size)
+        self.max_patients = max(1, int(max_patients or os.environ.get('QUERY_INDEX_PATIENTS', DEFAULT_MAX_PATIENTS)))
+
+        self.hits = 0
+        self.misses = 0
+        self._patients: 'OrderedDict[str, PatientQueryIndex]' = OrderedDict()
+        self._answers: 'OrderedDict[Tuple, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def patient(self, patient_id: str) -> PatientQueryIndex:
+        with self._lock:
+            index = self._patients.get(patient_id)
+            if index is None:
+                index = self._patients[patient_id] = PatientQueryIndex(self.store, patient_id)
+                while len(self._patients) > self.max_patients:
+                    self._patients.popitem(last=False)
+            else:
+                self._patients.move_to_end(patient_id)
+            return index
+
+    def memoized(self, compute: Callable[..., Any], patient_id: str, *args) -> Any:
+        """
+        ``compute(patient_id, *args)``, answered from the LRU when the same query was asked before.
+
+        Returns:
+            A copy of the answer the caller may modify
+        """
+        key = (compute.__name__, patient_id) + args
+        with self._lock:
+            if key in self._answers:
+                self._answers.move_to_end(key)
+                self.hits += 1
+                return copy_result(self._answers[key])
+            self.misses += 1
+        result = compute(patient_id, *args)
+        if self.cache_size > 0:
+            with self._lock:
+                self._answers[key] = result
+                while len(self._answers) > self.cache_size:
+                    self._answers.popitem(last=False)
+        return copy_result(result)
+
+    def invalidate(self, patient_id: Optional[str] = None):
+        """Drop one patient's indexes and answers (all patients when None), e.g. after its CSVs change."""
+        with self._lock:
+            if patient_id is None:
+                self._patients.clear()
+                self._answers.clear()
+                return
+            self._patients.pop(patient_id, None)
+            for key in [key for key in self._answers if key[1] == patient_id]:
+                del self._answers[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'memo_hits': self.hits,
+                'memo_misses': self.misses,
+                'answers_cached': len(self._answers),
+                'patients_indexed': len(self._patients),
+                'builds': sum(index.builds for index in self._patients.values()),
+            }
+
+    def summary(self) -> str:
+        return (f"Query index: {self.hits} memoized answers, {self.misses} computed, "
+                f"{len(self._patients)} patients indexed")
@@ -0,0 +1,249 @@
+"""
+Temporal Context Index
+======================
+
+Per-patient index of surgery, diagnosis and medication dates for HINT column
+generation.
+
+``FHIRExtractor.assign_surgery_number``, ``get_relevant_diagnosis`` and
+``get_active_medications`` answer one document at a time, re-parsing every
+event date and re-sorting on each call (O(notes x events) with per-call
+``pd.to_datetime``). ``TemporalContextIndex`` parses each event date once into
+sorted ``datetime64`` arrays and answers all documents together with
+``np.searchsorted`` interval lookups. Results are identical to the per-note
+methods, including their rules:
+
+- Surgery number: the first surgery (ordered by ``procedure_date``) within
+  90 days of the document, otherwise the closest one; ``'other'`` if none
+- Diagnosis: the latest diagnosis recorded on or before the document date
+  (first in list order on ties), otherwise the first diagnosis in the list
+- Medications: names of orders authored within 30 days, de-duplicated
+- Day differences follow ``Timedelta.days`` (floored)
+
+Usage:
+    index = TemporalContextIndex(fhir_context)
+    hints = index.hint_columns(document_dates)   # DataFrame of HINT_* columns
+"""
+
+import re
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+SURGERY_WINDOW_DAYS = 90
+MEDICATION_WINDOW_DAYS = 30
+
+_DAY = np.timedelta64(1, 'D')
+_WHO_GRADE_PATTERNS = [
+    re.compile(r'WHO\s+[Gg]rade\s+([IVX]+)'),
+    re.compile(r'[Gg]rade\s+([IVX]+)'),
+    re.compile(r'WHO\s+([IVX]+)'),
+]
+
+
+def to_datetime64(values: Sequence[Any]) -> np.ndarray:
+    """
+    Parse dates one value at a time (mixed formats allowed) into naive datetime64[ns].
+
+    Timezone-aware values are converted to UTC before the timezone is dropped.
+    Missing values become NaT.
+    """
+    parsed = np.empty(len(values), dtype='datetime64[ns]')
+    for i, value in enumerate(values):
+        timestamp = pd.to_datetime(value)
+        if pd.isna(timestamp):
+            parsed[i] = np.datetime64('NaT')
+            continue
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        parsed[i] = timestamp.to_datetime64()
+    return parsed
+
+
+def extract_who_grade(diagnosis_text: str) -> str:
+    """WHO grade ('I'-'IV') named in a diagnosis text, or ''."""
+    if not diagnosis_text:
+        return ''
+    for pattern in _WHO_GRADE_PATTERNS:
+        match = pattern.search(diagnosis_text)
+        if match:
+            grade = match.group(1).upper()
+            if grade in ['I', 'II', 'III', 'IV']:
+                return grade
+    return ''
+
+
+class TemporalContextIndex:
+    """
+    Sorted event-date arrays for one patient's surgeries, diagnoses and medications.
+    """
+
+    def __init__(self, fhir_context: Dict[str, Any], medication_window_days: int = MEDICATION_WINDOW_DAYS):
+        """
+        Build the index.
+
+        Args:
+            fhir_context: Dictionary from FHIRExtractor.extract_patient_context()
+            medication_window_days: Days before/after a document an order counts as active
+        """
+        self.medication_window_days = medication_window_days
+        self._build_surgeries(fhir_context.get('surgeries') or [])
+        self._build_diagnoses(fhir_context.get('diagnoses') or [])
+        self._build_medications(fhir_context.get('medications') or [])
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    def _build_surgeries(self, surgeries: List[Dict]):
+        # Same ordering as assign_surgery_number (raw procedure_date values)
+        ordered = sorted(surgeries, key=lambda x: x['procedure_date'])
+        self.surgery_dates = to_datetime64([s['procedure_date'] for s in ordered])
+        dates = self.surgery_dates
+        # searchsorted needs the raw ordering to be chronological and complete
+        self._surgeries_searchable = (
+            len(dates) > 0 and not np.isnat(dates).any() and bool(np.all(dates[1:] >= dates[:-1]))
+        )
+
+    def _build_diagnoses(self, diagnoses: List[Dict]):
+        self.diagnoses = diagnoses
+        self._first_diagnosis = diagnoses[0].get('diagnosis_text', '') if diagnoses else ''
+        dates = to_datetime64([d.get('recorded_date', d.get('onset_date')) for d in diagnoses])
+        valid = np.flatnonzero(~np.isnat(dates))
+        # Stable sort keeps list order among equal dates
+        order = valid[np.argsort(dates[valid], kind='stable')]
+        self._diagnosis_order = order
+        self._diagnosis_dates = dates[order]
+
+    def _build_medications(self, medications: List[Dict]):
+        dates = to_datetime64([m.get('authored_date') for m in medications])
+        valid = np.flatnonzero(~np.isnat(dates))
+        order = valid[np.argsort(dates[valid], kind='stable')]
+        self._medication_order = order
+        self._medication_dates = dates[order]
+        self._medication_names = [m.get('medication_name', '') for m in medications]
+
+    # ------------------------------------------------------------------
+    # Lookups (all documents at once)
+    # ------------------------------------------------------------------
+
+    def surgery_numbers(self, document_dates: np.ndarray) -> List[str]:
+        """Surgery number per document (same rules as FHIRExtractor.assign_surgery_number)."""
+        dates = self.surgery_dates
+        n = len(dates)
+        if n == 0:
+            return ['other'] * len(document_dates)
+        if not self._surgeries_searchable:
+            return self._surgery_numbers_dense(document_dates)
+
+        window = np.timedelta64(SURGERY_WINDOW_DAYS, 'D')
+        # floor((doc - s) / 1 day) in [-90, 90]  <=>  doc - 91 days < s <= doc + 90 days
+        first = np.searchsorted(dates, document_dates - window - _DAY, side='right')
+        in_window = (first < n) & (dates[np.minimum(first, n - 1)] <= document_dates + window)
+
+        # Closest: the per-note rule measures abs((surgery - document).days) here, i.e.
+        # ceil days to earlier surgeries and floor days to later ones
+        right = np.searchsorted(dates, document_dates, side='right')
+        left = right - 1
+        has_left = left >= 0
+        has_right = right < n
+        left_days = np.where(has_left, -((dates[np.maximum(left, 0)] - document_dates) // _DAY),
+                             np.iinfo(np.int64).max)
+        right_days = np.where(has_right, (dates[np.minimum(right, n - 1)] - document_dates) // _DAY,
+                              np.iinfo(np.int64).max)
+        # Earlier surgeries with the same distance come first in the list
+        left_key = np.where(has_left, left_days, 0)
+        left_first = np.searchsorted(dates, document_dates - left_key * _DAY, side='left')
+        closest = np.where(left_days <= right_days, left_first, right)
+
+        number = np.where(in_window, first, closest) + 1
+        return [str(i) for i in number]
+
+    def _surgery_numbers_dense(self, document_dates: np.ndarray) -> List[str]:
+        """Fallback for surgery dates that are missing or not in chronological order."""
+        dates = self.surgery_dates
+        offsets = document_dates[:, None] - dates[None, :]
+        missing = np.isnat(offsets)
+        with np.errstate(invalid='ignore'):  # NaT offsets, masked below
+            within = np.abs((offsets // _DAY).astype('float64')) <= SURGERY_WINDOW_DAYS
+            closeness = np.abs(((-offsets) // _DAY).astype('float64'))
+        within[missing] = False
+        closeness[missing] = np.nan
+
+        numbers = []
+        for in_window, row in zip(within, closeness):
+            candidates = np.flatnonzero(in_window)
+            if len(candidates):
+                numbers.append(str(candidates[0] + 1))
+            elif np.isnan(row[0]):
+                # min() keeps the first element when its key is NaN
+                numbers.append('1')
+            else:
+                numbers.append(str(int(np.argmin(np.where(np.isnan(row), np.inf, row))) + 1))
+        return numbers
+
+    def diagnoses_for(self, document_dates: np.ndarray) -> List[Any]:
+        """Relevant diagnosis text per document (same rules as FHIRExtractor.get_relevant_diagnosis)."""
+        if not self.diagnoses:
+            return [''] * len(document_dates)
+        dates = self._diagnosis_dates
+        last = np.searchsorted(dates, document_dates, side='right') - 1
+        # First (in list order) of the diagnoses sharing the latest date
+        first_of_date = np.searchsorted(dates, dates[np.maximum(last, 0)], side='left') if len(dates) else last
+        result = []
+        for position, found in zip(first_of_date, last >= 0):
+            if found:
+                result.append(self.diagnoses[self._diagnosis_order[position]].get('diagnosis_text', ''))
+            else:
+                result.append(self._first_diagnosis)
+        return result
+
+    def active_medications(self, document_dates: np.ndarray) -> List[List[str]]:
+        """Active medication names per document (same rules as FHIRExtractor.get_active_medications)."""
+        window = np.timedelta64(self.medication_window_days, 'D')
+        dates = self._medication_dates
+        # floor((doc - m) / 1 day) in [-w, w]  <=>  doc - (w + 1) days < m <= doc + w days
+        lo = np.searchsorted(dates, document_dates - window - _DAY, side='right')
+        hi = np.searchsorted(dates, document_dates + window, side='right')
+
+        result = []
+        for start, end in zip(lo, hi):
+            active = []
+            # Original list order, so the de-duplicated list comes out as before
+            for position in np.sort(self._medication_order[start:end]):
+                name = self._medication_names[position]
+                if name:
+                    active.append(name)
+            result.append(list(set(active)))
+        return result
+
+    def hint_columns(self, document_dates: Sequence[Any]) -> pd.DataFrame:
+        """
+        All HINT columns for all documents in one pass.
+
+        Args:
+            document_dates: Document dates (anything pd.to_datetime accepts)
+
+        Returns:
+            DataFrame with HINT_SURGERY_NUMBER, HINT_DIAGNOSIS, HINT_WHO_GRADE and
+            HINT_MEDICATIONS, one row per document in input order
+        """
+        dates = document_dates if isinstance(document_dates, np.ndarray) and document_dates.dtype.kind == 'M' \
+            else to_datetime64(list(document_dates))
+        dates = dates.astype('datetime64[ns]')
+
+        diagnoses = self.diagnoses_for(dates)
+        grades = {}
+        for diagnosis in diagnoses:
+            if isinstance(diagnosis, str) and diagnosis not in grades:
+                grades[diagnosis] = extract_who_grade(diagnosis)
+        medications = self.active_medications(dates)
+
+        return pd.DataFrame({
+            'HINT_SURGERY_NUMBER': self.surgery_numbers(dates),
+            'HINT_DIAGNOSIS': diagnoses,
+            'HINT_WHO_GRADE': [grades.get(d, '') if isinstance(d, str) else extract_who_grade(d)
+                               for d in diagnoses],
+            'HINT_MEDICATIONS': ['; '.join(meds) if meds else '' for meds in medications],
+        }, dtype=object)
@@ -0,0 +1,82 @@
+"""
+Text Matching
+=============
+
+Multi-pattern substring matching shared by the chemotherapy matchers and the
+document selector.
+
+``AliasAutomaton`` is an Aho-Corasick automaton over lower-cased patterns
+grouped by key: one pass over a text finds every key with a pattern that occurs
+in it, however many patterns there are, and ``match_values()`` scans each
+distinct value once.
+
+Usage:
+    automaton = AliasAutomaton({'carboplatin': ['carboplatin', 'paraplatin'], ...})
+    automaton.keys_in('carboplatin 450 mg in sodium chloride')  # ['carboplatin']
+"""
+
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, List
+
+
+class AliasAutomaton:
+    """
+    Aho-Corasick automaton over lower-cased name patterns.
+
+    ``keys_in(text)`` answers "which keys have a pattern that is a substring of
+    text", in key order, with one pass over the text.
+    """
+
+    def __init__(self, patterns: Dict[Hashable, Iterable[str]]):
+        self.keys = list(patterns)
+        self._always = set()  # keys with an empty pattern match every text
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[set] = [set()]
+
+        for rank, key in enumerate(self.keys):
+            for pattern in patterns[key]:
+                pattern = pattern.lower()
+                if not pattern:
+                    self._always.add(rank)
+                    continue
+                state = 0
+                for char in pattern:
+                    if char not in self._goto[state]:
+                        self._goto.append({})
+                        self._out.append(set())
+                        self._goto[state][char] = len(self._goto) - 1
+                    state = self._goto[state][char]
+                self._out[state].add(rank)
+
+        # Failure links, breadth first: longest proper suffix that is also a prefix
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                if state:
+                    self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] |= self._out[self._fail[child]]
+                queue.append(child)
+
+    def keys_in(self, text: str) -> List[Hashable]:
+        """Keys with a pattern occurring in ``text`` (already lower-cased), in key order."""
+        found = set(self._always)
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return [self.keys[rank] for rank in sorted(found)]
+
+    def match_values(self, values: Iterable[Any]) -> List[List[Hashable]]:
+        """``keys_in(str(value).lower())`` per value, each distinct value scanned once."""
+        texts = [str(value).lower() for value in values]
+        distinct = {text: self.keys_in(text) for text in dict.fromkeys(texts)}
+        return [distinct[text] for text in texts]
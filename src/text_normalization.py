@@ -0,0 +1,386 @@
+"""
+Text Normalization
+==================
+
+Shared HTML/RTF-to-text normalization for clinical documents.
+
+One function, ``normalize_text()``, used by every caller that turns Binary
+content into note text (BRIMCSVGenerator.sanitize_html, the pilot CSV
+generator and retrieve_binary_documents), so a document produces the same text
+whichever script handles it:
+
+- HTML/XML: parsed with lxml (C parser, ~10x faster than BeautifulSoup's
+  ``html.parser``); script/style/head/meta/link content dropped; text nodes
+  joined with spaces and whitespace collapsed. lxml repairs broken markup
+  differently from ``html.parser`` (a stray ``<Bx`` swallows the rest of the
+  note, ``<title>`` outside ``<head>`` and CDATA content are dropped), so when
+  its text has fewer non-whitespace characters than the document's visible
+  text the document is re-parsed with BeautifulSoup, as the original
+  ``sanitize_html`` did. Without lxml a single-pass stdlib ``HTMLParser``
+  tokenizer gives the same output for well-formed HTML
+- RTF: a control-word/group parser (destinations such as font/color tables
+  and pictures skipped, ``\\'hh`` and ``\\uN`` escapes decoded, ``\\par`` and
+  ``\\line`` as line breaks)
+- Plain text: entities unescaped, whitespace collapsed
+
+The format is detected from the content, not from the caller: a document is
+HTML only if it contains a real tag (``<html``, ``<div``, ``<p>``, ``<br>``, a
+closing tag, a comment or doctype), so plain-text notes such as ``BP <5`` or
+``wt<Ideal`` keep every character. ``keep_lines=True``
+keeps one line per paragraph/block instead of a single line of text.
+
+``normalize_many()`` runs a list of documents through a process pool.
+"""
+
+import html
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional
+
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    from bs4 import BeautifulSoup
+    BS4_AVAILABLE = True
+except ImportError:
+    BS4_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Elements whose content is never note text
+SKIP_TAGS = ('script', 'style', 'meta', 'link', 'head')
+# Elements that start a new line when keep_lines=True
+BLOCK_TAGS = ('address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'div', 'dl', 'dt',
+              'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+              'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul')
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source',
+             'track', 'wbr'}
+
+# Documents smaller than this in total are normalized in-process
+MIN_PARALLEL_BYTES = 4 * 1024 ** 2
+
+# A real tag: closing tag, comment, doctype/XML declaration, or a known element with its '>'
+_MARKUP = re.compile(
+    r'<(?:/[a-zA-Z][\w:.-]*\s*>|!--|!doctype\b|\?xml\b'
+    r'|(?:html|head|body|div|span|p|br|hr|table|thead|tbody|tr|td|th|ul|ol|li|dl|dt|dd|font|b|i|u|em'
+    r'|strong|pre|h[1-6]|script|style|meta|link|title|img|a|section|article|center)\b[^<>]*>)',
+    re.IGNORECASE)
+# Markup removed when counting a document's visible characters (CDATA content is kept)
+_HIDDEN_BLOCK = re.compile(r'<(?:!\[CDATA\[(.*?)\]\]>|!--.*?-->|(script|style|head)\b.*?</\2\s*>)',
+                           re.DOTALL | re.IGNORECASE)
+_HIDDEN_BLOCK_START = re.compile(r'<(?:!|script|style|head)', re.IGNORECASE)
+_TAG = re.compile(r'<[a-zA-Z/!?][^<>]*>')
+_WHITESPACE_CHARS = ' \n\t\r\x0b\x0c\xa0'
+# Private-use character marking block boundaries while the text nodes are joined
+_LINE_MARK = '\ue000'
+
+
+def _collapse(text: str, keep_lines: bool, line_break: str = '\n') -> str:
+    """Collapse whitespace; with keep_lines, per line and dropping blank lines."""
+    if not keep_lines:
+        return ' '.join(text.split())
+    lines = (' '.join(line.split()) for line in text.split(line_break))
+    return '\n'.join(line for line in lines if line)
+
+
+# ----------------------------------------------------------------------
+# HTML
+# ----------------------------------------------------------------------
+
+def _html_strings_lxml(content: str, keep_lines: bool) -> List[str]:
+    parser = etree.HTMLParser(encoding='utf-8', remove_comments=True, remove_pis=True,
+                              huge_tree=True, no_network=True)
+    root = etree.fromstring(content.encode('utf-8', errors='surrogatepass'), parser)
+    if root is None:
+        return []
+    # Empty skipped elements in place so the text on either side stays separate strings
+    for element in list(root.iter(*SKIP_TAGS)):
+        element.clear(keep_tail=True)
+    if keep_lines:
+        for element in root.iter(*BLOCK_TAGS):
+            element.text = _LINE_MARK + (element.text or '')
+            element.tail = _LINE_MARK + (element.tail or '')
+    return list(root.itertext())
+
+
+def _html_strings_soup(content: str, keep_lines: bool) -> List[str]:
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(list(SKIP_TAGS)):
+        element.decompose()
+    if keep_lines:
+        for element in soup(list(BLOCK_TAGS)):
+            element.insert(0, _LINE_MARK)
+            element.insert_after(_LINE_MARK)
+    return list(soup.strings)
+
+
+def _non_whitespace_length(text: str) -> int:
+    return len(text) - sum(text.count(char) for char in _WHITESPACE_CHARS)
+
+
+def _visible_length(content: str) -> int:
+    """Non-whitespace characters left once tags, comments and skipped elements are removed."""
+    if _HIDDEN_BLOCK_START.search(content):
+        content = _HIDDEN_BLOCK.sub(lambda match: match.group(1) or ' ', content)
+    visible = _TAG.sub(' ', content)
+    if '&' in visible:
+        visible = html.unescape(visible)
+    return _non_whitespace_length(visible)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Single-pass stdlib tokenizer used when lxml is not installed."""
+
+    def __init__(self, keep_lines: bool):
+        super().__init__(convert_charrefs=True)
+        self.keep_lines = keep_lines
+        self.strings = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+        elif self.keep_lines and tag in BLOCK_TAGS and not self._skip_depth:
+            self.strings.append(_LINE_MARK)
+
+    def handle_startendtag(self, tag, attrs):
+        if self.keep_lines and tag in BLOCK_TAGS and not self._skip_depth:
+            self.strings.append(_LINE_MARK)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            if tag not in VOID_TAGS and self._skip_depth:
+                self._skip_depth -= 1
+        elif self.keep_lines and tag in BLOCK_TAGS and not self._skip_depth:
+            self.strings.append(_LINE_MARK)
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.strings.append(data)
+
+
+def html_to_text(content: str, keep_lines: bool = False) -> str:
+    """
+    Visible text of an HTML (or XML) document.
+
+    Args:
+        content: Markup
+        keep_lines: One line per block element instead of a single line
+
+    Returns:
+        Normalized text
+    """
+    if LXML_AVAILABLE:
+        text = _collapse(' '.join(_html_strings_lxml(content, keep_lines)), keep_lines, _LINE_MARK)
+        if _non_whitespace_length(text) >= _visible_length(content):
+            return text
+        # lxml dropped text while repairing the markup
+        logger.debug("lxml lost document text; re-parsing with html.parser")
+    if BS4_AVAILABLE:
+        strings = _html_strings_soup(content, keep_lines)
+    else:
+        extractor = _HTMLTextExtractor(keep_lines)
+        extractor.feed(content)
+        extractor.close()
+        strings = extractor.strings
+    return _collapse(' '.join(strings), keep_lines, _LINE_MARK)
+
+
+# ----------------------------------------------------------------------
+# RTF
+# ----------------------------------------------------------------------
+
+_RTF_TOKEN = re.compile(
+    r"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?"   # control word with optional parameter
+    r"|\\'([0-9a-fA-F]{2})"                # hex-escaped byte
+    r"|\\([^a-zA-Z])"                      # control symbol
+    r"|([{}])"                             # group
+    r"|[\r\n]+"                            # source line breaks (not text)
+    r"|([^\\{}\r\n]+)"                     # text run
+)
+
+# Groups starting with these control words hold no document text
+RTF_DESTINATIONS = frozenset((
+    'aftncn', 'aftnsep', 'aftnsepc', 'annotation', 'atnauthor', 'atndate', 'atnicn', 'atnid', 'atnparent',
+    'atnref', 'atntime', 'atrfend', 'atrfstart', 'author', 'background', 'bkmkend', 'bkmkstart', 'blipuid',
+    'buptim', 'category', 'colorschememapping', 'colortbl', 'comment', 'company', 'creatim', 'datafield',
+    'datastore', 'defchp', 'defpap', 'do', 'doccomm', 'docvar', 'dptxbxtext', 'ebcend', 'ebcstart',
+    'factoidname', 'falt', 'fchars', 'ffdeftext', 'ffentrymcr', 'ffexitmcr', 'ffformat', 'ffhelptext', 'ffl',
+    'ffname', 'ffstattext', 'file', 'filetbl', 'fldinst', 'fldtype', 'fname', 'fontemb', 'fontfile',
+    'fonttbl', 'footer', 'footerf', 'footerl', 'footerr', 'footnote', 'formfield', 'ftncn', 'ftnsep',
+    'ftnsepc', 'g', 'generator', 'gridtbl', 'header', 'headerf', 'headerl', 'headerr', 'hl', 'hlfr',
+    'hlinkbase', 'hlloc', 'hlsrc', 'hsv', 'htmltag', 'info', 'keycode', 'keywords', 'latentstyles', 'lchars',
+    'levelnumbers', 'leveltext', 'lfolevel', 'linkval', 'list', 'listlevel', 'listname', 'listoverride',
+    'listoverridetable', 'listpicture', 'liststylename', 'listtable', 'listtext', 'lsdlockedexcept', 'macc',
+    'maccPr', 'mailmerge', 'manager', 'mmath', 'mmathPict', 'mmathPr', 'nesttableprops', 'nextfile',
+    'nonesttables', 'nonshppict', 'objalias', 'objclass', 'objdata', 'object', 'objname', 'objsect',
+    'objtime', 'oldcprops', 'oldpprops', 'oldsprops', 'oldtprops', 'oleclsid', 'operator', 'panose',
+    'password', 'passwordhash', 'pgp', 'pgptbl', 'picprop', 'pict', 'pn', 'pnseclvl', 'pntext', 'pntxta',
+    'pntxtb', 'printim', 'private', 'propname', 'protend', 'protstart', 'protusertbl', 'pxe', 'result',
+    'revtbl', 'revtim', 'rsidtbl', 'rxe', 'shp', 'shpgrp', 'shpinst', 'shppict', 'shprslt', 'shptxt', 'sn',
+    'sp', 'staticval', 'stylesheet', 'subject', 'sv', 'svb', 'tc', 'template', 'themedata', 'title', 'txe',
+    'ud', 'upr', 'userprops', 'wgrffmtfilter', 'windowcaption', 'writereservation', 'writereservhash', 'xe',
+    'xform', 'xmlattrname', 'xmlattrvalue', 'xmlclose', 'xmlname', 'xmlnstbl', 'xmlopen',
+))
+
+RTF_SPECIAL_WORDS = {
+    'par': '\n', 'sect': '\n', 'page': '\n', 'line': '\n', 'row': '\n', 'tab': '\t', 'cell': ' ',
+    'nestcell': ' ', 'emdash': '\u2014', 'endash': '\u2013', 'emspace': '\u2003', 'enspace': '\u2002',
+    'qmspace': '\u2005', 'bullet': '\u2022', 'lquote': '\u2018', 'rquote': '\u2019',
+    'ldblquote': '\u201c', 'rdblquote': '\u201d',
+}
+RTF_SPECIAL_SYMBOLS = {'~': '\u00a0', '-': '', '_': '-', '\\': '\\', '{': '{', '}': '}',
+                       '\n': '\n', '\r': '\n', '\t': '\t'}
+
+_SURROGATES = re.compile('[\ud800-\udfff]')
+
+
+def rtf_to_text(content: str, keep_lines: bool = False) -> str:
+    """
+    Document text of an RTF file.
+
+    Args:
+        content: RTF source
+        keep_lines: One line per paragraph instead of a single line
+
+    Returns:
+        Normalized text
+    """
+    out = []
+    stack = []
+    ignorable = False
+    uc_skip = 1
+    skip = 0
+    codepage = 'cp1252'
+
+    for match in _RTF_TOKEN.finditer(content):
+        word, param, hex_byte, symbol, brace, run = match.groups()
+
+        if brace:
+            skip = 0
+            if brace == '{':
+                stack.append((uc_skip, ignorable))
+            elif stack:
+                uc_skip, ignorable = stack.pop()
+        elif run:
+            if skip:
+                dropped = min(skip, len(run))
+                run = run[dropped:]
+                skip -= dropped
+            if run and not ignorable:
+                out.append(run)
+        elif hex_byte:
+            if skip:
+                skip -= 1
+            elif not ignorable:
+                try:
+                    out.append(bytes([int(hex_byte, 16)]).decode(codepage))
+                except (UnicodeDecodeError, LookupError):
+                    out.append(bytes([int(hex_byte, 16)]).decode('cp1252', errors='replace'))
+        elif symbol:
+            skip = 0
+            if symbol == '*':
+                ignorable = True
+            elif not ignorable and symbol in RTF_SPECIAL_SYMBOLS:
+                out.append(RTF_SPECIAL_SYMBOLS[symbol])
+        elif word:
+            skip = 0
+            if word in RTF_DESTINATIONS:
+                ignorable = True
+            elif word == 'ansicpg' and param:
+                codepage = f'cp{param}'
+            elif ignorable:
+                continue
+            elif word == 'uc':
+                uc_skip = int(param or 1)
+            elif word == 'u' and param:
+                code = int(param)
+                out.append(chr(code + 65536 if code < 0 else code))
+                skip = uc_skip
+            elif word in RTF_SPECIAL_WORDS:
+                out.append(RTF_SPECIAL_WORDS[word])
+
+    text = ''.join(out)
+    if _SURROGATES.search(text):
+        text = text.encode('utf-16', 'surrogatepass').decode('utf-16', errors='replace')
+    return _collapse(text, keep_lines)
+
+
+# ----------------------------------------------------------------------
+# Entry points
+# ----------------------------------------------------------------------
+
+def detect_format(content: str) -> str:
+    """'rtf', 'html' or 'text' from the document content."""
+    head = content[:64].lstrip()
+    if head.startswith('{\\rtf'):
+        return 'rtf'
+    if _MARKUP.search(content):
+        return 'html'
+    return 'text'
+
+
+def normalize_text(content: Optional[str], keep_lines: bool = False) -> str:
+    """
+    Normalized note text for HTML, RTF or plain-text Binary content.
+
+    Args:
+        content: Decoded document content
+        keep_lines: One line per paragraph/block instead of a single line
+
+    Returns:
+        Clean text ('' for empty content)
+    """
+    if not content:
+        return ''
+    fmt = detect_format(content)
+    if fmt == 'rtf':
+        return rtf_to_text(content, keep_lines)
+    if fmt == 'html':
+        return html_to_text(content, keep_lines)
+    if '&' in content:
+        content = html.unescape(content)
+    return _collapse(content, keep_lines)
+
+
+def normalize_many(
+    contents: Iterable[Optional[str]],
+    keep_lines: bool = False,
+    workers: Optional[int] = None,
+    chunksize: int = 8,
+    min_parallel_bytes: int = MIN_PARALLEL_BYTES
+) -> List[str]:
+    """
+    normalize_text() over many documents, in a process pool when worthwhile.
+
+    Args:
+        contents: Decoded document contents (None/'' give '')
+        keep_lines: Passed to normalize_text
+        workers: Pool size (default: CPU count; 1 = in-process)
+        chunksize: Documents per task sent to a worker
+        min_parallel_bytes: Below this total size the pool is not started
+
+    Returns:
+        Normalized texts, in input order
+    """
+    contents = list(contents)
+    total_bytes = sum(len(content) for content in contents if content)
+    if workers == 1 or len(contents) < 2 or total_bytes < min_parallel_bytes:
+        return [normalize_text(content, keep_lines) for content in contents]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(partial(normalize_text, keep_lines=keep_lines), contents,
+                                 chunksize=chunksize))
+    except (OSError, RuntimeError) as e:
+        # e.g. process creation not permitted in this environment
+        logger.warning(f"Process pool unavailable ({e}); normalizing in-process")
+        return [normalize_text(content, keep_lines) for content in contents]
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Compare AthenaQueryEngine.query_many with one query() call per SQL
+
+query_many (and the QueryBatch prefetch the extraction scripts use) replaced
+one start/poll/fetch round trip per query with many queries in flight, their
+states polled together through BatchGetQueryExecution; against a fake Athena
+client (paged GetQueryResults, queries that need several polls, failed
+queries) both must return the same DataFrames, in the caller's order.
+
+Run: python test_athena_query_engine.py  (or python -m pytest test_athena_query_engine.py)
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+from athena_query_engine import AthenaQueryEngine, AthenaQueryError, BATCH_STATUS_LIMIT, QueryBatch
+
+COLUMNS = [('patient_id', 'varchar'), ('value', 'integer'), ('note', 'varchar')]
+
+
+def table(name, n_rows):
+    """Result rows of 'SELECT * FROM <name>': NULL note on every third row"""
+    return [(f'{name}-{i}', str(i), None if i % 3 == 0 else f'note {i}') for i in range(n_rows)]
+
+
+class FakeAthena:
+    """
+    Athena client stand-in: each query needs `polls` status checks to finish.
+
+    Tables named 'fail*' end FAILED; get_query_results pages follow NextToken.
+    """
+
+    def __init__(self, polls=3):
+        self.polls = polls
+        self.executions = {}
+        self.batch_calls = []
+        self.single_status_calls = 0
+        self.result_calls = []
+        self.stopped = []
+        self.max_in_flight = 0
+
+    def start_query_execution(self, QueryString, **kwargs):
+        query_execution_id = f'qe-{len(self.executions)}'
+        name = QueryString.split()[-1]
+        self.executions[query_execution_id] = {
+            'name': name, 'checks': 0, 'done': False,
+            'polls': self.polls * 4 if name.startswith('slow') else self.polls,
+        }
+        in_flight = sum(not e['done'] for e in self.executions.values())
+        self.max_in_flight = max(self.max_in_flight, in_flight)
+        return {'QueryExecutionId': query_execution_id}
+
+    def _describe(self, query_execution_id):
+        execution = self.executions[query_execution_id]
+        execution['checks'] += 1
+        state = 'RUNNING'
+        if execution['checks'] >= execution['polls']:
+            execution['done'] = True
+            state = 'FAILED' if execution['name'].startswith('fail') else 'SUCCEEDED'
+        return {'QueryExecutionId': query_execution_id,
+                'Status': {'State': state, 'StateChangeReason': 'SYNTAX_ERROR'}}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        assert len(QueryExecutionIds) <= BATCH_STATUS_LIMIT
+        self.batch_calls.append(list(QueryExecutionIds))
+        return {'QueryExecutions': [self._describe(q) for q in QueryExecutionIds],
+                'UnprocessedQueryExecutionIds': []}
+
+    def get_query_execution(self, QueryExecutionId):
+        self.single_status_calls += 1
+        return {'QueryExecution': self._describe(QueryExecutionId)}
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        name = self.executions[QueryExecutionId]['name']
+        self.result_calls.append((QueryExecutionId, NextToken))
+        header = {'Data': [{'VarCharValue': column} for column, _ in COLUMNS]}
+        rows = [header] + [
+            {'Data': [{} if value is None else {'VarCharValue': value} for value in row]}
+            for row in table(name, int(name.split('_')[-1]))
+        ]
+        start = int(NextToken or 0)
+        page = {'ResultSet': {
+            'Rows': rows[start:start + MaxResults],
+            'ResultSetMetadata': {'ColumnInfo': [{'Name': c, 'Type': t} for c, t in COLUMNS]},
+        }}
+        if start + MaxResults < len(rows):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+    def stop_query_execution(self, QueryExecutionId):
+        self.stopped.append(QueryExecutionId)
+        self.executions[QueryExecutionId]['done'] = True
+
+
+def engine_for(athena, **kwargs):
+    return AthenaQueryEngine(athena, database='fhir_db', output_location='s3://results/',
+                             poll_initial=0.001, poll_max=0.001, page_size=7, **kwargs)
+
+
+QUERIES = {
+    'empty': 'SELECT * FROM empty_0',
+    'one page': 'SELECT * FROM one_page_5',
+    'page boundary': 'SELECT * FROM boundary_6',
+    'several pages': 'SELECT * FROM several_pages_40',
+    'slow': 'SELECT * FROM slow_12',
+}
+
+
+def test_query_many_matches_query():
+    for typed, na_value in ((True, None), (False, ''), (False, None)):
+        expected = {key: engine_for(FakeAthena()).query(sql, typed=typed, na_value=na_value)
+                    for key, sql in QUERIES.items()}
+
+        athena = FakeAthena()
+        results = engine_for(athena).query_many(QUERIES, typed=typed, na_value=na_value)
+
+        assert list(results) == list(QUERIES)
+        for key in QUERIES:
+            pd.testing.assert_frame_equal(results[key], expected[key])
+        assert len(results['several pages']) == 40
+
+        # States come from BatchGetQueryExecution only; every result page was followed
+        assert athena.single_status_calls == 0
+        assert athena.max_in_flight == len(QUERIES)
+        assert [token for qe, token in athena.result_calls if athena.executions[qe]['name'] == 'several_pages_40'] \
+            == [None] + [str(start) for start in range(7, 41, 7)]
+
+
+def test_query_many_concurrency_limit():
+    queries = {f'query {i}': f'SELECT * FROM t{i}_{i % 9}' for i in range(120)}
+    athena = FakeAthena()
+    results = engine_for(athena, max_concurrency=60).query_many(queries, typed=False)
+
+    assert athena.max_in_flight == 60
+    assert max(len(ids) for ids in athena.batch_calls) == BATCH_STATUS_LIMIT
+    assert list(results) == list(queries)
+    for i in range(120):
+        assert results[f'query {i}']['patient_id'].tolist() == [f't{i}_{i % 9}-{j}' for j in range(i % 9)]
+
+
+def test_query_many_failures():
+    queries = dict(QUERIES, failed='SELECT * FROM fail_3')
+
+    athena = FakeAthena()
+    try:
+        engine_for(athena).query_many(queries)
+    except AthenaQueryError as e:
+        assert str(e).startswith('failed: ')
+    else:
+        raise AssertionError('query_many did not raise')
+    # The slow query was still running and is stopped rather than left behind
+    assert [athena.executions[qe]['name'] for qe in athena.stopped] == ['slow_12']
+
+    athena = FakeAthena()
+    errors = {}
+    results = engine_for(athena).query_many(queries, raise_on_error=False, errors=errors)
+    assert list(results) == list(queries)
+    assert list(errors) == ['failed'] and isinstance(errors['failed'], AthenaQueryError)
+    assert results['failed'].empty
+    assert len(results['several pages']) == 40
+    assert athena.stopped == []
+
+
+def test_query_batch_hands_out_results_by_sql():
+    queries = dict(QUERIES, failed='SELECT * FROM fail_3')
+    batch = QueryBatch(engine_for(FakeAthena()), queries, typed=False, na_value='')
+
+    expected = engine_for(FakeAthena()).query(QUERIES['several pages'], typed=False, na_value='')
+    pd.testing.assert_frame_equal(batch.take(QUERIES['several pages']), expected)
+    assert batch.take(QUERIES['empty']).empty
+
+    # Taken results are released; unknown SQL is left to the caller to run
+    assert batch.take(QUERIES['several pages']) is None
+    assert batch.take('SELECT * FROM other_2') is None
+
+    try:
+        batch.take(queries['failed'])
+    except AthenaQueryError as e:
+        assert 'SYNTAX_ERROR' in str(e)
+    else:
+        raise AssertionError('failed query was handed out as a result')
+
+
+if __name__ == '__main__':
+    for test in (test_query_many_matches_query, test_query_many_concurrency_limit,
+                 test_query_many_failures, test_query_batch_hands_out_results_by_sql):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Compare the chemotherapy name matching with the row loops it replaced
+
+AliasAutomaton, ComprehensiveChemotherapyIdentifier._match_by_name and
+ChemoReferenceIndex.alias_lookup replaced a per-row, per-pattern substring
+loop and an iterrows() alias table build; on these fixtures (overlapping and
+mixed-case patterns, missing names, missing normalized keys, repeated aliases)
+both must give the same matches. The compiled index must also survive its
+JSON cache unchanged.
+
+Run: python test_chemo_matching.py  (or python -m pytest test_chemo_matching.py)
+"""
+
+import json
+import random
+import stat
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent / 'local_llm_extraction' / 'event_based_extraction'))
+from chemo_reference_index import ChemoReferenceIndex, load_reference_index, normalize_text
+from comprehensive_chemotherapy_identifier import ComprehensiveChemotherapyIdentifier
+from text_matching import AliasAutomaton
+
+PATTERNS = {
+    'lomustine': ['lomustine', 'CCNU', 'ceenu'],
+    'carmustine': ['carmustine', 'bcnu'],
+    'short': ['a', 'ab'],
+    'overlap': ['bab', 'abab'],
+    'suffix': ['nu'],
+    'no patterns': [],
+}
+
+MEDICATIONS = pd.DataFrame({
+    'medication_name': ['Lomustine 40 mg capsule', 'CeeNU', 'carmustine (BCNU) wafer', 'ondansetron',
+                        None, np.nan, '', 'Avastin 100 mg/4 mL', 'vincristine / VINBLASTINE', 'ccnu', '5-FU'],
+}, index=[10, 3, 7, 0, 21, 22, 5, 8, 9, 1, 2])
+
+DRUGS = pd.DataFrame({
+    'drug_id': ['D1', 'D2', 'D3', 'D4', 'D5'],
+    'preferred_name': ['carboplatin', 'vincristine', 'ondansetron', 'lomustine', 'withdrawn drug'],
+    'approval_status': ['FDA_approved', 'investigational', 'FDA_approved', 'FDA_approved', 'withdrawn'],
+    'rxnorm_in': [40048.0, 11202.0, 26225.0, np.nan, 1500.5],
+    'is_supportive_care': [False, False, True, False, False],
+})
+
+ALIASES = pd.DataFrame({
+    'drug_id': ['D1', 'D1', 'D2', 'D3', 'D4', 'D2', 'D5', 'D4'],
+    'alias': ['Paraplatin', 'CBDCA', 'Oncovin', 'Zofran', 'CeeNU', 'Paraplatin', 'old name', '--'],
+    'normalized_key': ['paraplatin', np.nan, 'oncovin', 'zofran', np.nan, 'paraplatin', 'oldname', np.nan],
+})
+
+RXNORM_MAP = pd.DataFrame({
+    'code_cui': [1000.0, 1001.0, 1000.0, np.nan, 1002.0],
+    'ingredient_rxcui': [40048.0, 26225.0, 11202.0, 40048.0, np.nan],
+})
+
+
+def keys_in_loop(patterns, text):
+    """The original name match: every pattern of every key tested with `in`"""
+    return [key for key, names in patterns.items() if any(name.lower() in text for name in names)]
+
+
+def test_automaton_matches_substring_loop():
+    automaton = AliasAutomaton(PATTERNS)
+    rng = random.Random(24)
+    texts = ['', 'lomustine', 'xccnux', 'bcnu and ceenu', 'ababab', 'bab', 'nunu'] \
+        + [''.join(rng.choice('abcenu ') for _ in range(rng.randint(0, 20))) for _ in range(500)]
+    for text in texts:
+        assert automaton.keys_in(text) == keys_in_loop(PATTERNS, text), text
+
+    # An empty pattern matches every text
+    assert AliasAutomaton({'any': [''], 'b': ['b']}).keys_in('xyz') == ['any']
+
+
+def test_match_by_name_matches_row_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        identifier = ComprehensiveChemotherapyIdentifier(Path(tmp) / 'missing')
+
+    expected = []
+    for idx, row in MEDICATIONS.iterrows():
+        med_name = str(row.get('medication_name', '')).lower()
+        matched_drugs = keys_in_loop(identifier.CHEMO_PATTERNS, med_name)
+        if matched_drugs:
+            expected.append((idx, matched_drugs, row.get('medication_name', '')))
+
+    matches = identifier._match_by_name(MEDICATIONS)
+    assert [(m['index'], m['matched_drugs'], m['medication_name']) for m in matches] == expected
+
+
+def test_alias_lookup_matches_row_loop():
+    chemo_drug_ids = set(DRUGS[
+        (DRUGS['approval_status'].isin(['FDA_approved', 'investigational'])) &
+        (DRUGS['is_supportive_care'] == False)
+    ]['drug_id'])
+    expected = {}
+    for _, row in ALIASES[ALIASES['drug_id'].isin(chemo_drug_ids)].iterrows():
+        normalized = row['normalized_key'] if pd.notna(row['normalized_key']) else normalize_text(row.iloc[1])
+        if normalized:
+            expected[normalized] = row['drug_id']
+
+    index = ChemoReferenceIndex(DRUGS, ALIASES, RXNORM_MAP)
+    assert index.alias_lookup == expected
+    assert list(index.alias_lookup) == list(expected)
+
+
+def test_index_survives_json_cache():
+    index = ChemoReferenceIndex(DRUGS, ALIASES, RXNORM_MAP)
+    restored = ChemoReferenceIndex.from_dict(json.loads(json.dumps(index.to_dict())))
+    assert restored.to_dict() == index.to_dict()
+    assert restored.alias_lookup == index.alias_lookup
+    assert restored.product_to_ingredient == index.product_to_ingredient
+    assert restored.ingredient_table.equals(index.ingredient_table)
+    assert restored.product_table.equals(index.product_table)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [Path(tmp) / name for name in ('drugs.csv', 'drug_alias.csv', 'rxnorm_code_map.csv')]
+        for frame, path in zip((DRUGS, ALIASES, RXNORM_MAP), files):
+            frame.to_csv(path, index=False)
+        cache_dir = Path(tmp) / 'index'
+        loaded = load_reference_index(*files, cache_dir=cache_dir)
+
+        assert stat.S_IMODE(cache_dir.stat().st_mode) == 0o700
+        cached = [json.loads(path.read_text()) for path in cache_dir.glob('*.json')]
+        assert len(cached) == 1
+        assert ChemoReferenceIndex.from_dict(cached[0]['index']).to_dict() == loaded.to_dict()
+
+
+if __name__ == '__main__':
+    for test in (test_automaton_matches_substring_loop, test_match_by_name_matches_row_loop,
+                 test_alias_lookup_matches_row_loop, test_index_survives_json_cache):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Compare cohort-batched extractor queries with per-patient runs
+
+cohort_batch_extraction.rewrite_for_cohort / split_by_patient replace one
+query per patient with one query per batch split by patient; on the real
+extractor SQL (direct `=` filter, `Patient/` prefix, parent-table subquery,
+the patient ID selected as a literal column, joins) run against an
+in-memory SQLite copy of the tables, every patient's split must equal the
+per-patient query. Shapes the rewriter rejects (EXISTS, UNION, GROUP BY)
+must raise CohortRewriteError and fall back to the per-patient query.
+
+Run: python test_cohort_batch_extraction.py  (or python -m pytest test_cohort_batch_extraction.py)
+"""
+
+import contextlib
+import io
+import logging
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / 'athena_extraction_validation' / 'scripts' / 'config_driven_versions'))
+from cohort_batch_extraction import (CohortPatientEngine, CohortQueryBatcher, CohortRewriteError,
+                                     PATIENT_PLACEHOLDER, rewrite_for_cohort, split_by_patient)
+from extract_all_encounters_metadata import AllEncountersExtractor
+from extract_all_imaging_metadata import ImagingExtractor
+from extract_all_measurements_metadata import MeasurementsExtractor
+from extract_all_procedures_metadata import AllProceduresExtractor
+
+logging.disable(logging.WARNING)
+
+DATABASE = 'fhir_db'
+# Batch patients (one without any rows) and a patient outside the batch
+PATIENTS = ['e4BwD8ZYDBccepXcJ.Ilo3w3', 'xQ9rT2mN7vK1pL4sW8yZ0a', 'noRowsPatient000000000a']
+OTHER = 'otherPatient9999999999z'
+P1, P2 = PATIENTS[:2]
+
+# (schema, table) -> rows; columns missing from a row are filled with '<table>.<column>.<n>'
+TABLES = {
+    (DATABASE, 'encounter'): (
+        ['id', 'subject_reference', 'status', 'class_code', 'class_display', 'service_type_text', 'priority_text',
+         'period_start', 'period_end', 'length_value', 'length_unit', 'service_provider_display',
+         'part_of_reference'],
+        [{'id': 'E1', 'subject_reference': P1, 'period_start': '2020-01-02'},
+         # Duplicate parent row: must not multiply the child rows
+         {'id': 'E1', 'subject_reference': P1, 'period_start': '2020-01-02'},
+         {'id': 'E2', 'subject_reference': P1, 'period_start': '2019-05-01'},
+         {'id': 'E3', 'subject_reference': P2, 'period_start': '2021-03-04'},
+         {'id': 'E4', 'subject_reference': OTHER, 'period_start': '2018-01-01'}],
+    ),
+    (DATABASE, 'encounter_type'): (
+        ['encounter_id', 'type_coding', 'type_text'],
+        [{'encounter_id': e} for e in ('E1', 'E1', 'E2', 'E3', 'E4', 'E9')],
+    ),
+    (DATABASE, 'appointment'): (
+        ['id', 'status', 'start'],
+        [{'id': 'A1', 'start': '2020-02-01'}, {'id': 'A2', 'start': '2021-01-01'},
+         {'id': 'A3', 'start': '2019-07-07'}, {'id': 'A4', 'start': '2022-01-01'}],
+    ),
+    (DATABASE, 'appointment_participant'): (
+        ['appointment_id', 'participant_actor_reference', 'participant_actor_type', 'participant_required',
+         'participant_status', 'participant_period_start', 'participant_period_end'],
+        [{'appointment_id': 'A1', 'participant_actor_reference': f'Patient/{P1}'},
+         {'appointment_id': 'A2', 'participant_actor_reference': f'Patient/{P2}'},
+         {'appointment_id': 'A3', 'participant_actor_reference': f'Patient/{P1}'},
+         {'appointment_id': 'A3', 'participant_actor_reference': 'Practitioner/X'},
+         {'appointment_id': 'A4', 'participant_actor_reference': f'Patient/{OTHER}'}],
+    ),
+    (DATABASE, 'procedure'): (
+        ['id', 'subject_reference'],
+        [{'id': 'PR1', 'subject_reference': P1}, {'id': 'PR2', 'subject_reference': P2},
+         {'id': 'PR3', 'subject_reference': OTHER}],
+    ),
+    (DATABASE, 'procedure_code_coding'): (
+        ['procedure_id', 'code_coding_system', 'code_coding_code', 'code_coding_display'],
+        [{'procedure_id': 'PR1', 'code_coding_code': '61510'}, {'procedure_id': 'PR1', 'code_coding_code': '00210'},
+         {'procedure_id': 'PR2', 'code_coding_code': '61510'}, {'procedure_id': 'PR3', 'code_coding_code': '1'}],
+    ),
+    (DATABASE, 'diagnostic_report'): (
+        ['id', 'status', 'code_text', 'subject_reference', 'encounter_reference', 'effective_date_time', 'issued',
+         'effective_period_start', 'effective_period_stop', 'conclusion'],
+        [{'id': f'R{i}'} for i in range(1, 6)],
+    ),
+    (DATABASE, 'diagnostic_report_category'): (
+        ['diagnostic_report_id', 'category_text'],
+        [{'diagnostic_report_id': 'R1', 'category_text': 'Radiology'},
+         {'diagnostic_report_id': 'R1', 'category_text': 'Imaging'},
+         {'diagnostic_report_id': 'R3', 'category_text': 'Radiology'}],
+    ),
+    (DATABASE, 'medication_request'): (
+        ['medication_request_id', 'subject_reference'],
+        [{'medication_request_id': 'M1', 'subject_reference': f'Patient/{P1}'},
+         {'medication_request_id': 'M2', 'subject_reference': f'Patient/{P2}'}],
+    ),
+    (DATABASE, 'medication_request_based_on'): (
+        ['medication_request_id', 'based_on_reference', 'based_on_display'],
+        [{'medication_request_id': 'M1', 'based_on_reference': 'CarePlan/C1', 'based_on_display': 'Plan'},
+         {'medication_request_id': 'M2', 'based_on_reference': 'CarePlan/C2', 'based_on_display': 'Plan'}],
+    ),
+    ('main', 'radiology_imaging_mri'): (
+        ['patient_id', 'imaging_procedure_id', 'result_datetime', 'imaging_procedure', 'result_diagnostic_report_id'],
+        [{'patient_id': P1, 'imaging_procedure_id': 'I1', 'result_datetime': '2020-01-01', 'result_diagnostic_report_id': 'R1'},
+         {'patient_id': P1, 'imaging_procedure_id': 'I2', 'result_datetime': '2021-01-01', 'result_diagnostic_report_id': 'R2'},
+         {'patient_id': P2, 'imaging_procedure_id': 'I3', 'result_datetime': '2020-06-01', 'result_diagnostic_report_id': 'R3'},
+         {'patient_id': P2, 'imaging_procedure_id': 'I5', 'result_datetime': '2020-07-01', 'result_diagnostic_report_id': None},
+         {'patient_id': OTHER, 'imaging_procedure_id': 'I4', 'result_datetime': '2020-01-01', 'result_diagnostic_report_id': 'R4'}],
+    ),
+    ('main', 'radiology_imaging'): (
+        ['patient_id', 'imaging_procedure_id', 'result_datetime', 'imaging_procedure', 'result_diagnostic_report_id'],
+        # R1 is also an MRI report: reported once
+        [{'patient_id': P1, 'imaging_procedure_id': 'I6', 'result_datetime': '2020-01-01', 'result_diagnostic_report_id': 'R1'},
+         {'patient_id': P2, 'imaging_procedure_id': 'I7', 'result_datetime': '2019-01-01', 'result_diagnostic_report_id': 'R5'}],
+    ),
+    ('main', 'radiology_imaging_mri_results'): (
+        ['imaging_procedure_id', 'result_information', 'result_display'],
+        [{'imaging_procedure_id': 'I1', 'result_information': 'stable', 'result_display': 'Narrative'},
+         {'imaging_procedure_id': 'I1', 'result_information': 'stable', 'result_display': 'Narrative'},
+         {'imaging_procedure_id': 'I2'}, {'imaging_procedure_id': 'I3'}, {'imaging_procedure_id': 'I4'}],
+    ),
+    ('main', 'lab_tests'): (
+        ['test_id', 'patient_id'],
+        [{'test_id': 'T1', 'patient_id': P1}, {'test_id': 'T2', 'patient_id': P2}, {'test_id': 'T3', 'patient_id': OTHER}],
+    ),
+    ('main', 'lab_test_results'): (
+        ['test_id', 'test_component', 'value_string', 'value_quantity_value', 'value_quantity_unit',
+         'value_codeable_concept_text', 'value_range_low_value', 'value_range_low_unit', 'value_range_high_value',
+         'value_range_high_unit', 'value_boolean', 'value_integer'],
+        [{'test_id': t} for t in ('T1', 'T1', 'T2', 'T3')],
+    ),
+}
+
+# The imaging extractor's MRI results and diagnostic report queries before they became joins
+MRI_RESULTS_EXISTS = f"""
+        SELECT DISTINCT
+            results.imaging_procedure_id,
+            results.result_information,
+            results.result_display
+        FROM radiology_imaging_mri_results results
+        WHERE EXISTS (
+            SELECT 1
+            FROM radiology_imaging_mri mri
+            WHERE mri.imaging_procedure_id = results.imaging_procedure_id
+            AND mri.patient_id = '{PATIENT_PLACEHOLDER}'
+        )
+        """
+
+REPORTS_UNION = f"""
+        SELECT DISTINCT
+            dr.id as diagnostic_report_id,
+            dr.status as report_status
+        FROM {DATABASE}.diagnostic_report dr
+        WHERE dr.id IN (
+            SELECT DISTINCT result_diagnostic_report_id
+            FROM radiology_imaging_mri
+            WHERE patient_id = '{PATIENT_PLACEHOLDER}'
+            AND result_diagnostic_report_id IS NOT NULL
+            UNION
+            SELECT DISTINCT result_diagnostic_report_id
+            FROM radiology_imaging
+            WHERE patient_id = '{PATIENT_PLACEHOLDER}'
+            AND result_diagnostic_report_id IS NOT NULL
+        )
+        """
+
+# discover_care_plan_linkages.py's care plan query (without its LIMIT)
+CARE_PLANS_GROUP_BY = f"""
+    SELECT DISTINCT
+        mrb.based_on_reference,
+        mrb.based_on_display,
+        COUNT(*) as medication_count
+    FROM {DATABASE}.medication_request mr
+    JOIN {DATABASE}.medication_request_based_on mrb
+        ON mr.medication_request_id = mrb.medication_request_id
+    WHERE mr.subject_reference = 'Patient/{PATIENT_PLACEHOLDER}'
+        AND mrb.based_on_reference IS NOT NULL
+        AND mrb.based_on_reference LIKE 'CarePlan/%'
+    GROUP BY mrb.based_on_reference, mrb.based_on_display
+    ORDER BY medication_count DESC
+    """
+
+
+def extractors():
+    """The config-driven extractors, built for the placeholder patient (banners silenced)"""
+    config = {'fhir_id': PATIENT_PLACEHOLDER, 'output_dir': 'unused', 'database': DATABASE,
+              'aws_profile': 'unused', 's3_output': 's3://unused/'}
+    engine = type('NoAthena', (), {'athena': None})()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            'encounters': AllEncountersExtractor('unused', DATABASE, config, engine=engine),
+            'procedures': AllProceduresExtractor('unused', DATABASE, config, engine=engine),
+            'imaging': ImagingExtractor(config, engine=engine),
+            'measurements': MeasurementsExtractor(config, engine=engine),
+        }
+
+
+# (extractor, query builder, expected key prefix)
+BATCHED = [
+    ('encounters', 'main_encounters_query', ''),             # e.subject_reference = '<id>'
+    ('encounters', 'appointments_query', 'Patient/'),        # = 'Patient/<id>' on a joined table
+    ('encounters', 'encounter_types_query', ''),             # IN (SELECT id FROM encounter WHERE ...)
+    ('measurements', 'lab_test_results_query', ''),          # IN (SELECT test_id FROM lab_tests WHERE ...)
+    ('imaging', 'mri_imaging_query', ''),                    # '<id>' as patient_mrn
+    ('imaging', 'mri_results_query', ''),                    # joined to the patient's MRI rows
+    ('imaging', 'diagnostic_reports_query', ''),             # joined to a UNION ALL subquery, GROUP BY in a CTE
+    ('procedures', 'procedure_codes_query', ''),
+]
+
+# (template, expected CohortRewriteError message)
+REJECTED = [
+    (MRI_RESULTS_EXISTS, 'No top-level patient filter'),
+    (REPORTS_UNION, 'No top-level patient filter'),
+    (CARE_PLANS_GROUP_BY, 'GROUP BY cannot be batched'),
+]
+
+
+def connect():
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    connection.execute(f"ATTACH DATABASE ':memory:' AS {DATABASE}")
+    for (schema, name), (columns, rows) in TABLES.items():
+        connection.execute(f"CREATE TABLE {schema}.{name} ({', '.join(columns)})")
+        values = [[row.get(c, f'{name}.{c}.{n}') for c in columns] for n, row in enumerate(rows)]
+        connection.executemany(f"INSERT INTO {schema}.{name} VALUES ({', '.join('?' * len(columns))})", values)
+    return connection
+
+
+def sqlite_sql(sql):
+    """Athena's LISTAGG ... WITHIN GROUP has no SQLite spelling: GROUP_CONCAT keeps the same rows"""
+    return re.sub(r"LISTAGG\((DISTINCT \w+), '[^']*'\) WITHIN GROUP \(ORDER BY \w+\)", r'GROUP_CONCAT(\1)', sql)
+
+
+class SqliteEngine:
+    """AthenaQueryEngine stand-in running the SQL on the SQLite tables"""
+
+    athena = None
+    database = DATABASE
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.queries = []
+
+    def query(self, query, database=None, typed=True, na_value=None, fetch_mode=None):
+        self.queries.append(query)
+        return pd.read_sql_query(sqlite_sql(query), self.connection)
+
+
+def assert_same_rows(actual, expected, ordered):
+    assert list(actual.columns) == list(expected.columns)
+    actual = actual.astype(object).where(actual.notna(), None)
+    expected = expected.astype(object).where(expected.notna(), None)
+    rows, expected_rows = actual.values.tolist(), expected.values.tolist()
+    if not ordered:
+        rows, expected_rows = sorted(rows, key=str), sorted(expected_rows, key=str)
+    assert rows == expected_rows
+
+
+def test_batched_queries_split_like_per_patient_runs():
+    connection = connect()
+    built = extractors()
+    for extractor, builder, prefix in BATCHED:
+        template = getattr(built[extractor], builder)()
+        cohort_sql, key_prefix = rewrite_for_cohort(template, PATIENTS)
+        assert key_prefix == prefix, builder
+
+        cohort_df = pd.read_sql_query(sqlite_sql(cohort_sql), connection)
+        split = split_by_patient(cohort_df, PATIENTS, key_prefix)
+        assert list(split) == PATIENTS
+
+        for patient_id in PATIENTS:
+            expected = pd.read_sql_query(sqlite_sql(template.replace(PATIENT_PLACEHOLDER, patient_id)), connection)
+            assert_same_rows(split[patient_id], expected, ordered='ORDER BY' in template)
+        assert len(split[P1]) > 0 and split[PATIENTS[2]].empty, builder
+
+
+def test_rejected_shapes_fall_back_to_per_patient_queries():
+    connection = connect()
+    for template, message in REJECTED:
+        try:
+            rewrite_for_cohort(template, PATIENTS)
+        except CohortRewriteError as e:
+            assert message in str(e), str(e)
+        else:
+            raise AssertionError(f'rewrite accepted: {template}')
+
+        engine = SqliteEngine(connection)
+        batcher = CohortQueryBatcher(engine, PATIENTS)
+        for patient_id in PATIENTS:
+            sql = template.replace(PATIENT_PLACEHOLDER, patient_id)
+            df = CohortPatientEngine(batcher, patient_id).query(sql, typed=False)
+            assert_same_rows(df, pd.read_sql_query(sqlite_sql(sql), connection), ordered=True)
+        assert batcher.batched_queries == 0 and batcher.fallback_queries == len(PATIENTS)
+        assert engine.queries == [template.replace(PATIENT_PLACEHOLDER, p) for p in PATIENTS]
+
+
+def test_batcher_runs_each_shape_once():
+    connection = connect()
+    built = extractors()
+    engine = SqliteEngine(connection)
+    batcher = CohortQueryBatcher(engine, PATIENTS)
+    for extractor, builder, _ in BATCHED:
+        template = getattr(built[extractor], builder)()
+        for patient_id in PATIENTS:
+            sql = template.replace(PATIENT_PLACEHOLDER, patient_id)
+            df = CohortPatientEngine(batcher, patient_id).query(sql, typed=False)
+            assert_same_rows(df, pd.read_sql_query(sqlite_sql(sql), connection), ordered='ORDER BY' in sql)
+
+    assert batcher.batched_queries == len(BATCHED) == len(engine.queries)
+    assert batcher.fallback_queries == 0
+
+
+if __name__ == '__main__':
+    for test in (test_batched_queries_split_like_per_patient_runs,
+                 test_rejected_shapes_fall_back_to_per_patient_queries, test_batcher_runs_each_shape_once):
+        test()
+        print(f"✅ {test.__name__}")
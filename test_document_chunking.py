@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Check document_chunking windows against the whole-note prompt they replace
+
+A note within the token budget must be one window holding the note unchanged
+(the prompt the pipeline sent before). Longer notes must be covered completely
+by windows that are slices of the note, within the budget, with every sentence
+whole in at least one window.
+
+Run: python test_document_chunking.py  (or python -m pytest test_document_chunking.py)
+"""
+
+import random
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+from document_chunking import CHARS_PER_TOKEN, chunk_document, merge_window_answers, select_windows
+
+WORDS = ('patient tumor resection MRI enhancement cerebellar pilocytic astrocytoma stable residual '
+         'vinblastine carboplatin ataxia headache imaging ventricle hydrocephalus shunt biopsy').split()
+
+
+def build_note(seed, sections=12):
+    rng = random.Random(seed)
+    parts = []
+    for i in range(sections):
+        header = rng.choice(['IMPRESSION:', 'FINDINGS:', 'Findings:', 'HISTORY:', 'Plan:'])
+        sentences = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize() + '.'
+                     for _ in range(rng.randint(2, 12))]
+        if i == 3:
+            sentences.append(' '.join(['residual'] * 400) + '.')  # longer than a window
+        parts.append(header + '\n' + ' '.join(sentences))
+    return '\n\n'.join(parts)
+
+
+def test_note_within_budget_is_unchanged():
+    note = 'IMPRESSION: Stable post-operative changes. No residual enhancing tumor.'
+    windows = chunk_document(note, max_tokens=100)
+    assert len(windows) == 1
+    assert windows[0]['text'] == note and (windows[0]['start'], windows[0]['end']) == (0, len(note))
+    assert select_windows(windows, ['resect*']) == windows
+    assert merge_window_answers(['Gross total resection']) == 'Gross total resection'
+
+
+def test_windows_cover_long_notes():
+    for seed in range(5):
+        note = build_note(seed)
+        for max_tokens in (64, 200, 500):
+            windows = chunk_document(note, max_tokens=max_tokens)
+            assert len(windows) > 1
+            covered = [False] * len(note)
+            for position, window in enumerate(windows):
+                assert window['index'] == position
+                assert window['text'] == note[window['start']:window['end']]
+                assert len(window['text']) <= max_tokens * CHARS_PER_TOKEN
+                for i in range(window['start'], window['end']):
+                    covered[i] = True
+            missing = ''.join(char for char, seen in zip(note, covered) if not seen)
+            assert not missing.strip(), (seed, max_tokens, missing[:80])
+
+            # Every sentence that fits a window is whole in one of them
+            for match in re.finditer(r'[^.\n]+\.', note):
+                sentence = match.group().strip()
+                if len(sentence) <= max_tokens * CHARS_PER_TOKEN:
+                    assert any(sentence in window['text'] for window in windows), (seed, max_tokens, sentence)
+
+
+def test_merge_window_answers():
+    assert merge_window_answers(['Not found', 'Gross total resection', 'gross total resection.', 'ERROR']) \
+        == 'Gross total resection'
+    assert merge_window_answers(['Not documented', 'Unavailable']) == 'Not documented'
+
+
+if __name__ == '__main__':
+    for test in (test_note_within_budget_is_unchanged, test_windows_cover_long_notes, test_merge_window_answers):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Compare Phase 3 document scoring and selection with the per-term implementation
+
+IntelligentDocumentSelector._score_documents / _select_top_documents replaced
+one str.contains() pass per KEY_TERMS term, nested np.where per key date and
+an iterrows() quota walk; on these fixtures (missing dates and descriptions,
+overlapping and mixed-case terms, window boundaries, type quotas) both must
+give the same scores, reasons and selected documents.
+
+Run: python test_document_selector.py  (or python -m pytest test_document_selector.py)
+"""
+
+import logging
+import sys
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent / 'local_llm_extraction' / 'event_based_extraction'))
+from phase3_intelligent_document_selector import IntelligentDocumentSelector
+
+logging.disable(logging.INFO)
+
+KEY_DATES = {
+    'initial_surgery': pd.Timestamp('2018-05-28', tz='UTC'),
+    'chemo_start': pd.Timestamp('2019-05-30', tz='UTC'),
+    'progression': pd.Timestamp('2020-11-02', tz='UTC'),
+    'missing': pd.NaT,
+}
+
+RECENT = (pd.Timestamp.now(tz='UTC') - timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%S')
+
+DOCUMENTS = [
+    ('Operative note', '2018-05-28T08:00:00', 'Gross total resection; no RESIDUAL tumor'),
+    ('Operative note', '2018-06-04T23:59:59', 'Partial resection, extent limited'),
+    ('Pathology report', '2018-06-05T00:00:00', 'Pilocytic astrocytoma, WHO grade I, Ki-67 2%, BRAF fusion'),
+    ('MRI brain', '2018-06-27', 'Stable disease'),
+    ('MRI brain', '2018-08-26', 'drop metastasis in spine; leptomeningeal'),
+    ('MRI brain', '2020-10-26', 'New enhancement concerning for progression; progressive disease'),
+    ('MRI brain', None, 'mixed response'),
+    ('Progress note', '2019-05-23', None),
+    ('Progress note', '2019-11-26', ''),
+    ('Oncology clinic visit', '2019-06-29', 'IDH wildtype glioma, molecular panel pending'),
+    ('Telephone encounter', RECENT, 'worsening headache'),
+    ('Telephone encounter', '2016-01-01', 'routine'),
+    ('Discharge summary', '2020-11-09', 'recurrence; increased size; growing; disseminated; metastatic'),
+] + [('Operative note', f'2018-0{month}-15', 'subtotal resection') for month in range(1, 10)] \
+  + [('Consult', f'2017-{month:02d}-01', 'complete response') for month in range(1, 13)]
+
+
+def binary_metadata():
+    df = pd.DataFrame(DOCUMENTS, columns=['file_name', 'document_date', 'description'])
+    df['document_id'] = [f'Binary/{i}' for i in range(len(df))]
+    df['document_date'] = pd.to_datetime(df['document_date'], utc=True, format='ISO8601')
+    df['document_type'] = df['file_name'].apply(IntelligentDocumentSelector._classify_document_type)
+    return df
+
+
+def score_per_term(selector, df, key_dates):
+    """The original _score_documents: one pass per key date and per KEY_TERMS term"""
+    df['priority_score'] = 0
+    df['scoring_reasons'] = ''
+    df['type_score'] = df['document_type'].map(lambda x: 11 - selector.DOCUMENT_PRIORITIES.get(x, 6))
+    df['priority_score'] += df['type_score']
+    df['temporal_score'] = 0
+    for event_name, event_date in key_dates.items():
+        if pd.notna(event_date):
+            days_diff = np.abs((df['document_date'] - event_date).dt.days)
+            proximity_score = np.where(
+                days_diff <= 7, 10,
+                np.where(days_diff <= 30, 7,
+                np.where(days_diff <= 90, 4,
+                np.where(days_diff <= 180, 2,
+                0)))
+            )
+            df['temporal_score'] = np.maximum(df['temporal_score'], proximity_score)
+            high_score_mask = proximity_score >= 7
+            df.loc[high_score_mask, 'scoring_reasons'] += f'{event_name}({proximity_score[high_score_mask].max()});'
+    df['priority_score'] += df['temporal_score']
+    df['content_score'] = 0
+    for category, terms in selector.KEY_TERMS.items():
+        for term in terms:
+            mask = df['description'].str.contains(term, case=False, na=False)
+            df.loc[mask, 'content_score'] += 1
+            df.loc[mask, 'scoring_reasons'] += f'{category}:{term};'
+    df['content_score'] = np.minimum(df['content_score'], 5)
+    df['priority_score'] += df['content_score']
+    recent_cutoff = pd.Timestamp.now(tz='UTC') - timedelta(days=730)
+    df.loc[df['document_date'] > recent_cutoff, 'priority_score'] += 2
+    df.loc[df['document_date'] > recent_cutoff, 'scoring_reasons'] += 'recent;'
+    return df
+
+
+def select_iterrows(selector, df, max_documents):
+    """The original _select_top_documents: walk the sorted documents with iterrows()"""
+    df = df.sort_values('priority_score', ascending=False)
+    selected = []
+    doc_types_count = {}
+    for idx, doc in df.iterrows():
+        doc_type = doc['document_type']
+        current_count = doc_types_count.get(doc_type, 0)
+        if current_count < selector.MAX_PER_TYPE.get(doc_type, 10):
+            selected.append(doc)
+            doc_types_count[doc_type] = current_count + 1
+        if len(selected) >= max_documents:
+            break
+    return pd.DataFrame(selected)
+
+
+def test_scores_match_per_term_passes():
+    with tempfile.TemporaryDirectory() as tmp:
+        selector = IntelligentDocumentSelector(tmp, tmp)
+        expected = score_per_term(selector, binary_metadata(), KEY_DATES)
+        scored = selector._score_documents(binary_metadata(), KEY_DATES)
+
+    assert list(scored.columns) == list(expected.columns)
+    for column in ('priority_score', 'type_score', 'temporal_score', 'content_score'):
+        assert scored[column].astype(int).tolist() == expected[column].astype(int).tolist(), column
+    assert IntelligentDocumentSelector.scoring_reason_text(scored).tolist() == expected['scoring_reasons'].tolist()
+
+
+def test_selection_matches_iterrows():
+    with tempfile.TemporaryDirectory() as tmp:
+        selector = IntelligentDocumentSelector(tmp, tmp)
+        scored = selector._score_documents(binary_metadata(), KEY_DATES)
+        for max_documents in (1, 5, 12, 100):
+            expected = select_iterrows(selector, scored, max_documents)
+            selected = selector._select_top_documents(scored, max_documents)
+            assert selected.index.tolist() == expected.index.tolist(), max_documents
+
+    # Operative notes are capped at their quota
+    assert (selected['document_type'] == 'operative_note').sum() == selector.MAX_PER_TYPE['operative_note']
+
+
+def test_no_key_dates():
+    with tempfile.TemporaryDirectory() as tmp:
+        selector = IntelligentDocumentSelector(tmp, tmp)
+        expected = score_per_term(selector, binary_metadata(), {'missing': pd.NaT})
+        scored = selector._score_documents(binary_metadata(), {'missing': pd.NaT})
+
+    assert scored['priority_score'].astype(int).tolist() == expected['priority_score'].astype(int).tolist()
+    assert IntelligentDocumentSelector.scoring_reason_text(scored).tolist() == expected['scoring_reasons'].tolist()
+
+
+if __name__ == '__main__':
+    for test in (test_scores_match_per_term_passes, test_selection_matches_iterrows, test_no_key_dates):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare TemporalContextIndex with the per-note FHIRExtractor HINT methods
+
+TemporalContextIndex replaced the per-note assign_surgery_number /
+get_relevant_diagnosis / extract_who_grade / get_active_medications calls in
+BRIMCSVGenerator.generate_project_csv; on these fixtures (including unsorted
+and missing surgery dates, window boundaries and date ties) both must give
+the same HINT columns.
+
+Run: python test_temporal_context.py  (or python -m pytest test_temporal_context.py)
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+from fhir_extractor import FHIRExtractor
+from temporal_context import TemporalContextIndex
+
+DIAGNOSES = [
+    {'diagnosis_text': 'Pilocytic astrocytoma, WHO grade I', 'recorded_date': '2018-03-02T10:00:00'},
+    {'diagnosis_text': 'Recurrent pilocytic astrocytoma', 'recorded_date': '2020-01-15T08:30:00'},
+    {'diagnosis_text': 'Low-grade glioma, grade II', 'recorded_date': '2020-01-15T08:30:00'},
+    {'diagnosis_text': 'Anaplastic astrocytoma WHO III', 'onset_date': '2021-06-01'},
+    {'diagnosis_text': 'Diagnosis without a date', 'recorded_date': ''},
+]
+
+MEDICATIONS = [
+    {'medication_name': 'vinblastine', 'authored_date': '2018-04-01T09:00:00'},
+    {'medication_name': 'carboplatin', 'authored_date': '2018-04-20T09:00:00'},
+    {'medication_name': 'vinblastine', 'authored_date': '2018-04-29T09:00:00'},
+    {'medication_name': '', 'authored_date': '2018-04-10T09:00:00'},
+    {'medication_name': 'selumetinib', 'authored_date': ''},
+    {'medication_name': 'bevacizumab', 'authored_date': '2020-02-14T23:59:59'},
+]
+
+SURGERY_SETS = {
+    'chronological': ['2018-03-01', '2019-06-10', '2020-01-20'],
+    'unsorted formats': ['2020-01-20', '03/01/2018', '2019-06-10'],
+    'missing date': ['2018-03-01', '', '2020-01-20'],
+    'all missing': ['', ''],
+    'same day': ['2019-06-10', '2019-06-10', '2018-03-01'],
+    'none': [],
+}
+
+DOCUMENT_DATES = [
+    '2017-01-01', '2018-03-01', '2018-05-30T12:00:00', '2018-05-31', '2018-06-01', '2018-12-01',
+    '2019-03-12', '2019-09-08', '2019-09-09', '2020-01-15T08:30:00', '2020-01-15T08:29:59',
+    '2020-03-15', '2021-06-01', '2023-01-01',
+]
+
+
+def per_note_hints(context, document_dates):
+    extractor = FHIRExtractor.__new__(FHIRExtractor)  # HINT methods need no AWS clients
+    rows = []
+    for document_date in document_dates:
+        diagnosis = extractor.get_relevant_diagnosis(document_date, context['diagnoses'])
+        medications = extractor.get_active_medications(document_date, context['medications'])
+        rows.append((
+            extractor.assign_surgery_number(document_date, context['surgeries']),
+            diagnosis,
+            extractor.extract_who_grade(diagnosis),
+            '; '.join(medications) if medications else '',
+        ))
+    return rows
+
+
+def test_matches_per_note_methods():
+    document_dates = [pd.to_datetime(date) for date in DOCUMENT_DATES]
+    for name, surgery_dates in SURGERY_SETS.items():
+        context = {
+            'surgeries': [{'procedure_date': date} for date in surgery_dates],
+            'diagnoses': DIAGNOSES,
+            'medications': MEDICATIONS,
+        }
+        expected = per_note_hints(context, document_dates)
+        hints = TemporalContextIndex(context).hint_columns(document_dates)
+        actual = [tuple(row) for row in hints.itertuples(index=False)]
+        for date, want, got in zip(DOCUMENT_DATES, expected, actual):
+            assert got == want, f"{name}, {date}: {got} != {want}"
+
+
+def test_empty_context():
+    hints = TemporalContextIndex({}).hint_columns([pd.to_datetime('2020-01-01')])
+    assert tuple(hints.iloc[0]) == ('other', '', '', '')
+
+
+if __name__ == '__main__':
+    for test in (test_matches_per_note_methods, test_empty_context):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare text_normalization.normalize_text with the original BeautifulSoup sanitizer
+
+normalize_text replaced BRIMCSVGenerator.sanitize_html; on these fixtures both
+must give the same text, including plain-text notes with '<' before a letter.
+
+Run: python test_text_normalization.py  (or python -m pytest test_text_normalization.py)
+"""
+
+import sys
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
+from text_normalization import detect_format, normalize_text
+
+
+def sanitize_html_bs4(content):
+    """The original BRIMCSVGenerator.sanitize_html"""
+    if not content:
+        return ''
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(['script', 'style', 'meta', 'link', 'head']):
+        element.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    return ' '.join(text.split())
+
+
+FIXTURES = [
+    # plain text with '<' before a letter or digit
+    'BP <5 and a<b',
+    'residual tumor measures <Bx site 2cm',
+    'wt<Ideal',
+    'Dose <Dmax; platelets <50K, ANC <Imm',
+    'a &lt; b &amp; c',
+    '',
+    # HTML
+    '<html><head><title>Note</title><style>p {color: red}</style></head>'
+    '<body><p>Patient seen &amp; examined.</p><script>var x = 1;</script><div>MRI stable</div></body></html>',
+    '<div>Line one<br>Line two<br/>Line three</div>',
+    '<p>before</p><title>Stray title</title><p>after</p>',
+    '<html><body><p>x</p><title>Stray title</title><p>y</p></body></html>',
+    '<div>x<![CDATA[keep me]]>y</div>',
+    '<p>residual tumor <Bx site 2cm</p><p>next paragraph</p>',
+    '<p>wt<Ideal</p>',
+    '<table><tr><td>WBC</td><td>4.5</td></tr><tr><td>Hgb</td><td>12</td></tr></table>',
+    '<!-- comment --><p>Impression:</p><ul><li>stable</li><li>no new lesion</li></ul>',
+]
+
+
+def test_matches_beautifulsoup():
+    for content in FIXTURES:
+        expected = sanitize_html_bs4(content)
+        actual = normalize_text(content)
+        assert actual == expected, f"{content!r}: {actual!r} != {expected!r}"
+
+
+def test_plain_text_with_angle_bracket_is_not_html():
+    for content in ('BP <5 and a<b', 'residual tumor measures <Bx site 2cm', 'wt<Ideal'):
+        assert detect_format(content) == 'text', content
+
+
+def test_keep_lines_keeps_text():
+    content = '<p>before</p><title>Stray title</title><p>after <Bx site</p>'
+    flat = normalize_text(content)
+    lines = normalize_text(content, keep_lines=True)
+    assert ' '.join(lines.split()) == flat, (lines, flat)
+
+
+if __name__ == '__main__':
+    tests = [test_matches_beautifulsoup, test_plain_text_with_angle_bracket_is_not_html,
+             test_keep_lines_keeps_text]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")